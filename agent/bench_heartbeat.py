@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+心跳通道性能测试
+
+注册一个拒绝新任务的测试主Agent，分别通过HTTP轮询和WebSocket通道连续发送心跳，
+对比延迟和吞吐量。需要服务器已启动并开启WebSocket服务(WEBSOCKET_ENABLED)。
+
+用法:
+    python agent/bench_heartbeat.py --server http://localhost:5050 --count 500
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import statistics
+import requests
+
+# 获取项目根目录
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 添加项目根目录到 Python 路径
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from agent.resource_util import get_resource_util
+from agent.ws_transport import WebSocketTransport, build_ws_url
+from config import Config
+
+def register_bench_agent(server_url, resource_info):
+    """注册测试用的主Agent
+    
+    Returns:
+        str: Agent ID
+    """
+    response = requests.post(f"{server_url}/api/agents/main", json={
+        'name': 'heartbeat_bench',
+        'cpu_cores': resource_info['cpu_cores'],
+        'gpu_ids': resource_info['gpu_ids']
+    })
+    response.raise_for_status()
+    return response.json()['data']['id']
+
+def run_threads(count, concurrency, send_one):
+    """用concurrency个线程共发送count次心跳
+    
+    Returns:
+        tuple: (每次心跳耗时列表（秒）, 总耗时（秒）, 失败次数)
+    """
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+    
+    def worker(n):
+        for _ in range(n):
+            start = time.perf_counter()
+            ok = send_one()
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    failures[0] += 1
+    
+    per_thread = [count // concurrency + (1 if i < count % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(n,)) for n in per_thread]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start, failures[0]
+
+def report(name, latencies, total, failures, payload_bytes):
+    """输出一组测试结果"""
+    if not latencies:
+        print(f"{name}: 全部失败 ({failures}次)")
+        return
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{name:<10} 次数={len(latencies):<6} 失败={failures:<4} "
+        f"吞吐={len(latencies) / total:8.1f}次/秒  "
+        f"平均={statistics.mean(latencies) * 1000:7.2f}ms  "
+        f"p50={statistics.median(latencies) * 1000:7.2f}ms  "
+        f"p95={p95 * 1000:7.2f}ms  "
+        f"单次上行={payload_bytes}字节"
+    )
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="心跳通道性能测试")
+    parser.add_argument("--server", help="服务器URL", default=Config.SERVER_URL)
+    parser.add_argument("--ws-port", type=int, help="WebSocket服务端口", default=Config.WEBSOCKET_PORT)
+    parser.add_argument("--count", type=int, help="每种方式发送的心跳次数", default=500)
+    parser.add_argument("--concurrency", type=int, help="并发线程数", default=1)
+    args = parser.parse_args()
+    
+    resource_info = get_resource_util().get_resource_info(os.getpid())
+    resource_info['available_cpu_cores'] = resource_info['cpu_cores']
+    resource_info['reject_new_task'] = True  # 测试Agent不领取任务
+    agent_id = register_bench_agent(args.server, resource_info)
+    print(f"测试Agent: ID={agent_id}, 每种方式{args.count}次心跳, 并发{args.concurrency}")
+    
+    try:
+        # HTTP轮询：每次心跳新建连接并发送全量资源信息（不带序号的旧版心跳格式）
+        url = f"{args.server}/api/agents/{agent_id}/heartbeat"
+        http_payload = {'resource_info': resource_info}
+        
+        def send_http():
+            response = requests.post(url, json=http_payload)
+            return response.status_code == 200 and response.json().get('success')
+        
+        report('HTTP', *run_threads(args.count, args.concurrency, send_http),
+               len(json.dumps(http_payload)))
+        
+        # WebSocket：长连接，首次发送全量资源信息，之后只发送变化的字段（此处资源不变，增量为空）
+        transport = WebSocketTransport(build_ws_url(args.server, agent_id, args.ws_port))
+        transport.start(wait=5)
+        if not transport.connected:
+            print("WebSocket: 连接失败，请确认服务器已开启WEBSOCKET_ENABLED")
+            return
+        try:
+            transport.request({'type': 'heartbeat', 'data': {'resource_info': resource_info}})
+            ws_payload = {'type': 'heartbeat', 'id': 0, 'ack': 0, 'data': {'resource_info': {}}}
+            
+            def send_ws():
+                return transport.request({'type': 'heartbeat', 'ack': 0, 'data': {'resource_info': {}}}) is not None
+            
+            report('WebSocket', *run_threads(args.count, args.concurrency, send_ws),
+                   len(json.dumps(ws_payload)))
+        finally:
+            transport.close()
+    finally:
+        requests.post(f"{args.server}/api/agents/{agent_id}/cancel")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+资源采样性能测试
+
+对比每次采样的耗时:
+    旧版采样    每次新建ResourceUtil（初始化NVML）并同步调用get_resource_info（含CPU采样等待）
+    主机信息    CPU核心数、总内存、GPU列表和GPU信息，分别在不缓存和缓存cgroup文件、GPU句柄时测量
+    快照读取    后台采样线程运行时get_resource_info读取最新快照
+
+用法:
+    python agent/bench_resource.py --count 200
+"""
+
+import os
+import sys
+import time
+import statistics
+
+# 获取项目根目录
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 添加项目根目录到 Python 路径
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from agent.resource_util import ResourceUtil, get_resource_util
+
+def measure(count, sample_one):
+    """调用count次sample_one
+    
+    Returns:
+        list: 每次耗时（秒）
+    """
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        sample_one()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def report(name, latencies):
+    """输出一组测试结果"""
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{name:<16} 次数={len(latencies):<6} "
+        f"平均={statistics.mean(latencies) * 1000:9.3f}ms  "
+        f"p50={statistics.median(latencies) * 1000:9.3f}ms  "
+        f"p95={p95 * 1000:9.3f}ms"
+    )
+
+def host_info(util):
+    """读取主机信息"""
+    util.get_cpu_core_count()
+    util.get_memory_total()
+    util.get_available_gpu_ids()
+    util.get_gpu_info()
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="资源采样性能测试")
+    parser.add_argument("--count", type=int, help="每种方式的采样次数", default=200)
+    parser.add_argument("--legacy-count", type=int, help="旧版采样的次数（每次约等待0.1秒）", default=20)
+    args = parser.parse_args()
+    
+    pid = os.getpid()
+    print(f"测试进程: PID={pid}, 每种方式{args.count}次")
+    
+    report('旧版采样', measure(args.legacy_count, lambda: ResourceUtil(cgroup_cache_ttl=0).get_resource_info(pid)))
+    
+    uncached = ResourceUtil(cgroup_cache_ttl=0)
+    report('主机信息(无缓存)', measure(args.count, lambda: host_info(uncached)))
+    
+    util = get_resource_util()
+    report('主机信息(缓存)', measure(args.count, lambda: host_info(util)))
+    
+    util.start_sampler(pid, interval=0.1, window=10)
+    try:
+        time.sleep(0.5)
+        report('快照读取', measure(args.count, lambda: util.get_resource_info(pid)))
+    finally:
+        util.stop_sampler()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+子Agent心跳汇聚
+
+主Agent在本机监听一个Unix域套接字，子Agent把心跳和任务日志块发给主Agent而不是直接发给服务器，
+主Agent每隔AGENT_HUB_FLUSH_INTERVAL秒把收到的所有心跳和日志块合并为一个请求发送到
+POST /api/agents/heartbeat/batch，服务器请求数只与节点数有关，与任务数无关。
+
+本机协议为每行一个JSON:
+    子Agent -> 主Agent: {'agent_id': 子Agent ID, 'data': 心跳数据（与HTTP心跳相同）}
+    主Agent -> 子Agent: {'data': 服务器对该子Agent上一批心跳的响应}
+    子Agent -> 主Agent: {'agent_id': 子Agent ID, 'log': {'task_id': 任务ID, 'offset': 字节偏移, 'data': base64编码的日志块}}
+    主Agent -> 子Agent: {'log': {'offset': 子Agent下一块日志应从这个偏移开始发送}}
+
+主Agent收到心跳后立即回复，子Agent即认为心跳已送达；服务器的响应（如quit、resync）在下一次
+心跳时返回给子Agent。转发失败的心跳保留在队列中下次重试。子Agent连接不上套接字时
+回退到直接向服务器发送心跳。
+
+日志块按子Agent拼接为一段连续的待转发日志，每个子Agent最多保存max_log_pending字节，
+写满时回复的偏移不再前进，子Agent稍后从该偏移重新发送。服务器在同一个批量请求中先写入日志块
+再处理心跳，任务结束的心跳不会先于任务日志到达。服务器缺少中间的日志（如主Agent重启丢失了
+待转发日志）时返回较小的确认偏移，主Agent丢弃待转发日志，子Agent从该偏移重新发送。
+"""
+
+import os
+import json
+import base64
+import socket
+import logging
+import threading
+import socketserver
+import requests
+from backend.utils.heartbeat_codec import encode_body
+
+logger = logging.getLogger("local_hub")
+
+def hub_supported():
+    """当前系统是否支持Unix域套接字"""
+    return hasattr(socket, 'AF_UNIX')
+
+class _HubRequestHandler(socketserver.StreamRequestHandler):
+    """处理一个子Agent连接，每行一个心跳"""
+    
+    def handle(self):
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+                if 'log' in message:
+                    reply = {'log': {'offset': self.server.hub.submit_log(message['agent_id'], message['log'])}}
+                else:
+                    reply = {'data': self.server.hub.submit(message['agent_id'], message.get('data') or {})}
+            except (ValueError, KeyError, TypeError):
+                logger.warning("子Agent心跳格式无效")
+                reply = {'data': {'action': 'continue'}}
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+class _HubServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """子Agent心跳监听服务"""
+    daemon_threads = True
+
+class SubAgentHub:
+    """主Agent端的子Agent心跳汇聚器"""
+    
+    def __init__(self, server_url, socket_path, flush_interval=1, max_queue=10000,
+                 max_log_pending=4 * 1024 * 1024, max_log_batch=16 * 1024 * 1024):
+        """初始化心跳汇聚器
+        
+        Args:
+            server_url: 服务器URL
+            socket_path: Unix域套接字路径
+            flush_interval: 向服务器转发的间隔（秒）
+            max_queue: 转发失败时最多保留的心跳数，超出时丢弃最早的心跳
+            max_log_pending: 每个子Agent最多保存的待转发日志字节数，不超过服务器接受的日志块大小
+            max_log_batch: 每次转发最多携带的日志字节数
+        """
+        self.server_url = server_url
+        self.socket_path = socket_path
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_log_pending = max_log_pending
+        self.max_log_batch = max_log_batch
+        self._lock = threading.Lock()
+        self._queue = []  # 等待转发的心跳 [(子Agent ID, 心跳数据)]
+        self._responses = {}  # 子Agent ID -> 等待返回给子Agent的服务器响应
+        self._logs = {}  # 子Agent ID -> 待转发的日志 {'task_id', 'offset': 起始偏移, 'data': bytearray}
+        self._server = None
+        self._threads = []
+        self._stop = threading.Event()
+    
+    def start(self):
+        """开始监听并启动转发线程"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _HubServer(self.socket_path, _HubRequestHandler)
+        self._server.hub = self
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._server.serve_forever, name='sub-agent-hub', daemon=True),
+            threading.Thread(target=self._flush_loop, name='sub-agent-hub-flush', daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"子Agent心跳汇聚已启动: {self.socket_path}")
+    
+    def close(self):
+        """转发剩余的心跳并停止监听"""
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=3)
+        self._threads = []
+        self.flush()
+        if os.path.exists(self.socket_path):
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+    
+    def submit(self, agent_id, data):
+        """接收子Agent的心跳
+        
+        Args:
+            agent_id: 子Agent ID
+            data: 心跳数据
+        
+        Returns:
+            dict: 服务器对该子Agent上一批心跳的响应，没有时返回continue
+        """
+        with self._lock:
+            self._queue.append((agent_id, data))
+            if len(self._queue) > self.max_queue:
+                dropped = len(self._queue) - self.max_queue
+                del self._queue[:dropped]
+                logger.warning(f"子Agent心跳队列已满，丢弃最早的{dropped}个心跳")
+            return self._responses.pop(agent_id, None) or {'action': 'continue'}
+    
+    def submit_log(self, agent_id, log):
+        """接收子Agent的日志块
+        
+        Args:
+            agent_id: 子Agent ID
+            log: {'task_id': 任务ID, 'offset': 日志块的字节偏移, 'data': base64编码的日志块}
+        
+        Returns:
+            int: 子Agent下一块日志应开始的偏移，已接收的部分由主Agent负责转发
+        
+        Raises:
+            ValueError: 日志块格式无效
+        """
+        offset = int(log['offset'])
+        data = base64.b64decode(log['data'])
+        with self._lock:
+            pending = self._logs.get(agent_id)
+            if pending is None:
+                pending = {'task_id': log['task_id'], 'offset': offset, 'data': bytearray()}
+                self._logs[agent_id] = pending
+            end = pending['offset'] + len(pending['data'])
+            if offset > end:
+                # 中间的部分不在主Agent中，要求子Agent从end重新发送
+                return end
+            
+            # 跳过已接收的部分，超出保存上限的部分由子Agent稍后重新发送
+            room = self.max_log_pending - len(pending['data'])
+            pending['data'] += data[end - offset:][:max(room, 0)]
+            return pending['offset'] + len(pending['data'])
+    
+    def flush(self):
+        """把队列中的心跳和待转发的日志合并为一个请求转发到服务器
+        
+        Returns:
+            bool: 转发是否成功（没有需要转发的内容时返回True）
+        """
+        with self._lock:
+            batch = self._queue
+            self._queue = []
+            logs = self._take_logs()
+        if not batch and not logs:
+            return True
+        
+        try:
+            body, headers = encode_body({
+                'heartbeats': [{'agent_id': agent_id, 'data': data} for agent_id, data in batch],
+                'logs': [
+                    {
+                        'agent_id': agent_id,
+                        'task_id': task_id,
+                        'offset': offset,
+                        'data': base64.b64encode(data).decode('ascii')
+                    }
+                    for agent_id, task_id, offset, data in logs
+                ]
+            })
+            response = requests.post(
+                f"{self.server_url}/api/agents/heartbeat/batch",
+                data=body, headers=headers, timeout=30
+            )
+            result = response.json() if response.status_code == 200 else {}
+            if not result.get('success'):
+                raise RuntimeError(result.get('message') or f"HTTP状态码={response.status_code}")
+        except Exception as e:
+            logger.error(f"转发子Agent心跳失败: {str(e)}")
+            # 放回队列头部，下次重试
+            with self._lock:
+                self._queue[:0] = batch
+            return False
+        
+        with self._lock:
+            for (agent_id, _), agent_response in zip(batch, result['data']['heartbeats']):
+                self._merge_response(agent_id, agent_response)
+            for (agent_id, _, offset, data), acked_offset in zip(logs, result['data']['logs']):
+                self._ack_log(agent_id, offset, data, acked_offset)
+        return True
+    
+    def _take_logs(self):
+        """取出本次转发的日志（复制，确认前仍保留在待转发日志中），调用时需持有_lock
+        
+        Returns:
+            list: [(子Agent ID, 任务ID, 偏移, 日志块)]
+        """
+        logs = []
+        budget = self.max_log_batch
+        for agent_id, pending in list(self._logs.items()):
+            if budget <= 0:
+                break
+            if not pending['data']:
+                continue
+            data = bytes(pending['data'][:budget])
+            budget -= len(data)
+            logs.append((agent_id, pending['task_id'], pending['offset'], data))
+            # 本次已转发的子Agent移到末尾，日志较多时各子Agent轮流转发
+            del self._logs[agent_id]
+            self._logs[agent_id] = pending
+        return logs
+    
+    def _ack_log(self, agent_id, offset, data, acked_offset):
+        """按服务器的确认偏移丢弃已写入的日志，调用时需持有_lock
+        
+        Args:
+            agent_id: 子Agent ID
+            offset: 转发的日志块偏移
+            data: 转发的日志块
+            acked_offset: 服务器的确认偏移，日志块格式无效时为None
+        """
+        pending = self._logs.get(agent_id)
+        if pending is None:
+            return
+        
+        if acked_offset is None:
+            logger.error(f"服务器拒绝子Agent日志块: 子Agent ID={agent_id}, 偏移={offset}")
+            del self._logs[agent_id]
+        elif acked_offset < offset:
+            # 服务器缺少这块之前的日志，保留空的待转发日志，子Agent从确认偏移重新发送
+            logger.warning(f"子Agent日志不连续: 子Agent ID={agent_id}, 服务器确认偏移={acked_offset}, 转发偏移={offset}")
+            pending['offset'] = acked_offset
+            pending['data'] = bytearray()
+        else:
+            confirmed = min(max(acked_offset - pending['offset'], 0), len(pending['data']))
+            del pending['data'][:confirmed]
+            pending['offset'] += confirmed
+            if not pending['data']:
+                del self._logs[agent_id]
+    
+    def _merge_response(self, agent_id, response):
+        """保存服务器响应，continue不覆盖尚未返回给子Agent的其他操作"""
+        pending = self._responses.get(agent_id)
+        if pending is None or response.get('action', 'continue') != 'continue':
+            merged = dict(response)
+        else:
+            merged = dict(pending)
+        if response.get('resync') or (pending and pending.get('resync')):
+            merged['resync'] = True
+        self._responses[agent_id] = merged
+    
+    def _flush_loop(self):
+        """转发线程"""
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+class HubClient:
+    """子Agent端的心跳汇聚客户端"""
+    
+    def __init__(self, socket_path, timeout=5):
+        """初始化客户端
+        
+        Args:
+            socket_path: 主Agent的Unix域套接字路径
+            timeout: 等待主Agent回复的超时时间（秒）
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+    
+    def request(self, agent_id, data):
+        """发送心跳并等待主Agent回复
+        
+        Args:
+            agent_id: 子Agent ID
+            data: 心跳数据
+        
+        Returns:
+            dict: 服务器对上一批心跳的响应，发送失败时返回None
+        """
+        reply = self._exchange({'agent_id': agent_id, 'data': data})
+        if reply is None:
+            return None
+        return reply.get('data') or {}
+    
+    def send_log(self, agent_id, task_id, offset, data):
+        """把日志块交给主Agent转发
+        
+        Args:
+            agent_id: 子Agent ID
+            task_id: 任务ID
+            offset: 日志块的字节偏移
+            data: 日志块（字节）
+        
+        Returns:
+            int: 下一块日志应开始的偏移，发送失败时返回None
+        """
+        reply = self._exchange({
+            'agent_id': agent_id,
+            'log': {'task_id': task_id, 'offset': offset, 'data': base64.b64encode(data).decode('ascii')}
+        })
+        try:
+            return int(reply['log']['offset'])
+        except (TypeError, KeyError, ValueError):
+            return None
+    
+    def _exchange(self, message):
+        """发送一条消息并等待主Agent回复
+        
+        Args:
+            message: 消息
+        
+        Returns:
+            dict: 主Agent的回复，发送失败时返回None
+        """
+        try:
+            if self._sock is None:
+                self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._sock.settimeout(self.timeout)
+                self._sock.connect(self.socket_path)
+                self._reader = self._sock.makefile('rb')
+            self._sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+            line = self._reader.readline()
+            if not line:
+                raise ConnectionError("主Agent已关闭连接")
+            return json.loads(line)
+        except Exception as e:
+            logger.warning(f"向主Agent发送消息失败: {str(e)}")
+            self.close()
+            return None
+    
+    def close(self):
+        """关闭连接"""
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
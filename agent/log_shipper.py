@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务日志上报
+
+任务输出由OutputPump写入本地日志文件并加入有界的输出队列，子Agent在后台线程中按字节偏移
+从输出队列分块读取并上报到服务器（格式见backend/utils/log_chunk.py）。队列中没有的部分
+（队列已满时未加入，或确认偏移回退）从本地日志文件读取。上报进度只是一个偏移，
+上报失败或服务器返回的确认偏移落后时从确认偏移重新发送，服务器按偏移去重。
+
+主Agent启用了心跳汇聚（agent/local_hub.py）时，日志块交给主Agent与心跳一起批量转发，
+主Agent已接收的部分即视为已确认；主Agent不可用时直接上报到服务器。
+"""
+
+import time
+import logging
+import threading
+import requests
+
+from backend.utils.log_chunk import encode_chunk
+
+logger = logging.getLogger("log_shipper")
+
+class LogShipper:
+    """从输出队列和本地日志文件按偏移分块上报任务日志"""
+    
+    def __init__(self, server_url, task_id, agent_id, log_path, queue=None, chunk_size=256 * 1024, interval=1,
+                 compress_min_size=1024, timeout=10, hub_client=None):
+        """初始化日志上报
+        
+        Args:
+            server_url: 服务器URL
+            task_id: 任务ID
+            agent_id: 子Agent ID
+            log_path: 本地日志文件路径
+            queue: 输出队列（OutputQueue），为None时只从本地日志文件读取
+            chunk_size: 每次上报的最大字节数
+            interval: 上报间隔（秒）
+            compress_min_size: 日志块超过此字节数时压缩
+            timeout: 上报请求的超时时间（秒）
+            hub_client: 主Agent心跳汇聚客户端（HubClient），为None时直接上报到服务器
+        """
+        self.url = f"{server_url}/api/tasks/{task_id}/log/chunks"
+        self.task_id = task_id
+        self.agent_id = agent_id
+        self.hub_client = hub_client
+        self.log_path = log_path
+        self.queue = queue
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self.compress_min_size = compress_min_size
+        self.timeout = timeout
+        self._acked_offset = 0  # 服务器（或主Agent）已确认的偏移，下一块从本地日志文件的这个位置读取
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._session = requests.Session()
+    
+    @property
+    def acked_offset(self):
+        """服务器（或主Agent）已确认的字节偏移"""
+        return self._acked_offset
+    
+    def start(self):
+        """启动上报线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._ship_loop, name='log-shipper', daemon=True)
+        self._thread.start()
+    
+    def close(self, timeout=10):
+        """停止上报线程，在timeout内尽量上报剩余的输出
+        
+        Args:
+            timeout: 等待剩余输出上报的最长时间（秒）
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._stop.set()
+        # 唤醒因积压过多而暂停的输出读取
+        if self.queue is not None:
+            self.queue.close()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=self.timeout + 1)
+        
+        deadline = time.monotonic() + timeout
+        while not self.flush():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"任务日志未全部上报: 已确认偏移={self._acked_offset}, 完整日志见{self.log_path}")
+                break
+            time.sleep(min(self.interval, remaining))
+        self._session.close()
+        if self.hub_client:
+            self.hub_client.close()
+    
+    def flush(self):
+        """上报未被确认的输出，直到上报到输出末尾或上报失败
+        
+        Returns:
+            bool: 是否已上报到输出末尾
+        """
+        with self._lock:
+            f = None
+            try:
+                rewound = False
+                while True:
+                    chunk = self.queue.read(self._acked_offset, self.chunk_size) if self.queue is not None else None
+                    if chunk is None:
+                        # 输出队列中没有这部分输出，从本地日志文件读取
+                        if f is None:
+                            try:
+                                f = open(self.log_path, 'rb')
+                            except FileNotFoundError:
+                                return True
+                        f.seek(self._acked_offset)
+                        chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        return True
+                
+                    acked_offset = self._send(self._acked_offset, chunk)
+                    if acked_offset is None or acked_offset == self._acked_offset:
+                        return False
+                    if acked_offset < self._acked_offset:
+                        # 服务器缺少中间的部分（如服务器恢复了旧数据），从确认偏移重新发送，每次最多回退一次
+                        logger.warning(f"服务器日志确认偏移回退: 本地={self._acked_offset}, 服务器={acked_offset}")
+                        if rewound:
+                            self._acked_offset = acked_offset
+                            return False
+                        rewound = True
+                    self._acked_offset = acked_offset
+            finally:
+                if f is not None:
+                    f.close()
+    
+    def _send(self, offset, chunk):
+        """上报一个日志块，优先交给主Agent转发
+        
+        Args:
+            offset: 日志块在输出流中的偏移
+            chunk: 日志块（字节）
+        
+        Returns:
+            int: 服务器（或主Agent）已确认的偏移，上报失败时返回None
+        """
+        if self.hub_client:
+            acked_offset = self.hub_client.send_log(self.agent_id, self.task_id, offset, chunk)
+            if acked_offset is not None:
+                return acked_offset
+        
+        body, headers = encode_chunk(chunk, self.compress_min_size)
+        try:
+            response = self._session.post(
+                self.url,
+                params={'agent_id': self.agent_id, 'offset': offset},
+                data=body,
+                headers=headers,
+                timeout=self.timeout
+            )
+            # 409表示偏移不连续，响应中同样带有服务器的确认偏移
+            if response.status_code in (200, 409):
+                return response.json()['data']['acked_offset']
+            logger.error(f"任务日志上报失败: HTTP状态码={response.status_code}")
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            logger.error(f"任务日志上报异常: {str(e)}")
+        return None
+    
+    def _ship_loop(self):
+        """按间隔上报输出"""
+        while not self._stop.wait(self.interval):
+            self.flush()
@@ -16,6 +16,7 @@ import requests
 import subprocess
 import threading
 import socket
+import tempfile
 from datetime import datetime
 
 # 获取项目根目录
@@ -26,6 +27,9 @@ if ROOT_DIR not in sys.path:
 
 # 导入资源监控工具
 from agent.resource_util import get_resource_util
+from agent.ws_transport import WebSocketTransport, build_ws_url
+from agent.local_hub import SubAgentHub, hub_supported
+from backend.utils.heartbeat_codec import HeartbeatEncoder, encode_body
 
 # 导入配置
 from config import Config
@@ -63,10 +67,29 @@ class MainAgent:
         self.heartbeat_thread = None
         self.start_time = datetime.now()
         self.reject_new_task = reject_new_task
+        self.last_action = None
+        self.heartbeat_event = threading.Event()
+        self.response_lock = threading.Lock()
+        
+        # WebSocket通道（可选），不可用时使用HTTP心跳
+        self.ws_transport = None
+        self.ws_ack = 0  # 已处理的最后一个服务器推送序号
+        
+        # 心跳只发送变化的资源字段，静态信息在注册时上报
+        self.heartbeat_encoder = HeartbeatEncoder(keyframe_interval=Config.HEARTBEAT_KEYFRAME_INTERVAL)
+        
+        # 子Agent心跳汇聚（可选），子Agent通过本机套接字上报心跳
+        self.hub = None
         
         # 资源信息
         self.resource_util = get_resource_util()
         self.resource_info = self.resource_util.get_resource_info(os.getpid())
+        # 后台采样，心跳直接读取最新的资源快照
+        self.resource_util.start_sampler(
+            os.getpid(), Config.RESOURCE_SAMPLE_INTERVAL, Config.RESOURCE_SAMPLE_WINDOW,
+            rescan_interval=Config.PROCESS_TREE_RESCAN_INTERVAL,
+            pss_interval=Config.PROCESS_PSS_INTERVAL
+        )
         self.locked_cpu_cores = 0
         self.locked_gpu_ids = []
         
@@ -91,7 +114,8 @@ class MainAgent:
             data = {
                 'name': self.name,
                 'cpu_cores': self.resource_info['cpu_cores'],
-                'gpu_ids': self.resource_info['gpu_ids']
+                'gpu_ids': self.resource_info['gpu_ids'],
+                'memory_total': self.resource_info['memory_total']
             }
             
             response = requests.post(url, json=data)
@@ -121,6 +145,8 @@ class MainAgent:
         
         try:
             url = f"{self.server_url}/api/agents/{self.id}/heartbeat"
+            # 在获取资源信息之前记录确认序号，保证上报的资源信息已包含这些推送的任务
+            ack = self.ws_ack
 
             # 检查子Agent进程
             for task_id, [process, cpu_cores, gpu_ids] in list(self.sub_agents.items()):
@@ -138,19 +164,31 @@ class MainAgent:
                 if gpu_unit["gpu_id"] in self.locked_gpu_ids:
                     gpu_unit["is_available"] = False
             resource_info["reject_new_task"] = self.reject_new_task
+            resource_info["max_tasks"] = Config.MAX_TASKS_PER_HEARTBEAT
 
-            data = {
-                'resource_info': resource_info
-            }
+            # 只发送变化的资源字段
+            data = self.heartbeat_encoder.encode(resource_info)
             
-            response = requests.post(url, json=data)
+            # 优先通过WebSocket发送，失败时回退到HTTP
+            if self.send_ws_heartbeat(data, ack):
+                return True
+            
+            # 长轮询：没有新任务时服务器最多等待wait秒后才返回
+            body, headers = encode_body(data, Config.HEARTBEAT_COMPRESS_MIN_SIZE)
+            wait = Config.MAIN_AGENT_LONG_POLL_WAIT
+            if wait > 0:
+                response = requests.post(url, data=body, headers=headers, params={'wait': wait}, timeout=wait + 30)
+            else:
+                response = requests.post(url, data=body, headers=headers)
             logger.info(f"{'='*10} 心跳发送完成 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {'='*10}")
             
             if response.status_code == 200:
                 result = response.json()
                 if result.get('success'):
                     # 处理服务器响应
-                    self.handle_heartbeat_response(result['data'])
+                    self.heartbeat_encoder.commit(result['data'])
+                    with self.response_lock:
+                        self.handle_heartbeat_response(result['data'])
                     return True
                 else:
                     logger.error(f"心跳处理失败: {result.get('message', '未知错误')}")
@@ -162,6 +200,50 @@ class MainAgent:
             logger.error(f"心跳发送异常: {str(e)}")
             return False
     
+    def send_ws_heartbeat(self, data, ack):
+        """通过WebSocket发送心跳
+        
+        Args:
+            data: 编码后的心跳数据
+            ack: 已处理的最后一个服务器推送序号
+        
+        Returns:
+            bool: 心跳是否成功，WebSocket未启用或不可用时返回False
+        """
+        if not self.ws_transport or not self.ws_transport.connected:
+            return False
+        
+        reply = self.ws_transport.request({'type': 'heartbeat', 'ack': ack, 'data': data})
+        if reply is None:
+            return False
+        
+        self.heartbeat_encoder.commit(reply.get('data'))
+        with self.response_lock:
+            self.handle_heartbeat_response(reply.get('data') or {})
+        return True
+    
+    def handle_ws_connect(self):
+        """WebSocket连接（重连）成功，下一次心跳发送全量资源信息"""
+        self.heartbeat_encoder.reset()
+        self.heartbeat_event.set()
+    
+    def handle_ws_message(self, message):
+        """处理服务器通过WebSocket推送的操作
+        
+        Args:
+            message: 推送消息 {'type': 'action', 'seq': 推送序号, 'data': 与心跳响应相同}
+        """
+        if message.get('type') != 'action':
+            return
+        
+        with self.response_lock:
+            self.handle_heartbeat_response(message.get('data') or {})
+            if message.get('seq'):
+                self.ws_ack = message['seq']
+        
+        # 立即发送心跳，确认推送并上报扣除新任务后的资源
+        self.heartbeat_event.set()
+    
     def handle_heartbeat_response(self, response):
         """处理心跳响应
         
@@ -169,19 +251,22 @@ class MainAgent:
             response: 服务器响应数据
                 {
                     'action': 操作类型，如'continue', 'new_task', 'reject_new_task', 'accept_new_task', 'quit'
-                    'task': 如果action='new_task'，则包含新任务信息
+                    'task': 如果action='new_task'，则包含第一个新任务信息
+                    'tasks': 如果action='new_task'，则包含本次分配的全部新任务信息
                 }
         """
         action = response.get('action', 'continue')
+        self.last_action = action
         print(response)
         
         if action == 'new_task':
-            # 获取新任务
-            task = response.get('task')
-            logger.info(f"收到新任务: ID={task['id']}, 名称={task['name']}")
+            # 获取新任务，服务器可能一次分配多个任务
+            tasks = response.get('tasks') or [response.get('task')]
+            for task in tasks:
+                logger.info(f"收到新任务: ID={task['id']}, 名称={task['name']}")
             
-            # 创建子Agent执行任务
-            self.create_sub_agent(task)
+                # 创建子Agent执行任务
+                self.create_sub_agent(task)
         
         elif action == 'reject_new_task':
             logger.info("收到指令:拒绝新任务")
@@ -206,8 +291,8 @@ class MainAgent:
         """
         try:
             # 确定要分配的资源
-            cpu_cores = task.get('cpu_cores', 0)
-            gpu_ids = task.get('gpu_ids', [])
+            cpu_cores = task.get('cpu_cores') or 0
+            gpu_ids = task.get('gpu_ids') or []
             self.locked_cpu_cores += cpu_cores
             self.locked_gpu_ids += gpu_ids
             
@@ -222,6 +307,8 @@ class MainAgent:
                 '--task', json.dumps(task),
                 '--server', self.server_url
             ]
+            if self.hub:
+                command += ['--hub-socket', self.hub.socket_path]
             
             # 启动子Agent进程
             logger.info(f"启动子Agent: 任务ID={task['id']}, CPU核心={cpu_cores}, GPU={gpu_ids}")
@@ -268,6 +355,19 @@ class MainAgent:
         if self.heartbeat_thread and self.heartbeat_thread.is_alive():
             self.heartbeat_thread.join(timeout=3)
         
+        # 转发剩余的子Agent心跳并停止汇聚
+        if self.hub:
+            self.hub.close()
+            self.hub = None
+        
+        # 关闭WebSocket通道
+        if self.ws_transport:
+            self.heartbeat_event.set()
+            self.ws_transport.close()
+        
+        # 停止资源采样
+        self.resource_util.stop_sampler()
+        
         logger.info("资源清理完成")
     
     def run(self):
@@ -282,16 +382,48 @@ class MainAgent:
         # 设置运行标志
         self.running = True
         
+        # 建立WebSocket通道
+        if Config.AGENT_USE_WEBSOCKET:
+            self.ws_transport = WebSocketTransport(
+                build_ws_url(self.server_url, self.id, Config.WEBSOCKET_PORT),
+                on_message=self.handle_ws_message,
+                on_connect=self.handle_ws_connect
+            )
+            self.ws_transport.start(wait=Config.AGENT_WEBSOCKET_CONNECT_TIMEOUT)
+        
+        # 启动子Agent心跳汇聚，失败时子Agent直接向服务器发送心跳
+        if Config.AGENT_LOCAL_HUB_ENABLED and hub_supported():
+            socket_dir = Config.AGENT_HUB_SOCKET_DIR or tempfile.gettempdir()
+            self.hub = SubAgentHub(
+                self.server_url,
+                os.path.join(socket_dir, f"task_system_{self.id}.sock"),
+                flush_interval=Config.AGENT_HUB_FLUSH_INTERVAL,
+                max_log_pending=Config.LOG_CHUNK_MAX_SIZE,
+                max_log_batch=Config.AGENT_HUB_MAX_LOG_BATCH
+            )
+            try:
+                self.hub.start()
+            except Exception as e:
+                logger.warning(f"启动子Agent心跳汇聚失败: {str(e)}")
+                self.hub = None
+        
         # 开始心跳
         try:
             while self.running:
+                heartbeat_start = time.monotonic()
+                self.last_action = None
                 try:
                     self.send_heartbeat()
                 except Exception as e:
                     logger.error(f"心跳异常: {str(e)}")
                 
-                # 等待下一次心跳
-                time.sleep(Config.MAIN_AGENT_HEARTBEAT_INTERVAL)
+                # 等待下一次心跳：分配到新任务时立即发起下一次心跳，
+                # 长轮询已在服务器端等待过时也不再等待，否则保持原有的心跳间隔；
+                # 收到WebSocket推送时提前发送心跳
+                if self.last_action != 'new_task':
+                    elapsed = time.monotonic() - heartbeat_start
+                    self.heartbeat_event.wait(max(0, Config.MAIN_AGENT_HEARTBEAT_INTERVAL - elapsed))
+                self.heartbeat_event.clear()
         except KeyboardInterrupt:
             logger.info("收到中断信号，准备退出")
         finally:
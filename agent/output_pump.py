@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务输出读取
+
+任务进程的标准输出和标准错误通过管道交给子Agent，OutputPump用selectors等待管道可读，
+读到的数据写入本地日志文件，同时加入有界的OutputQueue，由LogShipper从队列取出按字节偏移上报。
+加入队列从不等待：队列已满（上报缓慢）时这部分输出只保留在本地日志文件中，上报时从文件补读，
+短暂的网络问题不会使任务进程阻塞在管道上。服务器长时间不可用、本地积压的未上报输出超过上限时
+暂停读取管道，由管道对任务进程施加反压，积压的日志不会占满磁盘。
+Windows上管道不支持select，改为在读取线程中阻塞读取。
+"""
+
+import os
+import sys
+import logging
+import selectors
+import threading
+from collections import deque
+
+logger = logging.getLogger("output_pump")
+
+READ_SIZE = 65536
+
+class OutputQueue:
+    """有界的任务输出块队列，在输出读取和日志上报之间传递输出，多线程安全
+    
+    输出块带有其在本地日志文件（即上报的输出流）中的偏移，上报按偏移从队列读取，
+    读取时丢弃已确认偏移之前的输出块。
+    """
+    
+    def __init__(self, max_size=4 * 1024 * 1024, max_backlog=None):
+        """初始化输出队列
+        
+        Args:
+            max_size: 队列中最多保存的字节数，超过时新的输出块只保留在本地日志文件中
+            max_backlog: 本地日志文件中未上报输出的最大字节数，超过时wait_for_backlog等待上报，
+                None或0表示不限制
+        """
+        self.max_size = max_size
+        self.max_backlog = max_backlog
+        self.dropped = 0  # 因队列已满只保留在本地日志文件中的字节数
+        self._chunks = deque()  # (偏移, 输出块)
+        self._size = 0
+        self._end = 0  # 已写入本地日志文件的输出末尾偏移
+        self._acked = 0  # 上报已确认的偏移
+        self._closed = False
+        self._cond = threading.Condition()
+    
+    def put(self, offset, data):
+        """加入一个已写入本地日志文件的输出块，不等待
+        
+        队列为空时单个输出块可以超过max_size。
+        
+        Args:
+            offset: 输出块在本地日志文件中的偏移
+            data: 输出块（字节）
+        
+        Returns:
+            bool: 是否已加入，队列已满或已关闭时返回False，这部分输出由上报从本地日志文件读取
+        """
+        if not data:
+            return True
+        
+        with self._cond:
+            self._end = max(self._end, offset + len(data))
+            if self._closed:
+                return False
+            if self._chunks and self._size + len(data) > self.max_size:
+                self.dropped += len(data)
+                return False
+            self._chunks.append((offset, data))
+            self._size += len(data)
+            return True
+    
+    def read(self, offset, max_size):
+        """读取从offset开始的连续输出，offset之前的输出视为已确认并从队列中删除
+        
+        Args:
+            offset: 上报已确认的偏移
+            max_size: 最多读取的字节数
+        
+        Returns:
+            bytes: 从offset开始的输出，已读到输出末尾时为空；队列中没有offset处的输出
+                （队列已满时未加入或确认偏移回退）时返回None，需要从本地日志文件读取
+        """
+        with self._cond:
+            while self._chunks and self._chunks[0][0] + len(self._chunks[0][1]) <= offset:
+                self._size -= len(self._chunks.popleft()[1])
+            self._acked = offset
+            self._cond.notify_all()
+            
+            if offset >= self._end:
+                return b''
+            if not self._chunks or self._chunks[0][0] > offset:
+                return None
+            
+            # 从队首开始拼接连续的输出块，遇到未加入队列的部分时停止
+            parts = []
+            position = offset
+            remaining = max_size
+            for chunk_offset, data in self._chunks:
+                if chunk_offset > position or remaining <= 0:
+                    break
+                part = data[position - chunk_offset:position - chunk_offset + remaining]
+                parts.append(part)
+                position += len(part)
+                remaining -= len(part)
+            return b''.join(parts)
+    
+    def wait_for_backlog(self, timeout=None):
+        """本地日志文件中未上报的输出超过max_backlog时等待上报
+        
+        Args:
+            timeout: 最长等待时间（秒），None表示一直等待
+        
+        Returns:
+            bool: 未上报的输出是否已不超过上限（或队列已关闭），等待超时时返回False
+        """
+        if not self.max_backlog:
+            return True
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._closed or self._end - self._acked <= self.max_backlog,
+                timeout=timeout
+            )
+    
+    def close(self):
+        """关闭队列（上报停止），唤醒等待中的输出读取，之后的输出只写入本地日志文件"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+    
+    def __len__(self):
+        with self._cond:
+            return self._size
+
+class OutputPump:
+    """把任务进程的输出管道复制到本地日志文件和输出队列"""
+    
+    def __init__(self, pipe, log_file, queue=None, idle_timeout=1):
+        """初始化输出读取
+        
+        Args:
+            pipe: 任务进程的输出管道（二进制文件对象）
+            log_file: 本地日志文件（二进制追加模式）
+            queue: 输出队列，为None时（不上报日志）只写入本地日志文件
+            idle_timeout: 等待管道可读的超时时间（秒），超时后检查任务进程是否已退出
+        """
+        self.pipe = pipe
+        self.log_file = log_file
+        self.queue = queue
+        self.idle_timeout = idle_timeout
+    
+    def run(self, process):
+        """读取输出直到管道关闭
+        
+        任务进程退出后，后台子进程可能仍持有管道，此时在管道空闲一个idle_timeout后结束读取。
+        
+        Args:
+            process: 任务进程（subprocess.Popen）
+        """
+        if sys.platform.startswith('win'):
+            self._run_blocking(process)
+        else:
+            self._run_selector(process)
+    
+    def _run_selector(self, process):
+        """等待管道可读后非阻塞读取"""
+        fd = self.pipe.fileno()
+        os.set_blocking(fd, False)
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while True:
+                self._wait_for_backlog(process)
+                if not selector.select(timeout=self.idle_timeout):
+                    if process.poll() is not None:
+                        break
+                    continue
+                
+                try:
+                    data = os.read(fd, READ_SIZE)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    break
+                self._handle(data)
+    
+    def _run_blocking(self, process):
+        """阻塞读取，用于不支持select管道的系统"""
+        fd = self.pipe.fileno()
+        while True:
+            self._wait_for_backlog(process)
+            data = os.read(fd, READ_SIZE)
+            if not data:
+                break
+            self._handle(data)
+    
+    def _wait_for_backlog(self, process):
+        """未上报的输出超过上限时暂停读取，任务进程退出后不再等待，读完管道中剩余的输出"""
+        if self.queue is None:
+            return
+        while not self.queue.wait_for_backlog(self.idle_timeout):
+            if process.poll() is not None:
+                return
+    
+    def _handle(self, data):
+        """把一次读到的数据写入日志文件和输出队列
+        
+        写入失败（如磁盘已满）时丢弃这段输出并继续读取，不能让任务进程阻塞在管道上。
+        
+        Args:
+            data: 读到的字节
+        """
+        try:
+            offset = self.log_file.tell()
+            self.log_file.write(data)
+            self.log_file.flush()
+        except (OSError, ValueError) as e:
+            logger.error(f"写入任务日志文件失败: {str(e)}")
+            return
+        if self.queue is not None:
+            self.queue.put(offset, data)
+        
\ No newline at end of file
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+进程树资源统计
+
+基于/proc统计一个进程及其所有子孙进程的CPU使用率、RSS和PSS。跟踪器在两次采样之间保存
+每个进程的CPU时间，每次采样每个进程只读取一次/proc/<pid>/stat，不创建psutil.Process对象。
+进程ID被复用时按进程启动时间区分。
+
+子进程通过/proc/<pid>/task/<tid>/children从已知进程向下发现，内核不支持该文件时扫描/proc
+按父进程ID建树。进程树在两次采样之间缓存：每rescan_interval秒完整发现一次，其间只重新读取
+新进程和线程数变化的进程的children文件，其他进程沿用缓存的子进程列表，两次完整发现之间
+新启动的子进程在下一次完整发现时计入（CPU时间从启动时算起，不会漏算）。
+读取smaps_rollup的开销较大，PSS每pss_interval秒读取一次，其间返回上一次的值。
+"""
+
+import os
+import logging
+
+logger = logging.getLogger("process_tracker")
+
+PROC_DIR = '/proc'
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def proc_supported():
+    """当前系统是否提供/proc进程信息"""
+    return os.path.isfile(os.path.join(PROC_DIR, 'self', 'stat'))
+
+def read_proc_stat(pid):
+    """读取进程的/proc/<pid>/stat
+    
+    Args:
+        pid: 进程ID
+    
+    Returns:
+        tuple: (父进程ID, CPU时间(时钟周期), 启动时间(开机后的时钟周期), RSS(字节), 线程数)，
+            进程不存在时返回None
+    """
+    try:
+        with open(f'{PROC_DIR}/{pid}/stat', 'rb') as f:
+            data = f.read()
+        # 进程名可能包含空格和括号，从最后一个')'之后开始解析，第一个字段为进程状态
+        fields = data[data.rindex(b')') + 2:].split()
+        return (
+            int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[19]),
+            int(fields[21]) * PAGE_SIZE, int(fields[17])
+        )
+    except (OSError, ValueError, IndexError):
+        return None
+
+def read_proc_pss(pid):
+    """读取进程的PSS（按共享进程数分摊共享页后的内存）
+    
+    Args:
+        pid: 进程ID
+    
+    Returns:
+        int: PSS(字节)，无法读取时（内核低于4.14、无权限、进程已退出）返回None
+    """
+    try:
+        with open(f'{PROC_DIR}/{pid}/smaps_rollup', 'rb') as f:
+            for line in f:
+                if line.startswith(b'Pss:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def read_uptime_ticks():
+    """读取开机后的时间（时钟周期），与/proc/<pid>/stat中的启动时间单位相同"""
+    with open(f'{PROC_DIR}/uptime', 'rb') as f:
+        return float(f.read().split()[0]) * CLOCK_TICKS
+
+class ProcessTreeTracker:
+    """进程树资源跟踪器，在多次采样之间保存每个进程的状态"""
+    
+    def __init__(self, root_pid, rescan_interval=5, pss_interval=10, include_root=True):
+        """初始化跟踪器
+        
+        Args:
+            root_pid: 根进程ID
+            rescan_interval: 完整发现子进程的间隔（秒），0表示每次采样都完整发现
+            pss_interval: 读取PSS的间隔（秒），0表示不读取PSS
+            include_root: 是否统计根进程本身，为False时只统计子孙进程（如子Agent只统计任务进程树）
+        """
+        self.root_pid = root_pid
+        self.include_root = include_root
+        self.rescan_interval = rescan_interval
+        self.pss_interval = pss_interval
+        self._processes = {}  # 进程ID -> (启动时间, 上一次采样时的CPU时间)
+        self._tree = {}  # 进程ID -> ((启动时间, 线程数), 子进程ID列表)
+        self._last_ticks = None  # 上一次采样时的开机时间（时钟周期）
+        self._last_scan = None  # 上一次完整发现子进程时的开机时间（时钟周期）
+        self._last_pss = None  # 上一次读取PSS时的开机时间（时钟周期）
+        self._memory_pss = None
+        self._use_children_file = os.path.exists(f'{PROC_DIR}/{root_pid}/task/{root_pid}/children')
+    
+    def sample(self):
+        """采集进程树的资源使用
+        
+        CPU使用率为两次采样之间的平均值，首次采样只记录基准，CPU使用率为0。
+        首次出现的进程如果在上一次完整发现之后启动，其全部CPU时间计入本次采样；
+        两次采样之间退出的进程不计入。
+        
+        Returns:
+            dict: {
+                'cpu_usage': CPU使用率(百分比，可超过100%),
+                'memory_usage': RSS总和(字节),
+                'memory_pss': PSS总和(字节)，最多滞后pss_interval秒，未读取或无法读取时为None,
+                'process_count': 进程数
+            }
+        
+        Raises:
+            ProcessLookupError: 根进程已退出
+        """
+        now = read_uptime_ticks()
+        full = self._last_scan is None or now - self._last_scan >= self.rescan_interval * CLOCK_TICKS
+        stats = self._collect(full)
+        if self.root_pid not in stats:
+            raise ProcessLookupError(f"进程不存在: PID={self.root_pid}")
+        
+        if not self.include_root:
+            stats = {pid: stat for pid, stat in stats.items() if pid != self.root_pid}
+        
+        cpu_ticks = 0
+        memory_usage = 0
+        processes = {}
+        for pid, (_, cpu, start, rss, _) in stats.items():
+            previous = self._processes.get(pid)
+            if previous is not None and previous[0] == start:
+                cpu_ticks += cpu - previous[1]
+            elif self._last_ticks is not None and start >= self._last_scan:
+                # 上一次完整发现之后启动的进程，之前的CPU时间都未计入
+                cpu_ticks += cpu
+            processes[pid] = (start, cpu)
+            memory_usage += rss
+        
+        if self.pss_interval and (self._last_pss is None or now - self._last_pss >= self.pss_interval * CLOCK_TICKS):
+            memory_pss = None
+            for pid in stats:
+                pss = read_proc_pss(pid)
+                if pss is not None:
+                    memory_pss = (memory_pss or 0) + pss
+            self._memory_pss = memory_pss
+            self._last_pss = now
+        
+        elapsed = now - self._last_ticks if self._last_ticks is not None else 0
+        self._processes = processes
+        self._last_ticks = now
+        if full:
+            self._last_scan = now
+        return {
+            'cpu_usage': cpu_ticks * 100.0 / elapsed if elapsed > 0 else 0.0,
+            'memory_usage': memory_usage,
+            'memory_pss': self._memory_pss,
+            'process_count': len(stats)
+        }
+    
+    def _collect(self, full):
+        """从根进程开始逐层读取进程树中所有进程的stat
+        
+        Args:
+            full: 是否完整发现子进程，否则启动时间和线程数都未变化的进程沿用缓存的子进程列表
+        
+        Returns:
+            dict: 进程ID -> read_proc_stat的结果
+        """
+        scanned = self._scan_children() if full and not self._use_children_file else None
+        stats = {}
+        tree = {}
+        pending = [(self.root_pid, None)]
+        while pending:
+            pid, parent = pending.pop()
+            if pid in stats:
+                continue
+            stat = read_proc_stat(pid)
+            # 缓存的子进程已退出、进程ID已被其他进程复用时跳过
+            if stat is None or (parent is not None and stat[0] != parent):
+                continue
+            stats[pid] = stat
+            
+            key = (stat[2], stat[4])
+            cached = self._tree.get(pid)
+            if scanned is not None:
+                children = scanned.get(pid, [])
+            elif not full and cached is not None and (cached[0] == key or not self._use_children_file):
+                children = cached[1]
+            elif self._use_children_file:
+                children = self._read_children(pid)
+            else:
+                children = []
+            tree[pid] = (key, children)
+            pending.extend((child, pid) for child in children)
+        self._tree = tree
+        return stats
+    
+    def _read_children(self, pid):
+        """读取进程各线程的children文件
+        
+        Returns:
+            list: 子进程ID列表
+        """
+        children = []
+        try:
+            tids = os.listdir(f'{PROC_DIR}/{pid}/task')
+        except OSError:
+            return children
+        for tid in tids:
+            try:
+                with open(f'{PROC_DIR}/{pid}/task/{tid}/children', 'rb') as f:
+                    children.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+        return children
+    
+    def _scan_children(self):
+        """扫描/proc下所有进程，按父进程ID建立子进程列表
+        
+        Returns:
+            dict: 父进程ID -> 子进程ID列表
+        """
+        children = {}
+        for name in os.listdir(PROC_DIR):
+            if not name.isdigit():
+                continue
+            stat = read_proc_stat(int(name))
+            if stat is not None:
+                children.setdefault(stat[0], []).append(int(name))
+        return children
+        
\ No newline at end of file
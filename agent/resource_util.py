@@ -5,12 +5,24 @@
 资源监控工具
 
 用于获取系统资源信息，包括CPU、内存和GPU
+
+调用start_sampler后，后台采样线程按固定间隔采集指定进程（含子进程）的CPU、内存和GPU信息，
+进程树的CPU、RSS和PSS由ProcessTreeTracker基于/proc统计（没有/proc时使用psutil），
+保存为一份不可变的快照，get_resource_info直接读取最新快照，不再在调用时等待采样间隔。
+快照中附带最近一个时间窗口内CPU和内存使用量的最小值、平均值和最大值。
+
+进程内只有一个ResourceUtil实例（get_resource_util），NVML只初始化一次，GPU句柄在初始化时获取并缓存，
+每次采样每个GPU只查询一次使用率和显存，设备不支持的查询不再重复调用；
+cgroup限制文件按修改时间缓存，文件未修改且未超过CGROUP_CACHE_TTL时不重新读取。
 """
 
 import os
 import time
 import logging
+import threading
+from collections import deque
 import psutil
+from agent.process_tracker import ProcessTreeTracker, proc_supported
 
 # 配置日志
 logging.basicConfig(
@@ -19,11 +31,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger("resource_util")
 
+# cgroup限制文件缓存的最长有效期（秒），部分内核写入cgroup文件时不更新修改时间
+CGROUP_CACHE_TTL = 60
+
 class ResourceUtil:
     """资源监控工具类，提供获取系统资源信息的方法"""
     
-    def __init__(self):
-        """初始化资源监控工具"""
+    def __init__(self, cgroup_cache_ttl=CGROUP_CACHE_TTL):
+        """初始化资源监控工具
+        
+        Args:
+            cgroup_cache_ttl: cgroup限制文件缓存的最长有效期（秒），0表示每次都重新读取
+        """
         # 尝试导入pynvml，如果失败则记录警告
         try:
             import pynvml
@@ -36,6 +55,20 @@ class ResourceUtil:
         except Exception as e:
             logger.warning(f"初始化NVML失败: {str(e)}")
             self.has_gpu = False
+        
+        # GPU句柄 [(GPU ID, 句柄)]，设备列表在进程运行期间不变
+        self._gpu_handles = self._load_gpu_handles() if self.has_gpu else []
+        # 设备不支持的查询 {(GPU ID, 查询名称)}，之后的采样不再调用
+        self._gpu_unsupported = set()
+        
+        # cgroup限制文件缓存 路径 -> (修改时间, 读取时间, 内容)
+        self.cgroup_cache_ttl = cgroup_cache_ttl
+        self._cgroup_cache = {}
+        
+        # 后台采样
+        self._snapshot = None  # 最新资源快照，采样线程整体替换，读取时不加锁
+        self._sampler_thread = None
+        self._sampler_stop = threading.Event()
     
     def __del__(self):
         """清理资源"""
@@ -66,20 +99,26 @@ class ResourceUtil:
             except Exception as e:
                 logger.warning(f"解析CUDA_VISIBLE_DEVICES环境变量失败: {str(e)}")
         
-        # 如果没有环境变量或解析失败，尝试获取所有GPU
-        if not self.has_gpu:
-            return gpu_ids
+        # 如果没有环境变量或解析失败，返回所有GPU
+        return [gpu_id for gpu_id, _ in self._gpu_handles]
+        
+    def _load_gpu_handles(self):
+        """获取所有GPU的句柄
         
+        Returns:
+            list: [(GPU ID, 句柄)]
+        """
+        handles = []
         try:
             # 获取GPU设备数量
             device_count = self.pynvml.nvmlDeviceGetCount()
             
             for i in range(device_count):
-                gpu_ids.append(str(i))
+                handles.append((str(i), self.pynvml.nvmlDeviceGetHandleByIndex(i)))
         except Exception as e:
-            logger.error(f"获取可用GPU ID失败: {str(e)}")
+            logger.error(f"获取GPU句柄失败: {str(e)}")
         
-        return gpu_ids
+        return handles
 
     def get_gpu_info(self):
         """获取指定GPU的ID、使用率、显存使用量
@@ -106,57 +145,70 @@ class ResourceUtil:
             return result
         
         # 获取可用的GPU ID列表
-        available_gpu_ids = self.get_available_gpu_ids()
+        available_gpu_ids = set(self.get_available_gpu_ids())
         if not available_gpu_ids:
             return result
         
         try:
-            # 获取GPU设备数量
-            device_count = self.pynvml.nvmlDeviceGetCount()
-            
-            for i in range(device_count):
-                gpu_id = str(i)
-                
+            # 使用缓存的GPU句柄，每个设备查询一次
+            for gpu_id, handle in self._gpu_handles:
                 # 只处理可用GPU列表中包含的GPU
-                if gpu_id not in available_gpu_ids:
-                    continue
-                
-                # 获取GPU句柄
-                handle = self.pynvml.nvmlDeviceGetHandleByIndex(i)
-                
-                # 初始化GPU信息字典
-                gpu_info = {
-                    'gpu_id': gpu_id,
-                    'usage': 0.0,
-                    'memory_used': 0,
-                    'memory_total': 0,
-                    'memory_usage': 0.0,
-                    'is_available': True  # 默认可用
-                }
-                
-                # 获取GPU使用率
-                try:
-                    utilization = self.pynvml.nvmlDeviceGetUtilizationRates(handle)
-                    gpu_info['usage'] = utilization.gpu / 100.0
-                except:
-                    pass
-                
-                # 获取显存信息
-                try:
-                    mem_info = self.pynvml.nvmlDeviceGetMemoryInfo(handle)
-                    gpu_info['memory_total'] = mem_info.total
-                    gpu_info['memory_used'] = mem_info.used
-                    gpu_info['memory_usage'] = mem_info.used / mem_info.total if mem_info.total > 0 else 0.0
-                except:
-                    pass
-                
-                # 添加到结果列表
-                result.append(gpu_info)
+                if gpu_id in available_gpu_ids:
+                    result.append(self._query_gpu(gpu_id, handle))
         except Exception as e:
             logger.error(f"获取GPU信息失败: {str(e)}")
         
         return result
     
+    def _query_gpu(self, gpu_id, handle):
+        """查询单个GPU的使用率和显存
+        
+        NVML没有同时返回使用率和显存的接口，也没有多设备批量查询，每个设备每次采样调用
+        nvmlDeviceGetUtilizationRates和nvmlDeviceGetMemoryInfo各一次（显存总量、已用量在同一次调用中返回）。
+        设备不支持的查询（如MIG实例的使用率）记录下来，之后不再调用。
+        
+        Args:
+            gpu_id: GPU ID
+            handle: GPU句柄
+        
+        Returns:
+            dict: GPU信息（格式见get_gpu_info）
+        """
+        gpu_info = {
+            'gpu_id': gpu_id,
+            'usage': 0.0,
+            'memory_used': 0,
+            'memory_total': 0,
+            'memory_usage': 0.0,
+            'is_available': True  # 默认可用
+        }
+        
+        # 获取GPU使用率
+        if (gpu_id, 'utilization') not in self._gpu_unsupported:
+            try:
+                utilization = self.pynvml.nvmlDeviceGetUtilizationRates(handle)
+                gpu_info['usage'] = utilization.gpu / 100.0
+            except Exception as e:
+                self._check_gpu_unsupported(gpu_id, 'utilization', e)
+        
+        # 获取显存信息
+        if (gpu_id, 'memory') not in self._gpu_unsupported:
+            try:
+                mem_info = self.pynvml.nvmlDeviceGetMemoryInfo(handle)
+                gpu_info['memory_total'] = mem_info.total
+                gpu_info['memory_used'] = mem_info.used
+                gpu_info['memory_usage'] = mem_info.used / mem_info.total if mem_info.total > 0 else 0.0
+            except Exception as e:
+                self._check_gpu_unsupported(gpu_id, 'memory', e)
+        
+        return gpu_info
+    
+    def _check_gpu_unsupported(self, gpu_id, query, error):
+        """NVML返回NOT_SUPPORTED时记录设备不支持该查询，其他错误（可能是暂时的）下次采样重试"""
+        if getattr(error, 'value', None) == getattr(self.pynvml, 'NVML_ERROR_NOT_SUPPORTED', 3):
+            self._gpu_unsupported.add((gpu_id, query))
+            logger.info(f"GPU不支持该查询，之后不再调用: GPU ID={gpu_id}, 查询={query}")
+    
     def get_cpu_core_count(self):
         """获取可用CPU核心数
         
@@ -168,23 +220,21 @@ class ResourceUtil:
         # 首先尝试从cgroups获取限制（适用于容器环境）
         try:
             # 检查cgroup v2
-            if os.path.exists('/sys/fs/cgroup/cpu.max'):
-                with open('/sys/fs/cgroup/cpu.max', 'r') as f:
-                    content = f.read().strip()
-                    if content != 'max':
-                        quota, period = map(int, content.split())
-                        if quota > 0 and period > 0:
-                            return max(1, quota // period)
+            content = self._read_cgroup_file('/sys/fs/cgroup/cpu.max')
+            if content is not None:
+                if content != 'max':
+                    quota, period = map(int, content.split())
+                    if quota > 0 and period > 0:
+                        return max(1, quota // period)
             
             # 检查cgroup v1
-            elif os.path.exists('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') and \
-                 os.path.exists('/sys/fs/cgroup/cpu/cpu.cfs_period_us'):
-                with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', 'r') as f:
-                    quota = int(f.read().strip())
-                with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us', 'r') as f:
-                    period = int(f.read().strip())
-                if quota > 0 and period > 0:
-                    return max(1, quota // period)
+            else:
+                quota = self._read_cgroup_file('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+                period = self._read_cgroup_file('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+                if quota is not None and period is not None:
+                    quota, period = int(quota), int(period)
+                    if quota > 0 and period > 0:
+                        return max(1, quota // period)
         except Exception as e:
             logger.warning(f"获取cgroups CPU限制失败: {str(e)}")
         
@@ -202,16 +252,16 @@ class ResourceUtil:
         # 首先尝试从cgroups获取限制（适用于容器环境）
         try:
             # 检查cgroup v2
-            if os.path.exists('/sys/fs/cgroup/memory.max'):
-                with open('/sys/fs/cgroup/memory.max', 'r') as f:
-                    content = f.read().strip()
-                    if content != 'max':
-                        return int(content)
+            content = self._read_cgroup_file('/sys/fs/cgroup/memory.max')
+            if content is not None:
+                if content != 'max':
+                    return int(content)
             
             # 检查cgroup v1
-            elif os.path.exists('/sys/fs/cgroup/memory/memory.limit_in_bytes'):
-                with open('/sys/fs/cgroup/memory/memory.limit_in_bytes', 'r') as f:
-                    limit = int(f.read().strip())
+            else:
+                content = self._read_cgroup_file('/sys/fs/cgroup/memory/memory.limit_in_bytes')
+                if content is not None:
+                    limit = int(content)
                     # 非无限制的值（不等于 2^64-1）
                     if limit < 2**63:
                         return limit
@@ -220,6 +270,31 @@ class ResourceUtil:
         
         # 如果无法从cgroups获取，使用psutil获取系统总内存
         return psutil.virtual_memory().total
+    
+    def _read_cgroup_file(self, path):
+        """读取cgroup限制文件，文件修改时间不变且缓存未过期时返回缓存的内容
+        
+        Args:
+            path: 文件路径
+        
+        Returns:
+            str: 去掉首尾空白的文件内容，文件不存在时返回None
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._cgroup_cache.pop(path, None)
+            return None
+        
+        now = time.monotonic()
+        cached = self._cgroup_cache.get(path)
+        if cached is not None and cached[0] == mtime and now - cached[1] < self.cgroup_cache_ttl:
+            return cached[2]
+        
+        with open(path, 'r') as f:
+            content = f.read().strip()
+        self._cgroup_cache[path] = (mtime, now, content)
+        return content
 
     def get_cpu_usage(self, pid=None, interval=0.1):
         """获取CPU使用率
@@ -309,6 +384,8 @@ class ResourceUtil:
     def get_resource_info(self, pid=None):
         """获取资源信息汇总
         
+        采样线程正在采集同一进程时直接返回最新快照，否则同步采样（会等待CPU采样间隔）
+        
         Args:
             pid: 进程ID，None表示获取系统总体资源
             
@@ -321,9 +398,20 @@ class ResourceUtil:
                     'memory_total_usage': 系统总内存使用量(字节),
                     'memory_usage': 内存使用量(字节),
                     'gpu_info': GPU信息列表,
-                    'gpu_ids': 可用GPU ID列表
+                    'gpu_ids': 可用GPU ID列表,
+                    'memory_pss': 进程树的PSS(字节)，无法读取时为None（仅来自采样快照时）,
+                    'usage_stats': 采样窗口内的统计（仅来自采样快照时）
+                        {
+                            'cpu_usage': {'min': 最小值, 'avg': 平均值, 'max': 最大值},
+                            'memory_usage': {'min': 最小值, 'avg': 平均值, 'max': 最大值},
+                            'window': 窗口内的采样次数
+                        }
                 }
         """
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[0] == pid and self.is_sampling():
+            return self._copy_info(snapshot[1])
+        
         result = {
             'cpu_cores': self.get_cpu_core_count(),
             'cpu_usage': self.get_cpu_usage(pid),
@@ -336,8 +424,160 @@ class ResourceUtil:
         
         return result
 
+    def start_sampler(self, pid=None, interval=1, window=60, on_sample=None, rescan_interval=5, pss_interval=10,
+                      include_root=True):
+        """启动后台采样线程
+        
+        首次采样只记录CPU时间基准，一个采样间隔后才有快照，在此之前get_resource_info同步采样
+        
+        Args:
+            pid: 采集的进程ID（含子进程），None表示系统总体资源
+            interval: 采样间隔（秒）
+            window: 统计最小值、平均值、最大值的时间窗口（秒）
+            on_sample: 每次采样后调用的函数，参数为本次的资源信息（只读），在采样线程中调用
+            rescan_interval: 完整发现子进程的间隔（秒），见ProcessTreeTracker
+            pss_interval: 读取进程树PSS的间隔（秒），0表示不读取PSS
+            include_root: 是否统计pid本身，为False时只统计其子孙进程
+        """
+        if self.is_sampling():
+            return
+        max_samples = max(1, int(window / interval))
+        self._snapshot = None
+        self._sampler_stop.clear()
+        self._sampler_thread = threading.Thread(
+            target=self._sample_loop,
+            args=(pid, interval, max_samples, on_sample, rescan_interval, pss_interval, include_root),
+            name='resource-sampler', daemon=True
+        )
+        self._sampler_thread.start()
+        logger.info(f"资源采样线程已启动: PID={pid}, 间隔={interval}秒, 窗口={window}秒")
+    
+    def stop_sampler(self):
+        """停止后台采样线程"""
+        self._sampler_stop.set()
+        if self._sampler_thread and self._sampler_thread is not threading.current_thread():
+            self._sampler_thread.join(timeout=5)
+        self._sampler_thread = None
+        self._snapshot = None
+    
+    def is_sampling(self):
+        """采样线程是否在运行"""
+        return self._sampler_thread is not None and self._sampler_thread.is_alive()
+    
+    def _sample_loop(self, pid, interval, max_samples, on_sample, rescan_interval, pss_interval, include_root):
+        """采样线程，每次采样后整体替换快照"""
+        tracker = None
+        if pid is not None and proc_supported():
+            tracker = ProcessTreeTracker(pid, rescan_interval=rescan_interval, pss_interval=pss_interval,
+                                         include_root=include_root)
+        processes = {}  # 没有/proc时使用: 进程ID -> 上一次采样的psutil.Process
+        samples = deque(maxlen=max_samples)  # 窗口内的(CPU使用率, 内存使用量)
+        primed = False
+        while not self._sampler_stop.is_set():
+            try:
+                memory_pss = None
+                if pid is None:
+                    cpu_usage = psutil.cpu_percent(interval=None)
+                    memory_usage = psutil.virtual_memory().used
+                elif tracker is not None:
+                    usage = tracker.sample()
+                    cpu_usage, memory_usage, memory_pss = usage['cpu_usage'], usage['memory_usage'], usage['memory_pss']
+                else:
+                    cpu_usage, memory_usage = self._sample_process_tree(pid, processes, include_root)
+                
+                if primed:
+                    samples.append((cpu_usage, memory_usage))
+                    info = {
+                        'cpu_cores': self.get_cpu_core_count(),
+                        'cpu_usage': cpu_usage,
+                        'memory_total': self.get_memory_total(),
+                        'memory_total_usage': self.get_memory_usage(),
+                        'memory_usage': memory_usage,
+                        'memory_pss': memory_pss,
+                        'gpu_info': self.get_gpu_info(),
+                        'gpu_ids': self.get_available_gpu_ids(),
+                        'usage_stats': {
+                            'cpu_usage': self._window_stats([sample[0] for sample in samples]),
+                            'memory_usage': self._window_stats([sample[1] for sample in samples]),
+                            'window': len(samples)
+                        }
+                    }
+                    self._snapshot = (pid, info)
+                    if on_sample:
+                        on_sample(info)
+                primed = True
+            except (psutil.NoSuchProcess, ProcessLookupError):
+                logger.warning(f"采样进程已退出: PID={pid}")
+                break
+            except Exception as e:
+                logger.error(f"资源采样失败: {str(e)}")
+            
+            self._sampler_stop.wait(interval)
+    
+    def _sample_process_tree(self, pid, processes, include_root=True):
+        """采集进程（含递归子进程）的CPU使用率和内存使用量
+        
+        psutil.Process.cpu_percent返回距上一次调用的CPU使用率，因此复用上一次采样的进程对象，
+        新出现的进程本次只记录基准
+        
+        Args:
+            pid: 进程ID
+            processes: 上一次采样的进程对象，采样后更新为本次的进程对象
+            include_root: 是否统计pid本身，为False时只统计其子孙进程
+        
+        Returns:
+            tuple: (CPU使用率, 内存使用量(字节))
+        """
+        root = processes.get(pid) or psutil.Process(pid)
+        current = {pid: root}
+        for child in root.children(recursive=True):
+            current[child.pid] = processes.get(child.pid, child)
+        
+        cpu_usage = 0.0
+        memory_usage = 0
+        for process in current.values():
+            if not include_root and process is root:
+                continue
+            try:
+                with process.oneshot():
+                    cpu_usage += process.cpu_percent()
+                    memory_usage += process.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        
+        processes.clear()
+        processes.update(current)
+        return cpu_usage, memory_usage
+    
+    @staticmethod
+    def _window_stats(values):
+        """计算窗口内的最小值、平均值和最大值"""
+        return {'min': min(values), 'avg': sum(values) / len(values), 'max': max(values)}
+    
+    @staticmethod
+    def _copy_info(info):
+        """复制快照，调用方修改返回值不会影响快照"""
+        result = dict(info)
+        result['gpu_info'] = [dict(gpu) for gpu in info['gpu_info']]
+        result['gpu_ids'] = list(info['gpu_ids'])
+        stats = info['usage_stats']
+        result['usage_stats'] = {
+            'cpu_usage': dict(stats['cpu_usage']),
+            'memory_usage': dict(stats['memory_usage']),
+            'window': stats['window']
+        }
+        return result
+
+
+# 全局资源工具实例，首次使用时创建
+resource_util = None
+resource_util_lock = threading.Lock()
 
 def get_resource_util():
     """获取资源工具实例"""
-    resource_util = ResourceUtil()
+    global resource_util
+    if resource_util is None:
+        with resource_util_lock:
+            if resource_util is None:
+                resource_util = ResourceUtil()
     return resource_util
@@ -28,6 +28,12 @@ if ROOT_DIR not in sys.path:
 
 # 导入资源监控工具
 from agent.resource_util import get_resource_util
+from agent.ws_transport import WebSocketTransport, build_ws_url
+from agent.local_hub import HubClient
+from agent.task_usage import TaskUsageCollector
+from agent.output_pump import OutputQueue, OutputPump
+from agent.log_shipper import LogShipper
+from backend.utils.heartbeat_codec import HeartbeatEncoder, encode_body
 
 # 导入配置
 from config import Config
@@ -46,13 +52,14 @@ logger = logging.getLogger("sub_agent")
 class SubAgent:
     """子Agent类，负责执行单个任务并上报状态"""
     
-    def __init__(self, main_agent_id, task, server_url=None):
+    def __init__(self, main_agent_id, task, server_url=None, hub_socket=None):
         """初始化子Agent
         
         Args:
             main_agent_id: 主Agent ID
             task: 任务
             server_url: 服务器URL
+            hub_socket: 主Agent心跳汇聚的套接字路径，为None时直接向服务器发送心跳
             cpu_cores: 分配的CPU核心数
             gpu_ids: 分配的GPU ID列表
         """
@@ -67,15 +74,33 @@ class SubAgent:
         self.heartbeat_thread = None
         self.start_time = datetime.now()
         
+        # 主Agent心跳汇聚和WebSocket通道（可选），不可用时使用HTTP心跳
+        self.hub_client = HubClient(hub_socket) if hub_socket else None
+        self.ws_transport = None
+        
+        # 心跳只发送变化的资源字段，静态信息在注册时上报
+        self.heartbeat_encoder = HeartbeatEncoder(keyframe_interval=Config.HEARTBEAT_KEYFRAME_INTERVAL)
+        
         # 资源信息
         self.cpu_cores = task['cpu_cores']
         self.gpu_ids = task['gpu_ids']
         self.resource_util = get_resource_util()
+        # 任务生命周期内的资源使用汇总，任务结束后在最后一次心跳中上报
+        self.task_usage = TaskUsageCollector(self.gpu_ids)
+        # 后台采样任务进程树的资源使用（不含子Agent本身），心跳直接读取最新的资源快照
+        self.resource_util.start_sampler(
+            os.getpid(), Config.RESOURCE_SAMPLE_INTERVAL, Config.RESOURCE_SAMPLE_WINDOW,
+            on_sample=self.task_usage.add_sample,
+            rescan_interval=Config.PROCESS_TREE_RESCAN_INTERVAL,
+            pss_interval=Config.PROCESS_PSS_INTERVAL,
+            include_root=False
+        )
         
         # 任务执行
         self.task_process = None
-        self.task_output_thread = None
-        self.task_output_buffer = []
+        # 任务输出在上报前的有界缓存和按偏移分块上报，注册成功后创建
+        self.task_output = None
+        self.log_shipper = None
         self.task_status = "waiting"  # blocked, waiting, running, completed, failed, canceled
         self.task_start_time = None
         self.task_script_file = None
@@ -84,6 +109,10 @@ class SubAgent:
         self.log_dir = os.path.join(ROOT_DIR, 'data', 'logs', 'agents')
         os.makedirs(self.log_dir, exist_ok=True)
         
+        # 任务日志文件，同一任务重新执行时清空，日志上报从偏移0开始读取
+        self.task_log_file = os.path.join(self.log_dir, f"task_{self.task_id}.log")
+        open(self.task_log_file, 'wb').close()
+        
         # 设置子Agent的日志输出到文件
         file_handler = logging.FileHandler(os.path.join(self.log_dir, f"{self.name}.log"))
         file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
@@ -104,6 +133,9 @@ class SubAgent:
                 'name': self.name,
                 'main_agent_id': self.main_agent_id,
                 'task_id': self.task_id,
+                'cpu_cores': self.cpu_cores,
+                'gpu_ids': self.gpu_ids,
+                'memory_total': self.resource_util.get_memory_total()
             }
             
             response = requests.post(url, json=data)
@@ -162,32 +194,29 @@ class SubAgent:
                 'status': self.task_status
             }
             
-            # 添加任务输出
-            if self.task_output_buffer:
-                # 获取并清空缓冲区
-                with threading.Lock():
-                    output = ''.join(self.task_output_buffer)
-                    self.task_output_buffer = []
-                
-                if output:
-                    task_info['log'] = output
+            # 任务结束后附带资源使用汇总
+            if self.task_status in ('completed', 'failed'):
+                usage = self.task_usage.summary()
+                if usage:
+                    task_info['accounting'] = usage
             
-            data = {
-                'resource_info': resource_info,
-                'task_info': task_info
-            }
+            # 只发送变化的资源字段，任务输出由log_shipper单独上报
+            data = self.heartbeat_encoder.encode(resource_info)
+            data['task_info'] = task_info
             
-            response = requests.post(url, json=data)
+            # 优先交给主Agent汇聚转发，其次通过WebSocket发送，都失败时回退到HTTP
+            if self.send_hub_heartbeat(data) or self.send_ws_heartbeat(data):
+                return True
+            
+            body, headers = encode_body(data, Config.HEARTBEAT_COMPRESS_MIN_SIZE)
+            response = requests.post(url, data=body, headers=headers)
             
             if response.status_code == 200:
                 result = response.json()
                 if result.get('success'):
                     # 处理服务器响应
-                    action = result['data'].get('action', 'continue')
-                    if action == 'quit':
-                        logger.info("收到停止指令，准备退出")
-                        self.close()
-                    
+                    self.heartbeat_encoder.commit(result['data'])
+                    self.handle_action(result['data'].get('action', 'continue'))
                     return True
                 else:
                     logger.error(f"心跳处理失败: {result.get('message', '未知错误')}")
@@ -199,6 +228,71 @@ class SubAgent:
             logger.error(f"心跳发送异常: {str(e)}")
             return False
     
+    def send_hub_heartbeat(self, data):
+        """把心跳交给主Agent汇聚转发
+        
+        Args:
+            data: 编码后的心跳数据，包含任务状态和新日志
+        
+        Returns:
+            bool: 主Agent是否已接收，未启用或主Agent不可用时返回False
+        """
+        if not self.hub_client:
+            return False
+        
+        reply = self.hub_client.request(self.id, data)
+        if reply is None:
+            return False
+        
+        # 回复中是服务器对上一批心跳的响应
+        self.heartbeat_encoder.commit(reply)
+        self.handle_action(reply.get('action', 'continue'))
+        return True
+    
+    def send_ws_heartbeat(self, data):
+        """通过WebSocket发送心跳
+        
+        Args:
+            data: 编码后的心跳数据，包含任务状态和新日志
+        
+        Returns:
+            bool: 心跳是否成功，WebSocket未启用或不可用时返回False
+        """
+        if not self.ws_transport or not self.ws_transport.connected:
+            return False
+        
+        reply = self.ws_transport.request({'type': 'heartbeat', 'data': data})
+        if reply is None:
+            return False
+        
+        self.heartbeat_encoder.commit(reply.get('data'))
+        self.handle_action((reply.get('data') or {}).get('action', 'continue'))
+        return True
+    
+    def handle_ws_connect(self):
+        """WebSocket连接（重连）成功，下一次心跳发送全量资源信息"""
+        self.heartbeat_encoder.reset()
+    
+    def handle_ws_message(self, message):
+        """处理服务器通过WebSocket推送的操作"""
+        if message.get('type') != 'action':
+            return
+        
+        # close会等待心跳线程和WebSocket通道结束，不能在通道线程中直接调用
+        action = (message.get('data') or {}).get('action')
+        if action == 'quit':
+            threading.Thread(target=self.handle_action, args=(action,), daemon=True).start()
+    
+    def handle_action(self, action):
+        """处理服务器下发的操作
+        
+        Args:
+            action: 操作类型，子Agent只处理'quit'
+        """
+        if action == 'quit':
+            logger.info("收到停止指令，准备退出")
+            self.close()
+    
     def run_task(self):
         """启动任务执行
         
@@ -242,61 +336,43 @@ class SubAgent:
             self.task_start_time = datetime.now()
             
             # 添加任务开始标记到日志
-            self.task_output_buffer.append(f"=================== start: {self.task_start_time} ===================\n")
-            
-            # 设置任务日志文件
-            self.task_log_file = os.path.join(self.log_dir, f"task_{self.task_id}.log")
+            self.write_output(f"=================== start: {self.task_start_time} ===================\n")
             
-            # 启动进程
-            with open(self.task_log_file, 'w', buffering=1) as log_file:  # 使用行缓冲
+            # 启动进程，输出通过管道读取，同时写入日志文件和输出队列
+            with open(self.task_log_file, 'ab') as log_file:
                 # 根据操作系统类型选择不同的启动方式
                 if sys.platform.startswith('win'):
                     # Windows 上直接执行脚本文件
                     self.task_process = subprocess.Popen(
                         self.task_script_file,
-                        stdout=log_file,
+                        stdout=subprocess.PIPE,
                         stderr=subprocess.STDOUT,
                         env=env,
-                        shell=True,  # Windows 上需要 shell=True 来执行批处理文件
-                        text=True,
-                        bufsize=1    # 使用行缓冲
+                        shell=True  # Windows 上需要 shell=True 来执行批处理文件
                     )
                 else:
                     # Linux/macOS 上使用 bash 执行
                     self.task_process = subprocess.Popen(
                         ['/bin/bash', self.task_script_file],
-                        stdout=log_file,
+                        stdout=subprocess.PIPE,
                         stderr=subprocess.STDOUT,
-                        env=env,
-                        text=True,
-                        bufsize=1    # 使用行缓冲
+                        env=env
                     )
-            logger.info(f"任务进程已启动: PID={self.task_process.pid}")
-            
-            # 确保日志文件存在
-            while not os.path.exists(self.task_log_file) and self.running:
-                time.sleep(0.1)
-
-            # 使用单独的文件句柄读取日志    
-            with open(self.task_log_file, 'r') as f:
-                # 跳到文件末尾
-                f.seek(0, 2)
+                logger.info(f"任务进程已启动: PID={self.task_process.pid}")
+                self.task_usage.start()
                 
-                # 循环直到进程结束
-                while True:
-                    line = f.readline()
-                    if line:
-                        # 将输出添加到缓冲区
-                        with threading.Lock():
-                            self.task_output_buffer.append(line)
-                    else:
-                        if self.task_process.poll() is not None:
-                            break
-                        # 没有新内容，短暂等待
-                        time.sleep(0.1)
-
-            # 获取退出码 - 现在只需获取一次，因为poll()已经检测到进程结束
+                # 读取输出直到任务进程结束
+                pump = OutputPump(self.task_process.stdout, log_file, self.task_output)
+                try:
+                    pump.run(self.task_process)
+                finally:
+                    self.task_process.stdout.close()
+                self.task_process.wait()
+            
+            # 获取退出码
             exit_code = self.task_process.returncode
+            # 任务进程已被回收，getrusage中包含其CPU时间
+            self.task_usage.finish()
             
             # 进程结束，记录状态
             end_time = datetime.now()
@@ -304,8 +380,7 @@ class SubAgent:
             
             # 添加任务结束标记到日志
             end_message = f"=================== end: {end_time}, time: {duration:.2f}s, exit_code: {exit_code} ===================\n"
-            with threading.Lock():
-                self.task_output_buffer.append(end_message)
+            self.write_output(end_message)
             
             # 根据退出码设置任务状态
             if exit_code == 0:
@@ -318,6 +393,10 @@ class SubAgent:
             # 任务完成，可以退出
             self.running = False
 
+            # 先上报剩余的任务输出，任务结束时服务器上的日志已完整
+            if self.log_shipper:
+                self.log_shipper.flush()
+            
             # 发送最后一次心跳
             self.send_heartbeat()
 
@@ -325,9 +404,26 @@ class SubAgent:
         except Exception as e:
             logger.error(f"启动任务执行失败: {str(e)}")
             self.task_status = "failed"
-            self.task_output_buffer.append(f"failed: {str(e)}\n{traceback.format_exc()}\n")
+            self.write_output(f"failed: {str(e)}\n{traceback.format_exc()}\n")
             return False
     
+    def write_output(self, text):
+        """把子Agent生成的内容（开始、结束标记和异常信息）追加到本地任务日志文件，与任务输出一起上报
+        
+        Args:
+            text: 文本
+        """
+        data = text.encode('utf-8')
+        try:
+            with open(self.task_log_file, 'ab') as f:
+                offset = f.tell()
+                f.write(data)
+        except OSError as e:
+            logger.error(f"写入任务日志文件失败: {str(e)}")
+            return
+        if self.task_output is not None:
+            self.task_output.put(offset, data)
+    
     def close(self):
         """清理资源并退出"""
         logger.info("开始清理资源...")
@@ -347,6 +443,10 @@ class SubAgent:
                 except:
                     pass
         
+        # 上报剩余的任务输出
+        if self.log_shipper:
+            self.log_shipper.close(Config.LOG_SHIP_CLOSE_TIMEOUT)
+        
         # 删除临时脚本文件
         if self.task_script_file and os.path.exists(self.task_script_file):
             try:
@@ -355,14 +455,19 @@ class SubAgent:
             except:
                 pass
         
-        # 等待任务输出线程结束
-        if self.task_output_thread and self.task_output_thread.is_alive():
-            self.task_output_thread.join(timeout=3)
-        
         # 等待心跳线程结束
         if self.heartbeat_thread and self.heartbeat_thread.is_alive():
             self.heartbeat_thread.join(timeout=3)
         
+        # 关闭主Agent心跳汇聚连接和WebSocket通道
+        if self.hub_client:
+            self.hub_client.close()
+        if self.ws_transport:
+            self.ws_transport.close()
+        
+        # 停止资源采样
+        self.resource_util.stop_sampler()
+        
         logger.info("资源清理完成")
     
 
@@ -377,6 +482,28 @@ class SubAgent:
         # 设置运行标志
         self.running = True
         
+        # 建立WebSocket通道
+        if Config.AGENT_USE_WEBSOCKET and self.id:
+            self.ws_transport = WebSocketTransport(
+                build_ws_url(self.server_url, self.id, Config.WEBSOCKET_PORT),
+                on_message=self.handle_ws_message,
+                on_connect=self.handle_ws_connect
+            )
+            self.ws_transport.start(wait=Config.AGENT_WEBSOCKET_CONNECT_TIMEOUT)
+        
+        # 开始上报任务输出，未注册时输出无法上报，只保留在本地日志文件中
+        # 日志块与心跳一样优先交给主Agent汇聚转发，使用单独的连接，不与心跳互相等待
+        if self.id:
+            self.task_output = OutputQueue(Config.TASK_OUTPUT_QUEUE_SIZE, Config.TASK_OUTPUT_MAX_BACKLOG)
+            self.log_shipper = LogShipper(
+                self.server_url, self.task_id, self.id, self.task_log_file, self.task_output,
+                chunk_size=Config.LOG_CHUNK_SIZE,
+                interval=Config.LOG_SHIP_INTERVAL,
+                compress_min_size=Config.LOG_CHUNK_COMPRESS_MIN_SIZE,
+                hub_client=HubClient(self.hub_client.socket_path) if self.hub_client else None
+            )
+            self.log_shipper.start()
+        
         # 开始心跳
         self.start_heartbeat()
 
@@ -396,6 +523,7 @@ if __name__ == "__main__":
     parser.add_argument("--main-id", required=True, help="主Agent ID")
     parser.add_argument("--task", required=True, help="任务")
     parser.add_argument("--server", help="服务器URL")
+    parser.add_argument("--hub-socket", help="主Agent心跳汇聚的套接字路径")
     
     args = parser.parse_args()
     
@@ -405,6 +533,7 @@ if __name__ == "__main__":
             main_agent_id=args.main_id,
             task=json.loads(args.task),
             server_url=args.server,
+            hub_socket=args.hub_socket,
         )
         agent.run()
     except Exception as e:
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务资源使用汇总
+
+子Agent在任务运行期间接收资源采样线程的每次采样（只统计任务进程树，不含子Agent本身），记录CPU使用率、
+内存和分配给任务的GPU的峰值与平均值；任务结束后用getrusage(RUSAGE_CHILDREN)取得已回收的任务进程树的CPU时间
+和其中单个进程的最大RSS，汇总结果在最后一次心跳中上报，服务器保存到task_accounting表。
+采样得到的进程树RSS总和峰值（peak_rss）与getrusage的单进程RSS峰值（rusage_max_rss）含义不同，分别上报：
+前者可能漏掉两次采样之间的短暂峰值，后者不包含同时运行的其他进程。
+"""
+
+import sys
+import time
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+class TaskUsageCollector:
+    """任务生命周期内的资源使用汇总"""
+    
+    def __init__(self, gpu_ids=None):
+        """初始化汇总
+        
+        Args:
+            gpu_ids: 分配给任务的GPU ID列表，只统计这些GPU
+        """
+        self.gpu_ids = set(gpu_ids or [])
+        self._lock = threading.Lock()
+        self._start_time = None
+        self._end_time = None
+        self._start_rusage = None
+        self._end_rusage = None
+        self._last_sample_time = None
+        self._samples = 0
+        self._sampled_cpu_seconds = 0.0  # 按采样积分得到的CPU时间，没有getrusage时使用
+        self._cpu_usage_peak = 0.0
+        self._peak_rss = 0
+        self._peak_pss = None
+        self._gpu_samples = 0
+        self._gpu_usage_sum = 0.0
+        self._gpu_usage_peak = 0.0
+        self._gpu_memory_peak = 0
+    
+    @staticmethod
+    def _children_rusage():
+        """已回收子进程的资源使用，不支持时返回None"""
+        return resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+    
+    def start(self):
+        """任务进程启动"""
+        with self._lock:
+            self._start_time = time.monotonic()
+            self._start_rusage = self._children_rusage()
+    
+    def finish(self):
+        """任务进程已结束并被回收"""
+        with self._lock:
+            if self._start_time is None or self._end_time is not None:
+                return
+            self._end_time = time.monotonic()
+            self._end_rusage = self._children_rusage()
+    
+    def add_sample(self, info):
+        """记录一次资源采样，作为ResourceUtil.start_sampler的on_sample回调
+        
+        Args:
+            info: 资源采样（格式见ResourceUtil.get_resource_info）
+        """
+        with self._lock:
+            if self._start_time is None or self._end_time is not None:
+                return
+            
+            now = time.monotonic()
+            cpu_usage = info.get('cpu_usage') or 0.0
+            if self._last_sample_time is not None:
+                self._sampled_cpu_seconds += cpu_usage / 100.0 * (now - max(self._last_sample_time, self._start_time))
+            self._last_sample_time = now
+            self._samples += 1
+            self._cpu_usage_peak = max(self._cpu_usage_peak, cpu_usage)
+            self._peak_rss = max(self._peak_rss, info.get('memory_usage') or 0)
+            if info.get('memory_pss') is not None:
+                self._peak_pss = max(self._peak_pss or 0, info['memory_pss'])
+            
+            gpus = [gpu for gpu in info.get('gpu_info') or [] if gpu.get('gpu_id') in self.gpu_ids]
+            if gpus:
+                gpu_usage = sum(gpu.get('usage', 0) for gpu in gpus) / len(gpus)
+                self._gpu_samples += 1
+                self._gpu_usage_sum += gpu_usage
+                self._gpu_usage_peak = max(self._gpu_usage_peak, gpu_usage)
+                self._gpu_memory_peak = max(self._gpu_memory_peak, sum(gpu.get('memory_used', 0) for gpu in gpus))
+    
+    def summary(self):
+        """生成汇总
+        
+        Returns:
+            dict: 汇总（字段见backend/models/task_accounting.py），任务未启动时返回None
+        """
+        with self._lock:
+            if self._start_time is None:
+                return None
+            
+            end_time = self._end_time if self._end_time is not None else time.monotonic()
+            wall_seconds = end_time - self._start_time
+            cpu_seconds = self._sampled_cpu_seconds
+            rusage_max_rss = None
+            if self._start_rusage is not None and self._end_rusage is not None:
+                cpu_seconds = ((self._end_rusage.ru_utime + self._end_rusage.ru_stime)
+                               - (self._start_rusage.ru_utime + self._start_rusage.ru_stime))
+                # ru_maxrss是已回收子孙进程中单个进程的最大RSS，Linux上单位为KB，macOS上为字节
+                rusage_max_rss = self._end_rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+            
+            return {
+                'wall_seconds': wall_seconds,
+                'cpu_seconds': cpu_seconds,
+                'cpu_usage_avg': cpu_seconds * 100.0 / wall_seconds if wall_seconds > 0 else 0.0,
+                'cpu_usage_peak': self._cpu_usage_peak,
+                'peak_rss': self._peak_rss if self._samples else None,
+                'peak_pss': self._peak_pss,
+                'rusage_max_rss': rusage_max_rss,
+                'gpu_usage_avg': self._gpu_usage_sum / self._gpu_samples if self._gpu_samples else None,
+                'gpu_usage_peak': self._gpu_usage_peak if self._gpu_samples else None,
+                'gpu_memory_peak': self._gpu_memory_peak if self._gpu_samples else None,
+                'samples': self._samples
+            }
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Agent WebSocket通道
+
+在后台线程中运行asyncio事件循环，与服务器保持一条WebSocket长连接，断线后自动重连。
+心跳通过request发送并等待服务器回复；服务器主动推送的消息通过on_message回调处理。
+连接不可用时request返回None，调用方回退到HTTP心跳。消息格式见backend/api/ws_server.py。
+"""
+
+import json
+import asyncio
+import logging
+import threading
+from urllib.parse import urlparse
+import websockets
+
+logger = logging.getLogger("ws_transport")
+
+def build_ws_url(server_url, agent_id, port):
+    """根据HTTP服务器地址构建Agent的WebSocket地址
+    
+    Args:
+        server_url: HTTP服务器地址，如http://localhost:5050
+        agent_id: Agent ID
+        port: WebSocket服务端口
+    
+    Returns:
+        str: WebSocket地址，如ws://localhost:5051/ws/agents/<agent_id>
+    """
+    parsed = urlparse(server_url)
+    scheme = 'wss' if parsed.scheme == 'https' else 'ws'
+    return f"{scheme}://{parsed.hostname}:{port}/ws/agents/{agent_id}"
+
+class WebSocketTransport:
+    """Agent与服务器之间的WebSocket通道"""
+    
+    def __init__(self, url, on_message=None, on_connect=None, reconnect_interval=1, max_reconnect_interval=30):
+        """初始化WebSocket通道
+        
+        Args:
+            url: WebSocket地址
+            on_message: 服务器推送消息的回调函数，参数为消息字典，在通道线程中调用
+            on_connect: 连接（重连）成功后的回调函数，在通道线程中调用
+            reconnect_interval: 首次重连等待时间（秒）
+            max_reconnect_interval: 最长重连等待时间（秒），连续失败时等待时间翻倍
+        """
+        self.url = url
+        self.on_message = on_message
+        self.on_connect = on_connect
+        self.reconnect_interval = reconnect_interval
+        self.max_reconnect_interval = max_reconnect_interval
+        self._loop = None
+        self._thread = None
+        self._websocket = None
+        self._running = False
+        self._next_id = 0
+        self._pending = {}  # 心跳序号 -> 等待回复的Future
+        self._connected = threading.Event()
+    
+    @property
+    def connected(self):
+        """当前是否已连接"""
+        return self._connected.is_set()
+    
+    def start(self, wait=0):
+        """启动通道线程
+        
+        Args:
+            wait: 等待首次连接成功的时间（秒）
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='agent-ws-transport', daemon=True)
+        self._thread.start()
+        if wait:
+            self._connected.wait(timeout=wait)
+    
+    def close(self, timeout=5):
+        """关闭通道，等待正在发送的消息完成"""
+        self._running = False
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        # 在通道线程中（如处理推送的quit操作时）调用，不能等待自身
+        if threading.current_thread() is self._thread:
+            asyncio.ensure_future(self._close())
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close(), loop).result(timeout)
+        except Exception:
+            pass
+        if self._thread:
+            self._thread.join(timeout=timeout)
+    
+    def request(self, message, timeout=10):
+        """发送一条消息并等待服务器回复
+        
+        Args:
+            message: 消息字典，会自动添加id字段
+            timeout: 等待回复的超时时间（秒）
+        
+        Returns:
+            dict: 服务器回复的消息，连接不可用或超时时返回None
+        """
+        if not self.connected:
+            return None
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._request(message), self._loop)
+            return future.result(timeout)
+        except Exception as e:
+            logger.warning(f"WebSocket请求失败: {str(e)}")
+            return None
+    
+    def _run(self):
+        """通道线程入口"""
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._connect_loop())
+        finally:
+            self._loop.close()
+    
+    async def _connect_loop(self):
+        """保持连接，断线后按指数退避重连"""
+        interval = self.reconnect_interval
+        while self._running:
+            try:
+                async with websockets.connect(self.url, max_size=None) as websocket:
+                    self._websocket = websocket
+                    self._connected.set()
+                    interval = self.reconnect_interval
+                    logger.info(f"WebSocket已连接: {self.url}")
+                    if self.on_connect:
+                        self.on_connect()
+                    async for raw in websocket:
+                        self._on_raw_message(raw)
+            except Exception as e:
+                if self._running:
+                    logger.warning(f"WebSocket连接断开: {str(e)}，{interval}秒后重连")
+            finally:
+                self._connected.clear()
+                self._websocket = None
+                self._fail_pending()
+            
+            if self._running:
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, self.max_reconnect_interval)
+    
+    def _on_raw_message(self, raw):
+        """分发服务器消息：心跳回复交给等待中的请求，其余交给on_message回调"""
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            logger.warning("WebSocket消息格式无效")
+            return
+        
+        future = self._pending.pop(message.get('id'), None) if message.get('type') == 'heartbeat' else None
+        if future is not None:
+            if not future.done():
+                future.set_result(message)
+            return
+        
+        if self.on_message:
+            try:
+                self.on_message(message)
+            except Exception as e:
+                logger.error(f"处理WebSocket消息失败: {str(e)}")
+    
+    async def _request(self, message):
+        """发送消息并等待对应的回复"""
+        websocket = self._websocket
+        if websocket is None:
+            raise ConnectionError("WebSocket未连接")
+        self._next_id += 1
+        message = dict(message, id=self._next_id)
+        future = self._loop.create_future()
+        self._pending[message['id']] = future
+        try:
+            await websocket.send(json.dumps(message))
+            return await future
+        finally:
+            self._pending.pop(message['id'], None)
+    
+    async def _close(self):
+        """关闭当前连接"""
+        if self._websocket is not None:
+            await self._websocket.close()
+    
+    def _fail_pending(self):
+        """连接断开时结束所有等待中的请求"""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("WebSocket连接已断开"))
+        self._pending.clear()
@@ -54,6 +54,23 @@ def create_app(config_class=Config):
     db.connect()
     db.init_tables()
     
+    # 修正依赖已完成但仍处于blocked状态的任务
+    from backend.services.dependency_service import DependencyService
+    DependencyService().reconcile()
+    
+    # 从数据库重建就绪任务队列
+    from backend.services.ready_queue import get_ready_queue
+    get_ready_queue().rebuild()
+    
+    # 加载Agent状态并启动心跳信息定期写回
+    from backend.services.agent_registry import get_agent_registry
+    get_agent_registry().reload()
+    get_agent_registry().start()
+    
+    # 启动Agent资源指标汇总定期写入
+    from backend.services.metrics_store import get_metrics_store
+    get_metrics_store().start()
+    
     # 静态资源
     @app.route('/js/<path:path>')
     def send_js(path):
@@ -86,4 +103,10 @@ def create_app(config_class=Config):
 
 if __name__ == '__main__':
     app = create_app()
+    
+    # 启动Agent WebSocket服务，debug模式下只在重载器启动的子进程中启动
+    if Config.WEBSOCKET_ENABLED and (not Config.DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        from backend.api.ws_server import start_ws_server
+        start_ws_server()
+    
     app.run(host='0.0.0.0', port=Config.PORT, debug=Config.DEBUG)
@@ -5,10 +5,13 @@
 Agent管理API接口
 """
 
+import sys
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from backend.services.agent_service import AgentService
+from backend.utils.heartbeat_codec import decode_body
 from backend.utils.logger import system_logger
+from config import Config
 
 # 创建蓝图
 agent_bp = Blueprint('agent', __name__)
@@ -23,6 +26,25 @@ def json_serial(obj):
         return obj.strftime('%Y-%m-%d %H:%M:%S')
     raise TypeError(f"Type {type(obj)} not serializable")
 
+def _long_poll_supported():
+    """当前WSGI服务器在长轮询等待期间能否继续处理其他请求
+    
+    gunicorn sync worker每个进程同时只处理一个请求，长轮询会占住worker，使其他请求排队。
+    线程worker（gthread、Flask开发服务器）和打了猴子补丁的协程worker（gevent、eventlet）支持长轮询。
+    
+    Returns:
+        bool: 是否支持长轮询
+    """
+    if request.environ.get('wsgi.multithread'):
+        return True
+    gevent_monkey = sys.modules.get('gevent.monkey')
+    if gevent_monkey is not None and gevent_monkey.is_module_patched('socket'):
+        return True
+    eventlet_patcher = sys.modules.get('eventlet.patcher')
+    if eventlet_patcher is not None and eventlet_patcher.is_monkey_patched('socket'):
+        return True
+    return False
+
 @agent_bp.route('/', methods=['GET'])
 def get_agents():
     """获取Agent列表"""
@@ -72,6 +94,40 @@ def get_agent(agent_id):
             'message': f"获取Agent详情失败: {str(e)}"
         }), 500
 
+@agent_bp.route('/<string:agent_id>/metrics', methods=['GET'])
+def get_agent_metrics(agent_id):
+    """获取Agent的资源使用时间序列（from/to为秒级时间戳，step为数据点间隔秒数）"""
+    try:
+        try:
+            series = agent_service.get_agent_metrics(
+                agent_id,
+                start=request.args.get('from', type=float),
+                end=request.args.get('to', type=float),
+                step=request.args.get('step', type=int)
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        if series is None:
+            return jsonify({
+                'success': False,
+                'message': f"Agent不存在: ID={agent_id}"
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': series
+        }), 200
+    except Exception as e:
+        system_logger.error(f"获取Agent资源指标失败: ID={agent_id}, 错误={str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"获取Agent资源指标失败: {str(e)}"
+        }), 500
+
 @agent_bp.route('/main', methods=['POST'])
 def create_main_agent():
     """创建主Agent"""
@@ -97,7 +153,8 @@ def create_main_agent():
             name=data['name'],
             cpu_cores=data['cpu_cores'],
             gpu_ids=data.get('gpu_ids', []),
-            monitor_file=data.get('monitor_file')
+            monitor_file=data.get('monitor_file'),
+            memory_total=data.get('memory_total')
         )
         
         if not agent:
@@ -144,7 +201,8 @@ def create_sub_agent():
             main_agent_id=data['main_agent_id'],
             task_id=data['task_id'],
             cpu_cores=data.get('cpu_cores'),
-            gpu_ids=data.get('gpu_ids', [])
+            gpu_ids=data.get('gpu_ids', []),
+            memory_total=data.get('memory_total')
         )
         
         if not agent:
@@ -187,19 +245,84 @@ def cancel_agent(agent_id):
             'message': f"取消Agent失败: {str(e)}"
         }), 500
 
+@agent_bp.route('/<string:agent_id>/action', methods=['POST'])
+def post_agent_action(agent_id):
+    """向Agent下发控制操作（reject_new_task, accept_new_task, quit）"""
+    try:
+        data = request.get_json() or {}
+        action = data.get('action')
+        success = agent_service.post_action(agent_id, action)
+        if not success:
+            return jsonify({
+                'success': False,
+                'message': f"控制操作下发失败: {action}"
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'message': f"控制操作已下发: {action}"
+        }), 200
+    except Exception as e:
+        system_logger.error(f"下发控制操作失败: ID={agent_id}, 错误={str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"下发控制操作失败: {str(e)}"
+        }), 500
+
+@agent_bp.route('/heartbeat/batch', methods=['POST'])
+def handle_heartbeat_batch():
+    """处理主Agent汇聚转发的一批子Agent心跳和日志块
+    
+    请求中包含logs列表时先写入日志块，响应为{'heartbeats': 心跳响应列表, 'logs': 日志块的确认偏移列表}；
+    不包含时（旧版主Agent）响应为心跳响应列表
+    """
+    try:
+        try:
+            data = decode_body(request.get_data(), request.headers.get('Content-Encoding'), Config.HEARTBEAT_MAX_BODY_SIZE)
+        except ValueError:
+            data = None
+        heartbeats = data.get('heartbeats') if isinstance(data, dict) else None
+        logs = data.get('logs') if isinstance(data, dict) else None
+        if not isinstance(heartbeats, list) or (logs is not None and not isinstance(logs, list)):
+            return jsonify({
+                'success': False,
+                'message': "请求数据无效，需要包含heartbeats列表"
+            }), 400
+        
+        # 先写入日志块，同一批中任务结束的心跳不会先于任务日志处理
+        acked_offsets = agent_service.append_log_chunks(logs) if logs is not None else None
+        responses = agent_service.handle_heartbeat_batch(heartbeats)
+        
+        return jsonify({
+            'success': True,
+            'data': responses if logs is None else {'heartbeats': responses, 'logs': acked_offsets}
+        }), 200
+    except Exception as e:
+        system_logger.error(f"处理批量心跳失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"处理批量心跳失败: {str(e)}"
+        }), 500
+
 @agent_bp.route('/<string:agent_id>/heartbeat', methods=['POST'])
 def handle_heartbeat(agent_id):
-    """处理Agent心跳"""
+    """处理Agent心跳，请求体可以使用deflate压缩（Content-Encoding: deflate）"""
     try:
-        data = request.get_json()
+        try:
+            data = decode_body(request.get_data(), request.headers.get('Content-Encoding'), Config.HEARTBEAT_MAX_BODY_SIZE)
+        except ValueError:
+            data = None
         if not data:
             return jsonify({
                 'success': False,
                 'message': "请求数据无效，需要JSON格式"
             }), 400
         
-        # 处理心跳
-        response = agent_service.handle_heartbeat(agent_id, data)
+        # 处理心跳，wait参数指定长轮询等待时间（秒），worker不支持长轮询时立即返回
+        wait = request.args.get('wait', 0, type=float)
+        if wait > 0 and not _long_poll_supported():
+            wait = 0
+        response = agent_service.handle_heartbeat(agent_id, data, wait=wait)
         
         return jsonify({
             'success': True,
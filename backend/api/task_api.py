@@ -10,6 +10,8 @@ import json
 from datetime import datetime
 from backend.services.task_service import TaskService
 from backend.utils.logger import system_logger
+from backend.utils.log_chunk import decode_chunk
+from config import Config
 
 # 创建蓝图
 task_bp = Blueprint('task', __name__)
@@ -47,6 +49,34 @@ def get_tasks():
         if 'script_content' in request.args:
             filters['script_content'] = request.args.get('script_content')
         
+        # 游标分页模式：按(created_time, id)定位，默认返回估算总数
+        if 'cursor' in request.args:
+            exact_total = request.args.get('exact_total', 'false').lower() in ('1', 'true', 'yes')
+            try:
+                result = task_service.get_task_in_cursor(
+                    cursor=request.args.get('cursor'),
+                    per_page=per_page,
+                    filters=filters,
+                    exact_total=exact_total
+                )
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+            
+            return jsonify({
+                'success': True,
+                'data': {
+                    'tasks': [task.to_dict() for task in result['tasks']],
+                    'per_page': result['per_page'],
+                    'next_cursor': result['next_cursor'],
+                    'has_more': result['has_more'],
+                    'total': result['total'],
+                    'total_is_estimate': result['total_is_estimate']
+                }
+            }), 200
+        
         # 获取任务分页数据
         result = task_service.get_task_in_page(page, per_page, filters)
         
@@ -71,6 +101,55 @@ def get_tasks():
             'message': f"获取任务列表失败: {str(e)}"
         }), 500
 
+@task_bp.route('/search', methods=['GET'])
+def search_tasks():
+    """全文搜索任务（按相关度排序，带高亮片段）"""
+    try:
+        keyword = request.args.get('q', '')
+        field = request.args.get('field') or None
+        limit = request.args.get('limit', 20, type=int)
+        
+        try:
+            results = task_service.search_tasks(keyword, field=field, limit=limit)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'data': [
+                {
+                    'task': result['task'].to_dict(),
+                    'rank': result['rank'],
+                    'snippets': result['snippets']
+                }
+                for result in results
+            ]
+        }), 200
+    except Exception as e:
+        system_logger.error(f"搜索任务失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"搜索任务失败: {str(e)}"
+        }), 500
+
+@task_bp.route('/scheduler/stats', methods=['GET'])
+def get_scheduler_stats():
+    """获取任务调度统计（当前进程的任务领取次数与冲突次数）"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': task_service.get_claim_stats()
+        }), 200
+    except Exception as e:
+        system_logger.error(f"获取调度统计失败: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"获取调度统计失败: {str(e)}"
+        }), 500
+
 @task_bp.route('/<int:task_id>', methods=['GET'])
 def get_task(task_id):
     """获取单个任务详情"""
@@ -82,9 +161,14 @@ def get_task(task_id):
                 'message': f"任务不存在: ID={task_id}"
             }), 404
         
+        # 任务结束后附带资源使用汇总
+        task_dict = task.to_dict()
+        accounting = task_service.get_task_accounting(task_id)
+        task_dict['accounting'] = accounting.to_dict() if accounting else None
+        
         return jsonify({
             'success': True,
-            'data': task.to_dict()
+            'data': task_dict
         }), 200
     except Exception as e:
         system_logger.error(f"获取任务详情失败: ID={task_id}, 错误={str(e)}")
@@ -221,8 +305,34 @@ def cancel_task(task_id):
 
 @task_bp.route('/<int:task_id>/log', methods=['GET'])
 def get_task_log(task_id):
-    """获取任务日志"""
+    """获取任务日志
+    
+    默认按行读取（start_line、max_lines），另外支持:
+        tail=N: 读取末尾N行
+        search=关键字&direction=backward|forward&offset=字节偏移&max_matches=N: 查找包含关键字的行
+        offset=字节偏移&length=字节数: 按字节范围读取
+    末尾读取、查找和按字节范围读取的返回大小有上限，见Config.LOG_MAX_RESPONSE_BYTES
+    """
     try:
+        if 'tail' in request.args or 'search' in request.args or 'offset' in request.args:
+            try:
+                log_data = _read_task_log_by_args(task_id)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'message': str(e)
+                }), 400
+            if log_data is None:
+                return jsonify({
+                    'success': False,
+                    'message': f"任务不存在: ID={task_id}"
+                }), 404
+            
+            return jsonify({
+                'success': True,
+                'data': log_data
+            }), 200
+        
         # 解析参数
         start_line = request.args.get('start_line', 0, type=int)
         max_lines = request.args.get('max_lines', type=int)
@@ -241,6 +351,39 @@ def get_task_log(task_id):
             'message': f"获取任务日志失败: {str(e)}"
         }), 500
 
+def _read_task_log_by_args(task_id):
+    """按请求参数读取末尾若干行、查找关键字或按字节范围读取
+    
+    Args:
+        task_id: 任务ID
+    
+    Returns:
+        dict: 日志数据，任务不存在时返回None
+    
+    Raises:
+        ValueError: 参数无效
+    """
+    offset = request.args.get('offset', type=int)
+    if 'offset' in request.args and offset is None:
+        raise ValueError("offset需要是整数")
+    
+    if 'tail' in request.args:
+        tail = request.args.get('tail', type=int)
+        if tail is None:
+            raise ValueError("tail需要是整数")
+        return task_service.get_task_log_tail(task_id, tail)
+    
+    if 'search' in request.args:
+        return task_service.search_task_log(
+            task_id,
+            request.args.get('search'),
+            direction=request.args.get('direction', 'backward'),
+            offset=offset,
+            max_matches=request.args.get('max_matches', type=int)
+        )
+    
+    return task_service.get_task_log_range(task_id, offset, request.args.get('length', type=int))
+
 @task_bp.route('/<int:task_id>/log', methods=['POST'])
 def append_task_log(task_id):
     """添加任务日志"""
@@ -270,3 +413,65 @@ def append_task_log(task_id):
             'success': False,
             'message': f"添加任务日志失败: {str(e)}"
         }), 500
+
+@task_bp.route('/<int:task_id>/log/chunks', methods=['POST'])
+def append_task_log_chunk(task_id):
+    """按字节偏移添加子Agent上报的任务日志块，格式见backend/utils/log_chunk.py"""
+    try:
+        agent_id = request.args.get('agent_id')
+        offset = request.args.get('offset', type=int)
+        if not agent_id or offset is None or offset < 0:
+            return jsonify({
+                'success': False,
+                'message': "请求参数无效，需要agent_id和非负的offset"
+            }), 400
+        
+        try:
+            data = decode_chunk(request.get_data(), request.headers.get('Content-Encoding'), Config.LOG_CHUNK_MAX_SIZE)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
+        try:
+            success = task_service.append_task_log(task_id, data, offset=offset, agent_id=agent_id)
+        except ValueError as e:
+            # 中间的日志缺失，子Agent需要从已确认偏移重新发送
+            return jsonify({
+                'success': False,
+                'message': str(e),
+                'data': {'acked_offset': task_service.get_task_log_offset(task_id, agent_id)}
+            }), 409
+        if not success:
+            return jsonify({
+                'success': False,
+                'message': "添加任务日志失败"
+            }), 500
+        
+        return jsonify({
+            'success': True,
+            'data': {'acked_offset': task_service.get_task_log_offset(task_id, agent_id)}
+        }), 200
+    except Exception as e:
+        system_logger.error(f"添加任务日志块失败: ID={task_id}, 错误={str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"添加任务日志块失败: {str(e)}"
+        }), 500
+
+@task_bp.route('/<int:task_id>/log/chunks', methods=['GET'])
+def get_task_log_offset(task_id):
+    """获取子Agent日志流的已确认偏移，子Agent从该偏移续传"""
+    try:
+        agent_id = request.args.get('agent_id')
+        return jsonify({
+            'success': True,
+            'data': {'acked_offset': task_service.get_task_log_offset(task_id, agent_id)}
+        }), 200
+    except Exception as e:
+        system_logger.error(f"获取任务日志偏移失败: ID={task_id}, 错误={str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"获取任务日志偏移失败: {str(e)}"
+        }), 500
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Agent WebSocket服务
+
+Agent通过 ws://<host>:<WEBSOCKET_PORT>/ws/agents/<agent_id> 建立长连接，
+代替每次心跳都新建一个HTTP请求。HTTP心跳接口保持不变，作为WebSocket不可用时的回退。
+
+`python app.py`在WEBSOCKET_ENABLED时在同一进程中启动本服务。gunicorn部署时本服务不随worker启动，
+以独立的单个进程运行: python -m backend.api.ws_server。服务进程与HTTP worker之间通过数据库共享
+Agent状态、控制操作和心跳关键帧。
+
+上行消息（Agent -> 服务器）:
+    {
+        'type': 'heartbeat',
+        'id': 心跳序号，服务器处理完成后按此序号回复,
+        'ack': 主Agent已处理的最后一个推送序号,
+        'data': 与HTTP心跳相同的心跳数据（seq、full、资源增量和task_info），
+            格式见backend/utils/heartbeat_codec.py，连接建立后第一次为全量
+    }
+
+下行消息（服务器 -> Agent）:
+    {'type': 'heartbeat', 'id': 对应的心跳序号, 'data': 与HTTP心跳相同的响应}
+    {'type': 'action', 'seq': 推送序号, 'data': 服务器主动推送的操作(new_task, quit, reject_new_task等)}
+
+主Agent的新任务由服务器在任务就绪或收到心跳时主动推送。已推送的任务在主Agent
+确认(ack)之前不会继续分配，避免按尚未扣除已推送任务的资源信息重复分配。
+
+查看任务日志的客户端通过 ws://<host>:<WEBSOCKET_PORT>/ws/tasks/<task_id>/log?offset=<字节偏移> 订阅实时日志，
+offset为断线前最后收到的next_offset，省略时从日志末尾开始。服务器只推送，下行消息为
+backend/services/log_tail_hub.py中的事件，log事件的data为文本:
+    {'type': 'log', 'offset': 起始偏移, 'next_offset': 结束偏移, 'data': 日志内容}
+    {'type': 'gap', 'offset': 起始偏移, 'next_offset': 结束偏移}  缺失的部分通过GET /api/tasks/<id>/log?offset=补齐
+    {'type': 'reset', 'offset': 0}  日志文件被轮转
+客户端接收太慢、积压的日志超过LOG_TAIL_MAX_PENDING_BYTES字节时连接被关闭（4008），重连后从offset续传。
+"""
+
+import re
+import json
+from urllib.parse import parse_qs
+import socket
+import asyncio
+import functools
+import threading
+from datetime import datetime
+import websockets
+from backend.models.agent import Agent
+from backend.models.task import Task
+from backend.services.agent_service import AgentService
+from backend.services.heartbeat_notifier import get_heartbeat_notifier
+from backend.services.log_tail_hub import get_log_tail_hub
+from backend.utils.logger import system_logger
+from config import Config
+
+# Agent连接路径
+AGENT_PATH = re.compile(r'^/ws/agents/([^/?]+)/?(\?.*)?$')
+# 任务实时日志路径
+TASK_LOG_PATH = re.compile(r'^/ws/tasks/(\d+)/log/?(?:\?(.*))?$')
+
+# 日期时间转换函数
+def json_serial(obj):
+    """序列化日期/时间为JSON"""
+    if isinstance(obj, datetime):
+        return obj.strftime('%Y-%m-%d %H:%M:%S')
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+class AgentConnection:
+    """一个Agent的WebSocket连接状态"""
+    
+    def __init__(self, agent_id, agent_type, websocket):
+        """初始化连接状态
+        
+        Args:
+            agent_id: Agent ID
+            agent_type: Agent类型，'main'或'sub'
+            websocket: WebSocket连接
+        """
+        self.agent_id = agent_id
+        self.agent_type = agent_type
+        self.websocket = websocket
+        self.has_heartbeat = False  # 是否已收到心跳（服务器已有该Agent的资源信息）
+        self.sent_seq = 0  # 最后一个推送任务的序号
+        self.acked_seq = 0  # Agent已确认的推送序号
+        self.dispatch_scheduled = False
+        self.closed = False
+        self.lock = asyncio.Lock()
+
+class AgentWebSocketServer:
+    """Agent WebSocket服务类，在后台线程中运行asyncio事件循环"""
+    
+    def __init__(self, host=None, port=None, agent_service=None):
+        """初始化WebSocket服务
+        
+        Args:
+            host: 监听地址，默认使用配置中的地址
+            port: 监听端口，默认使用配置中的端口
+            agent_service: Agent服务实例
+        """
+        self.host = host or Config.WEBSOCKET_HOST
+        self.port = port if port is not None else Config.WEBSOCKET_PORT
+        self.agent_service = agent_service or AgentService()
+        self.notifier = get_heartbeat_notifier()
+        self.log_tail_hub = get_log_tail_hub()
+        self._connections = {}  # Agent ID -> AgentConnection
+        self._loop = None
+        self._thread = None
+        self._stop = None
+        self._started = threading.Event()
+    
+    def start(self):
+        """在后台线程中启动服务"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._started.clear()
+        self._thread = threading.Thread(target=self._run, name='agent-ws-server', daemon=True)
+        self._thread.start()
+        self._started.wait(timeout=5)
+    
+    def stop(self):
+        """停止服务"""
+        if self._loop and self._stop:
+            self._loop.call_soon_threadsafe(self._finish)
+        if self._thread:
+            self._thread.join(timeout=5)
+    
+    def _finish(self):
+        """在事件循环中结束服务"""
+        if not self._stop.done():
+            self._stop.set_result(None)
+    
+    def _run(self):
+        """后台线程入口"""
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+        except Exception as e:
+            system_logger.error(f"Agent WebSocket服务异常退出: {str(e)}")
+        finally:
+            self._started.set()
+            self._loop.close()
+    
+    async def _serve(self):
+        """监听端口直到服务停止"""
+        self._stop = self._loop.create_future()
+        self.notifier.subscribe(self._on_notify)
+        self.log_tail_hub.start()
+        try:
+            # 多个进程可以共享同一端口（需要操作系统支持SO_REUSEPORT）
+            async with websockets.serve(
+                self._handle, self.host, self.port,
+                reuse_port=hasattr(socket, 'SO_REUSEPORT'),
+                max_size=Config.WEBSOCKET_MAX_MESSAGE_SIZE
+            ):
+                system_logger.info(f"Agent WebSocket服务已启动: ws://{self.host}:{self.port}/ws/agents/<id>")
+                self._started.set()
+                await self._stop
+        finally:
+            self.notifier.unsubscribe(self._on_notify)
+            self.log_tail_hub.stop()
+    
+    def _on_notify(self, kind, agent_id):
+        """心跳事件监听函数，可能在任意线程中调用"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._on_event, kind, agent_id)
+    
+    def _on_event(self, kind, agent_id):
+        """在事件循环中处理心跳事件"""
+        if kind == 'task':
+            # 有任务就绪，为所有已连接的主Agent尝试分配（合并短时间内的多次事件）
+            for conn in list(self._connections.values()):
+                if conn.agent_type == 'main' and not conn.dispatch_scheduled:
+                    conn.dispatch_scheduled = True
+                    asyncio.ensure_future(self._try_dispatch(conn))
+        elif kind == 'agent':
+            conn = self._connections.get(agent_id)
+            if conn:
+                asyncio.ensure_future(self._push_control(conn))
+    
+    async def _handle(self, websocket, path=None):
+        """处理一个Agent连接或任务实时日志连接"""
+        log_match = TASK_LOG_PATH.match(path or websocket.path)
+        if log_match:
+            await self._handle_task_log(websocket, int(log_match.group(1)), log_match.group(2))
+            return
+        
+        match = AGENT_PATH.match(path or websocket.path)
+        if not match:
+            await websocket.close(code=4404, reason='not found')
+            return
+        
+        agent_id = match.group(1)
+        agent = await self._call(Agent.get_agent_by_id, agent_id)
+        if not agent or agent.status == 'end':
+            await websocket.close(code=4404, reason='agent not found')
+            return
+        
+        # 同一个Agent重连时关闭旧连接
+        conn = AgentConnection(agent_id, agent.type, websocket)
+        old_conn = self._connections.get(agent_id)
+        self._connections[agent_id] = conn
+        if old_conn:
+            old_conn.closed = True
+            await old_conn.websocket.close(code=4000, reason='replaced')
+        system_logger.info(f"Agent WebSocket已连接: ID={agent_id}, 地址={websocket.remote_address}")
+        
+        try:
+            async for message in websocket:
+                await self._on_message(conn, message)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            conn.closed = True
+            if self._connections.get(agent_id) is conn:
+                del self._connections[agent_id]
+            system_logger.info(f"Agent WebSocket已断开: ID={agent_id}")
+    
+    async def _handle_task_log(self, websocket, task_id, query):
+        """推送任务实时日志，同一任务的所有连接共用一份日志末尾缓存"""
+        task = await self._call(Task.get_task_by_id, task_id)
+        if not task or not task.log_file:
+            await websocket.close(code=4404, reason='task not found')
+            return
+        
+        offset = None
+        values = parse_qs(query or '').get('offset')
+        if values:
+            try:
+                offset = max(int(values[0]), 0)
+            except ValueError:
+                await websocket.close(code=4400, reason='invalid offset')
+                return
+        
+        # 积压按字节限制，单条日志事件最大可达日志块大小，按消息数限制无法约束内存
+        queue = asyncio.Queue()
+        pending_bytes = 0
+        overflow = False
+        loop = self._loop
+        
+        def enqueue(event):
+            nonlocal overflow, pending_bytes
+            if overflow:
+                return
+            size = len(event.get('data') or b'')
+            if not queue.empty() and pending_bytes + size > Config.LOG_TAIL_MAX_PENDING_BYTES:
+                # 客户端接收太慢，断开后由客户端从offset续传
+                overflow = True
+                asyncio.ensure_future(websocket.close(code=4008, reason='too slow'))
+                return
+            pending_bytes += size
+            queue.put_nowait(event)
+        
+        def dequeue():
+            nonlocal pending_bytes
+            event = queue.get_nowait()
+            pending_bytes -= len(event.get('data') or b'')
+            return event
+        
+        def on_event(event):
+            loop.call_soon_threadsafe(enqueue, event)
+        
+        backlog = await self._call(self.log_tail_hub.subscribe, task_id, task.log_file, on_event, offset)
+        system_logger.info(f"任务实时日志已连接: 任务ID={task_id}, 地址={websocket.remote_address}")
+        
+        # 客户端不发送消息，读取只用于发现连接断开
+        reader = asyncio.ensure_future(self._drain_incoming(websocket))
+        try:
+            for event in backlog:
+                await websocket.send(self._log_message(event))
+            while not reader.done():
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait([getter, reader], return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    break
+                event = getter.result()
+                pending_bytes -= len(event.get('data') or b'')
+                # 合并积压的连续日志，减少消息数
+                parts = [event.get('data')]
+                while not queue.empty():
+                    following = dequeue()
+                    if event['type'] == 'log' and following['type'] == 'log' and following['offset'] == event['next_offset']:
+                        event = dict(event, next_offset=following['next_offset'])
+                        parts.append(following['data'])
+                    else:
+                        await websocket.send(self._log_message(self._joined(event, parts)))
+                        event = following
+                        parts = [event.get('data')]
+                await websocket.send(self._log_message(self._joined(event, parts)))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            reader.cancel()
+            await self._call(self.log_tail_hub.unsubscribe, task_id, on_event)
+            system_logger.info(f"任务实时日志已断开: 任务ID={task_id}")
+    
+    @staticmethod
+    async def _drain_incoming(websocket):
+        """读取并丢弃客户端消息，直到连接断开"""
+        try:
+            async for _ in websocket:
+                pass
+        except websockets.ConnectionClosed:
+            pass
+    
+    @staticmethod
+    def _joined(event, parts):
+        """把合并的连续日志内容放回事件"""
+        if len(parts) > 1:
+            return dict(event, data=b''.join(parts))
+        return event
+    
+    @staticmethod
+    def _log_message(event):
+        """把日志事件编码为下行消息"""
+        if 'data' in event:
+            event = dict(event, data=event['data'].decode('utf-8', errors='replace'))
+        return json.dumps(event)
+    
+    async def _on_message(self, conn, raw):
+        """处理Agent上行消息"""
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            system_logger.warning(f"Agent WebSocket消息格式无效: ID={conn.agent_id}")
+            return
+        if message.get('type') != 'heartbeat':
+            return
+        
+        async with conn.lock:
+            if message.get('ack'):
+                conn.acked_seq = max(conn.acked_seq, int(message['ack']))
+            
+            try:
+                response = await self._call(
+                    self.agent_service.handle_heartbeat, conn.agent_id, message.get('data') or {}, dispatch=False
+                )
+                conn.has_heartbeat = conn.has_heartbeat or not response.get('resync')
+            except Exception as e:
+                system_logger.error(f"处理Agent心跳失败: ID={conn.agent_id}, 错误={str(e)}")
+                response = {'action': 'continue'}
+            await self._send(conn, {'type': 'heartbeat', 'id': message.get('id'), 'data': response})
+        
+        if conn.agent_type == 'main':
+            await self._try_dispatch(conn)
+    
+    async def _try_dispatch(self, conn):
+        """按主Agent最新的资源信息推送新任务"""
+        conn.dispatch_scheduled = False
+        async with conn.lock:
+            # 上一次推送的任务尚未被确认时，资源信息中还没有扣除这些任务
+            if conn.closed or conn.acked_seq < conn.sent_seq or not conn.has_heartbeat:
+                return
+            try:
+                response = await self._call(self.agent_service.dispatch_for_agent, conn.agent_id)
+            except Exception as e:
+                system_logger.error(f"推送任务失败: Agent ID={conn.agent_id}, 错误={str(e)}")
+                return
+            if response:
+                conn.sent_seq += 1
+                await self._send(conn, {'type': 'action', 'seq': conn.sent_seq, 'data': response})
+    
+    async def _push_control(self, conn):
+        """推送Agent待执行的控制操作"""
+        async with conn.lock:
+            if conn.closed:
+                return
+            try:
+                response = await self._call(self.agent_service.get_control_action, conn.agent_id)
+            except Exception as e:
+                system_logger.error(f"获取控制操作失败: Agent ID={conn.agent_id}, 错误={str(e)}")
+                return
+            if response:
+                await self._send(conn, {'type': 'action', 'seq': None, 'data': response})
+    
+    async def _send(self, conn, message):
+        """发送下行消息，连接已断开时忽略"""
+        try:
+            await conn.websocket.send(json.dumps(message, default=json_serial))
+        except websockets.ConnectionClosed:
+            conn.closed = True
+    
+    async def _call(self, func, *args, **kwargs):
+        """在线程池中执行阻塞的数据库操作"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+# 全局WebSocket服务实例
+ws_server = None
+
+def start_ws_server():
+    """启动Agent WebSocket服务
+    
+    Returns:
+        server: WebSocket服务实例
+    """
+    global ws_server
+    if ws_server is None:
+        ws_server = AgentWebSocketServer()
+    ws_server.start()
+    return ws_server
+
+if __name__ == '__main__':
+    # 生产部署时作为独立进程运行（python -m backend.api.ws_server），与gunicorn的HTTP worker共用数据库
+    from app import create_app
+    create_app()
+    server = start_ws_server()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -58,7 +58,7 @@ class Agent:
     
     @classmethod
     def create_agent(cls, name, type, cpu_cores=0, gpu_ids=None,
-                    task_id=None, main_agent_id=None, monitor_file=None):
+                    task_id=None, main_agent_id=None, monitor_file=None, memory_total=None):
         """创建新Agent
         
         Args:
@@ -69,6 +69,7 @@ class Agent:
             task_id: 关联任务ID
             main_agent_id: 主Agent ID
             monitor_file: 监控文件路径
+            memory_total: 内存总量（字节），注册时上报，之后的心跳不再发送
             
         Returns:
             agent: 新创建的Agent实例
@@ -86,7 +87,7 @@ class Agent:
         # 初始化资源使用情况
         cpu_usage = 0.0
         memory_used = 0
-        memory_total = 1
+        memory_total = memory_total or 1
         
         # 设置可用资源
         available_cpu_cores = cpu_cores
@@ -131,27 +132,15 @@ class Agent:
             return None
     
     @classmethod
-    def get_agent_by_id(cls, agent_id):
-        """根据ID获取Agent
+    def from_row(cls, row):
+        """根据数据库记录构建Agent实例
         
         Args:
-            agent_id: Agent ID
+            row: agents表中的一行记录
             
         Returns:
-            agent: Agent实例，如果不存在则返回None
+            agent: Agent实例
         """
-        if not agent_id:
-            return None
-        
-        db = get_db()
-        
-        # 查询Agent基本信息
-        query = "SELECT * FROM agents WHERE id = ?"
-        row = db.fetch_one(query, (agent_id,))
-        
-        if not row:
-            return None
-        
         # 解析JSON格式的GPU信息
         gpu_info = []
         if row['gpu_info']:
@@ -160,8 +149,7 @@ class Agent:
             except Exception as e:
                 system_logger.error(f"解析GPU信息失败: {str(e)}")
         
-        # 创建Agent实例
-        agent = cls(
+        return cls(
             id=row['id'],
             name=row['name'],
             type=row['type'],
@@ -179,8 +167,30 @@ class Agent:
             available_cpu_cores=row['available_cpu_cores'],
             monitor_file=row['monitor_file']
         )
+    
+    @classmethod
+    def get_agent_by_id(cls, agent_id):
+        """根据ID获取Agent
+        
+        Args:
+            agent_id: Agent ID
+            
+        Returns:
+            agent: Agent实例，如果不存在则返回None
+        """
+        if not agent_id:
+            return None
         
-        return agent
+        db = get_db()
+        
+        # 查询Agent基本信息
+        query = "SELECT * FROM agents WHERE id = ?"
+        row = db.fetch_one(query, (agent_id,))
+        
+        if not row:
+            return None
+        
+        return cls.from_row(row)
     
     @classmethod
     def get_all_agents(cls):
@@ -194,37 +204,45 @@ class Agent:
         query = "SELECT * FROM agents"
         rows = db.fetch_all(query)
         
-        agents = []
-        for row in rows:
-            # 解析JSON格式的GPU信息
-            gpu_info = []
-            if row['gpu_info']:
-                try:
-                    gpu_info = json.loads(row['gpu_info'])
-                except Exception as e:
-                    system_logger.error(f"解析GPU信息失败: {str(e)}")
+        return [cls.from_row(row) for row in rows]
+    
+    @classmethod
+    def get_agents_by_main_agent(cls, main_agent_id, status=None):
+        """获取指定主Agent下的子Agent
+        
+        Args:
+            main_agent_id: 主Agent ID
+            status: 可选的状态过滤
             
-            agent = cls(
-                id=row['id'],
-                name=row['name'],
-                type=row['type'],
-                status=row['status'],
-                created_time=row['created_time'],
-                last_heartbeat_time=row['last_heartbeat_time'],
-                running_time=row['running_time'],
-                cpu_cores=row['cpu_cores'],
-                cpu_usage=row['cpu_usage'],
-                memory_used=row['memory_used'],
-                memory_total=row['memory_total'],
-                gpu_info=gpu_info,
-                task_id=row['task_id'],
-                main_agent_id=row['main_agent_id'],
-                available_cpu_cores=row['available_cpu_cores'],
-                monitor_file=row['monitor_file']
-            )
-            agents.append(agent)
+        Returns:
+            list: 子Agent实例列表
+        """
+        db = get_db()
+        
+        if status:
+            query = "SELECT * FROM agents WHERE main_agent_id = ? AND status = ?"
+            rows = db.fetch_all(query, (main_agent_id, status))
+        else:
+            query = "SELECT * FROM agents WHERE main_agent_id = ?"
+            rows = db.fetch_all(query, (main_agent_id,))
         
-        return agents
+        return [cls.from_row(row) for row in rows]
+    
+    @classmethod
+    def get_agents_by_task(cls, task_id):
+        """获取执行指定任务的子Agent
+        
+        Args:
+            task_id: 任务ID
+        
+        Returns:
+            list: 子Agent实例列表
+        """
+        db = get_db()
+        query = "SELECT * FROM agents WHERE task_id = ? AND type = 'sub'"
+        rows = db.fetch_all(query, (task_id,))
+        
+        return [cls.from_row(row) for row in rows]
     
     def update_agent(self):
         """更新Agent信息到数据库
@@ -282,6 +300,54 @@ class Agent:
             system_logger.error(f"更新Agent失败: ID={self.id}, 错误={str(e)}")
             return False
     
+    @classmethod
+    def update_heartbeats(cls, agents):
+        """批量写回Agent的心跳和资源信息
+        
+        只更新心跳带来的字段，不修改状态等其他字段。
+        
+        Args:
+            agents: Agent实例列表
+        
+        Returns:
+            bool: 写回是否成功
+        """
+        if not agents:
+            return True
+        
+        db = get_db()
+        query = """
+            UPDATE agents SET
+                last_heartbeat_time = ?,
+                running_time = ?,
+                cpu_usage = ?,
+                memory_used = ?,
+                memory_total = ?,
+                gpu_info = ?,
+                available_cpu_cores = ?
+            WHERE id = ?
+        """
+        params = [
+            (
+                agent.last_heartbeat_time,
+                agent.running_time,
+                agent.cpu_usage,
+                agent.memory_used,
+                agent.memory_total,
+                json.dumps(agent.gpu_info),
+                agent.available_cpu_cores,
+                agent.id
+            )
+            for agent in agents
+        ]
+        
+        try:
+            db.executemany(query, params)
+            return True
+        except Exception as e:
+            system_logger.error(f"批量写回Agent心跳失败: 数量={len(agents)}, 错误={str(e)}")
+            return False
+    
     def cancel_agent(self):
         """取消Agent（设置为离线状态）
         
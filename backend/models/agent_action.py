@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Agent控制操作数据模型
+
+通过post_action下发的控制操作（reject_new_task、accept_new_task、quit）保存在agent_actions表中，
+在Agent下一次心跳或WebSocket推送时按下发顺序取出。多进程部署时任一进程下发的操作
+都能由处理该Agent心跳的进程取出，每个操作只被取出一次。
+"""
+
+from datetime import datetime
+from backend.utils.database import get_db
+from backend.utils.logger import system_logger
+
+class AgentAction:
+    """Agent控制操作数据模型类"""
+    
+    @classmethod
+    def add(cls, agent_id, action):
+        """添加一个待下发的控制操作
+        
+        Args:
+            agent_id: Agent ID
+            action: 控制操作
+        
+        Returns:
+            bool: 添加是否成功
+        """
+        db = get_db()
+        try:
+            db.execute(
+                "INSERT INTO agent_actions (agent_id, action, created_time) VALUES (?, ?, ?)",
+                (agent_id, action, datetime.now())
+            )
+            return True
+        except Exception as e:
+            system_logger.error(f"保存控制操作失败: Agent ID={agent_id}, 操作={action}, 错误={str(e)}")
+            return False
+    
+    @classmethod
+    def pop(cls, agent_id):
+        """取出Agent最早的一个待下发控制操作
+        
+        没有待下发操作时只执行一次只读查询，不占用写锁。
+        
+        Args:
+            agent_id: Agent ID
+        
+        Returns:
+            str: 控制操作，没有时返回None
+        """
+        db = get_db()
+        while True:
+            row = db.fetch_one(
+                "SELECT id, action FROM agent_actions WHERE agent_id = ? ORDER BY id LIMIT 1",
+                (agent_id,)
+            )
+            if not row:
+                return None
+            
+            # 其他进程已取出该操作时重新查询
+            cursor = db.execute("DELETE FROM agent_actions WHERE id = ?", (row['id'],))
+            if cursor.rowcount:
+                return row['action']
+    
+    @classmethod
+    def clear(cls, agent_id):
+        """删除Agent所有待下发的控制操作
+        
+        Args:
+            agent_id: Agent ID
+        
+        Returns:
+            bool: 删除是否成功
+        """
+        db = get_db()
+        try:
+            db.execute("DELETE FROM agent_actions WHERE agent_id = ?", (agent_id,))
+            return True
+        except Exception as e:
+            system_logger.error(f"删除控制操作失败: Agent ID={agent_id}, 错误={str(e)}")
+            return False
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Agent资源指标数据模型
+
+agent_metrics表保存按分钟、小时汇总的Agent资源使用，每行对应一个Agent在一个时间桶内的
+采样数、各指标的总和与最大值。同一时间桶可以多次写入，写入时累加。
+"""
+
+from backend.utils.database import get_db
+from backend.utils.logger import system_logger
+
+# 汇总数据的字段，顺序与add_rollups的参数一致
+ROLLUP_FIELDS = (
+    'samples', 'cpu_sum', 'cpu_max', 'memory_sum', 'memory_max',
+    'gpu_usage_sum', 'gpu_memory_sum'
+)
+
+class AgentMetric:
+    """Agent资源指标汇总数据模型类"""
+    
+    @classmethod
+    def add_rollups(cls, rollups):
+        """批量累加汇总数据
+        
+        Args:
+            rollups: 汇总数据列表，每个元素为
+                (Agent ID, 粒度(秒), 时间桶起始时间戳, 采样数, CPU总和, CPU最大值,
+                 内存总和, 内存最大值, GPU使用率总和, 显存总和)
+        
+        Returns:
+            bool: 写入是否成功
+        """
+        if not rollups:
+            return True
+        
+        db = get_db()
+        query = """
+            INSERT INTO agent_metrics (
+                agent_id, resolution, bucket, samples, cpu_sum, cpu_max,
+                memory_sum, memory_max, gpu_usage_sum, gpu_memory_sum
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (agent_id, resolution, bucket) DO UPDATE SET
+                samples = samples + excluded.samples,
+                cpu_sum = cpu_sum + excluded.cpu_sum,
+                cpu_max = MAX(cpu_max, excluded.cpu_max),
+                memory_sum = memory_sum + excluded.memory_sum,
+                memory_max = MAX(memory_max, excluded.memory_max),
+                gpu_usage_sum = gpu_usage_sum + excluded.gpu_usage_sum,
+                gpu_memory_sum = gpu_memory_sum + excluded.gpu_memory_sum
+        """
+        
+        try:
+            db.executemany(query, rollups)
+            return True
+        except Exception as e:
+            system_logger.error(f"写入Agent指标汇总失败: 数量={len(rollups)}, 错误={str(e)}")
+            return False
+    
+    @classmethod
+    def get_rollups(cls, agent_id, resolution, start, end):
+        """获取时间范围内的汇总数据
+        
+        Args:
+            agent_id: Agent ID
+            resolution: 粒度（秒）
+            start: 起始时间戳（包含）
+            end: 结束时间戳（不包含）
+        
+        Returns:
+            list: [(时间桶起始时间戳, (采样数, CPU总和, CPU最大值, 内存总和, 内存最大值, GPU使用率总和, 显存总和))]，
+                按时间排序
+        """
+        db = get_db()
+        # 与起始时间重叠的时间桶也要返回
+        rows = db.fetch_all(
+            f"""
+            SELECT bucket, {', '.join(ROLLUP_FIELDS)} FROM agent_metrics
+            WHERE agent_id = ? AND resolution = ? AND bucket > ? AND bucket < ?
+            ORDER BY bucket
+            """,
+            (agent_id, resolution, start - resolution, end)
+        )
+        return [(row['bucket'], tuple(row[field] for field in ROLLUP_FIELDS)) for row in rows]
+    
+    @classmethod
+    def delete_before(cls, resolution, cutoff):
+        """删除过期的汇总数据
+        
+        Args:
+            resolution: 粒度（秒）
+            cutoff: 删除时间桶起始时间早于此时间戳的数据
+        
+        Returns:
+            int: 删除的行数
+        """
+        db = get_db()
+        try:
+            cursor = db.execute(
+                "DELETE FROM agent_metrics WHERE resolution = ? AND bucket < ?",
+                (resolution, cutoff)
+            )
+            return cursor.rowcount
+        except Exception as e:
+            system_logger.error(f"清理Agent指标汇总失败: 粒度={resolution}, 错误={str(e)}")
+            return 0
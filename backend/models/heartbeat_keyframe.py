@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+心跳关键帧数据模型
+
+Agent的增量心跳相对最近一次被服务器确认的全量心跳（关键帧）编码。关键帧保存在
+heartbeat_keyframes表中，多进程部署时任一进程收到的增量心跳都能解码，
+不需要同一Agent的心跳总是由同一进程处理。
+"""
+
+import json
+from datetime import datetime
+from backend.utils.database import get_db
+from backend.utils.logger import system_logger
+
+class HeartbeatKeyframeStore:
+    """心跳关键帧存储，提供HeartbeatDecoder需要的load/save/delete接口"""
+    
+    def load(self, agent_id):
+        """读取Agent的关键帧
+        
+        Args:
+            agent_id: Agent ID
+        
+        Returns:
+            tuple: (序号, 资源信息)，不存在或读取失败时返回None
+        """
+        db = get_db()
+        try:
+            row = db.fetch_one(
+                "SELECT seq, resource_info FROM heartbeat_keyframes WHERE agent_id = ?",
+                (agent_id,)
+            )
+        except Exception as e:
+            system_logger.error(f"读取心跳关键帧失败: Agent ID={agent_id}, 错误={str(e)}")
+            return None
+        if not row:
+            return None
+        
+        return row['seq'], json.loads(row['resource_info'])
+    
+    def save(self, agent_id, seq, resource_info):
+        """保存Agent的关键帧
+        
+        Args:
+            agent_id: Agent ID
+            seq: 关键帧序号
+            resource_info: 关键帧的资源信息
+        
+        Returns:
+            bool: 保存是否成功
+        """
+        db = get_db()
+        try:
+            db.execute(
+                """
+                INSERT OR REPLACE INTO heartbeat_keyframes (agent_id, seq, resource_info, updated_time)
+                VALUES (?, ?, ?, ?)
+                """,
+                (agent_id, seq, json.dumps(resource_info), datetime.now())
+            )
+            return True
+        except Exception as e:
+            system_logger.error(f"保存心跳关键帧失败: Agent ID={agent_id}, 错误={str(e)}")
+            return False
+    
+    def delete(self, agent_id):
+        """删除Agent的关键帧
+        
+        Args:
+            agent_id: Agent ID
+        
+        Returns:
+            bool: 删除是否成功
+        """
+        db = get_db()
+        try:
+            db.execute("DELETE FROM heartbeat_keyframes WHERE agent_id = ?", (agent_id,))
+            return True
+        except Exception as e:
+            system_logger.error(f"删除心跳关键帧失败: Agent ID={agent_id}, 错误={str(e)}")
+            return False
@@ -11,6 +11,9 @@ from backend.utils.database import get_db
 from backend.utils.logger import system_logger
 from config import Config
 
+# 单条SQL中IN列表的最大参数数量（SQLite默认上限为999）
+MAX_SQL_PARAMS = 900
+
 class Task:
     """任务数据模型类"""
     
@@ -18,7 +21,7 @@ class Task:
                  status="waiting", created_time=None, script_content=None,
                  cpu_cores=None, gpu_count=None, gpu_memory=None,
                  start_time=None, end_time=None, execution_time=None,
-                 agent_id=None, log_file=None, depends_on=None):
+                 agent_id=None, log_file=None, depends_on=None, version=0):
         """初始化任务实例
         
         Args:
@@ -38,6 +41,7 @@ class Task:
             agent_id: 执行该任务的Agent ID
             log_file: 日志文件路径
             depends_on: 依赖任务ID列表
+            version: 版本号，每次更新加1，用于条件更新
         """
         self.id = id
         self.name = name
@@ -55,6 +59,7 @@ class Task:
         self.agent_id = agent_id
         self.log_file = log_file
         self.depends_on = depends_on or []
+        self.version = version or 0
     
     @classmethod
     def create_task(cls, name, template_type, script_content, priority=3,
@@ -77,56 +82,57 @@ class Task:
         """
         db = get_db()
         
-        # 处理依赖任务，先查看是否有依赖任务未完成，若有则将状态设置为blocked
-        depends_on = depends_on or []
-        status = "waiting"
-        if depends_on:
-            # 查询依赖的任务是否都已完成
-            placeholders = ', '.join(['?'] * len(depends_on))
-            query = f"""
-                SELECT COUNT(*) as count 
-                FROM tasks 
-                WHERE id IN ({placeholders}) 
-                AND status != 'completed'
-            """
-            result = db.fetch_one(query, depends_on)
-            if result and result['count'] > 0:
-                status = "blocked"
-        
         # 创建日志文件路径
         log_dir = Config.TASK_LOG_PATH
         os.makedirs(log_dir, exist_ok=True)
         
-        # 插入任务记录
-        query = """
-            INSERT INTO tasks (
+        # 依赖检查、任务插入和依赖关系写入在同一个事务中完成，只提交一次
+        depends_on = depends_on or []
+        with db.transaction():
+            # 处理依赖任务，先查看是否有依赖任务未完成，若有则将状态设置为blocked
+            status = "waiting"
+            if depends_on:
+                # 查询依赖的任务是否都已完成
+                placeholders = ', '.join(['?'] * len(depends_on))
+                query = f"""
+                    SELECT COUNT(*) as count 
+                    FROM tasks 
+                    WHERE id IN ({placeholders}) 
+                    AND status != 'completed'
+                """
+                result = db.fetch_one(query, depends_on)
+                if result and result['count'] > 0:
+                    status = "blocked"
+            
+            # 插入任务记录
+            query = """
+                INSERT INTO tasks (
+                    name, template_type, priority, status, script_content,
+                    cpu_cores, gpu_count, gpu_memory, created_time
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """
+            created_time = datetime.now()
+            params = (
                 name, template_type, priority, status, script_content,
                 cpu_cores, gpu_count, gpu_memory, created_time
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        created_time = datetime.now()
-        params = (
-            name, template_type, priority, status, script_content,
-            cpu_cores, gpu_count, gpu_memory, created_time
-        )
-        cursor = db.execute(query, params)
-        task_id = cursor.lastrowid
-        
-        # 创建日志文件
-        log_file = os.path.join(log_dir, f"task_{task_id}.log")
-        
-        # 更新日志文件路径
-        db.execute(
-            "UPDATE tasks SET log_file = ? WHERE id = ?",
-            (log_file, task_id)
-        )
-        
-        # 如果有依赖任务，插入依赖关系
-        if depends_on:
-            for dep_id in depends_on:
-                db.execute(
+            )
+            cursor = db.execute(query, params)
+            task_id = cursor.lastrowid
+            
+            # 创建日志文件
+            log_file = os.path.join(log_dir, f"task_{task_id}.log")
+            
+            # 更新日志文件路径
+            db.execute(
+                "UPDATE tasks SET log_file = ? WHERE id = ?",
+                (log_file, task_id)
+            )
+            
+            # 如果有依赖任务，批量插入依赖关系
+            if depends_on:
+                db.executemany(
                     "INSERT INTO task_dependencies (task_id, depends_on_id) VALUES (?, ?)",
-                    (task_id, dep_id)
+                    [(task_id, dep_id) for dep_id in depends_on]
                 )
         
         system_logger.info(f"创建任务: ID={task_id}, 名称={name}, 状态={status}")
@@ -163,6 +169,79 @@ class Task:
         )
         return task
     
+    @classmethod
+    def from_rows(cls, rows):
+        """根据tasks表记录批量构建任务实例
+        
+        所有任务的依赖关系通过一次查询批量获取，避免逐个任务查询。
+        
+        Args:
+            rows: tasks表中的记录列表
+            
+        Returns:
+            list: 任务实例列表，顺序与rows一致
+        """
+        if not rows:
+            return []
+        
+        depends_map = cls.get_dependencies_map([row['id'] for row in rows])
+        return [cls(depends_on=depends_map.get(row['id'], []), **row) for row in rows]
+    
+    @classmethod
+    def get_dependencies_map(cls, task_ids):
+        """批量获取任务的依赖任务ID列表
+        
+        任务数量较少时使用IN查询，较多时一次性扫描依赖表，
+        查询次数与任务数量无关。
+        
+        Args:
+            task_ids: 任务ID列表
+            
+        Returns:
+            dict: 任务ID -> 依赖任务ID列表
+        """
+        db = get_db()
+        depends_map = {}
+        if not task_ids:
+            return depends_map
+        
+        if len(task_ids) <= MAX_SQL_PARAMS:
+            placeholders = ', '.join(['?'] * len(task_ids))
+            query = f"SELECT task_id, depends_on_id FROM task_dependencies WHERE task_id IN ({placeholders})"
+            rows = db.fetch_all(query, list(task_ids))
+            wanted = None
+        else:
+            rows = db.fetch_all("SELECT task_id, depends_on_id FROM task_dependencies")
+            wanted = set(task_ids)
+        
+        for row in rows:
+            if wanted is not None and row['task_id'] not in wanted:
+                continue
+            depends_map.setdefault(row['task_id'], []).append(row['depends_on_id'])
+        
+        return depends_map
+    
+    @classmethod
+    def get_tasks_by_ids(cls, task_ids):
+        """根据ID列表批量获取任务
+        
+        Args:
+            task_ids: 任务ID列表
+            
+        Returns:
+            list: 任务实例列表，顺序与task_ids一致，不存在的ID会被忽略
+        """
+        db = get_db()
+        rows = []
+        task_ids = list(task_ids)
+        for i in range(0, len(task_ids), MAX_SQL_PARAMS):
+            chunk = task_ids[i:i + MAX_SQL_PARAMS]
+            placeholders = ', '.join(['?'] * len(chunk))
+            rows.extend(db.fetch_all(f"SELECT * FROM tasks WHERE id IN ({placeholders})", chunk))
+        
+        tasks = {task.id: task for task in cls.from_rows(rows)}
+        return [tasks[task_id] for task_id in task_ids if task_id in tasks]
+    
     @classmethod
     def get_task_in_range(cls, start_id, end_id):
         """获取指定ID范围内的任务
@@ -175,16 +254,10 @@ class Task:
             list: 任务实例列表
         """
         db = get_db()
-        query = "SELECT id FROM tasks WHERE id >= ? AND id <= ? ORDER BY id"
-        task_ids = db.fetch_all(query, (start_id, end_id))
-        
-        tasks = []
-        for data in task_ids:
-            task = cls.get_task_by_id(data['id'])
-            if task:
-                tasks.append(task)
+        query = "SELECT * FROM tasks WHERE id >= ? AND id <= ? ORDER BY id"
+        rows = db.fetch_all(query, (start_id, end_id))
         
-        return tasks
+        return cls.from_rows(rows)
     
     @classmethod
     def get_max_id(cls):
@@ -207,16 +280,10 @@ class Task:
             list: 所有任务实例列表
         """
         db = get_db()
-        query = "SELECT id FROM tasks ORDER BY id"
-        task_ids = db.fetch_all(query)
-        
-        tasks = []
-        for data in task_ids:
-            task = cls.get_task_by_id(data['id'])
-            if task:
-                tasks.append(task)
+        query = "SELECT * FROM tasks ORDER BY id"
+        rows = db.fetch_all(query)
         
-        return tasks
+        return cls.from_rows(rows)
     
     def update_task(self):
         """更新任务信息到数据库
@@ -239,7 +306,8 @@ class Task:
                 end_time = ?,
                 execution_time = ?,
                 agent_id = ?,
-                log_file = ?
+                log_file = ?,
+                version = version + 1
             WHERE id = ?
         """
         params = (
@@ -261,14 +329,53 @@ class Task:
         
         try:
             db.execute(query, params)
+            self.version += 1
             system_logger.info(f"更新任务: ID={self.id}, 状态={self.status}")
             return True
         except Exception as e:
             system_logger.error(f"更新任务失败: ID={self.id}, 错误={str(e)}")
             return False
     
+    def claim_task(self, agent_id, start_time=None):
+        """领取任务（比较并设置）
+        
+        仅当任务在数据库中仍为waiting状态且版本号与本实例一致时，
+        才将其设置为running并分配给指定Agent。条件更新由SQLite保证原子性，
+        多个进程或线程同时领取同一任务时只有一个能够成功。
+        
+        Args:
+            agent_id: 领取任务的Agent ID
+            start_time: 开始时间，默认为当前时间
+            
+        Returns:
+            bool: 领取是否成功，失败说明任务已被其他Agent领取或已被修改
+        """
+        db = get_db()
+        start_time = start_time or datetime.now()
+        cursor = db.execute("""
+            UPDATE tasks SET
+                status = 'running',
+                agent_id = ?,
+                start_time = ?,
+                version = version + 1
+            WHERE id = ? AND status = 'waiting' AND version = ?
+        """, (agent_id, start_time, self.id, self.version))
+        
+        if cursor.rowcount != 1:
+            return False
+        
+        self.status = 'running'
+        self.agent_id = agent_id
+        self.start_time = start_time
+        self.version += 1
+        system_logger.info(f"领取任务: ID={self.id}, Agent ID={agent_id}")
+        return True
+    
     def cancel_task(self):
-        """取消任务
+        """取消任务（条件更新）
+        
+        只修改status、end_time和version，不写回本实例中的其他字段：取消与领取并发时，
+        不会用读取时的旧值覆盖领取写入的agent_id和start_time。数据库中的任务已进入终态时不做修改。
         
         Returns:
             bool: 取消是否成功
@@ -277,13 +384,25 @@ class Task:
             system_logger.warning(f"无法取消任务: ID={self.id}, 当前状态={self.status}")
             return False
         
-        self.status = 'canceled'
-        result = self.update_task()
+        db = get_db()
+        end_time = datetime.now()
+        cursor = db.execute("""
+            UPDATE tasks SET
+                status = 'canceled',
+                end_time = ?,
+                version = version + 1
+            WHERE id = ? AND status NOT IN ('completed', 'failed', 'canceled')
+        """, (end_time, self.id))
         
-        if result:
-            system_logger.info(f"取消任务: ID={self.id}")
+        if cursor.rowcount != 1:
+            system_logger.warning(f"无法取消任务: ID={self.id}, 任务已结束或不存在")
+            return False
         
-        return result
+        self.status = 'canceled'
+        self.end_time = end_time
+        self.version += 1
+        system_logger.info(f"取消任务: ID={self.id}")
+        return True
     
     def to_dict(self):
         """将任务转换为字典
@@ -307,5 +426,6 @@ class Task:
             'execution_time': self.execution_time,
             'agent_id': self.agent_id,
             'log_file': self.log_file,
-            'depends_on': self.depends_on
+            'depends_on': self.depends_on,
+            'version': self.version
         }
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务资源使用汇总数据模型
+"""
+
+from datetime import datetime
+from backend.utils.database import get_db
+from backend.utils.logger import system_logger
+
+# 子Agent上报的汇总字段及类型
+METRIC_FIELDS = (
+    ('wall_seconds', float),
+    ('cpu_seconds', float),
+    ('cpu_usage_avg', float),
+    ('cpu_usage_peak', float),
+    ('peak_rss', int),
+    ('peak_pss', int),
+    ('rusage_max_rss', int),
+    ('gpu_usage_avg', float),
+    ('gpu_usage_peak', float),
+    ('gpu_memory_peak', int),
+    ('samples', int)
+)
+
+class TaskAccounting:
+    """任务资源使用汇总数据模型类"""
+    
+    def __init__(self, task_id=None, agent_id=None, recorded_time=None, **metrics):
+        """初始化任务资源使用汇总
+        
+        Args:
+            task_id: 任务ID
+            agent_id: 上报的子Agent ID
+            recorded_time: 记录时间
+            **metrics: 汇总字段（见METRIC_FIELDS），未上报的字段为None
+                wall_seconds: 任务运行时长（秒）
+                cpu_seconds: CPU时间（秒，用户态+内核态）
+                cpu_usage_avg: 平均CPU使用率（百分比，可能超过100%）
+                cpu_usage_peak: 采样到的最大CPU使用率
+                peak_rss: 采样到的任务进程树RSS总和的最大值（字节）
+                peak_pss: 采样到的任务进程树PSS总和的最大值（字节）
+                rusage_max_rss: getrusage得到的任务进程树中单个进程的最大RSS（字节）
+                gpu_usage_avg: 分配给任务的GPU平均使用率（0~1）
+                gpu_usage_peak: 分配给任务的GPU最大使用率（0~1）
+                gpu_memory_peak: 分配给任务的GPU显存使用量最大值（字节）
+                samples: 采样次数
+        """
+        self.task_id = task_id
+        self.agent_id = agent_id
+        self.recorded_time = recorded_time or datetime.now()
+        for field, _ in METRIC_FIELDS:
+            setattr(self, field, metrics.get(field))
+    
+    @classmethod
+    def from_report(cls, task_id, agent_id, report):
+        """根据子Agent上报的数据构建实例，忽略未知字段和无法转换的值
+        
+        Args:
+            task_id: 任务ID
+            agent_id: 子Agent ID
+            report: 子Agent上报的汇总字典
+        
+        Returns:
+            accounting: 任务资源使用汇总实例
+        """
+        metrics = {}
+        for field, field_type in METRIC_FIELDS:
+            value = report.get(field)
+            if value is None:
+                continue
+            try:
+                metrics[field] = field_type(value)
+            except (TypeError, ValueError):
+                system_logger.warning(f"任务资源使用字段无效: 任务ID={task_id}, {field}={value}")
+        return cls(task_id=task_id, agent_id=agent_id, **metrics)
+    
+    def save(self):
+        """保存汇总，同一任务重复上报时覆盖
+        
+        Returns:
+            bool: 保存是否成功
+        """
+        db = get_db()
+        fields = ['task_id', 'agent_id', 'recorded_time'] + [field for field, _ in METRIC_FIELDS]
+        query = f"""
+            INSERT OR REPLACE INTO task_accounting ({', '.join(fields)})
+            VALUES ({', '.join('?' for _ in fields)})
+        """
+        params = tuple(getattr(self, field) for field in fields)
+        
+        try:
+            db.execute(query, params)
+            system_logger.info(f"保存任务资源使用: 任务ID={self.task_id}")
+            return True
+        except Exception as e:
+            system_logger.error(f"保存任务资源使用失败: 任务ID={self.task_id}, 错误={str(e)}")
+            return False
+    
+    @classmethod
+    def get_by_task_id(cls, task_id):
+        """根据任务ID获取汇总
+        
+        Args:
+            task_id: 任务ID
+        
+        Returns:
+            accounting: 任务资源使用汇总实例，不存在时返回None
+        """
+        db = get_db()
+        row = db.fetch_one("SELECT * FROM task_accounting WHERE task_id = ?", (task_id,))
+        if not row:
+            return None
+        
+        return cls(
+            task_id=row['task_id'],
+            agent_id=row['agent_id'],
+            recorded_time=row['recorded_time'],
+            **{field: row[field] for field, _ in METRIC_FIELDS}
+        )
+    
+    def to_dict(self):
+        """将汇总转换为字典
+        
+        Returns:
+            dict: 汇总字典表示
+        """
+        result = {
+            'task_id': self.task_id,
+            'agent_id': self.agent_id,
+            'recorded_time': self.recorded_time
+        }
+        for field, _ in METRIC_FIELDS:
+            result[field] = getattr(self, field)
+        return result
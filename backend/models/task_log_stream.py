@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务日志流数据模型
+
+子Agent按字节偏移分块上报任务输出，服务器把每个任务已写入日志文件的输出流偏移保存在
+task_log_streams表中。偏移只针对子Agent的输出流，不包含服务器写入同一日志文件的任务事件。
+"""
+
+from datetime import datetime
+from backend.utils.database import get_db
+from backend.utils.logger import system_logger
+
+class TaskLogStream:
+    """任务日志流数据模型类"""
+    
+    def __init__(self, task_id=None, agent_id=None, acked_offset=0, updated_time=None):
+        """初始化任务日志流
+        
+        Args:
+            task_id: 任务ID
+            agent_id: 上报日志的子Agent ID，子Agent变化时输出流从0重新开始
+            acked_offset: 已写入日志文件的字节偏移
+            updated_time: 更新时间
+        """
+        self.task_id = task_id
+        self.agent_id = agent_id
+        self.acked_offset = acked_offset
+        self.updated_time = updated_time or datetime.now()
+    
+    def save(self):
+        """保存日志流状态
+        
+        Returns:
+            bool: 保存是否成功
+        """
+        db = get_db()
+        self.updated_time = datetime.now()
+        try:
+            db.execute(
+                """
+                INSERT OR REPLACE INTO task_log_streams (task_id, agent_id, acked_offset, updated_time)
+                VALUES (?, ?, ?, ?)
+                """,
+                (self.task_id, self.agent_id, self.acked_offset, self.updated_time)
+            )
+            return True
+        except Exception as e:
+            system_logger.error(f"保存任务日志流失败: 任务ID={self.task_id}, 错误={str(e)}")
+            return False
+    
+    @classmethod
+    def get_by_task_id(cls, task_id):
+        """根据任务ID获取日志流
+        
+        Args:
+            task_id: 任务ID
+        
+        Returns:
+            stream: 任务日志流实例，不存在时返回None
+        """
+        db = get_db()
+        row = db.fetch_one("SELECT * FROM task_log_streams WHERE task_id = ?", (task_id,))
+        if not row:
+            return None
+        
+        return cls(
+            task_id=row['task_id'],
+            agent_id=row['agent_id'],
+            acked_offset=row['acked_offset'],
+            updated_time=row['updated_time']
+        )
+    
+    def to_dict(self):
+        """将日志流转换为字典
+        
+        Returns:
+            dict: 日志流字典表示
+        """
+        return {
+            'task_id': self.task_id,
+            'agent_id': self.agent_id,
+            'acked_offset': self.acked_offset,
+            'updated_time': self.updated_time
+        }
@@ -43,13 +43,6 @@ class Template:
         
         db = get_db()
         
-        # 检查名称是否已存在
-        check_query = "SELECT id FROM templates WHERE name = ?"
-        existing = db.fetch_one(check_query, (name,))
-        if existing:
-            system_logger.error(f"创建模板失败: 名称已存在: {name}")
-            return None
-        
         # 插入模板记录
         query = """
             INSERT INTO templates (name, content, created_time)
@@ -59,8 +52,18 @@ class Template:
         params = (name, content, created_time)
         
         try:
-            cursor = db.execute(query, params)
-            template_id = cursor.lastrowid
+            # 名称检查和插入在同一个事务中完成
+            with db.transaction():
+                # 检查名称是否已存在
+                check_query = "SELECT id FROM templates WHERE name = ?"
+                existing = db.fetch_one(check_query, (name,))
+                if existing:
+                    system_logger.error(f"创建模板失败: 名称已存在: {name}")
+                    return None
+                
+                cursor = db.execute(query, params)
+                template_id = cursor.lastrowid
+            
             system_logger.info(f"创建模板成功: ID={template_id}, 名称={name}")
             
             # 返回创建的模板实例
@@ -156,14 +159,7 @@ class Template:
             system_logger.error("更新模板失败: 无效的模板ID")
             return False
         
-        # 检查名称是否已被其他模板使用
         db = get_db()
-        check_query = "SELECT id FROM templates WHERE name = ? AND id != ?"
-        existing = db.fetch_one(check_query, (self.name, self.id))
-        if existing:
-            system_logger.error(f"更新模板失败: 名称已被其他模板使用: {self.name}")
-            return False
-        
         query = """
             UPDATE templates SET
                 name = ?,
@@ -173,7 +169,16 @@ class Template:
         params = (self.name, self.content, self.id)
         
         try:
-            db.execute(query, params)
+            with db.transaction():
+                # 检查名称是否已被其他模板使用
+                check_query = "SELECT id FROM templates WHERE name = ? AND id != ?"
+                existing = db.fetch_one(check_query, (self.name, self.id))
+                if existing:
+                    system_logger.error(f"更新模板失败: 名称已被其他模板使用: {self.name}")
+                    return False
+                
+                db.execute(query, params)
+            
             system_logger.info(f"更新模板成功: ID={self.id}, 名称={self.name}")
             return True
         except Exception as e:
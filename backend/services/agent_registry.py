@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+内存中的Agent状态表
+
+心跳只更新内存中的Agent，由后台线程按AGENT_REGISTRY_FLUSH_INTERVAL把有变化的Agent
+在一个事务中批量写回数据库，心跳不再每次都读写agents表。Agent列表和详情直接从内存返回。
+
+写回语义:
+    - 只有心跳带来的字段（最后心跳时间、运行时长、CPU/内存使用、GPU信息、可用CPU核心数）
+      延迟写回。创建、取消、子Agent结束等状态变化仍在各自的事务中立即写入数据库，
+      提交后再更新内存。
+    - 服务器崩溃时最多丢失一个写回间隔内的心跳字段，数据库中的last_heartbeat_time可能
+      比实际落后一个写回间隔；Agent状态和任务状态不会丢失。重启后从数据库重新加载。
+    - 正常退出时会再写回一次。
+    - 多进程部署时各进程有各自的内存状态。get/get_all每隔AGENT_REGISTRY_REFRESH_INTERVAL
+      从数据库重新读取Agent，其他进程提交的状态变化（如取消）最多延迟一个刷新间隔可见；
+      在事务中修改Agent状态时用get(agent_id, refresh=True)读取数据库中的最新状态。
+      心跳字段取内存和数据库中最后心跳时间较新的一份，未写回的心跳字段不会被覆盖。
+"""
+
+import copy
+import atexit
+import threading
+import time
+from datetime import datetime
+from backend.models.agent import Agent
+from backend.utils.logger import system_logger
+from config import Config
+
+# 心跳更新、延迟写回的字段
+HEARTBEAT_FIELDS = (
+    'last_heartbeat_time', 'running_time', 'cpu_usage', 'memory_used',
+    'memory_total', 'gpu_info', 'available_cpu_cores'
+)
+
+def clone_agent(agent):
+    """复制Agent实例，调用方修改副本不会影响内存中的状态
+    
+    时间字段转换为与从数据库读出时相同的字符串格式，接口返回的格式不因是否已写回而变化。
+    """
+    clone = copy.copy(agent)
+    clone.gpu_info = [dict(gpu) for gpu in agent.gpu_info]
+    for field in ('created_time', 'last_heartbeat_time'):
+        value = getattr(clone, field)
+        if isinstance(value, datetime):
+            setattr(clone, field, str(value))
+    return clone
+
+def _heartbeat_key(agent):
+    """用于比较两份Agent心跳字段新旧的最后心跳时间"""
+    return str(agent.last_heartbeat_time or '')
+
+class AgentRegistry:
+    """内存中的Agent状态表，定期批量写回数据库"""
+    
+    def __init__(self, flush_interval=None, refresh_interval=None):
+        """初始化Agent状态表
+        
+        Args:
+            flush_interval: 写回数据库的间隔（秒），0表示每次心跳立即写回
+            refresh_interval: 从数据库重新读取Agent的间隔（秒），0表示不重新读取
+        """
+        self.flush_interval = (Config.AGENT_REGISTRY_FLUSH_INTERVAL
+                               if flush_interval is None else flush_interval)
+        self.refresh_interval = (Config.AGENT_REGISTRY_REFRESH_INTERVAL
+                                 if refresh_interval is None else refresh_interval)
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._agents = {}  # Agent ID -> Agent实例
+        self._dirty = set()  # 有未写回心跳字段的Agent ID
+        self._version = 0  # put的次数
+        self._put_versions = {}  # Agent ID -> 最近一次put时的版本
+        self._loaded = False
+        self._refreshed = 0  # 最近一次重新读取的时间（time.monotonic）
+        self._thread = None
+        self._stop = threading.Event()
+    
+    def reload(self):
+        """从数据库重新加载所有Agent，未写回的心跳字段会先写回
+        
+        Returns:
+            int: Agent数量
+        """
+        self.flush()
+        return self.refresh()
+    
+    def refresh(self):
+        """从数据库重新读取所有Agent，合并其他进程提交的状态变化，不写回心跳字段
+        
+        Returns:
+            int: Agent数量
+        """
+        self._refreshed = time.monotonic()
+        with self._lock:
+            since = self._version
+        agents = Agent.get_all_agents()
+        with self._lock:
+            for agent in agents:
+                self._merge(agent, since)
+            self._loaded = True
+            return len(self._agents)
+    
+    def get(self, agent_id, refresh=False):
+        """获取Agent，内存中没有时从数据库加载
+        
+        Args:
+            agent_id: Agent ID
+            refresh: 是否从数据库读取最新状态，在事务中修改Agent状态前使用
+        
+        Returns:
+            agent: Agent实例的副本，不存在时返回None
+        """
+        if not agent_id:
+            return None
+        
+        self._refresh_if_due()
+        if not refresh:
+            with self._lock:
+                agent = self._agents.get(agent_id)
+                if agent is not None:
+                    return clone_agent(agent)
+        
+        with self._lock:
+            since = self._version
+        agent = Agent.get_agent_by_id(agent_id)
+        if agent is None:
+            return None
+        with self._lock:
+            return clone_agent(self._merge(agent, since))
+    
+    def get_all(self):
+        """获取所有Agent
+        
+        Returns:
+            list: Agent实例副本列表
+        """
+        if not self._loaded:
+            self.reload()
+        else:
+            self._refresh_if_due()
+        with self._lock:
+            return [clone_agent(agent) for agent in self._agents.values()]
+    
+    def put(self, agent):
+        """Agent已写入数据库（创建、状态变化），更新内存中的Agent
+        
+        Args:
+            agent: 已提交到数据库的Agent实例
+        """
+        with self._lock:
+            self._agents[agent.id] = clone_agent(agent)
+            self._version += 1
+            self._put_versions[agent.id] = self._version
+    
+    def update_heartbeat(self, agent):
+        """记录Agent的心跳字段，延迟写回数据库
+        
+        Args:
+            agent: 已更新心跳字段的Agent实例
+        """
+        with self._lock:
+            cached = self._agents.get(agent.id)
+            if cached is None:
+                self._agents[agent.id] = clone_agent(agent)
+            else:
+                self._copy_heartbeat(clone_agent(agent), cached)
+            self._dirty.add(agent.id)
+        
+        # 未启动写回线程时立即写回
+        if not self.flush_interval or not self.is_running():
+            self.flush()
+    
+    def flush(self):
+        """把有未写回心跳字段的Agent批量写回数据库
+        
+        Returns:
+            int: 写回的Agent数量
+        """
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty = self._dirty
+            self._dirty = set()
+            agents = [copy.copy(self._agents[agent_id]) for agent_id in dirty if agent_id in self._agents]
+        
+        if Agent.update_heartbeats(agents):
+            return len(agents)
+        
+        # 写回失败，下次重试
+        with self._lock:
+            self._dirty |= dirty
+        return 0
+    
+    def is_running(self):
+        """写回线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """启动后台写回线程，进程退出时再写回一次"""
+        if not self.flush_interval or self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name='agent-registry-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        system_logger.info(f"Agent状态写回线程已启动: 间隔={self.flush_interval}秒")
+    
+    def stop(self):
+        """停止后台写回线程并写回剩余的心跳字段"""
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+    
+    def _flush_loop(self):
+        """后台写回线程"""
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                system_logger.error(f"Agent状态写回失败: {str(e)}")
+    
+    def _refresh_if_due(self):
+        """距上一次重新读取已超过刷新间隔时重新读取，同一时间只有一个线程读取"""
+        if not self.refresh_interval or time.monotonic() - self._refreshed < self.refresh_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._refreshed >= self.refresh_interval:
+                self.refresh()
+        except Exception as e:
+            system_logger.error(f"重新读取Agent状态失败: {str(e)}")
+        finally:
+            self._refresh_lock.release()
+    
+    def _merge(self, agent, since):
+        """把从数据库读出的Agent合并到内存中，调用方持有_lock
+        
+        Args:
+            agent: 从数据库读出的Agent实例
+            since: 读取数据库前的版本，之后put过的Agent以内存为准
+        
+        Returns:
+            agent: 内存中的Agent实例
+        """
+        cached = self._agents.get(agent.id)
+        if cached is not None:
+            if self._put_versions.get(agent.id, 0) > since:
+                return cached
+            # 未写回或比数据库更新的心跳字段以内存为准
+            if agent.id in self._dirty or _heartbeat_key(cached) > _heartbeat_key(agent):
+                self._copy_heartbeat(cached, agent)
+        agent = clone_agent(agent)
+        self._agents[agent.id] = agent
+        return agent
+    
+    def _copy_heartbeat(self, source, target):
+        """复制心跳字段"""
+        for field in HEARTBEAT_FIELDS:
+            setattr(target, field, getattr(source, field))
+        target.gpu_info = [dict(gpu) for gpu in source.gpu_info]
+
+# 全局Agent状态表实例
+agent_registry = AgentRegistry()
+
+def get_agent_registry():
+    """获取Agent状态表实例"""
+    return agent_registry
@@ -5,14 +5,28 @@
 Agent管理服务
 """
 
-import json
+import time
+import base64
 from datetime import datetime, timedelta
 from backend.models.agent import Agent
 from backend.utils.database import get_db
 from backend.utils.logger import system_logger, get_agent_logger
 from backend.services.task_service import TaskService
+from backend.services.heartbeat_notifier import get_heartbeat_notifier
+from backend.services.agent_registry import get_agent_registry
+from backend.services.metrics_store import get_metrics_store
+from backend.models.agent_action import AgentAction
+from backend.models.heartbeat_keyframe import HeartbeatKeyframeStore
+from backend.utils.heartbeat_codec import HeartbeatDecoder
 from config import Config
 
+# 可以通过post_action下发给Agent的控制操作
+CONTROL_ACTIONS = ('reject_new_task', 'accept_new_task', 'quit')
+
+# 心跳解码状态（按Agent保存关键帧和合并后的资源信息），所有AgentService实例共用，
+# 关键帧同时保存在数据库中供其他进程解码
+heartbeat_decoder = HeartbeatDecoder(keyframe_store=HeartbeatKeyframeStore())
+
 class AgentService:
     """Agent管理服务类，封装Agent相关业务逻辑"""
     
@@ -20,8 +34,12 @@ class AgentService:
         """初始化Agent服务"""
         self.db = get_db()
         self.task_service = TaskService()
+        self.notifier = get_heartbeat_notifier()
+        self.registry = get_agent_registry()
+        self.metrics = get_metrics_store()
+        self.decoder = heartbeat_decoder
     
-    def create_main_agent(self, name, cpu_cores, gpu_ids=None, monitor_file=None):
+    def create_main_agent(self, name, cpu_cores, gpu_ids=None, monitor_file=None, memory_total=None):
         """创建主Agent
         
         Args:
@@ -29,6 +47,7 @@ class AgentService:
             cpu_cores: CPU核心数
             gpu_ids: GPU ID列表
             monitor_file: 监控文件路径
+            memory_total: 内存总量（字节）
             
         Returns:
             agent: 新创建的主Agent
@@ -40,18 +59,20 @@ class AgentService:
             type='main',
             cpu_cores=cpu_cores,
             gpu_ids=gpu_ids,
-            monitor_file=monitor_file
+            monitor_file=monitor_file,
+            memory_total=memory_total
         )
         
         # 记录Agent创建日志
         if agent:
+            self.registry.put(agent)
             logger = get_agent_logger(agent.id)
             logger.info(f"主Agent创建成功: ID={agent.id}, 名称={name}")
             logger.info(f"资源配置: CPU核心数={cpu_cores}, GPU IDs={gpu_ids}")
         
         return agent
     
-    def create_sub_agent(self, name, main_agent_id, task_id, cpu_cores=None, gpu_ids=None):
+    def create_sub_agent(self, name, main_agent_id, task_id, cpu_cores=None, gpu_ids=None, memory_total=None):
         """创建子Agent
         
         Args:
@@ -60,13 +81,14 @@ class AgentService:
             task_id: 关联的任务ID
             cpu_cores: 分配的CPU核心数
             gpu_ids: 分配的GPU ID列表
+            memory_total: 内存总量（字节）
             
         Returns:
             agent: 新创建的子Agent
         """
         
         # 检查主Agent是否存在
-        main_agent = Agent.get_agent_by_id(main_agent_id)
+        main_agent = self.registry.get(main_agent_id)
         if not main_agent or main_agent.type != 'main' or main_agent.status != 'online':
             system_logger.error(f"创建子Agent失败: 主Agent不存在或不可用: ID={main_agent_id}")
             return None
@@ -78,11 +100,13 @@ class AgentService:
             cpu_cores=cpu_cores,
             gpu_ids=gpu_ids,
             task_id=task_id,
-            main_agent_id=main_agent_id
+            main_agent_id=main_agent_id,
+            memory_total=memory_total
         )
         
         if not agent:
             return None
+        self.registry.put(agent)
         
         # 记录日志
         logger = get_agent_logger(agent.id)
@@ -100,7 +124,29 @@ class AgentService:
         Returns:
             agent: Agent实例
         """
-        return Agent.get_agent_by_id(agent_id)
+        return self.registry.get(agent_id)
+    
+    def get_agent_metrics(self, agent_id, start=None, end=None, step=None):
+        """获取Agent的资源使用时间序列
+        
+        Args:
+            agent_id: Agent ID
+            start: 起始时间戳（秒），默认为结束时间前1小时
+            end: 结束时间戳（秒），默认为当前时间
+            step: 数据点间隔（秒），默认自动选择
+            
+        Returns:
+            dict: 时间序列（格式见MetricsStore.get_series），Agent不存在时返回None
+        
+        Raises:
+            ValueError: 时间范围或step无效
+        """
+        if not self.registry.get(agent_id):
+            return None
+        
+        end = time.time() if end is None else end
+        start = end - 3600 if start is None else start
+        return self.metrics.get_series(agent_id, start, end, step)
     
     def get_all_agents(self, filter_type=None, filter_status=None):
         """获取所有Agent（可选过滤）
@@ -112,7 +158,7 @@ class AgentService:
         Returns:
             list: Agent列表
         """
-        agents = Agent.get_all_agents()
+        agents = self.registry.get_all()
         
         # 应用过滤
         if filter_type:
@@ -123,6 +169,18 @@ class AgentService:
         
         return agents
     
+    def get_sub_agents(self, main_agent_id, filter_status=None):
+        """获取主Agent下的子Agent
+        
+        Args:
+            main_agent_id: 主Agent ID
+            filter_status: 可选的Agent状态过滤
+            
+        Returns:
+            list: 子Agent列表
+        """
+        return Agent.get_agents_by_main_agent(main_agent_id, status=filter_status)
+    
     def cancel_agent(self, agent_id):
         """取消Agent
         
@@ -132,56 +190,67 @@ class AgentService:
         Returns:
             bool: 取消是否成功
         """
-        agent = Agent.get_agent_by_id(agent_id)
-        if not agent:
-            system_logger.error(f"取消Agent失败: Agent不存在: ID={agent_id}")
-            return False
-        
-        # 如果是主Agent，先取消所有子Agent
-        if agent.type == 'main':
-            sub_agents = self.get_sub_agents(main_agent_id=agent_id, filter_status='online')
-            for sub_agent in sub_agents:
-                self.cancel_agent(sub_agent.id)
-        
-        # 如果是子Agent且有关联任务，标记任务为失败
-        if agent.type == 'sub' and agent.task_id:
-            task = self.task_service.get_task_by_id(agent.task_id)
-            if task and task.status == 'running':
-                self.task_service.update_task_by_key(
-                    task.id, 
-                    status='failed',
-                    end_time=datetime.now()
-                )
-                logger = get_agent_logger(agent.id)
-                logger.warning(f"Agent被取消，任务标记为失败: 任务ID={agent.task_id}")
-        
-        # 如果是子Agent，返还资源给主Agent
-        if agent.type == 'sub' and agent.main_agent_id:
-            main_agent = Agent.get_agent_by_id(agent.main_agent_id)
-            if main_agent:
-                # 返还CPU资源
-                if agent.cpu_cores and main_agent.available_cpu_cores is not None:
-                    main_agent.available_cpu_cores += agent.cpu_cores
-                
-                # 返还GPU资源
-                for gpu in agent.gpu_info:
-                    gpu_id = gpu.get('gpu_id')
-                    for main_gpu in main_agent.gpu_info:
-                        if main_gpu.get('gpu_id') == gpu_id:
-                            main_gpu['is_available'] = True
-                            break
-                
-                main_agent.update_agent()
-        
-        return agent.cancel_agent()
+        # 级联取消、任务状态和资源返还在同一个事务中完成
+        with self.db.transaction():
+            # 读取数据库中的最新状态，其他进程可能已修改该Agent
+            agent = self.registry.get(agent_id, refresh=True)
+            if not agent:
+                system_logger.error(f"取消Agent失败: Agent不存在: ID={agent_id}")
+                return False
+            
+            # 如果是主Agent，先取消所有子Agent
+            if agent.type == 'main':
+                sub_agents = self.get_sub_agents(main_agent_id=agent_id, filter_status='online')
+                for sub_agent in sub_agents:
+                    self.cancel_agent(sub_agent.id)
+            
+            # 如果是子Agent且有关联任务，标记任务为失败
+            if agent.type == 'sub' and agent.task_id:
+                task = self.task_service.get_task_by_id(agent.task_id)
+                if task and task.status == 'running':
+                    self.task_service.update_task_by_key(
+                        task.id, 
+                        status='failed',
+                        end_time=datetime.now()
+                    )
+                    logger = get_agent_logger(agent.id)
+                    logger.warning(f"Agent被取消，任务标记为失败: 任务ID={agent.task_id}")
+            
+            # 如果是子Agent，返还资源给主Agent
+            if agent.type == 'sub' and agent.main_agent_id:
+                main_agent = self.registry.get(agent.main_agent_id, refresh=True)
+                if main_agent:
+                    # 返还CPU资源
+                    if agent.cpu_cores and main_agent.available_cpu_cores is not None:
+                        main_agent.available_cpu_cores += agent.cpu_cores
+                    
+                    # 返还GPU资源
+                    for gpu in agent.gpu_info:
+                        gpu_id = gpu.get('gpu_id')
+                        for main_gpu in main_agent.gpu_info:
+                            if main_gpu.get('gpu_id') == gpu_id:
+                                main_gpu['is_available'] = True
+                                break
+                    
+                    main_agent.update_agent()
+                    self.db.after_commit(lambda: self.registry.put(main_agent))
+            
+            # 提交后更新内存中的Agent，并唤醒正在长轮询的心跳，使Agent立即收到退出指令
+            self.db.after_commit(lambda: self.registry.put(agent))
+            self.db.after_commit(lambda: self.notifier.wake_agent(agent_id))
+            return agent.cancel_agent()
     
-    def handle_heartbeat(self, agent_id, data):
+    def handle_heartbeat(self, agent_id, data, wait=0, dispatch=True):
         """处理Agent心跳
         
         Args:
             agent_id: Agent ID
-            data: agent传来的信息
+            wait: 长轮询等待时间（秒），仅对主Agent有效，0表示立即返回
+            dispatch: 是否为主Agent分配新任务，WebSocket通道由服务器主动推送任务时为False
+            data: agent传来的信息，资源增量的格式见backend/utils/heartbeat_codec.py
                 {
+                    'seq': 心跳序号（旧版Agent没有此字段，每次发送全量资源信息）,
+                    'full': 是否为全量资源信息,
                     'resource_info': {
                         'cpu_cores': CPU核心数,
                         'cpu_usage': CPU使用率(百分比，可能超过100%),
@@ -189,29 +258,122 @@ class AgentService:
                         'memory_total_usage': 系统总内存使用量(字节),
                         'memory_used': 内存使用量(字节),
                         'gpu_info': GPU信息列表,
-                        'gpu_ids': 可用GPU ID列表
+                        'gpu_ids': 可用GPU ID列表,
+                        'available_cpu_cores': 可用CPU核心数,
+                        'reject_new_task': 是否拒绝新任务,
+                        'max_tasks': 本次心跳最多接收的任务数（仅主agent提供）
                     }
                     'task_info': { # 仅子agent提供
                         'status': 任务状态, 
-                        'log': 新日志内容
+                        'log': 新日志内容（旧版子Agent，新版子Agent通过日志分块接口上报）,
+                        'accounting': 任务资源使用汇总（仅任务结束后的最后一次心跳）
                     }
                 }
                 
         Returns:
             dict: 包含Agent应执行的操作
                 {
-                    'action': 操作类型，如'continue', 'new_task', 'stop',
-                    'task': 如果action='new_task'，则包含新任务信息
+                    'action': 操作类型，如'continue', 'new_task', 'stop', 'quit', 'reject_new_task', 'accept_new_task',
+                    'task': 如果action='new_task'，则包含第一个新任务信息,
+                    'tasks': 如果action='new_task'，则包含本次分配的全部新任务信息,
+                    'resync': 无法解码资源增量时为True，要求Agent下一次心跳发送全量资源信息
                 }
         """
-        agent = Agent.get_agent_by_id(agent_id)
+        # 合并资源增量；缺少增量所基于的关键帧时忽略本次资源信息，不按过期的资源分配任务
+        resource_info, resync = self.decoder.decode(agent_id, data)
+        if resync:
+            system_logger.warning(f"无法解码心跳资源增量，要求重新同步: Agent ID={agent_id}, 序号={data.get('seq')}, 关键帧={data.get('base')}")
+        
+        response = self._process_heartbeat(
+            agent_id, resource_info or {}, data.get('task_info', {}),
+            wait=wait, dispatch=dispatch and not resync
+        )
+        if response['action'] in ('stop', 'quit'):
+            self.decoder.forget(agent_id)
+            AgentAction.clear(agent_id)
+        if resync:
+            response['resync'] = True
+        return response
+    
+    def handle_heartbeat_batch(self, heartbeats):
+        """处理主Agent汇聚转发的一批子Agent心跳
+        
+        按顺序逐个处理，同一个子Agent可以有多个心跳。批量心跳不分配新任务。
+        
+        Args:
+            heartbeats: 心跳列表 [{'agent_id': Agent ID, 'data': 与handle_heartbeat相同的心跳数据}]
+        
+        Returns:
+            list: 与心跳列表一一对应的响应
+        """
+        responses = []
+        for heartbeat in heartbeats:
+            agent_id = heartbeat.get('agent_id')
+            try:
+                responses.append(self.handle_heartbeat(agent_id, heartbeat.get('data') or {}, dispatch=False))
+            except Exception as e:
+                system_logger.error(f"处理批量心跳失败: ID={agent_id}, 错误={str(e)}")
+                responses.append({'action': 'continue'})
+        return responses
+    
+    def append_log_chunks(self, chunks):
+        """写入主Agent汇聚转发的子Agent日志块
+        
+        Args:
+            chunks: 日志块列表 [{'agent_id': 子Agent ID, 'task_id': 任务ID, 'offset': 字节偏移, 'data': base64编码的日志块}]
+        
+        Returns:
+            list: 与日志块一一对应的已确认偏移（与POST /api/tasks/<id>/log/chunks的acked_offset相同），
+                小于日志块偏移表示中间的日志缺失，日志块无效时为None
+        """
+        acked_offsets = []
+        for chunk in chunks:
+            try:
+                agent_id = chunk['agent_id']
+                task_id = int(chunk['task_id'])
+                offset = int(chunk['offset'])
+                data = base64.b64decode(chunk['data'])
+                if offset < 0 or len(data) > Config.LOG_CHUNK_MAX_SIZE:
+                    raise ValueError(f"偏移或大小无效: 偏移={offset}, 大小={len(data)}")
+            except (KeyError, TypeError, ValueError) as e:
+                system_logger.error(f"子Agent日志块无效: {str(e)}")
+                acked_offsets.append(None)
+                continue
+            
+            try:
+                self.task_service.append_task_log(task_id, data, offset=offset, agent_id=agent_id)
+            except ValueError:
+                # 中间的日志缺失，返回的确认偏移小于日志块偏移，子Agent从确认偏移重新发送
+                pass
+            except Exception as e:
+                system_logger.error(f"写入子Agent日志块失败: 任务ID={task_id}, 错误={str(e)}")
+            acked_offsets.append(self.task_service.get_task_log_offset(task_id, agent_id))
+        return acked_offsets
+    
+    def _process_heartbeat(self, agent_id, resource_info, task_info, wait=0, dispatch=True):
+        """按合并后的资源信息处理Agent心跳
+        
+        Args:
+            agent_id: Agent ID
+            resource_info: 合并后的资源信息
+            task_info: 任务信息
+            wait: 长轮询等待时间（秒）
+            dispatch: 是否为主Agent分配新任务
+        
+        Returns:
+            dict: Agent应执行的操作
+        """
+        agent = self.registry.get(agent_id)
         if not agent or agent.status == "end":
             system_logger.error(f"处理心跳失败: Agent不存在: ID={agent_id}")
             return {'action': 'stop'}
         
-        # 从data中提取信息
-        resource_info = data.get('resource_info', {})
-        task_info = data.get('task_info', {})
+        # Agent已被取消，通知其退出
+        if agent.status == 'offline':
+            return {'action': 'quit'}
+        
+        # 记录处理心跳前的通知代数，处理期间发生的事件不会被长轮询错过
+        generation = self.notifier.generation
         
         # 更新Agent信息
         agent.last_heartbeat_time = datetime.now()
@@ -229,8 +391,11 @@ class AgentService:
                 agent.memory_total = resource_info['memory_total']
             
             if 'gpu_info' in resource_info:
-                # 更新GPU信息
-                agent.gpu_info = json.dumps(resource_info['gpu_info'])
+                # 更新GPU信息（保存时由update_agent序列化）
+                agent.gpu_info = resource_info['gpu_info']
+            
+            if 'available_cpu_cores' in resource_info:
+                agent.available_cpu_cores = resource_info['available_cpu_cores']
             
             # 确保 created_time 是 datetime 对象
             if isinstance(agent.created_time, str):
@@ -243,53 +408,207 @@ class AgentService:
             agent.running_time = (datetime.now() - agent.created_time).total_seconds()
             agent.last_heartbeat_time = datetime.now()
 
+            # 记录资源使用时间序列
+            self.metrics.record(agent_id, resource_info)
+
         
         # 处理任务信息，主要针对子Agent
+        task = None
         if task_info and agent.task_id and agent.type == 'sub':
             task = self.task_service.get_task_by_id(agent.task_id)
-            if task:
-                # 处理任务状态更新
-                if 'status' in task_info and task_info['status'] in ['completed', 'failed']:
-                    self.task_service.update_task_by_key(
-                        task.id,
-                        status=task_info['status'],
-                        end_time=datetime.now()
-                    )
-                    # 子agent生命终结
-                    agent.status = "end"
-                
-                # 追加任务日志
-                if 'log' in task_info and task_info['log']:
-                    self.task_service.append_task_log(task.id, task_info['log'])
-        
-        # 保存Agent更新
-        agent.update_agent()
-        
-        # 如果是主Agent，检查是否有新任务
-        if agent.type == 'main':
-            # 查找适合该Agent的任务
             
-            task, gpu_dis = self.task_service.find_task_for_agent(agent)
-            if task:
-                # 立即将任务状态更新为running，防止被其他Agent获取
-                success = self.task_service.update_task_by_key(
+            # 追加任务日志（文件操作，不占用数据库事务）
+            if task and 'log' in task_info and task_info['log']:
+                self.task_service.append_task_log(task.id, task_info['log'])
+        
+        # 处理任务状态更新，已被取消的任务不再被子Agent的结束状态覆盖
+        if (task and task.status == 'running' and 'status' in task_info
+                and task_info['status'] in ['completed', 'failed']):
+            # 任务状态和Agent状态在同一个事务中立即提交
+            with self.db.transaction():
+                self.task_service.update_task_by_key(
                     task.id,
-                    status='running',
-                    agent_id=agent_id,
-                    start_time=datetime.now()
+                    status=task_info['status'],
+                    end_time=datetime.now()
                 )
-                
-                if success:
-                    system_logger.info(f"为主Agent分配任务: Agent ID={agent_id}, Task ID={task.id}")
-                    task = task.to_dict()
-                    task.update({'gpu_ids': gpu_dis})
-                    return {
-                        'action': 'new_task',
-                        'task': task,
-                    }
-                    
-                    
-
+                # 任务整个生命周期的资源使用汇总
+                if isinstance(task_info.get('accounting'), dict):
+                    self.task_service.save_task_accounting(task.id, agent.id, task_info['accounting'])
+                # 子agent生命终结
+                agent.status = "end"
+                agent.update_agent()
+                self.db.after_commit(lambda: self.registry.put(agent))
+            
+                # 子Agent结束后主Agent有资源释放，唤醒其长轮询心跳以便重新上报资源
+                if agent.main_agent_id:
+                    main_agent_id = agent.main_agent_id
+                    self.db.after_commit(lambda: self.notifier.wake_agent(main_agent_id))
+        else:
+            # 只有心跳字段变化，在内存中更新，由Agent状态表定期批量写回
+            self.registry.update_heartbeat(agent)
+        
+        # 任务已被取消，通知子Agent终止任务并退出
+        if task and task.status == 'canceled':
+            return {'action': 'quit'}
+        
+        # 下发待执行的控制操作
+        action = AgentAction.pop(agent_id)
+        if action:
+            return {'action': action}
+        
+        # 如果是主Agent，按剩余资源分配一批新任务
+        if agent.type == 'main' and dispatch:
+            response = self._dispatch_tasks(agent, resource_info)
+            if response:
+                return response
+            
+            # 长轮询：没有可分配的任务时在服务器端等待，有任务就绪或Agent被唤醒时立即返回
+            if wait and wait > 0:
+                return self._wait_for_dispatch(agent, resource_info, wait, generation)
         
         # 默认继续当前操作
         return {'action': 'continue'}
+    
+    def dispatch_for_agent(self, agent_id, resource_info=None):
+        """按主Agent最近上报的剩余资源分配一批新任务，用于服务器主动推送
+        
+        Args:
+            agent_id: 主Agent ID
+            resource_info: 主Agent最近一次上报的资源信息，默认使用心跳解码后的资源信息
+        
+        Returns:
+            dict: 分配到任务时返回new_task操作，否则返回None
+        """
+        if resource_info is None:
+            resource_info = self.decoder.state(agent_id)
+            if not resource_info:
+                return None
+        
+        agent = self.registry.get(agent_id)
+        if not agent or agent.type != 'main' or agent.status != 'online':
+            return None
+        
+        if 'available_cpu_cores' in resource_info:
+            agent.available_cpu_cores = resource_info['available_cpu_cores']
+        if 'gpu_info' in resource_info:
+            agent.gpu_info = resource_info['gpu_info']
+        return self._dispatch_tasks(agent, resource_info)
+    
+    def get_control_action(self, agent_id):
+        """获取Agent当前需要执行的控制操作
+        
+        Args:
+            agent_id: Agent ID
+        
+        Returns:
+            dict: 控制操作，如{'action': 'quit'}，没有时返回None
+        """
+        agent = self.registry.get(agent_id)
+        if not agent or agent.status == 'end':
+            return {'action': 'stop'}
+        if agent.status == 'offline':
+            return {'action': 'quit'}
+        
+        # 子Agent执行的任务已被取消
+        if agent.type == 'sub' and agent.task_id:
+            task = self.task_service.get_task_by_id(agent.task_id)
+            if task and task.status == 'canceled':
+                return {'action': 'quit'}
+        
+        action = AgentAction.pop(agent_id)
+        if action:
+            return {'action': action}
+        return None
+    
+    def post_action(self, agent_id, action):
+        """向Agent下发控制操作
+        
+        操作保存在数据库中，在Agent下一次心跳时返回（可以由任一进程处理）；Agent正在当前进程中
+        长轮询或通过当前进程的WebSocket服务连接时立即送达。
+        
+        Args:
+            agent_id: Agent ID
+            action: 控制操作，'reject_new_task', 'accept_new_task'或'quit'
+        
+        Returns:
+            bool: 下发是否成功
+        """
+        if action not in CONTROL_ACTIONS:
+            system_logger.error(f"下发控制操作失败: 不支持的操作: {action}")
+            return False
+        
+        agent = self.registry.get(agent_id)
+        if not agent or agent.status == 'end':
+            system_logger.error(f"下发控制操作失败: Agent不存在: ID={agent_id}")
+            return False
+        
+        if not AgentAction.add(agent_id, action):
+            return False
+        self.notifier.wake_agent(agent_id)
+        get_agent_logger(agent_id).info(f"下发控制操作: {action}")
+        return True
+
+    def _dispatch_tasks(self, agent, resource_info):
+        """按主Agent上报的剩余资源分配一批新任务
+        
+        Args:
+            agent: 主Agent实例
+            resource_info: 心跳中的资源信息
+            
+        Returns:
+            dict: 分配到任务时返回new_task操作，否则返回None
+        """
+        if resource_info.get('reject_new_task'):
+            return None
+        
+        # 未声明max_tasks的旧版主Agent只会处理'task'字段，每次只分配一个任务
+        max_tasks = max(1, min(int(resource_info.get('max_tasks') or 1), Config.MAX_TASKS_PER_HEARTBEAT))
+        dispatched = self.task_service.dispatch_tasks(agent, max_tasks)
+        if not dispatched:
+            return None
+        
+        tasks = []
+        for task, gpu_ids in dispatched:
+            system_logger.info(f"为主Agent分配任务: Agent ID={agent.id}, Task ID={task.id}")
+            task = task.to_dict()
+            task.update({'gpu_ids': gpu_ids})
+            tasks.append(task)
+        return {
+            'action': 'new_task',
+            'task': tasks[0],
+            'tasks': tasks,
+        }
+    
+    def _wait_for_dispatch(self, agent, resource_info, wait, generation):
+        """长轮询等待新任务或控制操作
+        
+        等待时间不超过HEARTBEAT_LONG_POLL_MAX_WAIT，并且小于心跳超时时间。
+        
+        Args:
+            agent: 主Agent实例
+            resource_info: 心跳中的资源信息
+            wait: Agent请求的等待时间（秒）
+            generation: 处理心跳前记录的通知代数
+            
+        Returns:
+            dict: Agent应执行的操作
+        """
+        wait = min(wait, Config.HEARTBEAT_LONG_POLL_MAX_WAIT, Config.HEARTBEAT_TIMEOUT / 2)
+        deadline = time.monotonic() + wait
+        
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return {'action': 'continue'}
+            
+            reason, generation = self.notifier.wait(agent.id, generation, remaining)
+            if reason is None:
+                return {'action': 'continue'}
+            
+            if reason == 'agent':
+                # 有控制操作时立即下发，否则立即返回让Agent重新上报资源
+                return self.get_control_action(agent.id) or {'action': 'continue'}
+            
+            response = self._dispatch_tasks(agent, resource_info)
+            if response:
+                return response
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务依赖调度服务
+
+任务进入终态时，通过task_dependencies.depends_on_id反向查找直接下游任务：
+上游完成时解除下游的blocked状态，上游失败或取消时按配置级联处理。
+调度时只需选择status='waiting'的任务，不再需要逐个检查依赖。
+"""
+
+from datetime import datetime
+from backend.models.task import Task, MAX_SQL_PARAMS
+from backend.services.ready_queue import get_ready_queue
+from backend.utils.database import get_db
+from backend.utils.logger import system_logger, get_task_logger
+from config import Config
+
+# 任务终态
+FINISHED_STATUSES = ('completed', 'failed', 'canceled')
+
+class DependencyService:
+    """任务依赖调度服务类"""
+    
+    def __init__(self):
+        """初始化依赖调度服务"""
+        self.db = get_db()
+        self.ready_queue = get_ready_queue()
+    
+    def on_task_finished(self, task_id, status):
+        """任务进入终态时处理其直接下游任务
+        
+        在调用方的事务中执行时作为同一工作单元提交。
+        
+        Args:
+            task_id: 进入终态的任务ID
+            status: 任务的新状态
+        
+        Returns:
+            dict: 受影响的下游任务
+                {
+                    'unblocked': 变为waiting的任务ID列表,
+                    'propagated': 被级联设置为失败或取消的任务ID列表
+                }
+        """
+        result = {'unblocked': [], 'propagated': []}
+        
+        with self.db.transaction():
+            if status == 'completed':
+                result['unblocked'] = self._unblock_dependents([task_id])
+            elif status in ('failed', 'canceled'):
+                result['propagated'] = self._propagate_failure([task_id])
+        
+        for dep_id in result['unblocked']:
+            get_task_logger(dep_id).info(f"task unblocked: dependency {task_id} completed")
+        for dep_id in result['propagated']:
+            get_task_logger(dep_id).info(f"task {self._failure_status()}: dependency {task_id} {status}")
+        
+        return result
+    
+    def check_new_task(self, task_id, depends_on):
+        """新建的blocked任务若有上游已失败或取消，按配置立即级联处理
+        
+        Args:
+            task_id: 新任务ID
+            depends_on: 依赖任务ID列表
+        
+        Returns:
+            list: 被级联处理的任务ID列表
+        """
+        new_status = self._failure_status()
+        if not new_status or not depends_on:
+            return []
+        
+        placeholders = ', '.join(['?'] * len(depends_on))
+        row = self.db.fetch_one(f"""
+            SELECT COUNT(*) as count FROM tasks
+            WHERE id IN ({placeholders}) AND status IN ('failed', 'canceled')
+        """, list(depends_on))
+        if not row or row['count'] == 0:
+            return []
+        
+        with self.db.transaction():
+            self._set_status([task_id], new_status)
+        get_task_logger(task_id).info(f"task {new_status}: upstream dependency failed or canceled")
+        return [task_id]
+    
+    def reconcile(self):
+        """修正存量数据中依赖已全部完成但仍为blocked的任务
+        
+        启动时调用一次，用于升级前创建的任务或进程异常退出导致的遗漏。
+        
+        Returns:
+            int: 被解除阻塞的任务数量
+        """
+        cursor = self.db.execute("""
+            UPDATE tasks SET status = 'waiting'
+            WHERE status = 'blocked' AND NOT EXISTS (
+                SELECT 1 FROM task_dependencies d
+                JOIN tasks upstream ON upstream.id = d.depends_on_id
+                WHERE d.task_id = tasks.id AND upstream.status != 'completed'
+            )
+        """)
+        if cursor.rowcount:
+            system_logger.info(f"依赖修正: {cursor.rowcount}个blocked任务已解除阻塞")
+        return cursor.rowcount
+    
+    def _unblock_dependents(self, task_ids):
+        """将所有上游均已完成的直接下游blocked任务设置为waiting
+        
+        Args:
+            task_ids: 已完成的任务ID列表
+        
+        Returns:
+            list: 被解除阻塞的任务ID列表
+        """
+        placeholders = ', '.join(['?'] * len(task_ids))
+        rows = self.db.fetch_all(f"""
+            SELECT DISTINCT d.task_id FROM task_dependencies d
+            JOIN tasks t ON t.id = d.task_id
+            WHERE d.depends_on_id IN ({placeholders}) AND t.status = 'blocked'
+            AND NOT EXISTS (
+                SELECT 1 FROM task_dependencies d2
+                JOIN tasks upstream ON upstream.id = d2.depends_on_id
+                WHERE d2.task_id = d.task_id AND upstream.status != 'completed'
+            )
+        """, list(task_ids))
+        ready_ids = [row['task_id'] for row in rows]
+        self._set_status(ready_ids, 'waiting', expected_status='blocked')
+        return ready_ids
+    
+    def _propagate_failure(self, task_ids):
+        """按配置将失败/取消沿依赖关系级联到所有未开始的下游任务
+        
+        Args:
+            task_ids: 失败或取消的任务ID列表
+        
+        Returns:
+            list: 被级联处理的任务ID列表
+        """
+        new_status = self._failure_status()
+        if not new_status:
+            return []
+        
+        affected = []
+        seen = set(task_ids)
+        frontier = list(task_ids)
+        while frontier:
+            next_frontier = []
+            for i in range(0, len(frontier), MAX_SQL_PARAMS):
+                chunk = frontier[i:i + MAX_SQL_PARAMS]
+                placeholders = ', '.join(['?'] * len(chunk))
+                rows = self.db.fetch_all(f"""
+                    SELECT DISTINCT d.task_id FROM task_dependencies d
+                    JOIN tasks t ON t.id = d.task_id
+                    WHERE d.depends_on_id IN ({placeholders})
+                    AND t.status IN ('blocked', 'waiting')
+                """, chunk)
+                next_frontier.extend(row['task_id'] for row in rows)
+            
+            next_frontier = [task_id for task_id in dict.fromkeys(next_frontier) if task_id not in seen]
+            seen.update(next_frontier)
+            self._set_status(next_frontier, new_status)
+            affected.extend(next_frontier)
+            frontier = next_frontier
+        
+        return affected
+    
+    def _set_status(self, task_ids, status, expected_status=None):
+        """批量设置任务状态，终态同时记录结束时间，事务提交后同步就绪队列"""
+        if not task_ids:
+            return
+        task_ids = list(task_ids)
+        self.db.after_commit(lambda: self._sync_ready_queue(task_ids, status))
+        end_time = datetime.now() if status in FINISHED_STATUSES else None
+        if expected_status:
+            query = "UPDATE tasks SET status = ?, end_time = COALESCE(?, end_time) WHERE id = ? AND status = ?"
+            params = [(status, end_time, task_id, expected_status) for task_id in task_ids]
+        else:
+            query = "UPDATE tasks SET status = ?, end_time = COALESCE(?, end_time) WHERE id = ?"
+            params = [(status, end_time, task_id) for task_id in task_ids]
+        self.db.executemany(query, params)
+    
+    def _sync_ready_queue(self, task_ids, status):
+        """将状态变化同步到就绪队列"""
+        if status != 'waiting':
+            for task_id in task_ids:
+                self.ready_queue.remove(task_id)
+            return
+        for task in Task.get_tasks_by_ids(task_ids):
+            if task.status == 'waiting':
+                self.ready_queue.push(task)
+    
+    def _failure_status(self):
+        """根据配置返回级联处理时下游任务的状态，不级联时返回None"""
+        policy = Config.DEPENDENCY_FAILURE_POLICY
+        if policy == 'fail':
+            return 'failed'
+        if policy == 'cancel':
+            return 'canceled'
+        return None
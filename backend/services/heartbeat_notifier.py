@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+心跳唤醒通知
+
+长轮询心跳在服务器端等待，直到有新任务进入就绪队列、Agent需要执行控制操作
+（如被取消、子Agent结束后需要重新上报资源）或等待超时。
+
+使用一个全局递增的代数(generation)记录事件：等待方记下开始等待时的代数，
+只要事件发生时的代数比它新就立即返回，因此在两次等待之间发生的事件不会丢失。
+WebSocket服务通过subscribe注册监听函数，在事件发生时主动推送。
+通知只在当前进程内有效，多进程部署时其他进程产生的任务在等待超时或就绪队列定期重建后
+才会被发现，其他进程下发的控制操作（保存在数据库中）在Agent下一次心跳时送达。
+"""
+
+import time
+import threading
+from backend.utils.logger import system_logger
+
+class HeartbeatNotifier:
+    """长轮询心跳的唤醒通知类"""
+    
+    def __init__(self):
+        """初始化唤醒通知"""
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._task_generation = 0   # 最近一次有任务就绪时的代数
+        self._agent_generation = {}  # Agent ID -> 最近一次唤醒该Agent时的代数
+        self._listeners = []
+    
+    @property
+    def generation(self):
+        """当前代数，开始处理心跳前记录，作为等待的起点"""
+        with self._cond:
+            return self._generation
+    
+    def subscribe(self, listener):
+        """注册事件监听函数
+        
+        监听函数在触发事件的线程中同步调用，不能阻塞。
+        
+        Args:
+            listener: 监听函数，参数为(事件类型, Agent ID)，事件类型为'task'或'agent'，
+                'task'事件的Agent ID为None
+        """
+        with self._cond:
+            self._listeners.append(listener)
+    
+    def unsubscribe(self, listener):
+        """取消注册事件监听函数"""
+        with self._cond:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+    
+    def notify_task_ready(self):
+        """有任务进入就绪队列，唤醒所有等待中的主Agent"""
+        with self._cond:
+            self._generation += 1
+            self._task_generation = self._generation
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        self._emit(listeners, 'task', None)
+    
+    def wake_agent(self, agent_id):
+        """唤醒指定Agent的长轮询心跳
+        
+        Args:
+            agent_id: Agent ID
+        """
+        with self._cond:
+            self._generation += 1
+            self._agent_generation[agent_id] = self._generation
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        self._emit(listeners, 'agent', agent_id)
+    
+    def _emit(self, listeners, kind, agent_id):
+        """调用监听函数，单个监听函数出错不影响其他监听函数"""
+        for listener in listeners:
+            try:
+                listener(kind, agent_id)
+            except Exception as e:
+                system_logger.error(f"心跳事件监听函数执行失败: {str(e)}")
+    
+    def wait(self, agent_id, since, timeout):
+        """等待任务就绪或Agent被唤醒
+        
+        Args:
+            agent_id: 等待的Agent ID
+            since: 开始等待时的代数，比它新的事件会立即返回
+            timeout: 最长等待时间（秒）
+        
+        Returns:
+            tuple: (原因, 当前代数)，原因为'agent'（Agent被唤醒）、'task'（有任务就绪）
+                或None（超时）
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._agent_generation.get(agent_id, 0) > since:
+                    self._agent_generation.pop(agent_id, None)
+                    return 'agent', self._generation
+                if self._task_generation > since:
+                    return 'task', self._generation
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None, self._generation
+                self._cond.wait(remaining)
+
+# 全局唤醒通知实例
+heartbeat_notifier = HeartbeatNotifier()
+
+def get_heartbeat_notifier():
+    """获取心跳唤醒通知实例"""
+    return heartbeat_notifier
@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务日志实时推送
+
+有人查看任务实时日志时，为该任务创建一个TailStream，在内存中保存日志文件末尾的一段（tail buffer）。
+日志文件有新内容时（追加日志后立即通知，另外定期检查文件大小以发现任务日志器等其他写入方），
+只读取一次新增的字节，再推送给该任务的所有订阅者。没有订阅者时释放TailStream。
+
+推送给订阅者的事件（偏移均为日志文件中的字节偏移）:
+    {'type': 'log', 'offset': 起始偏移, 'next_offset': 结束偏移, 'data': 内容(字节)}
+    {'type': 'gap', 'offset': 缺失部分的起始偏移, 'next_offset': 缺失部分的结束偏移}
+        内存中已没有这部分（断线太久或短时间内写入过多），可通过按字节范围读取日志的接口补齐
+    {'type': 'reset', 'offset': 0}
+        日志文件被轮转或截断，之后的偏移从新文件开头算起
+订阅者断线重连时带上最后收到的next_offset，从该偏移继续推送。
+推送的内容不会在UTF-8多字节字符中间截断。
+"""
+
+import os
+import threading
+from backend.utils.logger import system_logger
+from config import Config
+
+def _complete_utf8(data):
+    """去掉末尾不完整的UTF-8字符
+    
+    Args:
+        data: 字节
+    
+    Returns:
+        int: 完整部分的长度
+    """
+    for back in range(1, min(4, len(data) + 1)):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue
+        # 多字节字符的首字节，检查后续字节是否完整
+        if byte & 0xE0 == 0xC0:
+            need = 2
+        elif byte & 0xF0 == 0xE0:
+            need = 3
+        elif byte & 0xF8 == 0xF0:
+            need = 4
+        else:
+            need = 1
+        return len(data) if back >= need else len(data) - back
+    return len(data)
+
+def _skip_continuation(data):
+    """跳过开头的UTF-8后续字节（从多字节字符中间开始读取时）
+    
+    Args:
+        data: 字节
+    
+    Returns:
+        int: 跳过的字节数
+    """
+    skip = 0
+    while skip < min(3, len(data)) and data[skip] & 0xC0 == 0x80:
+        skip += 1
+    return skip
+
+class TailStream:
+    """单个任务日志文件的末尾缓存和订阅者"""
+    
+    def __init__(self, task_id, log_path, buffer_size):
+        """初始化末尾缓存，读取日志文件末尾的buffer_size字节
+        
+        Args:
+            task_id: 任务ID
+            log_path: 日志文件路径
+            buffer_size: 缓存的最大字节数
+        """
+        self.task_id = task_id
+        self.log_path = log_path
+        self.buffer_size = buffer_size
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.inode = None
+        self.buffer = bytearray()  # 只保存完整的UTF-8字符
+        self.base_offset = 0  # buffer第一个字节在日志文件中的偏移
+        self.refresh()
+    
+    @property
+    def end_offset(self):
+        """缓存末尾在日志文件中的偏移，末尾不完整的UTF-8字符下次从这里重新读取"""
+        return self.base_offset + len(self.buffer)
+    
+    def _restart(self, offset):
+        """清空缓存，从offset开始读取"""
+        self.buffer = bytearray()
+        self.base_offset = offset
+    
+    def refresh(self):
+        """读取日志文件新增的部分，调用时需持有lock（初始化时除外）
+        
+        Returns:
+            list: 需要推送给订阅者的事件
+        """
+        events = []
+        try:
+            f = open(self.log_path, 'rb')
+        except FileNotFoundError:
+            return events
+        
+        with f:
+            st = os.fstat(f.fileno())
+            if self.inode is None:
+                # 首次读取，从文件末尾buffer_size字节开始
+                self.inode = st.st_ino
+                self._restart(max(st.st_size - self.buffer_size, 0))
+            elif self.inode != st.st_ino or st.st_size < self.end_offset:
+                # 日志文件被轮转或截断
+                self.inode = st.st_ino
+                self._restart(0)
+                events.append({'type': 'reset', 'offset': 0})
+            elif st.st_size - self.end_offset > self.buffer_size:
+                # 新增内容超过缓存大小，只读取最后buffer_size字节
+                skip_to = st.st_size - self.buffer_size
+                events.append({'type': 'gap', 'offset': self.end_offset, 'next_offset': skip_to})
+                self._restart(skip_to)
+            
+            if st.st_size <= self.end_offset:
+                return events
+            f.seek(self.end_offset)
+            data = f.read(st.st_size - self.end_offset)
+        
+        if not self.buffer and self.base_offset > 0:
+            # 从文件中间开始读取时对齐到字符边界
+            skip = _skip_continuation(data)
+            self.base_offset += skip
+            data = data[skip:]
+        
+        data = data[:_complete_utf8(data)]
+        if data:
+            events.append({
+                'type': 'log',
+                'offset': self.end_offset,
+                'next_offset': self.end_offset + len(data),
+                'data': data
+            })
+            self.buffer += data
+            if len(self.buffer) > self.buffer_size:
+                excess = len(self.buffer) - self.buffer_size
+                del self.buffer[:excess]
+                self.base_offset += excess
+        return events
+    
+    def backlog(self, offset=None, initial_bytes=None):
+        """新订阅者需要先收到的事件，调用时需持有lock
+        
+        Args:
+            offset: 订阅者已收到的位置（断线重连时的next_offset），None表示从末尾initial_bytes字节开始
+            initial_bytes: 未指定offset时返回的字节数，从该范围内的第一个行首开始
+        
+        Returns:
+            list: 事件列表
+        """
+        events = []
+        end = self.end_offset
+        if offset is None:
+            start = max(end - (initial_bytes or 0), self.base_offset)
+            if start > self.base_offset:
+                newline = self.buffer.find(b'\n', start - self.base_offset - 1)
+                if newline >= 0:
+                    start = self.base_offset + newline + 1
+                else:
+                    start += _skip_continuation(self.buffer[start - self.base_offset:])
+        elif offset > end:
+            # 订阅者的偏移属于轮转前的文件
+            events.append({'type': 'reset', 'offset': 0})
+            if self.base_offset > 0:
+                events.append({'type': 'gap', 'offset': 0, 'next_offset': self.base_offset})
+            start = self.base_offset
+        elif offset < self.base_offset:
+            events.append({'type': 'gap', 'offset': offset, 'next_offset': self.base_offset})
+            start = self.base_offset
+        else:
+            start = offset
+        
+        if start < end:
+            events.append({
+                'type': 'log',
+                'offset': start,
+                'next_offset': end,
+                'data': bytes(self.buffer[start - self.base_offset:])
+            })
+        return events
+
+class LogTailHub:
+    """任务日志实时推送中心，多线程安全"""
+    
+    def __init__(self, buffer_size=None, poll_interval=None, initial_bytes=None):
+        """初始化推送中心
+        
+        Args:
+            buffer_size: 每个任务在内存中保存的日志末尾字节数
+            poll_interval: 检查日志文件是否有新内容的间隔（秒）
+            initial_bytes: 新订阅者未指定偏移时先收到的末尾字节数
+        """
+        self.buffer_size = buffer_size or Config.LOG_TAIL_BUFFER_SIZE
+        self.poll_interval = poll_interval or Config.LOG_TAIL_POLL_INTERVAL
+        self.initial_bytes = initial_bytes or Config.LOG_TAIL_INITIAL_BYTES
+        self._lock = threading.Lock()
+        self._streams = {}  # 任务ID -> TailStream
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def subscribe(self, task_id, log_path, callback, offset=None):
+        """订阅任务日志
+        
+        Args:
+            task_id: 任务ID
+            log_path: 日志文件路径
+            callback: 回调函数，参数为事件字典，在读取日志的线程中同步调用，不能阻塞
+            offset: 已收到的位置，None表示从末尾开始
+        
+        Returns:
+            list: 订阅者需要先收到的事件（之后的事件通过callback推送，不会遗漏或重复）
+        """
+        # 与unsubscribe使用相同的加锁顺序，避免订阅到刚被释放的TailStream
+        with self._lock:
+            stream = self._streams.get(task_id)
+            if stream is None or stream.log_path != log_path:
+                stream = TailStream(task_id, log_path, self.buffer_size)
+                self._streams[task_id] = stream
+            with stream.lock:
+                self._publish(stream, stream.refresh())
+                stream.subscribers.append(callback)
+                return stream.backlog(offset, self.initial_bytes)
+    
+    def unsubscribe(self, task_id, callback):
+        """取消订阅，任务没有订阅者时释放其缓存
+        
+        Args:
+            task_id: 任务ID
+            callback: subscribe时的回调函数
+        """
+        with self._lock:
+            stream = self._streams.get(task_id)
+            if stream is None:
+                return
+            with stream.lock:
+                if callback in stream.subscribers:
+                    stream.subscribers.remove(callback)
+                if not stream.subscribers:
+                    del self._streams[task_id]
+    
+    def notify(self, task_id):
+        """任务日志有新内容，没有订阅者时直接返回
+        
+        Args:
+            task_id: 任务ID
+        """
+        stream = self._streams.get(task_id)
+        if stream is None:
+            return
+        with stream.lock:
+            self._publish(stream, stream.refresh())
+    
+    def _publish(self, stream, events):
+        """推送事件给所有订阅者，调用时需持有stream.lock"""
+        for event in events:
+            for callback in list(stream.subscribers):
+                try:
+                    callback(event)
+                except Exception as e:
+                    system_logger.error(f"推送任务日志失败: 任务ID={stream.task_id}, 错误={str(e)}")
+    
+    def subscriber_count(self, task_id):
+        """任务日志的订阅者数"""
+        stream = self._streams.get(task_id)
+        return len(stream.subscribers) if stream else 0
+    
+    def is_running(self):
+        """检查线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """启动定期检查日志文件的线程"""
+        if self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._poll_loop, name='log-tail-hub', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """停止检查线程"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._thread = None
+    
+    def _poll_loop(self):
+        """定期检查有订阅者的日志文件，每个任务每次只读取一次"""
+        while not self._stop.wait(self.poll_interval):
+            with self._lock:
+                task_ids = list(self._streams)
+            for task_id in task_ids:
+                try:
+                    self.notify(task_id)
+                except Exception as e:
+                    system_logger.error(f"读取任务日志失败: 任务ID={task_id}, 错误={str(e)}")
+
+# 全局日志推送中心实例
+log_tail_hub = LogTailHub()
+
+def get_log_tail_hub():
+    """获取日志推送中心实例"""
+    return log_tail_hub
@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Agent资源指标时间序列
+
+每次心跳记录一个采样（CPU使用率、内存使用量、GPU平均使用率、显存使用量）:
+    - 内存中每个Agent一个数组实现的环形缓冲区，保存最近METRICS_RAW_CAPACITY个原始采样，
+      写满后覆盖最早的采样；超过METRICS_RAW_RETENTION没有新采样的Agent（如已结束的子Agent）被移除。
+    - 同时累加到分钟和小时时间桶，由后台线程每METRICS_FLUSH_INTERVAL秒把新增部分累加写入
+      agent_metrics表，分钟和小时汇总分别按METRICS_MINUTE_RETENTION、METRICS_HOUR_RETENTION清理。
+
+查询时按step选择数据源：step小于1分钟且时间范围仍在环形缓冲区内时使用原始采样；
+环形缓冲区只覆盖时间范围的后一部分时，之前的部分使用汇总，之后使用原始采样；
+其他情况使用分钟或小时汇总（合并尚未写入数据库的部分）。最后按step重新分桶。
+原始采样只在当前进程内可见，服务器重启后丢失；汇总数据最多丢失一个写入间隔。
+"""
+
+import math
+import time
+import atexit
+import threading
+from array import array
+from backend.models.agent_metric import AgentMetric
+from backend.utils.logger import system_logger
+from config import Config
+
+# 汇总粒度（秒）: 分钟、小时
+MINUTE = 60
+HOUR = 3600
+
+# 查询结果中的指标
+SERIES = ('cpu_usage', 'cpu_usage_max', 'memory_used', 'memory_used_max', 'gpu_usage', 'gpu_memory_used')
+
+def sample_from_resource_info(resource_info):
+    """从心跳资源信息中提取一个采样
+    
+    Args:
+        resource_info: 合并后的资源信息
+    
+    Returns:
+        tuple: (CPU使用率, 内存使用量, GPU平均使用率, 显存使用量)，没有CPU和内存信息时返回None
+    """
+    if 'cpu_usage' not in resource_info and 'memory_usage' not in resource_info:
+        return None
+    gpu_info = resource_info.get('gpu_info') or []
+    gpu_usage = sum(gpu.get('usage', 0) for gpu in gpu_info) / len(gpu_info) if gpu_info else 0.0
+    gpu_memory = sum(gpu.get('memory_used', 0) for gpu in gpu_info)
+    return (
+        float(resource_info.get('cpu_usage') or 0),
+        float(resource_info.get('memory_usage') or 0),
+        float(gpu_usage),
+        float(gpu_memory)
+    )
+
+def merge_rollup(target, rollup):
+    """把一个汇总合并到另一个汇总（原地修改target）
+    
+    汇总格式为[采样数, CPU总和, CPU最大值, 内存总和, 内存最大值, GPU使用率总和, 显存总和]
+    """
+    target[0] += rollup[0]
+    target[1] += rollup[1]
+    target[2] = max(target[2], rollup[2])
+    target[3] += rollup[3]
+    target[4] = max(target[4], rollup[4])
+    target[5] += rollup[5]
+    target[6] += rollup[6]
+
+def rollup_of(sample):
+    """单个采样的汇总"""
+    cpu, memory, gpu, gpu_memory = sample
+    return [1, cpu, cpu, memory, memory, gpu, gpu_memory]
+
+class MetricRing:
+    """单个Agent的原始采样环形缓冲区，每个字段一个数组，写满前按需增长"""
+    
+    def __init__(self, capacity):
+        """初始化环形缓冲区
+        
+        Args:
+            capacity: 最多保存的采样数
+        """
+        self.capacity = capacity
+        self.times = array('d')
+        self.values = [array('d') for _ in range(4)]
+        self.count = 0  # 累计写入的采样数
+    
+    def append(self, timestamp, sample):
+        """追加一个采样，写满后覆盖最早的采样"""
+        if self.count < self.capacity:
+            self.times.append(timestamp)
+            for column, value in zip(self.values, sample):
+                column.append(value)
+        else:
+            index = self.count % self.capacity
+            self.times[index] = timestamp
+            for column, value in zip(self.values, sample):
+                column[index] = value
+        self.count += 1
+    
+    @property
+    def oldest_time(self):
+        """最早的采样时间，没有采样时返回None"""
+        if self.count == 0:
+            return None
+        return self.times[(self.count - min(self.count, self.capacity)) % self.capacity]
+    
+    @property
+    def newest_time(self):
+        """最新的采样时间，没有采样时返回None"""
+        return self.times[(self.count - 1) % self.capacity] if self.count else None
+    
+    def range(self, start, end):
+        """按时间顺序返回时间范围内的采样
+        
+        Args:
+            start: 起始时间戳（包含）
+            end: 结束时间戳（不包含）
+        
+        Returns:
+            list: [(时间戳, 采样)]
+        """
+        first = self.count - min(self.count, self.capacity)
+        # 采样按时间递增写入，二分查找起始位置
+        low, high = first, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[middle % self.capacity] < start:
+                low = middle + 1
+            else:
+                high = middle
+        
+        result = []
+        for position in range(low, self.count):
+            index = position % self.capacity
+            timestamp = self.times[index]
+            if timestamp >= end:
+                break
+            result.append((timestamp, tuple(column[index] for column in self.values)))
+        return result
+
+class MetricsStore:
+    """Agent资源指标时间序列存储"""
+    
+    def __init__(self, raw_capacity=None, flush_interval=None):
+        """初始化指标存储
+        
+        Args:
+            raw_capacity: 每个Agent保留的原始采样数
+            flush_interval: 汇总写入数据库的间隔（秒），0表示每次记录后立即写入
+        """
+        self.raw_capacity = raw_capacity or Config.METRICS_RAW_CAPACITY
+        self.flush_interval = (Config.METRICS_FLUSH_INTERVAL
+                               if flush_interval is None else flush_interval)
+        self._lock = threading.Lock()
+        self._rings = {}  # Agent ID -> MetricRing
+        self._pending = {}  # (Agent ID, 粒度, 时间桶) -> 尚未写入数据库的汇总
+        self._thread = None
+        self._stop = threading.Event()
+        self._last_cleanup = 0
+    
+    def record(self, agent_id, resource_info, timestamp=None):
+        """记录一次心跳的资源使用
+        
+        Args:
+            agent_id: Agent ID
+            resource_info: 合并后的资源信息
+            timestamp: 采样时间戳，默认为当前时间
+        """
+        sample = sample_from_resource_info(resource_info)
+        if sample is None:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        
+        with self._lock:
+            ring = self._rings.get(agent_id)
+            if ring is None:
+                ring = self._rings[agent_id] = MetricRing(self.raw_capacity)
+            if ring.count and timestamp < ring.newest_time:
+                # 时钟回拨时使用最新采样的时间，保持环形缓冲区按时间有序
+                timestamp = ring.newest_time
+            ring.append(timestamp, sample)
+            
+            for resolution in (MINUTE, HOUR):
+                key = (agent_id, resolution, int(timestamp // resolution) * resolution)
+                rollup = self._pending.get(key)
+                if rollup is None:
+                    self._pending[key] = rollup_of(sample)
+                else:
+                    merge_rollup(rollup, rollup_of(sample))
+        
+        # 未启动写入线程时立即写入
+        if not self.flush_interval or not self.is_running():
+            self.flush()
+    
+    def flush(self):
+        """把尚未写入的汇总累加写入数据库
+        
+        Returns:
+            int: 写入的汇总行数
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending = self._pending
+            self._pending = {}
+        
+        rows = [key + tuple(rollup) for key, rollup in pending.items()]
+        if AgentMetric.add_rollups(rows):
+            return len(rows)
+        
+        # 写入失败，合并回待写入数据下次重试
+        with self._lock:
+            for key, rollup in pending.items():
+                current = self._pending.get(key)
+                if current is None:
+                    self._pending[key] = rollup
+                else:
+                    merge_rollup(current, rollup)
+        return 0
+    
+    def cleanup(self, now=None):
+        """清理过期的汇总数据和长时间没有采样的环形缓冲区
+        
+        Returns:
+            int: 删除的汇总行数
+        """
+        now = time.time() if now is None else now
+        deleted = AgentMetric.delete_before(MINUTE, now - Config.METRICS_MINUTE_RETENTION)
+        deleted += AgentMetric.delete_before(HOUR, now - Config.METRICS_HOUR_RETENTION)
+        
+        with self._lock:
+            for agent_id, ring in list(self._rings.items()):
+                if ring.newest_time < now - Config.METRICS_RAW_RETENTION:
+                    del self._rings[agent_id]
+        self._last_cleanup = now
+        return deleted
+    
+    def get_series(self, agent_id, start, end, step=None):
+        """获取Agent的指标时间序列
+        
+        Args:
+            agent_id: Agent ID
+            start: 起始时间戳（包含）
+            end: 结束时间戳（不包含）
+            step: 数据点间隔（秒），默认按METRICS_MAX_POINTS自动选择
+        
+        Returns:
+            dict: 按列返回，只包含有采样的时间桶
+                {
+                    'agent_id': Agent ID,
+                    'from': 起始时间戳, 'to': 结束时间戳,
+                    'step': 实际使用的数据点间隔（秒）,
+                    'resolution': 数据源粒度（秒），1表示原始采样，汇总和原始采样混合时为汇总的粒度,
+                    'time': [时间桶起始时间戳],
+                    'cpu_usage': [平均CPU使用率], 'cpu_usage_max': [最大CPU使用率],
+                    'memory_used': [平均内存使用量], 'memory_used_max': [最大内存使用量],
+                    'gpu_usage': [平均GPU使用率], 'gpu_memory_used': [平均显存使用量]
+                }
+        
+        Raises:
+            ValueError: 时间范围或step无效
+        """
+        if end <= start:
+            raise ValueError("结束时间必须大于起始时间")
+        if step is not None and step <= 0:
+            raise ValueError("step必须大于0")
+        
+        # step过小时放大，数据点数不超过METRICS_MAX_POINTS
+        min_step = math.ceil((end - start) / Config.METRICS_MAX_POINTS)
+        step = max(int(step or 0), min_step, 1)
+        
+        buckets = {}
+        # [start, split)使用汇总，[split, end)使用原始采样
+        resolution, split = self._choose_resolution(agent_id, start, end, step)
+        if split > start:
+            for bucket, rollup in AgentMetric.get_rollups(agent_id, resolution, start, split):
+                self._add_to_bucket(buckets, max(bucket, start), step, list(rollup))
+            # 合并尚未写入数据库的部分
+            with self._lock:
+                pending = [
+                    (key[2], list(rollup)) for key, rollup in self._pending.items()
+                    if key[0] == agent_id and key[1] == resolution and start - resolution < key[2] < split
+                ]
+            for bucket, rollup in pending:
+                self._add_to_bucket(buckets, max(bucket, start), step, rollup)
+        if split < end:
+            with self._lock:
+                ring = self._rings.get(agent_id)
+                samples = ring.range(split, end) if ring else []
+            for timestamp, sample in samples:
+                self._add_to_bucket(buckets, timestamp, step, rollup_of(sample))
+        
+        series = {
+            'agent_id': agent_id,
+            'from': start,
+            'to': end,
+            'step': step,
+            'resolution': resolution,
+            'time': []
+        }
+        for name in SERIES:
+            series[name] = []
+        for bucket in sorted(buckets):
+            samples, cpu_sum, cpu_max, memory_sum, memory_max, gpu_sum, gpu_memory_sum = buckets[bucket]
+            series['time'].append(bucket)
+            series['cpu_usage'].append(cpu_sum / samples)
+            series['cpu_usage_max'].append(cpu_max)
+            series['memory_used'].append(memory_sum / samples)
+            series['memory_used_max'].append(memory_max)
+            series['gpu_usage'].append(gpu_sum / samples)
+            series['gpu_memory_used'].append(gpu_memory_sum / samples)
+        return series
+    
+    def _choose_resolution(self, agent_id, start, end, step):
+        """选择数据源粒度和汇总与原始采样的分界时间
+        
+        Returns:
+            tuple: (粒度, 分界时间)。粒度为1（原始采样）、MINUTE或HOUR，
+                分界时间之前使用该粒度的汇总，之后使用原始采样
+        """
+        if step < HOUR and start >= time.time() - Config.METRICS_MINUTE_RETENTION:
+            resolution = MINUTE
+        else:
+            resolution = HOUR
+        
+        if step < MINUTE:
+            with self._lock:
+                ring = self._rings.get(agent_id)
+                oldest = ring.oldest_time if ring else None
+            if oldest is not None:
+                # 缓冲区中有起始时间之前的采样，整个时间范围都使用原始采样
+                if oldest <= start:
+                    return 1, start
+                # 最早采样所在的汇总时间桶仍使用汇总，之后的时间桶使用原始采样，不重复计算
+                split = math.ceil(oldest / resolution) * resolution
+                if split < end:
+                    return resolution, split
+        return resolution, end
+    
+    @staticmethod
+    def _add_to_bucket(buckets, timestamp, step, rollup):
+        """把汇总合并到所在的查询时间桶"""
+        bucket = int(timestamp // step) * step
+        current = buckets.get(bucket)
+        if current is None:
+            buckets[bucket] = rollup
+        else:
+            merge_rollup(current, rollup)
+    
+    def is_running(self):
+        """写入线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """启动后台写入线程，进程退出时再写入一次"""
+        if not self.flush_interval or self.is_running():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name='metrics-store-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        system_logger.info(f"Agent指标写入线程已启动: 间隔={self.flush_interval}秒")
+    
+    def stop(self):
+        """停止后台写入线程并写入剩余的汇总"""
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+    
+    def _flush_loop(self):
+        """后台写入线程，每分钟清理一次过期数据"""
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.time() - self._last_cleanup >= MINUTE:
+                    self.cleanup()
+            except Exception as e:
+                system_logger.error(f"Agent指标写入失败: {str(e)}")
+
+# 全局指标存储实例
+metrics_store = MetricsStore()
+
+def get_metrics_store():
+    """获取指标存储实例"""
+    return metrics_store
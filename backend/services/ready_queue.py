@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+就绪任务队列
+
+在内存中维护status='waiting'的任务，按资源规格(cpu_cores, gpu_count, gpu_memory)分桶，
+每个桶是一个按(priority, created_time, id)排序的小顶堆。为Agent查找任务时只需检查
+各个桶的堆顶，耗时与排队任务数量无关，只与不同资源规格的数量有关。
+
+队列在任务创建、解除阻塞、取消、开始执行时增量更新，启动时从SQLite重建。
+重建在锁外读取数据库，读取期间的push/remove记录下来，替换队列前在新队列上重放，不会丢失。
+多进程部署时每个进程各有一份队列，通过定期重建与其他进程的修改保持一致，
+队列中的过期条目在取出时会根据数据库中的实际状态剔除。
+"""
+
+import time
+import heapq
+import threading
+from backend.services.heartbeat_notifier import get_heartbeat_notifier
+from backend.utils.database import get_db
+from backend.utils.logger import system_logger
+from config import Config
+
+def task_shape(task):
+    """获取任务的资源规格
+    
+    Args:
+        task: 任务实例或包含资源字段的字典/记录
+    
+    Returns:
+        tuple: (cpu_cores, gpu_count, gpu_memory)，未设置的字段为0
+    """
+    if isinstance(task, dict) or hasattr(task, 'keys'):
+        return (task['cpu_cores'] or 0, task['gpu_count'] or 0, task['gpu_memory'] or 0)
+    return (task.cpu_cores or 0, task.gpu_count or 0, task.gpu_memory or 0)
+
+class ReadyQueue:
+    """按资源规格分桶的就绪任务优先队列"""
+    
+    def __init__(self, refresh_interval=None):
+        """初始化就绪队列
+        
+        Args:
+            refresh_interval: 定期从数据库重建的间隔（秒），0表示不定期重建
+        """
+        self.refresh_interval = (Config.READY_QUEUE_REFRESH_INTERVAL
+                                 if refresh_interval is None else refresh_interval)
+        self._lock = threading.RLock()
+        self._buckets = {}  # 资源规格 -> 堆，元素为[priority, created_time, task_id]
+        self._entries = {}  # 任务ID -> (资源规格, 堆中的条目)
+        self._journals = []  # 进行中的重建各自记录的操作列表，元素为(任务ID, 资源规格, 条目)，条目为None表示移除
+        self._last_rebuild = None
+        self.notifier = get_heartbeat_notifier()
+    
+    def rebuild(self):
+        """从数据库重建队列
+        
+        Returns:
+            int: 队列中的任务数量
+        """
+        journal = []
+        with self._lock:
+            self._journals.append(journal)
+        try:
+            db = get_db()
+            rows = db.fetch_all("""
+                SELECT id, priority, created_time, cpu_cores, gpu_count, gpu_memory
+                FROM tasks WHERE status = 'waiting'
+            """)
+        
+            buckets = {}
+            entries = {}
+            for row in rows:
+                shape = task_shape(row)
+                entry = [row['priority'], str(row['created_time']), row['id']]
+                buckets.setdefault(shape, []).append(entry)
+                entries[row['id']] = (shape, entry)
+            for heap in buckets.values():
+                heapq.heapify(heap)
+        except Exception:
+            with self._lock:
+                self._journals.remove(journal)
+            raise
+        
+        with self._lock:
+            self._journals.remove(journal)
+            # 重放读取数据库期间的操作，这些操作对应的数据库修改可能不在读取结果中
+            for task_id, shape, entry in journal:
+                if entry is None:
+                    entries.pop(task_id, None)
+                else:
+                    entries[task_id] = (shape, entry)
+                    heapq.heappush(buckets.setdefault(shape, []), entry)
+            has_new = bool(entries.keys() - self._entries.keys())
+            self._buckets = buckets
+            self._entries = entries
+            self._last_rebuild = time.monotonic()
+        
+        # 其他进程创建或解除阻塞的任务，唤醒等待中的长轮询心跳
+        if has_new:
+            self.notifier.notify_task_ready()
+        
+        system_logger.info(f"就绪队列已重建: 任务数={len(entries)}, 资源规格数={len(buckets)}")
+        return len(entries)
+    
+    def _refresh_if_stale(self):
+        """首次使用或超过重建间隔时从数据库重建"""
+        if self._last_rebuild is None:
+            self.rebuild()
+        elif self.refresh_interval and time.monotonic() - self._last_rebuild > self.refresh_interval:
+            self.rebuild()
+    
+    def push(self, task):
+        """加入或更新一个就绪任务
+        
+        Args:
+            task: 任务实例
+        """
+        shape = task_shape(task)
+        entry = [task.priority, str(task.created_time), task.id]
+        with self._lock:
+            # 旧条目留在堆中，取出时根据_entries判断为过期条目
+            self._entries[task.id] = (shape, entry)
+            heapq.heappush(self._buckets.setdefault(shape, []), entry)
+            for journal in self._journals:
+                journal.append((task.id, shape, entry))
+        self.notifier.notify_task_ready()
+    
+    def remove(self, task_id):
+        """从队列中移除任务（惰性删除）
+        
+        Args:
+            task_id: 任务ID
+        """
+        with self._lock:
+            self._entries.pop(task_id, None)
+            for journal in self._journals:
+                journal.append((task_id, None, None))
+    
+    def _is_live(self, entry):
+        """判断堆中的条目是否仍然有效"""
+        current = self._entries.get(entry[2])
+        return current is not None and current[1] is entry
+    
+    def _head(self, shape):
+        """获取桶的有效堆顶条目，顺便清理过期条目和空桶"""
+        heap = self._buckets.get(shape)
+        while heap and not self._is_live(heap[0]):
+            heapq.heappop(heap)
+        if not heap:
+            self._buckets.pop(shape, None)
+            return None
+        return heap[0]
+    
+    def find(self, fits):
+        """查找资源规格满足条件且优先级最高的任务
+        
+        Args:
+            fits: 判断函数，参数为资源规格(cpu_cores, gpu_count, gpu_memory)，返回是否可执行
+        
+        Returns:
+            int: 任务ID，没有合适任务时返回None
+        """
+        self._refresh_if_stale()
+        with self._lock:
+            best = None
+            for shape in list(self._buckets.keys()):
+                if not fits(shape):
+                    continue
+                head = self._head(shape)
+                if head is not None and (best is None or head < best):
+                    best = head
+            return best[2] if best else None
+    
+    def __len__(self):
+        """队列中的任务数量"""
+        with self._lock:
+            return len(self._entries)
+
+# 全局就绪队列实例
+ready_queue = ReadyQueue()
+
+def get_ready_queue():
+    """获取就绪队列实例"""
+    return ready_queue
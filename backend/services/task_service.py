@@ -6,18 +6,67 @@
 """
 
 import os
+import json
+import base64
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from backend.models.task import Task
+from backend.models.agent import Agent
+from backend.models.agent_action import AgentAction
+from backend.models.task_accounting import TaskAccounting
+from backend.models.task_log_stream import TaskLogStream
+from backend.services.dependency_service import DependencyService, FINISHED_STATUSES
+from backend.services.ready_queue import get_ready_queue, task_shape
+from backend.services.heartbeat_notifier import get_heartbeat_notifier
+from backend.services.log_tail_hub import get_log_tail_hub
 from backend.utils.database import get_db
 from backend.utils.logger import system_logger, get_task_logger
+from backend.utils.log_index import get_line_index, decode_log
+from backend.utils import log_reader
 from config import Config
 
+try:
+    import fcntl
+except ImportError:
+    # Windows上没有fcntl，按偏移追加日志只在进程内互斥
+    fcntl = None
+
+# 任务领取统计（进程内累计）
+_claim_stats_lock = threading.Lock()
+_claim_stats = {
+    'attempts': 0,
+    'claimed': 0,
+    'lost': 0,
+}
+
+# 按偏移追加任务日志时的锁，按任务ID分散到固定数量的锁上
+_log_append_locks = [threading.Lock() for _ in range(64)]
+
+@contextmanager
+def _lock_log_file(path):
+    """对日志文件加排他锁（flock），多个进程（如gunicorn的多个worker）按偏移追加同一任务日志时互斥
+    
+    Args:
+        path: 日志文件路径
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'ab') as f:
+        if fcntl is not None:
+            # 关闭文件时自动释放
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
 class TaskService:
     """任务管理服务类，封装任务相关业务逻辑"""
     
     def __init__(self):
         """初始化任务服务"""
         self.db = get_db()
+        self.dependency_service = DependencyService()
+        self.ready_queue = get_ready_queue()
+        self.notifier = get_heartbeat_notifier()
+        self._fts_available = None
     
     def create_task(self, name, template_type, script_content, priority=3,
                     cpu_cores=None, gpu_count=None, gpu_memory=None,
@@ -45,17 +94,23 @@ class TaskService:
         # 优先级范围校验
         priority = max(1, min(5, priority))
         
-        # 创建任务
-        task = Task.create_task(
-            name=name,
-            template_type=template_type,
-            script_content=script_content,
-            priority=priority,
-            cpu_cores=cpu_cores,
-            gpu_count=gpu_count,
-            gpu_memory=gpu_memory,
-            depends_on=depends_on
-        )
+        # 创建任务，上游已失败时按配置级联处理
+        with self.db.transaction():
+            task = Task.create_task(
+                name=name,
+                template_type=template_type,
+                script_content=script_content,
+                priority=priority,
+                cpu_cores=cpu_cores,
+                gpu_count=gpu_count,
+                gpu_memory=gpu_memory,
+                depends_on=depends_on
+            )
+            if task and task.status == 'blocked':
+                if self.dependency_service.check_new_task(task.id, task.depends_on):
+                    task = Task.get_task_by_id(task.id)
+            if task:
+                self._sync_ready_queue(task)
         
         # 记录任务创建日志
         if task:
@@ -69,9 +124,122 @@ class TaskService:
     def get_task_by_id(self, task_id):
         return Task.get_task_by_id(task_id)
     
+    def get_task_accounting(self, task_id):
+        """获取任务的资源使用汇总
+        
+        Args:
+            task_id: 任务ID
+            
+        Returns:
+            accounting: 任务资源使用汇总实例，任务未结束或未上报时返回None
+        """
+        return TaskAccounting.get_by_task_id(task_id)
+    
+    def save_task_accounting(self, task_id, agent_id, report):
+        """保存子Agent上报的任务资源使用汇总
+        
+        Args:
+            task_id: 任务ID
+            agent_id: 子Agent ID
+            report: 上报的汇总字典
+            
+        Returns:
+            bool: 保存是否成功
+        """
+        return TaskAccounting.from_report(task_id, agent_id, report).save()
+    
     def get_task_in_range(self, start_id, end_id):
         return Task.get_task_in_range(start_id, end_id)
     
+    def _build_filter_clause(self, filters):
+        """根据过滤条件构建WHERE子句
+        
+        Args:
+            filters: 过滤条件，格式见get_task_in_page
+            
+        Returns:
+            tuple: (WHERE子句, 参数列表)，无过滤条件时WHERE子句为空字符串
+        """
+        conditions, params = self._build_filter_conditions(filters)
+        where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where_clause, params
+    
+    def _build_filter_conditions(self, filters):
+        """根据过滤条件构建查询条件列表
+        
+        Args:
+            filters: 过滤条件，格式见get_task_in_page
+            
+        Returns:
+            tuple: (条件列表, 参数列表)
+        """
+        conditions = []
+        params = []
+        
+        if filters:
+            if 'status' in filters and filters['status']:
+                placeholders = ', '.join(['?'] * len(filters['status']))
+                conditions.append(f"status IN ({placeholders})")
+                params.extend(filters['status'])
+            
+            if 'name' in filters and filters['name']:
+                self._append_text_condition(conditions, params, 'name', filters['name'])
+            
+            if 'template_type' in filters and filters['template_type']:
+                conditions.append("template_type = ?")
+                params.append(filters['template_type'])
+            
+            if 'script_content' in filters and filters['script_content']:
+                self._append_text_condition(conditions, params, 'script_content', filters['script_content'])
+        
+        return conditions, params
+    
+    def _append_text_condition(self, conditions, params, column, keyword):
+        """添加文本子串过滤条件
+        
+        全文索引可用且关键词不少于3个字符时通过tasks_fts查询，
+        否则回退到LIKE '%...%'全表扫描。
+        
+        Args:
+            conditions: 条件列表
+            params: 参数列表
+            column: 列名
+            keyword: 关键词
+        """
+        if self._can_use_fts(keyword):
+            conditions.append("id IN (SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?)")
+            params.append(self._build_fts_query(keyword, column))
+        else:
+            conditions.append(f"{column} LIKE ?")
+            params.append(f"%{keyword}%")
+    
+    def _can_use_fts(self, keyword):
+        """判断关键词能否使用全文索引查询
+        
+        trigram分词器无法匹配少于3个字符的子串
+        """
+        if self._fts_available is None:
+            row = self.db.fetch_one(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'"
+            )
+            self._fts_available = row is not None
+        return self._fts_available and len(keyword) >= 3
+    
+    def _build_fts_query(self, keyword, column=None):
+        """构建FTS5 MATCH表达式，关键词作为短语进行子串匹配
+        
+        Args:
+            keyword: 关键词
+            column: 限定的列名，None表示所有列
+            
+        Returns:
+            str: MATCH表达式
+        """
+        phrase = '"' + keyword.replace('"', '""') + '"'
+        if column:
+            return f"{column} : {phrase}"
+        return phrase
+    
     def get_task_in_page(self, page=1, per_page=10, filters=None):
         """分页获取任务列表
         
@@ -97,29 +265,7 @@ class TaskService:
                 }
         """
         # 构建查询条件
-        conditions = []
-        params = []
-        
-        if filters:
-            if 'status' in filters and filters['status']:
-                placeholders = ', '.join(['?'] * len(filters['status']))
-                conditions.append(f"status IN ({placeholders})")
-                params.extend(filters['status'])
-            
-            if 'name' in filters and filters['name']:
-                conditions.append("name LIKE ?")
-                params.append(f"%{filters['name']}%")
-            
-            if 'template_type' in filters and filters['template_type']:
-                conditions.append("template_type = ?")
-                params.append(filters['template_type'])
-            
-            if 'script_content' in filters and filters['script_content']:
-                conditions.append("script_content LIKE ?")
-                params.append(f"%{filters['script_content']}%")
-        
-        # 构建WHERE子句
-        where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+        where_clause, params = self._build_filter_clause(filters)
         
         # 查询总数量
         count_query = f"SELECT COUNT(*) as total FROM tasks{where_clause}"
@@ -131,21 +277,14 @@ class TaskService:
         offset = (page - 1) * per_page
         pages = (total + per_page - 1) // per_page  # 总页数，向上取整
         
-        # 查询任务ID列表
-        id_query = f"""
-            SELECT id FROM tasks{where_clause}
+        # 查询当前页的任务记录，并批量构建任务实例
+        query = f"""
+            SELECT * FROM tasks{where_clause}
             ORDER BY created_time DESC
             LIMIT ? OFFSET ?
         """
-        id_params = params + [per_page, offset]
-        task_ids = self.db.fetch_all(id_query, id_params)
-        
-        # 获取任务实例列表
-        tasks = []
-        for data in task_ids:
-            task = Task.get_task_by_id(data['id'])
-            if task:
-                tasks.append(task)
+        rows = self.db.fetch_all(query, params + [per_page, offset])
+        tasks = Task.from_rows(rows)
         
         return {
             'tasks': tasks,
@@ -155,6 +294,134 @@ class TaskService:
             'pages': pages
         }
     
+    def get_task_in_cursor(self, cursor=None, per_page=10, filters=None, exact_total=False):
+        """按游标（keyset）分页获取任务列表
+        
+        按(created_time, id)倒序排列，通过上一页最后一条记录定位下一页，
+        翻页耗时与页码深度无关。默认只返回估算的总数，需要精确总数时
+        设置exact_total=True。
+        
+        Args:
+            cursor: 上一页返回的next_cursor，None或空字符串表示第一页
+            per_page: 每页数量
+            filters: 过滤条件，格式见get_task_in_page
+            exact_total: 是否精确统计总数
+            
+        Returns:
+            dict: 包含任务列表和游标信息
+                {
+                    'tasks': 任务实例列表,
+                    'per_page': 每页数量,
+                    'next_cursor': 下一页游标，没有更多数据时为None,
+                    'has_more': 是否还有下一页,
+                    'total': 总任务数,
+                    'total_is_estimate': 总数是否为估算值
+                }
+                
+        Raises:
+            ValueError: 游标格式无效
+        """
+        per_page = max(1, per_page)
+        
+        # 构建查询条件
+        where_clause, params = self._build_filter_clause(filters)
+        
+        # 从游标位置开始向后查找
+        seek_clause = where_clause
+        seek_params = list(params)
+        if cursor:
+            created_time, last_id = self._decode_cursor(cursor)
+            seek_clause += (" AND " if where_clause else " WHERE ") + "(created_time, id) < (?, ?)"
+            seek_params.extend([created_time, last_id])
+        
+        # 多取一条用于判断是否还有下一页
+        query = f"""
+            SELECT * FROM tasks{seek_clause}
+            ORDER BY created_time DESC, id DESC
+            LIMIT ?
+        """
+        rows = self.db.fetch_all(query, seek_params + [per_page + 1])
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        
+        next_cursor = None
+        if has_more:
+            last_row = rows[-1]
+            next_cursor = self._encode_cursor(last_row['created_time'], last_row['id'])
+        
+        # 统计总数
+        if exact_total:
+            count_query = f"SELECT COUNT(*) as total FROM tasks{where_clause}"
+            total_result = self.db.fetch_one(count_query, params)
+            total = total_result['total'] if total_result else 0
+            total_is_estimate = False
+        else:
+            total, total_is_estimate = self._estimate_total(filters)
+        
+        return {
+            'tasks': Task.from_rows(rows),
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'total': total,
+            'total_is_estimate': total_is_estimate
+        }
+    
+    def _estimate_total(self, filters):
+        """估算满足过滤条件的任务总数
+        
+        任务不会被删除且ID自增，因此MAX(id)即为任务总数的近似值；
+        有过滤条件时，统计最近TASK_COUNT_SAMPLE_SIZE条任务中满足条件的比例，
+        再按比例推算总数。任务总数不超过采样数量时结果是精确的。
+        
+        Args:
+            filters: 过滤条件
+            
+        Returns:
+            tuple: (总数, 是否为估算值)
+        """
+        total_rows = Task.get_max_id()
+        conditions, params = self._build_filter_conditions(filters)
+        if not conditions:
+            return total_rows, True
+        
+        sample_size = Config.TASK_COUNT_SAMPLE_SIZE
+        query = f"""
+            SELECT COUNT(*) as sampled, COALESCE(SUM(matched), 0) as matched FROM (
+                SELECT CASE WHEN {" AND ".join(conditions)} THEN 1 ELSE 0 END as matched
+                FROM tasks ORDER BY id DESC LIMIT ?
+            )
+        """
+        result = self.db.fetch_one(query, params + [sample_size])
+        sampled = result['sampled'] if result else 0
+        matched = result['matched'] if result else 0
+        
+        if sampled < sample_size:
+            # 采样覆盖了全部任务，结果是精确的
+            return matched, False
+        return int(round(matched * total_rows / sampled)), True
+    
+    def _encode_cursor(self, created_time, task_id):
+        """将分页位置编码为不透明的游标字符串"""
+        raw = json.dumps([str(created_time), task_id]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+    
+    def _decode_cursor(self, cursor):
+        """解析游标字符串
+        
+        Returns:
+            tuple: (created_time, task_id)
+            
+        Raises:
+            ValueError: 游标格式无效
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            created_time, task_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            return str(created_time), int(task_id)
+        except Exception:
+            raise ValueError(f"无效的分页游标: {cursor}")
+    
     def get_all_tasks(self, filters=None):
         """获取所有任务（可选过滤）
         
@@ -165,42 +432,111 @@ class TaskService:
             list: 任务列表
         """
         # 构建查询条件
-        conditions = []
-        params = []
+        where_clause, params = self._build_filter_clause(filters)
         
-        if filters:
-            if 'status' in filters and filters['status']:
-                placeholders = ', '.join(['?'] * len(filters['status']))
-                conditions.append(f"status IN ({placeholders})")
-                params.extend(filters['status'])
-            
-            if 'name' in filters and filters['name']:
-                conditions.append("name LIKE ?")
-                params.append(f"%{filters['name']}%")
-            
-            if 'template_type' in filters and filters['template_type']:
-                conditions.append("template_type = ?")
-                params.append(filters['template_type'])
+        # 查询任务记录，并批量构建任务实例
+        query = f"SELECT * FROM tasks{where_clause} ORDER BY created_time DESC"
+        rows = self.db.fetch_all(query, params)
+        
+        return Task.from_rows(rows)
+    
+    def search_tasks(self, keyword, field=None, limit=20,
+                     highlight_start='<mark>', highlight_end='</mark>'):
+        """全文搜索任务，按相关度排序并返回高亮片段
+        
+        Args:
+            keyword: 搜索关键词（子串匹配）
+            field: 限定搜索的字段(name, template_type, script_content)，None表示全部
+            limit: 最大返回数量
+            highlight_start: 高亮起始标记
+            highlight_end: 高亮结束标记
             
-            if 'script_content' in filters and filters['script_content']:
-                conditions.append("script_content LIKE ?")
-                params.append(f"%{filters['script_content']}%")
+        Returns:
+            list: 搜索结果列表，内容未做HTML转义
+                [
+                    {
+                        'task': 任务实例,
+                        'rank': 相关度(bm25，越小越相关，回退查询时为None),
+                        'snippets': {字段名: 高亮片段}
+                    },
+                    ...
+                ]
+                
+        Raises:
+            ValueError: 搜索字段无效
+        """
+        fields = ['name', 'template_type', 'script_content']
+        if field is not None and field not in fields:
+            raise ValueError(f"不支持的搜索字段: {field}")
+        if not keyword:
+            return []
+        limit = max(1, limit)
         
-        # 构建WHERE子句
-        where_clause = " WHERE " + " AND ".join(conditions) if conditions else ""
+        if not self._can_use_fts(keyword):
+            return self._search_tasks_by_like(keyword, field, limit, highlight_start, highlight_end)
         
-        # 查询任务ID列表
-        id_query = f"SELECT id FROM tasks{where_clause} ORDER BY created_time DESC"
-        task_ids = self.db.fetch_all(id_query, params)
+        # snippet的列序号与tasks_fts定义顺序一致
+        snippet_columns = ', '.join(
+            f"snippet(tasks_fts, {index}, ?, ?, '...', 16) as snippet_{name}"
+            for index, name in enumerate(fields)
+        )
+        query = f"""
+            SELECT tasks.*, bm25(tasks_fts) as fts_rank, {snippet_columns}
+            FROM tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid
+            WHERE tasks_fts MATCH ?
+            ORDER BY fts_rank
+            LIMIT ?
+        """
+        params = [highlight_start, highlight_end] * len(fields)
+        params += [self._build_fts_query(keyword, field), limit]
+        rows = self.db.fetch_all(query, params)
         
-        # 获取任务实例列表
-        tasks = []
-        for data in task_ids:
-            task = Task.get_task_by_id(data['id'])
-            if task:
-                tasks.append(task)
+        extra_columns = {'fts_rank'} | {f"snippet_{name}" for name in fields}
+        task_rows = [
+            {key: row[key] for key in row.keys() if key not in extra_columns}
+            for row in rows
+        ]
+        tasks = Task.from_rows(task_rows)
         
-        return tasks
+        results = []
+        for task, row in zip(tasks, rows):
+            snippets = {}
+            for name in fields:
+                snippet = row[f"snippet_{name}"]
+                if snippet and highlight_start in snippet:
+                    snippets[name] = snippet
+            results.append({
+                'task': task,
+                'rank': row['fts_rank'],
+                'snippets': snippets
+            })
+        return results
+    
+    def _search_tasks_by_like(self, keyword, field, limit, highlight_start, highlight_end):
+        """全文索引不可用时的LIKE回退搜索，按创建时间倒序"""
+        fields = [field] if field else ['name', 'template_type', 'script_content']
+        condition = " OR ".join(f"{name} LIKE ?" for name in fields)
+        query = f"SELECT * FROM tasks WHERE {condition} ORDER BY created_time DESC LIMIT ?"
+        rows = self.db.fetch_all(query, [f"%{keyword}%"] * len(fields) + [limit])
+        
+        results = []
+        for task in Task.from_rows(rows):
+            snippets = {}
+            for name in fields:
+                text = getattr(task, name) or ''
+                pos = text.lower().find(keyword.lower())
+                if pos < 0:
+                    continue
+                start = max(0, pos - 40)
+                end = min(len(text), pos + len(keyword) + 40)
+                snippets[name] = (
+                    ('...' if start > 0 else '')
+                    + text[start:pos] + highlight_start + text[pos:pos + len(keyword)] + highlight_end
+                    + text[pos + len(keyword):end]
+                    + ('...' if end < len(text) else '')
+                )
+            results.append({'task': task, 'rank': None, 'snippets': snippets})
+        return results
     
     def update_task(self, task: Task):
         """更新任务
@@ -215,31 +551,96 @@ class TaskService:
             system_logger.error("更新任务失败: 无效的任务实例")
             return False
         
-        # 获取原任务信息用于比较
-        original_task = Task.get_task_by_id(task.id)
-        if not original_task:
-            system_logger.error(f"更新任务失败: 任务不存在: ID={task.id}")
-            return False
-        
-        # 状态变更记录
-        if original_task.status != task.status:
-            logger = get_task_logger(task.id)
-            logger.info(f"task status changed: {original_task.status} -> {task.status}")
+        # 读取原任务和写回更新在同一个事务中完成
+        with self.db.transaction():
+            # 获取原任务信息用于比较
+            original_task = Task.get_task_by_id(task.id)
+            if not original_task:
+                system_logger.error(f"更新任务失败: 任务不存在: ID={task.id}")
+                return False
+            
+            # 状态变更记录
+            if original_task.status != task.status:
+                logger = get_task_logger(task.id)
+                logger.info(f"task status changed: {original_task.status} -> {task.status}")
+            
+                # 任务开始执行时记录开始时间
+                if task.status == 'running' and not task.start_time:
+                    task.start_time = datetime.now()
+                    logger.info(f"task started: time={task.start_time}")
+            
+                # 任务完成或失败时记录结束时间和执行时长
+                if task.status in ['completed', 'failed'] and not task.end_time:
+                    task.end_time = datetime.now()
+                    if task.start_time:
+                        duration = (task.end_time - task.start_time).total_seconds()
+                        task.execution_time = int(duration)
+                        logger.info(f"task finished: time={task.end_time}, duration={task.execution_time} seconds")
+            
+            if not task.update_task():
+                return False
+            self._sync_ready_queue(task)
             
-            # 任务开始执行时记录开始时间
-            if task.status == 'running' and not task.start_time:
-                task.start_time = datetime.now()
-                logger.info(f"task started: time={task.start_time}")
+            # 任务进入终态时解除或级联处理下游任务
+            if original_task.status != task.status and task.status in FINISHED_STATUSES:
+                self.dependency_service.on_task_finished(task.id, task.status)
+            
+            return True
+    
+    def claim_task(self, task, agent_id):
+        """为Agent领取任务
+        
+        通过条件更新原子地将waiting任务设置为running，替代先查询再更新的方式，
+        多个API进程同时为不同Agent分配同一任务时只有一个会成功。
+        
+        Args:
+            task: find_task_for_agent返回的任务实例
+            agent_id: Agent ID
             
-            # 任务完成或失败时记录结束时间和执行时长
-            if task.status in ['completed', 'failed'] and not task.end_time:
-                task.end_time = datetime.now()
-                if task.start_time:
-                    duration = (task.end_time - task.start_time).total_seconds()
-                    task.execution_time = int(duration)
-                    logger.info(f"task finished: time={task.end_time}, duration={task.execution_time} seconds")
+        Returns:
+            bool: 领取是否成功
+        """
+        with self.db.transaction():
+            claimed = task.claim_task(agent_id)
+        
+        if claimed:
+            self.ready_queue.remove(task.id)
+        else:
+            # 任务已被其他Agent领取或被修改，按数据库中的最新状态更新就绪队列
+            latest = Task.get_task_by_id(task.id)
+            if latest and latest.status == 'waiting':
+                self.ready_queue.push(latest)
+            else:
+                self.ready_queue.remove(task.id)
         
-        return task.update_task()
+        with _claim_stats_lock:
+            _claim_stats['attempts'] += 1
+            _claim_stats['claimed' if claimed else 'lost'] += 1
+        
+        if claimed:
+            logger = get_task_logger(task.id)
+            logger.info("task status changed: waiting -> running")
+            logger.info(f"task started: time={task.start_time}, agent={agent_id}")
+        else:
+            system_logger.warning(f"领取任务冲突: Task ID={task.id}, Agent ID={agent_id}")
+        return claimed
+    
+    def get_claim_stats(self):
+        """获取任务领取统计
+        
+        Returns:
+            dict: 统计信息
+                {
+                    'attempts': 领取次数,
+                    'claimed': 成功次数,
+                    'lost': 因冲突失败的次数,
+                    'ready_queue_size': 就绪队列中的任务数
+                }
+        """
+        with _claim_stats_lock:
+            stats = dict(_claim_stats)
+        stats['ready_queue_size'] = len(self.ready_queue)
+        return stats
     
     def update_task_by_key(self, task_id, **kwargs):
         """按键值对更新任务指定字段
@@ -251,21 +652,25 @@ class TaskService:
         Returns:
             bool: 更新是否成功
         """
-        task = Task.get_task_by_id(task_id)
-        if not task:
-            system_logger.error(f"更新任务失败: 任务不存在: ID={task_id}")
-            return False
-        
-        # 更新字段
-        for key, value in kwargs.items():
-            if hasattr(task, key):
-                setattr(task, key, value)
-        
-        return self.update_task(task)
+        with self.db.transaction():
+            task = Task.get_task_by_id(task_id)
+            if not task:
+                system_logger.error(f"更新任务失败: 任务不存在: ID={task_id}")
+                return False
+            
+            # 更新字段
+            for key, value in kwargs.items():
+                if hasattr(task, key):
+                    setattr(task, key, value)
+            
+            return self.update_task(task)
     
     def cancel_task(self, task_id):
         """取消任务
         
+        在写事务中重新读取任务并按条件更新，读取与取消之间不会有其他Agent领取该任务；
+        任务正在执行时为执行它的子Agent保存quit操作，并唤醒子Agent和领取任务的主Agent。
+        
         Args:
             task_id: 任务ID
             
@@ -273,61 +678,148 @@ class TaskService:
             bool: 取消是否成功
         """
         print(f"取消任务: ID={task_id}")
-        task = Task.get_task_by_id(task_id)
-        if not task:
-            system_logger.error(f"取消任务失败: 任务不存在: ID={task_id}")
-            return False
+        with self.db.transaction():
+            task = Task.get_task_by_id(task_id)
+            if not task:
+                system_logger.error(f"取消任务失败: 任务不存在: ID={task_id}")
+                return False
         
-        # 如果任务有子任务正在执行，也需要取消
-        if task.status == 'running' and task.agent_id:
-            # 这里暂不处理，需要在Agent模块中实现
-            pass
+            was_running = task.status == 'running'
+            if not task.cancel_task():
+                return False
+            self._sync_ready_queue(task)
+            self.dependency_service.on_task_finished(task.id, 'canceled')
+            
+            # 任务正在执行时通知子Agent终止任务并退出，并唤醒其长轮询或WebSocket连接
+            if was_running:
+                wake_ids = [task.agent_id] if task.agent_id else []
+                for agent in Agent.get_agents_by_task(task.id):
+                    if agent.status != 'end':
+                        AgentAction.add(agent.id, 'quit')
+                        wake_ids.append(agent.id)
+                for agent_id in wake_ids:
+                    self.db.after_commit(lambda agent_id=agent_id: self.notifier.wake_agent(agent_id))
         
-        print(f"取消任务: ID={task_id}")
         # 记录取消操作日志
         logger = get_task_logger(task.id)
         logger.info(f"任务被取消")
+        return True
+    
+    def _sync_ready_queue(self, task):
+        """事务提交后按任务的新状态更新就绪队列
         
-        print(f"取消任务: ID={task_id}")
-        return task.cancel_task()
+        Args:
+            task: 任务实例
+        """
+        if task.status == 'waiting':
+            self.db.after_commit(lambda: self.ready_queue.push(task))
+        else:
+            task_id = task.id
+            self.db.after_commit(lambda: self.ready_queue.remove(task_id))
     
-    def append_task_log(self, task_id, log_content):
+    def append_task_log(self, task_id, log_content, offset=None, agent_id=None):
         """将新的日志添加到任务日志文件中
         
+        指定offset时按子Agent输出流的字节偏移幂等追加：已写入的部分被忽略，只写入超出已确认偏移的部分，
+        写入并同步到磁盘后更新已确认偏移。子Agent变化时输出流从0重新开始。
+        读取已确认偏移、写入和更新偏移期间持有日志文件的排他锁，子Agent超时重发的日志块被另一个进程
+        同时处理时也不会重复写入。
+        
         Args:
             task_id: 任务ID
-            log_content: 日志内容
+            log_content: 日志内容（字符串或UTF-8字节）
+            offset: 日志内容在子Agent输出流中的字节偏移，None表示直接追加
+            agent_id: 上报日志的子Agent ID，仅在指定offset时使用
             
         Returns:
-            bool: 添加是否成功
+            bool: 添加是否成功（重复上报也返回True）
+        
+        Raises:
+            ValueError: offset大于已确认偏移，中间的输出缺失
         """
         task = Task.get_task_by_id(task_id)
         if not task or not task.log_file:
             system_logger.error(f"添加任务日志失败: 任务不存在或无日志文件: ID={task_id}")
             return False
         
+        if isinstance(log_content, str):
+            log_content = log_content.encode('utf-8')
+        
+        if offset is None:
+            return self._write_task_log(task, log_content)
+        
+        with _log_append_locks[task_id % len(_log_append_locks)], _lock_log_file(task.log_file):
+            stream = TaskLogStream.get_by_task_id(task_id)
+            if not stream or stream.agent_id != agent_id:
+                stream = TaskLogStream(task_id=task_id, agent_id=agent_id)
+            
+            if offset > stream.acked_offset:
+                raise ValueError(f"日志偏移不连续: 已确认={stream.acked_offset}, 上报={offset}")
+            
+            # 跳过已写入的部分
+            data = log_content[stream.acked_offset - offset:]
+            if not data:
+                return True
+            if not self._write_task_log(task, data, sync=True):
+                return False
+            
+            stream.acked_offset += len(data)
+            return stream.save()
+    
+    def _write_task_log(self, task, data, sync=False):
+        """追加写入任务日志文件
+        
+        Args:
+            task: 任务实例
+            data: 日志内容（字节）
+            sync: 是否在返回前同步到磁盘
+        
+        Returns:
+            bool: 写入是否成功
+        """
         try:
             # 确保日志目录存在
             os.makedirs(os.path.dirname(task.log_file), exist_ok=True)
             
             # 追加日志内容
-            with open(task.log_file, 'a', encoding='utf-8') as f:
-                f.write(log_content)
-                # if not log_content.endswith('\n'):
-                #     f.write('\n')
+            with open(task.log_file, 'ab') as f:
+                f.write(data)
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            
+            # 新增部分还在页缓存中，顺便扩展行索引
+            get_line_index(task.log_file).update()
+            # 推送给正在查看实时日志的客户端
+            get_log_tail_hub().notify(task.id)
             
             return True
         except Exception as e:
-            system_logger.error(f"添加任务日志失败: ID={task_id}, 错误={str(e)}")
+            system_logger.error(f"添加任务日志失败: ID={task.id}, 错误={str(e)}")
             return False
     
+    def get_task_log_offset(self, task_id, agent_id=None):
+        """获取子Agent输出流已写入日志文件的字节偏移，子Agent据此续传
+        
+        Args:
+            task_id: 任务ID
+            agent_id: 子Agent ID，与当前日志流的子Agent不同时返回0
+        
+        Returns:
+            int: 已确认的字节偏移
+        """
+        stream = TaskLogStream.get_by_task_id(task_id)
+        if not stream or (agent_id is not None and stream.agent_id != agent_id):
+            return 0
+        return stream.acked_offset
+    
     def get_task_log(self, task_id, start_line=0, max_lines=None):
         """从任务日志文件中获取日志
         
         Args:
             task_id: 任务ID
-            start_line: 起始行号，从0开始
-            max_lines: 最大行数，None表示获取所有行
+            start_line: 起始行号，从0开始，负数表示从末尾倒数
+            max_lines: 最大行数，None表示获取到末尾
             
         Returns:
             dict: 包含日志内容和信息
@@ -349,45 +841,11 @@ class TaskService:
             }
         
         try:
-            # 如果日志文件不存在，返回空内容
-            if not os.path.exists(task.log_file):
-                return {
-                    'content': '',
-                    'total_lines': 0,
-                    'start_line': 0,
-                    'end_line': 0
-                }
-            
-            # 读取日志文件
-            # 首先尝试使用UTF-8编码
-            try:
-                with open(task.log_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-            except UnicodeDecodeError:
-                # 如果UTF-8解码失败，尝试使用系统默认编码（Windows上通常是cp936/GBK）
-                try:
-                    with open(task.log_file, 'r', encoding='cp936') as f:
-                        lines = f.readlines()
-                except UnicodeDecodeError:
-                    # 如果GBK也失败，使用二进制模式读取并用errors='replace'处理解码错误
-                    with open(task.log_file, 'rb') as f:
-                        binary_content = f.read()
-                        # 尝试解码，遇到错误时替换为�符号
-                        content = binary_content.decode('utf-8', errors='replace')
-                        lines = content.splitlines(True)  # 保留换行符
-            
-            total_lines = len(lines)
-            start_line = min(start_line, total_lines - 1) if total_lines > 0 else 0
-            
-            if max_lines is not None:
-                end_line = min(start_line + max_lines, total_lines)
-                content = ''.join(lines[start_line:end_line])
-            else:
-                end_line = total_lines
-                content = ''.join(lines[start_line:])
+            # 按行索引定位，只读取请求范围内的字节，日志文件不存在时返回空内容
+            data, start_line, end_line, total_lines = get_line_index(task.log_file).read_lines(start_line, max_lines)
             
             return {
-                'content': content,
+                'content': decode_log(data),
                 'total_lines': total_lines,
                 'start_line': start_line,
                 'end_line': end_line
@@ -401,6 +859,124 @@ class TaskService:
                 'end_line': 0
             }
     
+    def get_task_log_tail(self, task_id, lines):
+        """读取任务日志末尾的若干行，返回内容不超过Config.LOG_MAX_RESPONSE_BYTES字节
+        
+        Args:
+            task_id: 任务ID
+            lines: 行数
+        
+        Returns:
+            dict: 包含日志内容和信息，任务不存在时返回None
+                {
+                    'content': 日志内容,
+                    'total_lines': 总行数,
+                    'start_line': 起始行号（截断时为不完整的第一行）,
+                    'end_line': 结束行号,
+                    'start_offset': 起始字节偏移,
+                    'end_offset': 结束字节偏移,
+                    'truncated': 是否因大小限制截断
+                }
+        
+        Raises:
+            ValueError: 行数为负数
+        """
+        if lines < 0:
+            raise ValueError(f"行数不能为负数: {lines}")
+        
+        task = Task.get_task_by_id(task_id)
+        if not task or not task.log_file:
+            system_logger.error(f"获取任务日志失败: 任务不存在或无日志文件: ID={task_id}")
+            return None
+        
+        # 行号来自行索引，只读取行索引已覆盖的部分，两者保持一致
+        total_lines, size = get_line_index(task.log_file).update()
+        result = log_reader.tail(task.log_file, lines, Config.LOG_MAX_RESPONSE_BYTES, size=size)
+        return {
+            'content': decode_log(result['content']),
+            'total_lines': total_lines,
+            'start_line': total_lines - result['lines'],
+            'end_line': total_lines,
+            'start_offset': result['start_offset'],
+            'end_offset': result['end_offset'],
+            'truncated': result['truncated']
+        }
+    
+    def search_task_log(self, task_id, pattern, direction='backward', offset=None, max_matches=None):
+        """在任务日志中按字面查找关键字，返回包含关键字的行
+        
+        Args:
+            task_id: 任务ID
+            pattern: 关键字
+            direction: 'backward'从后向前查找（默认），'forward'从前向后查找
+            offset: 查找的起始字节偏移（上一次结果中的next_offset），None表示从文件末尾（或开头）开始
+            max_matches: 最多返回的匹配数，不超过Config.LOG_SEARCH_MAX_MATCHES
+        
+        Returns:
+            dict: 查找结果，任务不存在时返回None
+                {
+                    'matches': [{'offset': 字节偏移, 'match_offset': 关键字的字节偏移, 'line': 行内容}],
+                    'next_offset': 继续查找时使用的offset，已查找完时为None
+                }
+        
+        Raises:
+            ValueError: 关键字为空或查找方向无效
+        """
+        if not pattern:
+            raise ValueError("查找关键字不能为空")
+        if direction not in ('backward', 'forward'):
+            raise ValueError(f"无效的查找方向: {direction}")
+        
+        task = Task.get_task_by_id(task_id)
+        if not task or not task.log_file:
+            system_logger.error(f"查找任务日志失败: 任务不存在或无日志文件: ID={task_id}")
+            return None
+        
+        max_matches = min(max_matches or Config.LOG_SEARCH_MAX_MATCHES, Config.LOG_SEARCH_MAX_MATCHES)
+        result = log_reader.search(
+            task.log_file, pattern.encode('utf-8'),
+            backward=(direction == 'backward'),
+            offset=offset,
+            max_matches=max_matches,
+            max_bytes=Config.LOG_MAX_RESPONSE_BYTES
+        )
+        for match in result['matches']:
+            match['line'] = decode_log(match['line'])
+        return result
+    
+    def get_task_log_range(self, task_id, offset, length=None):
+        """按字节范围读取任务日志
+        
+        Args:
+            task_id: 任务ID
+            offset: 起始字节偏移
+            length: 字节数，None或超过Config.LOG_MAX_RESPONSE_BYTES时按该上限读取
+        
+        Returns:
+            dict: 任务不存在时返回None
+                {
+                    'content': 日志内容（范围边界上不完整的字符被替换为�）,
+                    'start_offset': 起始字节偏移,
+                    'end_offset': 结束字节偏移,
+                    'size': 日志文件大小
+                }
+        
+        Raises:
+            ValueError: 偏移或字节数为负数
+        """
+        if offset < 0 or (length is not None and length < 0):
+            raise ValueError(f"无效的字节范围: offset={offset}, length={length}")
+        
+        task = Task.get_task_by_id(task_id)
+        if not task or not task.log_file:
+            system_logger.error(f"获取任务日志失败: 任务不存在或无日志文件: ID={task_id}")
+            return None
+        
+        length = min(length if length is not None else Config.LOG_MAX_RESPONSE_BYTES, Config.LOG_MAX_RESPONSE_BYTES)
+        result = log_reader.read_range(task.log_file, offset, length)
+        result['content'] = result['content'].decode('utf-8', errors='replace')
+        return result
+    
     def find_task_for_agent(self, agent):
         """获取适合指定Agent执行的任务
         
@@ -408,68 +984,122 @@ class TaskService:
             agent: Agent实例，包含可用资源信息
             
         Returns:
-            task: 可执行的任务实例，如果没有合适任务则返回None
-        """
-        # 查询待执行的任务，按优先级排序
-        query = """
-            SELECT id FROM tasks 
-            WHERE status = 'waiting' 
-            ORDER BY priority, created_time
+            tuple: (任务实例, 分配的GPU ID列表)，如果没有合适任务则返回(None, None)
         """
-        waiting_tasks = self.db.fetch_all(query)
+        return self._find_fitting_task(agent.available_cpu_cores, self._get_available_gpus(agent))
+    
+    def dispatch_tasks(self, agent, max_tasks=1):
+        """为Agent选择并领取一批任务
         
-        if not waiting_tasks:
-            return None, None
+        按优先级依次从就绪队列中取出能放入Agent剩余资源的任务并领取，每领取一个任务
+        就从剩余资源中扣除其CPU核心和GPU，直到没有放得下的任务或达到数量上限。
+        
+        Args:
+            agent: 主Agent实例，包含可用资源信息
+            max_tasks: 最多领取的任务数
+            
+        Returns:
+            list: 已领取的任务列表，元素为(任务实例, 分配的GPU ID列表)
+        """
+        available_cpu_cores = agent.available_cpu_cores
+        available_gpus = self._get_available_gpus(agent)
+        dispatched = []
+        lost = 0
         
-        # 检查每个任务是否满足依赖条件
-        for task_data in waiting_tasks:
-            task = Task.get_task_by_id(task_data['id'])
+        while len(dispatched) < max_tasks and lost < Config.TASK_CLAIM_MAX_ATTEMPTS:
+            task, gpu_ids = self._find_fitting_task(available_cpu_cores, available_gpus)
             if not task:
+                break
+            
+            # 被其他Agent抢先领取时换下一个任务重试
+            if not self.claim_task(task, agent.id):
+                lost += 1
                 continue
             
-            # 检查任务依赖是否已完成
-            if task.depends_on:
-                # 查询依赖的任务是否都已完成
-                placeholders = ', '.join(['?'] * len(task.depends_on))
-                dep_query = f"""
-                    SELECT COUNT(*) as count 
-                    FROM tasks 
-                    WHERE id IN ({placeholders}) 
-                    AND status != 'completed'
-                """
-                result = self.db.fetch_one(dep_query, task.depends_on)
-                if result and result['count'] > 0:
-                    # 依赖任务未完成，更新状态为blocked并跳过
-                    if task.status != 'blocked':
-                        task.status = 'blocked'
-                        task.update_task()
-                    continue
-                elif task.status == 'blocked':
-                    # 依赖已完成但状态仍为blocked，更新为waiting
-                    task.status = 'waiting'
-                    task.update_task()
-            
-            # 检查资源需求是否满足
-            can_execute = True
-            
-            # 检查CPU资源
-            if task.cpu_cores and (agent.available_cpu_cores is None or 
-                                  agent.available_cpu_cores < task.cpu_cores):
-                can_execute = False
-            
-            # 检查GPU资源
-            gpu_ids = []
-            if task.gpu_count and task.gpu_memory:
-                for gpu_i in agent.gpu_info:
-                    if gpu_i["is_available"] == False:
-                        continue
-                    if task.gpu_memory <= gpu_i["memory_total"]:
-                        gpu_ids.append(gpu_i["gpu_id"])
-                if len(gpu_ids) < task.gpu_count:
-                    can_execute = False
-            # 如果资源满足，返回该任务
-            if can_execute:
-                return task, gpu_ids
-        
-        # 没有找到合适的任务
-        return None, None
+            dispatched.append((task, gpu_ids))
+            if task.cpu_cores and available_cpu_cores is not None:
+                available_cpu_cores -= task.cpu_cores
+            available_gpus = [gpu for gpu in available_gpus if gpu['gpu_id'] not in gpu_ids]
+        
+        return dispatched
+    
+    def _find_fitting_task(self, available_cpu_cores, available_gpus):
+        """从就绪队列中查找能在给定资源上执行的优先级最高的任务
+        
+        查找耗时与排队任务数量无关。队列中的条目可能已被其他进程修改，
+        取出后以数据库中的状态为准，不再是waiting的任务从队列中剔除后继续查找。
+        
+        Args:
+            available_cpu_cores: 可用CPU核心数
+            available_gpus: 可分配的GPU列表
+            
+        Returns:
+            tuple: (任务实例, 分配的GPU ID列表)，如果没有合适任务则返回(None, None)
+        """
+        def fits(shape):
+            return self._can_fit(shape, available_cpu_cores, available_gpus)
+        
+        while True:
+            task_id = self.ready_queue.find(fits)
+            if task_id is None:
+                # 没有找到合适的任务
+                return None, None
+            
+            task = Task.get_task_by_id(task_id)
+            if not task or task.status != 'waiting':
+                self.ready_queue.remove(task_id)
+                continue
+            if not fits(task_shape(task)):
+                # 资源需求已被其他进程修改，按最新数据重新入队
+                self.ready_queue.push(task)
+                continue
+            
+            return task, self._assign_gpus(task, available_gpus)
+    
+    def _get_available_gpus(self, agent):
+        """获取Agent上可分配的GPU列表"""
+        gpu_info = agent.gpu_info or []
+        if isinstance(gpu_info, str):
+            gpu_info = json.loads(gpu_info)
+        return [gpu for gpu in gpu_info if gpu.get('is_available', True)]
+    
+    def _can_fit(self, shape, available_cpu_cores, available_gpus):
+        """判断资源规格是否能在Agent的可用资源上执行
+        
+        Args:
+            shape: 资源规格(cpu_cores, gpu_count, gpu_memory)，gpu_memory单位为MB
+            available_cpu_cores: Agent可用CPU核心数
+            available_gpus: Agent可分配的GPU列表，memory_total单位为字节
+        
+        Returns:
+            bool: 是否可以执行
+        """
+        cpu_cores, gpu_count, gpu_memory = shape
+        
+        # 检查CPU资源
+        if cpu_cores and (available_cpu_cores is None or available_cpu_cores < cpu_cores):
+            return False
+        
+        # 检查GPU资源
+        if gpu_count:
+            memory_bytes = gpu_memory * 1024 * 1024
+            matched = sum(1 for gpu in available_gpus if gpu.get('memory_total', 0) >= memory_bytes)
+            if matched < gpu_count:
+                return False
+            
+        return True
+            
+    def _assign_gpus(self, task, available_gpus):
+        """为任务选择gpu_count个显存满足需求的GPU
+        
+        按显存从小到大选择（最佳适配），把大显存GPU留给显存需求更高的任务。
+        
+        Returns:
+            list: GPU ID列表
+        """
+        if not task.gpu_count:
+            return []
+        memory_bytes = (task.gpu_memory or 0) * 1024 * 1024
+        candidates = [gpu for gpu in available_gpus if gpu.get('memory_total', 0) >= memory_bytes]
+        candidates.sort(key=lambda gpu: gpu.get('memory_total', 0))
+        return [gpu['gpu_id'] for gpu in candidates[:task.gpu_count]]
@@ -6,15 +6,200 @@
 """
 
 import os
+import time
+import queue
 import sqlite3
 import logging
 import threading
+from contextlib import contextmanager
 from config import Config
+from backend.utils.migrations import run_migrations
 
 logger = logging.getLogger(__name__)
 
-# 线程本地存储，用于保存每个线程的数据库连接
-local = threading.local()
+
+class ConnectionPool:
+    """SQLite连接池
+    
+    使用WAL日志模式，维护一个串行化的写连接和若干个可并发使用的读连接。
+    WAL模式下读操作不会被写操作阻塞，写操作之间通过进程内的锁串行化，
+    跨进程（如gunicorn多worker）的写冲突由SQLite的busy_timeout处理。
+    """
+    
+    def __init__(self, db_path, reader_count=None, busy_timeout=None,
+                 checkout_timeout=None, synchronous=None):
+        """初始化连接池
+        
+        Args:
+            db_path: 数据库文件路径
+            reader_count: 读连接数量上限
+            busy_timeout: SQLite忙等待超时（毫秒）
+            checkout_timeout: 获取连接的超时时间（秒）
+            synchronous: WAL模式下的同步级别
+        """
+        self.db_path = db_path
+        self.reader_count = max(1, reader_count or Config.DATABASE_READER_POOL_SIZE)
+        self.busy_timeout = busy_timeout if busy_timeout is not None else Config.DATABASE_BUSY_TIMEOUT
+        self.checkout_timeout = checkout_timeout if checkout_timeout is not None else Config.DATABASE_POOL_TIMEOUT
+        self.synchronous = synchronous or Config.DATABASE_SYNCHRONOUS
+        self.pid = os.getpid()
+        
+        # 写连接，同一时刻只允许一个线程使用
+        self._writer_lock = threading.RLock()
+        self._writer = self._create_connection(readonly=False)
+        
+        # 读连接按需创建，空闲连接放入队列复用
+        self._idle_readers = queue.LifoQueue()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        
+        # 连接池统计信息
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'writer_checkouts': 0,
+            'writer_waits': 0,
+            'writer_wait_time': 0.0,
+            'reader_checkouts': 0,
+            'reader_waits': 0,
+            'reader_wait_time': 0.0,
+            'lock_timeouts': 0,
+        }
+    
+    def _create_connection(self, readonly):
+        """创建一个配置好的SQLite连接
+        
+        Args:
+            readonly: 是否为只读连接
+            
+        Returns:
+            conn: SQLite连接
+        """
+        # 写连接使用autocommit模式，事务由Database.transaction显式控制
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000.0,
+            check_same_thread=False,
+            isolation_level=None
+        )
+        conn.row_factory = sqlite3.Row  # 设置返回结果为字典格式
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            # journal_mode是持久化到数据库文件中的，由写连接设置一次即可
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            if mode.lower() != 'wal':
+                logger.warning(f"数据库未能切换到WAL模式，当前模式: {mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        return conn
+    
+    def _record(self, key, value=1):
+        """累加统计值"""
+        with self._stats_lock:
+            self._stats[key] += value
+    
+    def _check_lock_error(self, error):
+        """如果异常是数据库锁超时，则计入统计"""
+        message = str(error).lower()
+        if 'locked' in message or 'busy' in message:
+            self._record('lock_timeouts')
+    
+    @contextmanager
+    def writer(self):
+        """获取写连接（串行化）
+        
+        Yields:
+            conn: 写连接
+        """
+        self._record('writer_checkouts')
+        if not self._writer_lock.acquire(blocking=False):
+            self._record('writer_waits')
+            wait_start = time.monotonic()
+            acquired = self._writer_lock.acquire(timeout=self.checkout_timeout)
+            self._record('writer_wait_time', time.monotonic() - wait_start)
+            if not acquired:
+                self._record('lock_timeouts')
+                raise TimeoutError("获取数据库写连接超时")
+        try:
+            yield self._writer
+        except sqlite3.OperationalError as e:
+            self._check_lock_error(e)
+            raise
+        finally:
+            self._writer_lock.release()
+    
+    @contextmanager
+    def reader(self):
+        """获取一个读连接，用完后归还连接池
+        
+        Yields:
+            conn: 读连接
+        """
+        self._record('reader_checkouts')
+        conn = self._checkout_reader()
+        try:
+            yield conn
+        except sqlite3.OperationalError as e:
+            self._check_lock_error(e)
+            raise
+        finally:
+            self._idle_readers.put(conn)
+    
+    def _checkout_reader(self):
+        """从连接池取出一个读连接，必要时创建新连接或等待
+        
+        Returns:
+            conn: 读连接
+        """
+        try:
+            return self._idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+        
+        # 未达到上限时创建新的读连接
+        with self._readers_lock:
+            if len(self._readers) < self.reader_count:
+                conn = self._create_connection(readonly=True)
+                self._readers.append(conn)
+                return conn
+        
+        # 连接已全部被占用，等待归还
+        self._record('reader_waits')
+        wait_start = time.monotonic()
+        try:
+            return self._idle_readers.get(timeout=self.checkout_timeout)
+        except queue.Empty:
+            self._record('lock_timeouts')
+            raise TimeoutError("获取数据库读连接超时")
+        finally:
+            self._record('reader_wait_time', time.monotonic() - wait_start)
+    
+    def get_stats(self):
+        """获取连接池统计信息
+        
+        Returns:
+            dict: 统计信息
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['reader_pool_size'] = self.reader_count
+        stats['readers_open'] = len(self._readers)
+        stats['readers_idle'] = self._idle_readers.qsize()
+        return stats
+    
+    def close(self):
+        """关闭连接池中的所有连接"""
+        with self._readers_lock:
+            for conn in self._readers:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._readers = []
+            self._idle_readers = queue.LifoQueue()
+        with self._writer_lock:
+            self._writer.close()
+
 
 class Database:
     """数据库操作类"""
@@ -32,31 +217,151 @@ class Database:
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         
         self.db_path = db_path
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        
+        # 线程本地存储，记录当前线程正在进行的事务
+        self._local = threading.local()
         
     def connect(self):
-        """建立数据库连接"""
-        if hasattr(local, 'conn') and local.conn:
-            return local.conn
-            
-        try:
-            local.conn = sqlite3.connect(self.db_path)
-            local.conn.row_factory = sqlite3.Row  # 设置返回结果为字典格式
-            logger.info(f"连接到数据库: {self.db_path}")
-            return local.conn
-        except Exception as e:
-            logger.error(f"数据库连接失败: {str(e)}")
-            raise
+        """建立数据库连接池
+        
+        Returns:
+            pool: 连接池实例
+        """
+        pool = self._pool
+        # fork之后子进程不能继续使用父进程的连接，需要重新建立
+        if pool is not None and pool.pid == os.getpid():
+            return pool
+        
+        with self._pool_lock:
+            if self._pool is None or self._pool.pid != os.getpid():
+                try:
+                    self._pool = ConnectionPool(self.db_path)
+                    logger.info(f"连接到数据库: {self.db_path}")
+                except Exception as e:
+                    logger.error(f"数据库连接失败: {str(e)}")
+                    raise
+            return self._pool
     
     def close(self):
         """关闭数据库连接"""
-        if hasattr(local, 'conn') and local.conn:
-            local.conn.close()
-            local.conn = None
-            logger.info("数据库连接已关闭")
+        with self._pool_lock:
+            if self._pool is not None and self._pool.pid == os.getpid():
+                self._pool.close()
+                logger.info("数据库连接已关闭")
+            self._pool = None
+    
+    def get_pool_stats(self):
+        """获取连接池统计信息（等待次数、取用次数、锁超时次数等）
+        
+        Returns:
+            dict: 统计信息
+        """
+        return self.connect().get_stats()
+    
+    def _current_transaction(self):
+        """获取当前线程正在使用的事务连接
+        
+        Returns:
+            conn: 事务中的写连接，不在事务中时返回None
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._pool is not None and self._pool.pid == os.getpid():
+            return conn
+        return None
+    
+    @contextmanager
+    def transaction(self):
+        """开启一个事务（工作单元）
+        
+        最外层事务持有写连接并使用BEGIN IMMEDIATE，退出时统一提交一次；
+        嵌套调用使用SAVEPOINT，内层异常只回滚到对应的保存点。
+        事务内的execute/fetch_*都在同一个写连接上执行，可以读到本事务的写入。
+        
+        用法:
+            with db.transaction():
+                db.execute(...)
+                db.executemany(...)
+        
+        Yields:
+            conn: 事务使用的写连接
+        """
+        conn = self._current_transaction()
+        if conn is not None:
+            # 嵌套事务，使用保存点
+            depth = self._local.depth
+            savepoint = f"sp_{depth}"
+            self._local.depth = depth + 1
+            conn.execute(f"SAVEPOINT {savepoint}")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+                # 丢弃回滚部分注册的提交后回调
+                self._local.callbacks = [
+                    item for item in self._local.callbacks if item[0] <= depth
+                ]
+                raise
+            else:
+                conn.execute(f"RELEASE {savepoint}")
+                # 保存点释放后，其中注册的回调归属到外层
+                self._local.callbacks = [
+                    (min(item[0], depth), item[1]) for item in self._local.callbacks
+                ]
+            finally:
+                self._local.depth = depth
+            return
+        
+        with self.connect().writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._local.conn = conn
+            self._local.depth = 1
+            self._local.callbacks = []
+            try:
+                yield conn
+                conn.execute("COMMIT")
+                callbacks = self._local.callbacks
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._local.conn = None
+                self._local.depth = 0
+                self._local.callbacks = []
+        
+        # 提交成功并释放写连接后再执行回调
+        for _, callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"事务提交后回调执行失败: {str(e)}")
+    
+    def after_commit(self, callback):
+        """注册事务提交后执行的回调
+        
+        不在事务中时立即执行；事务（或所在的保存点）回滚时回调被丢弃。
+        用于在数据提交后同步内存中的状态（如就绪队列）。
+        
+        Args:
+            callback: 无参数的回调函数
+        """
+        if self._current_transaction() is None:
+            callback()
+            return
+        self._local.callbacks.append((self._local.depth, callback))
+    
+    def in_transaction(self):
+        """当前线程是否处于事务中"""
+        return self._current_transaction() is not None
     
     def execute(self, query, params=None):
         """执行SQL语句
         
+        在事务中执行时不单独提交，由事务统一提交；否则自动提交。
+        
         Args:
             query: SQL查询语句
             params: 查询参数
@@ -64,18 +369,71 @@ class Database:
         Returns:
             cursor: 执行结果游标
         """
-        conn = self.connect()
+        conn = self._current_transaction()
+        if conn is not None:
+            return self._run_statement(conn, query, params, many=False)
+        with self.transaction() as conn:
+            return self._run_statement(conn, query, params, many=False)
+    
+    def executemany(self, query, seq_of_params):
+        """批量执行同一条SQL语句
         
+        Args:
+            query: SQL语句
+            seq_of_params: 参数序列
+            
+        Returns:
+            cursor: 执行结果游标
+        """
+        conn = self._current_transaction()
+        if conn is not None:
+            return self._run_statement(conn, query, seq_of_params, many=True)
+        with self.transaction() as conn:
+            return self._run_statement(conn, query, seq_of_params, many=True)
+    
+    def _run_statement(self, conn, query, params, many):
+        """在指定连接上执行写语句"""
         cursor = conn.cursor()
         try:
-            if params:
+            if many:
+                cursor.executemany(query, params)
+            elif params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
-            conn.commit()
             return cursor
         except Exception as e:
-            conn.rollback()
+            logger.error(f"SQL执行错误: {str(e)}, 查询: {query}, 参数: {params}")
+            raise
+    
+    def _query(self, query, params, fetch_one):
+        """执行查询
+        
+        在事务中时使用事务连接以读到未提交的写入，否则使用读连接。
+        
+        Args:
+            query: SQL查询语句
+            params: 查询参数
+            fetch_one: 是否只获取第一条结果
+            
+        Returns:
+            查询结果
+        """
+        conn = self._current_transaction()
+        if conn is not None:
+            return self._run_query(conn, query, params, fetch_one)
+        with self.connect().reader() as conn:
+            return self._run_query(conn, query, params, fetch_one)
+    
+    def _run_query(self, conn, query, params, fetch_one):
+        """在指定连接上执行查询并获取结果"""
+        try:
+            if params:
+                cursor = conn.execute(query, params)
+            else:
+                cursor = conn.execute(query)
+            return cursor.fetchone() if fetch_one else cursor.fetchall()
+        except Exception as e:
             logger.error(f"SQL执行错误: {str(e)}, 查询: {query}, 参数: {params}")
             raise
     
@@ -89,8 +447,7 @@ class Database:
         Returns:
             list: 查询结果列表
         """
-        cursor = self.execute(query, params)
-        return cursor.fetchall()
+        return self._query(query, params, fetch_one=False)
     
     def fetch_one(self, query, params=None):
         """执行查询并返回单个结果
@@ -102,8 +459,7 @@ class Database:
         Returns:
             dict: 查询结果
         """
-        cursor = self.execute(query, params)
-        return cursor.fetchone()
+        return self._query(query, params, fetch_one=True)
     
     def init_tables(self):
         """初始化数据库表结构"""
@@ -124,7 +480,8 @@ class Database:
             end_time TIMESTAMP,
             execution_time INTEGER,
             agent_id TEXT,
-            log_file TEXT
+            log_file TEXT,
+            version INTEGER NOT NULL DEFAULT 0
         )
         ''')
         
@@ -172,6 +529,9 @@ class Database:
         )
         ''')
         
+        # 执行schema迁移（索引等），对已有数据库原地升级
+        run_migrations(self)
+        
         logger.info("数据库表结构初始化完成")
     
 # 创建全局数据库实例
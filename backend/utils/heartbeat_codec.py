@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+心跳编码
+
+Agent在注册时上报静态信息（CPU核心数、总内存、GPU ID列表），之后的心跳只发送与基准
+（最近一次被服务器确认的全量心跳，即关键帧）相比发生变化的资源字段，并带上递增的序号:
+    {
+        'seq': 心跳序号,
+        'full': 是否为全量资源信息（关键帧：首次发送、重连、服务器要求重新同步或距上一个关键帧已满
+            keyframe_interval次心跳时）,
+        'base': 增量所基于的关键帧序号（仅增量）,
+        'resource_info': 变化的资源字段，删除的字段名放在removed_keys中，GPU信息按gpu_id只发送变化的字段（gpu_delta）,
+        'task_info': 任务状态（仅子Agent）
+    }
+
+增量只依赖关键帧而不依赖上一次心跳，中间的心跳丢失或被多进程部署中的其他进程处理都不影响解码。
+服务器把关键帧保存到各进程共用的存储（keyframe_store，服务器使用数据库），进程内没有对应的
+关键帧时从存储读取；存储中也没有（如数据库被清空）时本次心跳的资源信息被忽略，
+响应中带上'resync': True，Agent下一次心跳发送全量。
+没有seq字段的心跳按旧版全量心跳处理；没有base字段的增量按旧版相对上一次心跳的增量处理，
+要求序号连续。
+
+HTTP请求体超过一定大小时使用zlib压缩，并设置Content-Encoding: deflate；服务器解压时限制解压后的大小。
+本模块不依赖数据库，Agent和服务器共用。
+"""
+
+import json
+import zlib
+import threading
+
+# 只在注册时上报的静态字段
+STATIC_FIELDS = ('cpu_cores', 'memory_total', 'gpu_ids')
+
+def diff_resource_info(previous, current):
+    """计算资源信息的增量
+    
+    Args:
+        previous: 上一次发送的资源信息
+        current: 当前资源信息
+    
+    Returns:
+        dict: 变化的字段，删除的字段名放在removed_keys中。GPU列表和各GPU的字段都不变时，
+            GPU信息的变化放在gpu_delta中: {gpu_id: {变化的字段: 新值}}
+    """
+    delta = {}
+    for key, value in current.items():
+        if key == 'gpu_info':
+            continue
+        if key not in previous or previous[key] != value:
+            delta[key] = value
+    
+    removed = [key for key in previous if key not in current]
+    if removed:
+        delta['removed_keys'] = removed
+    if 'gpu_info' not in current:
+        return delta
+    
+    old_gpus = {gpu.get('gpu_id'): gpu for gpu in previous.get('gpu_info') or []}
+    new_gpus = current.get('gpu_info') or []
+    if ('gpu_info' not in previous
+            or [gpu.get('gpu_id') for gpu in new_gpus] != list(old_gpus)
+            or any(set(old_gpus[gpu.get('gpu_id')]) - set(gpu) for gpu in new_gpus)):
+        # GPU列表变化或GPU的字段被删除时发送完整的GPU信息
+        delta['gpu_info'] = new_gpus
+    else:
+        gpu_delta = {}
+        for gpu in new_gpus:
+            old = old_gpus[gpu.get('gpu_id')]
+            changed = {key: value for key, value in gpu.items() if old.get(key) != value}
+            if changed:
+                gpu_delta[gpu.get('gpu_id')] = changed
+        if gpu_delta:
+            delta['gpu_delta'] = gpu_delta
+    return delta
+
+def apply_resource_delta(resource_info, delta):
+    """把增量合并到资源信息
+    
+    Args:
+        resource_info: 合并前的资源信息
+        delta: diff_resource_info计算的增量
+    
+    Returns:
+        dict: 合并后的资源信息（新字典，不修改参数）
+    """
+    merged = dict(resource_info)
+    for key in delta.get('removed_keys') or []:
+        merged.pop(key, None)
+    for key, value in delta.items():
+        if key not in ('gpu_delta', 'removed_keys'):
+            merged[key] = value
+    
+    gpu_delta = delta.get('gpu_delta')
+    if gpu_delta:
+        gpu_info = []
+        for gpu in merged.get('gpu_info') or []:
+            changed = gpu_delta.get(gpu.get('gpu_id'))
+            gpu_info.append(dict(gpu, **changed) if changed else gpu)
+        merged['gpu_info'] = gpu_info
+    return merged
+
+class HeartbeatEncoder:
+    """Agent端心跳编码器
+    
+    encode生成心跳后，服务器确认收到时调用commit；发送失败时不调用。全量心跳被确认后成为
+    之后增量的基准（关键帧），未被确认时下一次心跳仍以上一个关键帧为基准。
+    """
+    
+    def __init__(self, static_fields=STATIC_FIELDS, keyframe_interval=30):
+        """初始化编码器
+        
+        Args:
+            static_fields: 不在心跳中发送的静态字段
+            keyframe_interval: 每隔多少次心跳发送一次全量，使增量不会随时间越来越大
+        """
+        self.static_fields = static_fields
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self._base = None  # (序号, 资源信息)，服务器已确认的关键帧
+        self._pending = None  # (序号, 资源信息, 是否全量)，等待确认的心跳
+        self._lock = threading.Lock()
+    
+    def encode(self, resource_info):
+        """生成一次心跳的资源部分
+        
+        Args:
+            resource_info: 当前资源信息
+        
+        Returns:
+            dict: {'seq': 序号, 'full': 是否全量, 'base': 关键帧序号（仅增量）, 'resource_info': 资源信息或增量}
+        """
+        info = {key: value for key, value in resource_info.items() if key not in self.static_fields}
+        with self._lock:
+            seq = self.seq + 1
+            full = self._base is None or seq - self._base[0] >= self.keyframe_interval
+            self._pending = (seq, info, full)
+            if full:
+                return {'seq': seq, 'full': True, 'resource_info': info}
+            return {
+                'seq': seq,
+                'full': False,
+                'base': self._base[0],
+                'resource_info': diff_resource_info(self._base[1], info)
+            }
+    
+    def commit(self, response=None):
+        """服务器已处理最近一次encode生成的心跳
+        
+        Args:
+            response: 服务器的心跳响应，要求重新同步时下一次心跳发送全量
+        """
+        with self._lock:
+            if self._pending is not None:
+                seq, info, full = self._pending
+                self.seq = seq
+                if full:
+                    self._base = (seq, info)
+                self._pending = None
+            if response and response.get('resync'):
+                self._base = None
+    
+    def reset(self):
+        """下一次心跳发送全量资源信息（如重新建立连接后）"""
+        with self._lock:
+            self._base = None
+            self._pending = None
+
+class HeartbeatDecoder:
+    """服务器端心跳解码器，按Agent保存关键帧和合并后的资源信息"""
+    
+    def __init__(self, keyframe_store=None):
+        """初始化解码器
+        
+        Args:
+            keyframe_store: 多个进程共用的关键帧存储，为None时只保存在当前进程中。需要提供:
+                load(agent_id) -> (序号, 资源信息)或None
+                save(agent_id, seq, resource_info)
+                delete(agent_id)
+        """
+        self.keyframe_store = keyframe_store
+        self._lock = threading.Lock()
+        self._keyframes = {}  # Agent ID -> (序号, 资源信息)
+        self._states = {}  # Agent ID -> (序号, 资源信息)，最近一次心跳合并后的资源信息
+    
+    def decode(self, agent_id, data):
+        """解码心跳中的资源信息
+        
+        Args:
+            agent_id: Agent ID
+            data: Agent发送的心跳数据
+        
+        Returns:
+            tuple: (合并后的资源信息, 是否需要重新同步)。需要重新同步时资源信息为None
+        """
+        resource_info = data.get('resource_info') or {}
+        seq = data.get('seq')
+        if seq is None:
+            # 旧版Agent，每次发送全量资源信息
+            return resource_info, False
+        
+        if data.get('full'):
+            merged = dict(resource_info)
+            with self._lock:
+                self._keyframes[agent_id] = (seq, merged)
+            if self.keyframe_store is not None:
+                self.keyframe_store.save(agent_id, seq, merged)
+        elif 'base' in data:
+            keyframe = self._get_keyframe(agent_id, data['base'])
+            if keyframe is None:
+                return None, True
+            merged = apply_resource_delta(keyframe[1], resource_info)
+        else:
+            # 旧版增量，相对上一次心跳
+            with self._lock:
+                state = self._states.get(agent_id)
+            if state is None or seq != state[0] + 1:
+                return None, True
+            merged = apply_resource_delta(state[1], resource_info)
+        
+        with self._lock:
+            self._states[agent_id] = (seq, merged)
+        return dict(merged), False
+    
+    def _get_keyframe(self, agent_id, base):
+        """获取增量所基于的关键帧，当前进程中没有时从关键帧存储读取
+        
+        Args:
+            agent_id: Agent ID
+            base: 关键帧序号
+        
+        Returns:
+            tuple: (序号, 资源信息)，没有该关键帧时返回None
+        """
+        with self._lock:
+            keyframe = self._keyframes.get(agent_id)
+        if keyframe is not None and keyframe[0] == base:
+            return keyframe
+        if self.keyframe_store is None:
+            return None
+        
+        keyframe = self.keyframe_store.load(agent_id)
+        if keyframe is None or keyframe[0] != base:
+            return None
+        with self._lock:
+            self._keyframes[agent_id] = keyframe
+        return keyframe
+    
+    def state(self, agent_id):
+        """获取Agent合并后的资源信息
+        
+        Returns:
+            dict: 资源信息，没有时返回None
+        """
+        with self._lock:
+            state = self._states.get(agent_id)
+            return dict(state[1]) if state else None
+    
+    def forget(self, agent_id):
+        """删除Agent的解码状态和关键帧"""
+        with self._lock:
+            self._states.pop(agent_id, None)
+            self._keyframes.pop(agent_id, None)
+        if self.keyframe_store is not None:
+            self.keyframe_store.delete(agent_id)
+
+def encode_body(data, min_size=1024):
+    """把心跳编码为HTTP请求体，超过min_size字节时压缩
+    
+    Args:
+        data: 心跳数据
+        min_size: 压缩的最小字节数
+    
+    Returns:
+        tuple: (请求体, 请求头)
+    """
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if min_size is not None and len(body) >= min_size:
+        body = zlib.compress(body)
+        headers['Content-Encoding'] = 'deflate'
+    return body, headers
+
+def decode_body(body, content_encoding=None, max_size=None):
+    """解码HTTP请求体
+    
+    Args:
+        body: 请求体
+        content_encoding: Content-Encoding请求头
+        max_size: 解压后的最大字节数，None表示不限制
+    
+    Returns:
+        dict: 心跳数据
+    
+    Raises:
+        ValueError: 请求体无法解压、解压后超过max_size或不是有效的JSON
+    """
+    if content_encoding and content_encoding.lower() == 'deflate':
+        decompressor = zlib.decompressobj()
+        try:
+            body = decompressor.decompress(body, max_size or 0)
+        except zlib.error as e:
+            raise ValueError(f"请求体解压失败: {str(e)}")
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ValueError("请求体解压失败: 数据不完整或超过大小限制")
+    if max_size is not None and len(body) > max_size:
+        raise ValueError(f"请求体超过大小限制: {len(body)} > {max_size}")
+    return json.loads(body)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务日志分块编码
+
+子Agent把任务输出作为字节流，按偏移分块上报到POST /api/tasks/<task_id>/log/chunks:
+    请求参数: agent_id=子Agent ID, offset=本块第一个字节在输出流中的偏移
+    请求体: 本块的原始字节，超过一定大小时使用zlib压缩并设置Content-Encoding: deflate
+    响应: {'acked_offset': 服务器已写入日志文件的偏移}
+
+服务器按偏移去重，子Agent收到确认后才丢弃已确认的部分，上报失败时从已确认偏移重新发送。
+本模块不依赖数据库，Agent和服务器共用。
+"""
+
+import zlib
+
+def encode_chunk(data, min_size=1024):
+    """把日志块编码为HTTP请求体，超过min_size字节时压缩
+    
+    Args:
+        data: 日志块（字节）
+        min_size: 压缩的最小字节数
+    
+    Returns:
+        tuple: (请求体, 请求头)
+    """
+    headers = {'Content-Type': 'application/octet-stream'}
+    if min_size is not None and len(data) >= min_size:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            headers['Content-Encoding'] = 'deflate'
+            return compressed, headers
+    return data, headers
+
+def decode_chunk(body, content_encoding=None, max_size=None):
+    """解码HTTP请求体中的日志块
+    
+    Args:
+        body: 请求体
+        content_encoding: Content-Encoding请求头
+        max_size: 解压后的最大字节数，None表示不限制
+    
+    Returns:
+        bytes: 日志块
+    
+    Raises:
+        ValueError: 请求体无法解压或解压后超过max_size
+    """
+    if content_encoding and content_encoding.lower() == 'deflate':
+        decompressor = zlib.decompressobj()
+        try:
+            body = decompressor.decompress(body, max_size or 0)
+        except zlib.error as e:
+            raise ValueError(f"日志块解压失败: {str(e)}")
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ValueError("日志块解压失败: 数据不完整或超过大小限制")
+    if max_size is not None and len(body) > max_size:
+        raise ValueError(f"日志块超过大小限制: {len(body)} > {max_size}")
+    return body
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务日志行索引
+
+在日志文件旁保存稀疏的行偏移索引（<日志文件>.idx），每stride行记录一次行首的字节偏移。
+按行读取时先定位到最近的索引点，最多顺序跳过stride-1行，只读取请求的字节，总行数直接来自索引。
+
+日志文件由多个写入方追加（子Agent上报的输出、任务日志器），索引不依赖写入方通知，
+每次使用前从上次索引到的位置扫描新增的部分。日志文件被轮转或截断（inode变化、变小或最后一个已索引的
+换行符不在原位置）时重建索引。
+
+索引文件格式: 文件头（见HEADER）之后是按本机字节序保存的64位偏移数组，第i项为第i*stride行的行首偏移。
+索引文件只是缓存，损坏或格式不符时直接重建。
+"""
+
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from backend.utils.logger import system_logger
+from config import Config
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'TLOGIDX1'
+# 魔数, stride, 日志文件inode, 已索引的字节数, 完整行数（换行符个数）, 最后一行的行首偏移
+HEADER = struct.Struct('<8sQQQQQ')
+READ_BLOCK = 1024 * 1024
+MAX_CACHED_INDEXES = 256
+
+class LineIndex:
+    """单个日志文件的行偏移索引，多线程安全"""
+    
+    def __init__(self, log_path, stride=1024):
+        """初始化行索引
+        
+        Args:
+            log_path: 日志文件路径
+            stride: 索引间隔（行）
+        """
+        self.log_path = log_path
+        self.index_path = log_path + INDEX_SUFFIX
+        self.stride = stride
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset(None)
+    
+    def _reset(self, inode):
+        """清空索引
+        
+        Args:
+            inode: 日志文件的inode
+        """
+        self.inode = inode
+        self.indexed_size = 0
+        self.complete_lines = 0
+        self.last_line_start = 0
+        self.offsets = array('Q', [0])
+        self._saved_offsets = 0  # 已写入索引文件的偏移数，0表示需要重写整个索引文件
+    
+    @property
+    def total_lines(self):
+        """总行数，末尾没有换行符的部分也算一行（与readlines一致）"""
+        return self.complete_lines + (1 if self.indexed_size > self.last_line_start else 0)
+    
+    def update(self):
+        """把索引扩展到日志文件当前的末尾
+        
+        Returns:
+            tuple: (总行数, 已索引的字节数)，日志文件不存在时返回(0, 0)
+        """
+        with self._lock:
+            try:
+                with open(self.log_path, 'rb') as f:
+                    self._update(f)
+            except FileNotFoundError:
+                self._reset(None)
+            return self.total_lines, self.indexed_size
+    
+    def read_lines(self, start_line=0, max_lines=None):
+        """读取指定范围的行
+        
+        Args:
+            start_line: 起始行号，从0开始，负数表示从末尾倒数
+            max_lines: 最大行数，None表示读取到末尾
+        
+        Returns:
+            tuple: (内容(字节), 起始行号, 结束行号(不包含), 总行数)，日志文件不存在时返回(b'', 0, 0, 0)
+        """
+        with self._lock:
+            try:
+                f = open(self.log_path, 'rb')
+            except FileNotFoundError:
+                self._reset(None)
+                return b'', 0, 0, 0
+            
+            with f:
+                # 索引和读取使用同一个文件句柄，期间日志文件被轮转也不会读错文件
+                self._update(f)
+                total_lines = self.total_lines
+                if start_line < 0:
+                    start_line = max(total_lines + start_line, 0)
+                start_line = min(start_line, total_lines - 1) if total_lines > 0 else 0
+                end_line = min(start_line + max_lines, total_lines) if max_lines is not None else total_lines
+                if end_line <= start_line:
+                    return b'', start_line, start_line, total_lines
+                
+                begin = self._line_offset(f, start_line)
+                if end_line == total_lines:
+                    end = self.indexed_size
+                else:
+                    end = self._line_offset(f, end_line, start_line, begin)
+                f.seek(begin)
+                return f.read(end - begin), start_line, end_line, total_lines
+    
+    def _line_offset(self, f, line, known_line=None, known_offset=None):
+        """计算行首的字节偏移，从最近的索引点（或已知行）开始逐行跳过
+        
+        Args:
+            f: 日志文件句柄
+            line: 行号，不超过完整行数
+            known_line: 已知偏移的行号，在同一个索引间隔内时从该行开始跳过
+            known_offset: known_line的行首偏移
+        
+        Returns:
+            int: 字节偏移
+        """
+        block = line // self.stride
+        from_line, offset = block * self.stride, self.offsets[block]
+        if known_line is not None and from_line <= known_line <= line:
+            from_line, offset = known_line, known_offset
+        
+        f.seek(offset)
+        for _ in range(line - from_line):
+            f.readline()
+        return f.tell()
+    
+    def _update(self, f):
+        """扫描日志文件新增的部分并保存索引
+        
+        Args:
+            f: 日志文件句柄
+        """
+        st = os.fstat(f.fileno())
+        if not self._loaded:
+            self._load()
+            self._loaded = True
+        if self.inode != st.st_ino or st.st_size < self.indexed_size or not self._check_last_newline(f):
+            # 日志文件被轮转、截断或原地重写
+            self._reset(st.st_ino)
+        if st.st_size == self.indexed_size:
+            return
+        
+        f.seek(self.indexed_size)
+        position = self.indexed_size
+        remaining = st.st_size - position
+        while remaining > 0:
+            block = f.read(min(READ_BLOCK, remaining))
+            if not block:
+                break
+            self._scan(block, position)
+            position += len(block)
+            remaining -= len(block)
+        self.indexed_size = position
+        self._save()
+    
+    def _check_last_newline(self, f):
+        """检查最后一个已索引的换行符是否还在原位置，用于发现被原地重写的日志文件
+        
+        Args:
+            f: 日志文件句柄
+        
+        Returns:
+            bool: 索引是否仍然有效
+        """
+        if self.last_line_start == 0:
+            return True
+        f.seek(self.last_line_start - 1)
+        return f.read(1) == b'\n'
+    
+    def _scan(self, block, base):
+        """统计一块数据中的换行符，记录经过的索引点
+        
+        Args:
+            block: 数据
+            base: 数据在日志文件中的偏移
+        """
+        count = block.count(b'\n')
+        if not count:
+            return
+        
+        next_mark = (self.complete_lines // self.stride + 1) * self.stride
+        if self.complete_lines + count < next_mark:
+            # 没有经过索引点，不需要逐个查找换行符
+            self.complete_lines += count
+            self.last_line_start = base + block.rindex(b'\n') + 1
+            return
+        
+        position = -1
+        for _ in range(count):
+            position = block.find(b'\n', position + 1)
+            self.complete_lines += 1
+            if self.complete_lines % self.stride == 0:
+                self.offsets.append(base + position + 1)
+        self.last_line_start = base + position + 1
+    
+    def _load(self):
+        """从索引文件加载索引，文件不存在或无效时保持空索引"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return
+                magic, stride, inode, indexed_size, complete_lines, last_line_start = HEADER.unpack(header)
+                if magic != INDEX_MAGIC or stride != self.stride:
+                    return
+                
+                count = complete_lines // stride + 1
+                offsets = array('Q')
+                data = f.read(count * offsets.itemsize)
+                if len(data) < count * offsets.itemsize:
+                    return
+                offsets.frombytes(data)
+        except OSError:
+            return
+        
+        self.inode = inode
+        self.indexed_size = indexed_size
+        self.complete_lines = complete_lines
+        self.last_line_start = last_line_start
+        self.offsets = offsets
+        self._saved_offsets = count
+    
+    def _save(self):
+        """把新增的索引点追加到索引文件，最后更新文件头"""
+        header = HEADER.pack(
+            INDEX_MAGIC, self.stride, self.inode, self.indexed_size,
+            self.complete_lines, self.last_line_start
+        )
+        try:
+            if self._saved_offsets and os.path.exists(self.index_path):
+                with open(self.index_path, 'r+b') as f:
+                    f.seek(HEADER.size + self._saved_offsets * self.offsets.itemsize)
+                    f.write(self.offsets[self._saved_offsets:].tobytes())
+                    f.truncate()
+                    # 文件头最后写入，中途失败时旧文件头仍然有效
+                    f.seek(0)
+                    f.write(header)
+            else:
+                with open(self.index_path, 'wb') as f:
+                    f.write(header)
+                    f.write(self.offsets.tobytes())
+            self._saved_offsets = len(self.offsets)
+        except OSError as e:
+            # 索引文件只是缓存，写入失败时继续使用内存中的索引
+            system_logger.warning(f"保存日志行索引失败: {self.index_path}, 错误={str(e)}")
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def get_line_index(log_path):
+    """获取日志文件的行索引，最近使用的索引保存在内存中
+    
+    Args:
+        log_path: 日志文件路径
+    
+    Returns:
+        LineIndex: 行索引
+    """
+    with _indexes_lock:
+        index = _indexes.get(log_path)
+        if index is None:
+            index = LineIndex(log_path, Config.LOG_INDEX_STRIDE)
+            _indexes[log_path] = index
+            if len(_indexes) > MAX_CACHED_INDEXES:
+                _indexes.popitem(last=False)
+        else:
+            _indexes.move_to_end(log_path)
+        return index
+
+def decode_log(data):
+    """解码日志内容
+    
+    依次尝试UTF-8和系统默认编码（Windows上通常是cp936/GBK），都失败时按UTF-8解码并把无法解码的字节替换为�
+    
+    Args:
+        data: 日志内容（字节）
+    
+    Returns:
+        str: 日志文本
+    """
+    for encoding in ('utf-8', 'cp936'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return data.decode('utf-8', errors='replace')
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+大日志文件读取
+
+用mmap在日志文件上直接查找换行符和关键字，只把返回给调用方的字节复制出来，
+不把整个文件读入内存。用于读取末尾N行、从后向前（或从前向后）查找关键字和按字节范围读取。
+所有函数的返回大小都有上限，调用方通过返回的偏移继续读取。
+"""
+
+import os
+import mmap
+from contextlib import contextmanager
+
+# 查找结果中每行最多返回的字节数
+MAX_MATCH_LINE_BYTES = 4096
+
+@contextmanager
+def open_mmap(path):
+    """以只读方式映射日志文件
+    
+    Args:
+        path: 日志文件路径
+    
+    Yields:
+        mmap: 文件映射，文件不存在或为空时为None
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        yield None
+        return
+    
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield None
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+def _char_start(mm, position, limit):
+    """把位置向后移动到UTF-8字符的起始字节，避免从多字节字符中间截断
+    
+    Args:
+        mm: 文件映射
+        position: 位置
+        limit: 最多移动到的位置
+    
+    Returns:
+        int: 字符起始位置
+    """
+    for candidate in range(position, min(position + 3, limit)):
+        if mm[candidate] & 0xC0 != 0x80:
+            return candidate
+    return position
+
+def tail(path, lines, max_bytes, size=None):
+    """读取末尾的若干行
+    
+    Args:
+        path: 日志文件路径
+        lines: 行数
+        max_bytes: 最多返回的字节数，超过时从靠后的字符边界截断
+        size: 只读取文件的前size个字节（与行索引保持一致），None表示整个文件
+    
+    Returns:
+        dict: {
+            'content': 内容(字节),
+            'start_offset': 内容的起始字节偏移,
+            'end_offset': 内容的结束字节偏移,
+            'lines': 返回的行数（截断时第一行不完整）,
+            'truncated': 是否因max_bytes截断
+        }
+    """
+    with open_mmap(path) as mm:
+        end = len(mm) if mm is not None else 0
+        if size is not None:
+            end = min(end, size)
+        if end == 0 or lines <= 0:
+            return {'content': b'', 'start_offset': end, 'end_offset': end, 'lines': 0, 'truncated': False}
+        
+        limit = max(end - max_bytes, 0)
+        # 最后一行末尾的换行符不算作行分隔
+        search_end = end - 1 if mm[end - 1] == ord('\n') else end
+        start = search_end
+        found = 0
+        while found < lines:
+            newline = mm.rfind(b'\n', limit, start)
+            if newline < 0:
+                break
+            found += 1
+            start = newline
+        if found == lines:
+            start += 1
+            truncated = False
+        elif limit == 0:
+            # 文件中的行数不足
+            start = 0
+            found += 1
+            truncated = False
+        else:
+            start = _char_start(mm, limit, end)
+            found += 1
+            truncated = True
+        
+        return {
+            'content': mm[start:end],
+            'start_offset': start,
+            'end_offset': end,
+            'lines': found,
+            'truncated': truncated
+        }
+
+def search(path, pattern, backward=True, offset=None, max_matches=100, max_bytes=1024 * 1024):
+    """查找包含关键字的行
+    
+    Args:
+        path: 日志文件路径
+        pattern: 关键字（字节，按字面匹配）
+        backward: 是否从后向前查找
+        offset: 查找的起始字节偏移，从后向前时只查找此偏移之前的内容，None表示文件末尾（或开头）
+        max_matches: 最多返回的匹配数
+        max_bytes: 匹配行的总字节数上限
+    
+    Returns:
+        dict: {
+            'matches': [{
+                'offset': 返回内容的字节偏移（行首，超长的行从关键字附近开始）,
+                'match_offset': 关键字的字节偏移,
+                'line': 行内容(字节，最多MAX_MATCH_LINE_BYTES)
+            }],
+            'next_offset': 继续查找时使用的offset，已查找完整个文件时为None
+        }
+    """
+    matches = []
+    with open_mmap(path) as mm:
+        if mm is None or not pattern:
+            return {'matches': matches, 'next_offset': None}
+        
+        size = len(mm)
+        position = size if offset is None and backward else (offset or 0)
+        position = min(max(position, 0), size)
+        total_bytes = 0
+        while len(matches) < max_matches and total_bytes < max_bytes:
+            if backward:
+                found = mm.rfind(pattern, 0, position)
+            else:
+                found = mm.find(pattern, position)
+            if found < 0:
+                return {'matches': matches, 'next_offset': None}
+            
+            line_start = mm.rfind(b'\n', 0, found) + 1
+            line_end = mm.find(b'\n', found + len(pattern))
+            line_end = size if line_end < 0 else line_end + 1
+            # 超长的行只返回关键字附近的部分
+            begin = line_start
+            if line_end - line_start > MAX_MATCH_LINE_BYTES:
+                begin = _char_start(mm, max(line_start, found - MAX_MATCH_LINE_BYTES // 2), found)
+            line = mm[begin:min(line_end, begin + MAX_MATCH_LINE_BYTES)]
+            matches.append({'offset': begin, 'match_offset': found, 'line': line})
+            total_bytes += len(line)
+            
+            # 同一行只返回一次
+            position = line_start if backward else line_end
+            if (backward and position == 0) or (not backward and position >= size):
+                return {'matches': matches, 'next_offset': None}
+        
+        return {'matches': matches, 'next_offset': position}
+
+def read_range(path, offset, length):
+    """按字节范围读取
+    
+    Args:
+        path: 日志文件路径
+        offset: 起始字节偏移
+        length: 字节数
+    
+    Returns:
+        dict: {'content': 内容(字节), 'start_offset': 起始偏移, 'end_offset': 结束偏移, 'size': 文件大小}
+    """
+    with open_mmap(path) as mm:
+        size = len(mm) if mm is not None else 0
+        start = min(max(offset, 0), size)
+        end = min(start + max(length, 0), size)
+        return {
+            'content': mm[start:end] if mm is not None else b'',
+            'start_offset': start,
+            'end_offset': end,
+            'size': size
+        }
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+数据库迁移模块
+
+按版本号顺序执行schema迁移，已执行的版本记录在schema_version表中。
+每个迁移都必须是幂等的，这样即使版本记录丢失也可以安全地重复执行。
+迁移函数返回False表示当前环境不满足条件而跳过，不记录版本，下次启动时重新尝试。
+"""
+
+import sqlite3
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# 已注册的迁移列表，元素为(版本号, 描述, 迁移函数)
+MIGRATIONS = []
+
+def migration(version, description):
+    """注册一个迁移
+    
+    Args:
+        version: 版本号，必须唯一且递增
+        description: 迁移描述
+    """
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return func
+    return decorator
+
+@migration(1, "tasks表添加调度索引(status, priority, created_time)")
+def add_task_schedule_index(db):
+    """find_task_for_agent按状态过滤并按优先级和创建时间排序"""
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tasks_status_priority_created
+        ON tasks (status, priority, created_time)
+    """)
+
+@migration(2, "task_dependencies表添加task_id索引")
+def add_task_dependency_index(db):
+    """按task_id查询依赖列表"""
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_task_dependencies_task_id
+        ON task_dependencies (task_id, depends_on_id)
+    """)
+
+@migration(3, "agents表添加main_agent_id索引")
+def add_sub_agent_index(db):
+    """按主Agent查询子Agent"""
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_agents_main_agent_status
+        ON agents (main_agent_id, status)
+    """)
+
+@migration(4, "tasks表添加(created_time, id)索引")
+def add_task_created_index(db):
+    """任务列表按(created_time, id)倒序做游标分页"""
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tasks_created_id
+        ON tasks (created_time, id)
+    """)
+
+@migration(5, "添加任务全文索引tasks_fts(FTS5 trigram)")
+def add_task_fulltext_index(db):
+    """name/template_type/script_content的FTS5影子索引，由触发器保持同步
+    
+    使用trigram分词器以支持任意子串匹配（与原LIKE '%...%'语义一致）。
+    SQLite未编译FTS5或版本低于3.34时跳过且不记录版本，任务过滤会回退到LIKE查询，
+    升级SQLite后下次启动时建立索引。
+    
+    Returns:
+        bool: 当前SQLite不支持FTS5 trigram时返回False
+    """
+    try:
+        db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+                name, template_type, script_content,
+                content='tasks', content_rowid='id', tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        logger.warning(f"当前SQLite不支持FTS5 trigram，跳过全文索引: {str(e)}")
+        return False
+    
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, name, template_type, script_content)
+            VALUES (new.id, new.name, new.template_type, new.script_content);
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, name, template_type, script_content)
+            VALUES ('delete', old.id, old.name, old.template_type, old.script_content);
+        END
+    """)
+    # update_task每次都会写回全部字段，只有文本真正变化时才更新索引
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update
+        AFTER UPDATE OF name, template_type, script_content ON tasks
+        WHEN old.name IS NOT new.name
+            OR old.template_type IS NOT new.template_type
+            OR old.script_content IS NOT new.script_content
+        BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, name, template_type, script_content)
+            VALUES ('delete', old.id, old.name, old.template_type, old.script_content);
+            INSERT INTO tasks_fts (rowid, name, template_type, script_content)
+            VALUES (new.id, new.name, new.template_type, new.script_content);
+        END
+    """)
+    
+    # 为已有任务建立索引
+    db.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+@migration(6, "task_dependencies表添加depends_on_id反向索引")
+def add_task_dependents_index(db):
+    """任务结束时按depends_on_id查找直接下游任务"""
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_task_dependencies_depends_on_id
+        ON task_dependencies (depends_on_id, task_id)
+    """)
+
+@migration(7, "tasks表添加version列")
+def add_task_version_column(db):
+    """任务领取时按(status, version)做条件更新，防止同一任务被重复分配"""
+    columns = [row['name'] for row in db.fetch_all("PRAGMA table_info(tasks)")]
+    if 'version' not in columns:
+        db.execute("ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+@migration(8, "添加agent_metrics表（Agent资源指标的分钟、小时汇总）")
+def add_agent_metrics_table(db):
+    """按(Agent, 粒度, 时间桶)保存采样数、总和与最大值，写入时累加，平均值在查询时计算"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS agent_metrics (
+            agent_id TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            samples INTEGER NOT NULL DEFAULT 0,
+            cpu_sum REAL NOT NULL DEFAULT 0,
+            cpu_max REAL NOT NULL DEFAULT 0,
+            memory_sum REAL NOT NULL DEFAULT 0,
+            memory_max INTEGER NOT NULL DEFAULT 0,
+            gpu_usage_sum REAL NOT NULL DEFAULT 0,
+            gpu_memory_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (agent_id, resolution, bucket)
+        ) WITHOUT ROWID
+    """)
+    # 按粒度和时间清理过期数据
+    db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_agent_metrics_resolution_bucket
+        ON agent_metrics (resolution, bucket)
+    """)
+
+@migration(9, "添加task_accounting表（任务结束时的资源使用汇总）")
+def add_task_accounting_table(db):
+    """子Agent在最后一次心跳中上报任务整个生命周期的资源使用，每个任务一行"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS task_accounting (
+            task_id INTEGER PRIMARY KEY,
+            agent_id TEXT,
+            wall_seconds REAL,
+            cpu_seconds REAL,
+            cpu_usage_avg REAL,
+            cpu_usage_peak REAL,
+            peak_rss INTEGER,
+            peak_pss INTEGER,
+            gpu_usage_avg REAL,
+            gpu_usage_peak REAL,
+            gpu_memory_peak INTEGER,
+            samples INTEGER,
+            recorded_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (task_id) REFERENCES tasks (id)
+        )
+    """)
+
+@migration(10, "添加task_log_streams表（子Agent日志流的已确认偏移）")
+def add_task_log_streams_table(db):
+    """每个任务一行，记录当前上报日志的子Agent和已写入日志文件的字节偏移，用于日志分块去重和续传"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS task_log_streams (
+            task_id INTEGER PRIMARY KEY,
+            agent_id TEXT,
+            acked_offset INTEGER NOT NULL DEFAULT 0,
+            updated_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (task_id) REFERENCES tasks (id)
+        )
+    """)
+
+@migration(11, "添加heartbeat_keyframes表（增量心跳的关键帧）")
+def add_heartbeat_keyframes_table(db):
+    """每个Agent一行，保存最近一次全量心跳的资源信息，多进程部署中各进程都能解码相对它的增量心跳"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS heartbeat_keyframes (
+            agent_id TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            resource_info TEXT NOT NULL,
+            updated_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+@migration(12, "添加agent_actions表（待下发的Agent控制操作）")
+def add_agent_actions_table(db):
+    """post_action下发的控制操作，按id顺序在Agent心跳时取出，多进程部署时各进程共用"""
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS agent_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            agent_id TEXT NOT NULL,
+            action TEXT NOT NULL,
+            created_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_agent_actions_agent_id ON agent_actions (agent_id, id)")
+
+@migration(13, "task_accounting表添加rusage_max_rss列")
+def add_task_accounting_rusage_column(db):
+    """getrusage得到的单进程最大RSS与采样得到的进程树RSS峰值分开保存"""
+    columns = [row['name'] for row in db.fetch_all("PRAGMA table_info(task_accounting)")]
+    if 'rusage_max_rss' not in columns:
+        db.execute("ALTER TABLE task_accounting ADD COLUMN rusage_max_rss INTEGER")
+
+def get_schema_version(db):
+    """获取当前数据库schema版本
+    
+    Args:
+        db: 数据库实例
+    
+    Returns:
+        int: 当前版本号，未执行过迁移时返回0
+    """
+    row = db.fetch_one("SELECT MAX(version) as version FROM schema_version")
+    return row['version'] if row and row['version'] else 0
+
+def run_migrations(db):
+    """执行所有未执行的迁移
+    
+    每个迁移在独立的事务中执行，并在同一事务中写入版本记录。
+    事务使用BEGIN IMMEDIATE，多个进程同时启动时只有一个会真正执行迁移。
+    
+    Args:
+        db: 数据库实例
+    
+    Returns:
+        int: 本次执行的迁移数量
+    """
+    db.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    
+    applied = 0
+    for version, description, func in MIGRATIONS:
+        with db.transaction():
+            row = db.fetch_one(
+                "SELECT version FROM schema_version WHERE version = ?",
+                (version,)
+            )
+            if row:
+                continue
+            
+            logger.info(f"执行数据库迁移: 版本={version}, 描述={description}")
+            if func(db) is False:
+                logger.info(f"数据库迁移已跳过，不记录版本: 版本={version}")
+                continue
+            db.execute(
+                "INSERT INTO schema_version (version, description, applied_time) VALUES (?, ?, ?)",
+                (version, description, datetime.now())
+            )
+            applied += 1
+    
+    if applied:
+        # 新建索引后更新查询优化器的统计信息
+        db.execute("ANALYZE")
+        logger.info(f"数据库迁移完成: 执行{applied}个迁移, 当前版本={get_schema_version(db)}")
+    
+    return applied
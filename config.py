@@ -19,16 +19,79 @@ class Config:
     DATABASE_PATH = os.path.join(BASE_DIR, 'data', 'database', 'task_system.db')
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{DATABASE_PATH}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DATABASE_READER_POOL_SIZE = 4     # 并发读连接数量
+    DATABASE_BUSY_TIMEOUT = 5000      # SQLite忙等待超时（毫秒）
+    DATABASE_POOL_TIMEOUT = 10        # 从连接池获取连接的超时时间（秒）
+    DATABASE_SYNCHRONOUS = 'NORMAL'   # WAL模式下的同步级别（NORMAL只在检查点时fsync）
+    
+    # 任务列表配置
+    TASK_COUNT_SAMPLE_SIZE = 1000     # 估算过滤后任务总数时采样的最近任务数
+    
+    # 任务依赖配置
+    # 上游任务失败或取消时对下游任务的处理: 'none'(保持blocked), 'fail'(级联失败), 'cancel'(级联取消)
+    DEPENDENCY_FAILURE_POLICY = 'none'
+    
+    # 调度配置
+    READY_QUEUE_REFRESH_INTERVAL = 30  # 就绪队列从数据库重建的间隔（秒），多进程部署时用于同步，0表示不重建
+    TASK_CLAIM_MAX_ATTEMPTS = 3  # 每次心跳允许的领取冲突次数，领取冲突时换下一个任务重试
+    MAX_TASKS_PER_HEARTBEAT = 16  # 每次心跳最多为主Agent分配的任务数
     
     # 日志配置
     LOG_DIR = os.path.join(BASE_DIR, 'data', 'logs')
     SYSTEM_LOG_PATH = os.path.join(LOG_DIR, 'system')
     TASK_LOG_PATH = os.path.join(LOG_DIR, 'tasks')
+    LOG_INDEX_STRIDE = 1024  # 任务日志行索引每隔多少行记录一次行首偏移，按行读取时最多顺序跳过这么多行
+    LOG_MAX_RESPONSE_BYTES = 1024 * 1024  # 任务日志末尾读取、查找和按字节范围读取时最多返回的字节数
+    LOG_SEARCH_MAX_MATCHES = 100  # 任务日志查找最多返回的匹配数
     
     # Agent配置
     HEARTBEAT_TIMEOUT = 10  # 心跳超时时间（秒）
     MAIN_AGENT_HEARTBEAT_INTERVAL = 2  # 主Agent心跳间隔（秒）
     SUB_AGENT_HEARTBEAT_INTERVAL = 1   # 子Agent心跳间隔（秒）
+    HEARTBEAT_LONG_POLL_MAX_WAIT = 5   # 服务器端长轮询心跳的最长等待时间（秒），不超过心跳超时时间的一半
+    MAIN_AGENT_LONG_POLL_WAIT = 0      # 主Agent长轮询心跳的等待时间（秒），0表示不使用长轮询。长轮询请求会占用服务器worker，
+                                       # 只在服务器使用线程或协程worker（gunicorn --threads/gthread、gevent、eventlet）时开启，
+                                       # sync worker下服务器忽略等待时间立即返回
+    AGENT_REGISTRY_FLUSH_INTERVAL = 5  # 心跳信息从内存写回数据库的间隔（秒），应小于心跳超时时间，0表示每次心跳立即写回
+    AGENT_REGISTRY_REFRESH_INTERVAL = 2  # 从数据库重新读取Agent状态的间隔（秒），多进程部署时其他进程的状态变化最多延迟这么久可见，0表示不重新读取
+    HEARTBEAT_COMPRESS_MIN_SIZE = 1024  # Agent心跳请求体超过此字节数时使用deflate压缩
+    HEARTBEAT_KEYFRAME_INTERVAL = 30   # Agent每隔多少次心跳发送一次全量资源信息（关键帧）
+    HEARTBEAT_MAX_BODY_SIZE = 32 * 1024 * 1024  # 服务器接受的心跳请求体解压后的最大字节数（批量心跳中包含子Agent的日志块）
+    AGENT_LOCAL_HUB_ENABLED = True     # 子Agent是否通过本机Unix域套接字把心跳交给主Agent汇聚转发
+    AGENT_HUB_FLUSH_INTERVAL = 1       # 主Agent转发子Agent心跳的间隔（秒）
+    AGENT_HUB_SOCKET_DIR = None        # 主Agent套接字文件所在目录，默认为系统临时目录
+    AGENT_HUB_MAX_LOG_BATCH = 16 * 1024 * 1024  # 主Agent每次转发子Agent日志块的最大总字节数
+    RESOURCE_SAMPLE_INTERVAL = 1       # Agent后台资源采样间隔（秒）
+    RESOURCE_SAMPLE_WINDOW = 60        # 资源使用量最小值、平均值、最大值的统计窗口（秒）
+    PROCESS_TREE_RESCAN_INTERVAL = 5   # Agent完整发现任务进程树中子进程的间隔（秒），其间只检查新进程和线程数变化的进程
+    PROCESS_PSS_INTERVAL = 10          # Agent读取进程树PSS（smaps_rollup）的间隔（秒），0表示不读取PSS
+    LOG_CHUNK_SIZE = 256 * 1024        # 子Agent上报任务日志的最大分块（字节）
+    LOG_CHUNK_MAX_SIZE = 4 * 1024 * 1024  # 服务器接受的日志块解压后的最大字节数
+    LOG_CHUNK_COMPRESS_MIN_SIZE = 1024  # 日志块超过此字节数时使用deflate压缩
+    LOG_SHIP_INTERVAL = 1              # 子Agent上报任务日志的间隔（秒）
+    LOG_SHIP_CLOSE_TIMEOUT = 10        # 子Agent退出时等待剩余日志上报的最长时间（秒）
+    TASK_OUTPUT_QUEUE_SIZE = 4 * 1024 * 1024  # 子Agent在内存中缓存的待上报任务输出的最大字节数，超过时从本地日志文件补读
+    TASK_OUTPUT_MAX_BACKLOG = 1024 * 1024 * 1024  # 本地日志文件中未上报任务输出的最大字节数，超过时暂停读取任务输出，0表示不限制
+    
+    # Agent资源指标配置
+    METRICS_RAW_CAPACITY = 3600        # 每个Agent在内存中保留的原始采样数（环形缓冲区容量）
+    METRICS_RAW_RETENTION = 600        # Agent超过此时间（秒）没有新采样时释放其原始采样
+    METRICS_FLUSH_INTERVAL = 30        # 分钟/小时汇总写入数据库的间隔（秒）
+    METRICS_MINUTE_RETENTION = 7 * 86400   # 分钟汇总的保留时间（秒）
+    METRICS_HOUR_RETENTION = 90 * 86400    # 小时汇总的保留时间（秒）
+    METRICS_MAX_POINTS = 1000          # 指标查询最多返回的数据点数，step过小时自动放大
+    
+    # WebSocket配置
+    WEBSOCKET_ENABLED = False          # 是否启动Agent WebSocket服务
+    WEBSOCKET_HOST = '0.0.0.0'         # WebSocket服务监听地址
+    WEBSOCKET_PORT = 5051              # WebSocket服务端口
+    WEBSOCKET_MAX_MESSAGE_SIZE = 16 * 1024 * 1024  # 单条消息最大字节数（子Agent的日志块）
+    LOG_TAIL_BUFFER_SIZE = 1024 * 1024  # 实时日志每个任务在内存中保存的末尾字节数，断线重连时从中续传
+    LOG_TAIL_INITIAL_BYTES = 64 * 1024  # 实时日志连接未指定偏移时先推送的末尾字节数
+    LOG_TAIL_POLL_INTERVAL = 1         # 实时日志检查日志文件新内容的间隔（秒），追加日志时另外立即推送
+    LOG_TAIL_MAX_PENDING_BYTES = 8 * 1024 * 1024  # 实时日志每个连接最多积压的日志字节数，超过时断开，客户端重连后续传
+    AGENT_USE_WEBSOCKET = False        # Agent是否优先使用WebSocket通道，连接不可用时回退到HTTP心跳
+    AGENT_WEBSOCKET_CONNECT_TIMEOUT = 2  # Agent启动时等待WebSocket连接的时间（秒）
     
     # API服务器地址
     SERVER_URL = 'http://localhost:5050'  # 服务器地址，Agent使用此地址连接服务器
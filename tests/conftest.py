@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+测试公共配置
+
+把项目根目录加入Python路径，并在导入后端模块之前把日志和数据库路径指向临时目录，
+测试不会写入data/目录。
+"""
+
+import os
+import sys
+import tempfile
+import pytest
+
+# 获取项目根目录
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 添加项目根目录到 Python 路径
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from config import Config
+
+TEST_DATA_DIR = tempfile.mkdtemp(prefix='task_system_test_')
+Config.DATABASE_PATH = os.path.join(TEST_DATA_DIR, 'db', 'task_system.db')
+Config.LOG_DIR = os.path.join(TEST_DATA_DIR, 'logs')
+Config.SYSTEM_LOG_PATH = os.path.join(TEST_DATA_DIR, 'logs', 'system')
+Config.TASK_LOG_PATH = os.path.join(TEST_DATA_DIR, 'logs', 'tasks')
+
+# 测试之间需要清空的数据表，schema_version和全文索引的影子表保持不变
+DATA_TABLES = (
+    'task_dependencies', 'tasks', 'agents', 'templates', 'agent_metrics', 'task_accounting',
+    'task_log_streams', 'heartbeat_keyframes', 'agent_actions',
+)
+
+@pytest.fixture
+def db():
+    """建好表的临时数据库，测试结束后清空数据并重建就绪队列"""
+    from backend.utils.database import get_db
+    from backend.services.ready_queue import get_ready_queue
+    database = get_db()
+    database.init_tables()
+    yield database
+    with database.transaction():
+        for table in DATA_TABLES:
+            database.execute(f"DELETE FROM {table}")
+    get_ready_queue().rebuild()
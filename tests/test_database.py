@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+数据库连接池和事务测试
+"""
+
+import threading
+import sqlite3
+import pytest
+from backend.utils.database import Database, ConnectionPool
+
+@pytest.fixture
+def database(tmp_path):
+    """带有items表的独立数据库"""
+    database = Database(str(tmp_path / 'test.db'))
+    database.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    yield database
+    database.close()
+
+def count(database):
+    """items表的行数"""
+    return database.fetch_one("SELECT COUNT(*) AS count FROM items")['count']
+
+def test_pool_uses_wal_mode(database):
+    assert database.fetch_one("PRAGMA journal_mode")[0].lower() == 'wal'
+
+def test_reader_is_not_blocked_by_open_write_transaction(database):
+    database.execute("INSERT INTO items (name) VALUES ('a')")
+    counts = []
+    with database.transaction():
+        database.execute("INSERT INTO items (name) VALUES ('b')")
+        # 其他线程使用读连接，读到提交前的数据且不等待写事务
+        reader = threading.Thread(target=lambda: counts.append(count(database)))
+        reader.start()
+        reader.join(2)
+        assert not reader.is_alive()
+    assert counts == [1]
+    assert count(database) == 2
+
+def test_readers_are_read_only(database):
+    with database.connect().reader() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO items (name) VALUES ('a')")
+
+def test_reader_checkout_times_out_when_pool_is_exhausted(tmp_path):
+    pool = ConnectionPool(str(tmp_path / 'pool.db'), reader_count=1, checkout_timeout=0.05)
+    try:
+        with pool.reader():
+            with pytest.raises(TimeoutError):
+                with pool.reader():
+                    pass
+        stats = pool.get_stats()
+        assert stats['readers_open'] == 1 and stats['reader_waits'] == 1 and stats['lock_timeouts'] == 1
+        # 归还后可以再次取出
+        with pool.reader():
+            pass
+    finally:
+        pool.close()
+
+def test_transaction_commits_once_and_rolls_back_on_error(database):
+    with database.transaction():
+        database.execute("INSERT INTO items (name) VALUES ('a')")
+        database.execute("INSERT INTO items (name) VALUES ('b')")
+        # 事务内的查询使用写连接，读到本事务的写入
+        assert count(database) == 2
+    assert count(database) == 2
+    
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            database.execute("INSERT INTO items (name) VALUES ('c')")
+            raise RuntimeError("rollback")
+    assert count(database) == 2 and not database.in_transaction()
+
+def test_nested_savepoint_rollback_keeps_outer_writes(database):
+    with database.transaction():
+        database.execute("INSERT INTO items (name) VALUES ('outer')")
+        with pytest.raises(RuntimeError):
+            with database.transaction():
+                database.execute("INSERT INTO items (name) VALUES ('inner')")
+                raise RuntimeError("rollback inner")
+        with database.transaction():
+            database.execute("INSERT INTO items (name) VALUES ('second')")
+    names = [row['name'] for row in database.fetch_all("SELECT name FROM items ORDER BY id")]
+    assert names == ['outer', 'second']
+
+def test_after_commit_runs_only_after_commit(database):
+    calls = []
+    with database.transaction():
+        database.after_commit(lambda: calls.append('outer'))
+        with database.transaction():
+            database.after_commit(lambda: calls.append('released'))
+        with pytest.raises(RuntimeError):
+            with database.transaction():
+                database.after_commit(lambda: calls.append('rolled back'))
+                raise RuntimeError("rollback inner")
+        assert calls == []
+    assert calls == ['outer', 'released']
+    
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            database.after_commit(lambda: calls.append('outer rolled back'))
+            raise RuntimeError("rollback")
+    assert calls == ['outer', 'released']
+    
+    # 不在事务中时立即执行
+    database.after_commit(lambda: calls.append('immediate'))
+    assert calls[-1] == 'immediate'
+
+def test_after_commit_callback_error_does_not_undo_commit(database):
+    def fail():
+        raise ValueError("callback failed")
+    
+    with database.transaction():
+        database.execute("INSERT INTO items (name) VALUES ('a')")
+        database.after_commit(fail)
+    assert count(database) == 1
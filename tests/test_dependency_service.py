@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务依赖调度测试
+"""
+
+import pytest
+from backend.models.task import Task
+from backend.services.dependency_service import DependencyService
+from backend.services.ready_queue import get_ready_queue
+from backend.services.task_service import TaskService
+from config import Config
+
+def finish(db, task, status):
+    """将任务设置为终态并处理下游任务"""
+    db.execute("UPDATE tasks SET status = ? WHERE id = ?", (status, task.id))
+    get_ready_queue().remove(task.id)
+    return DependencyService().on_task_finished(task.id, status)
+
+def make_chain():
+    """创建依赖链A <- B <- C，以及同时依赖A和D的E"""
+    service = TaskService()
+    a = service.create_task('a', 'shell', 'echo a')
+    b = service.create_task('b', 'shell', 'echo b', depends_on=[a.id])
+    c = service.create_task('c', 'shell', 'echo c', depends_on=[b.id])
+    d = service.create_task('d', 'shell', 'echo d')
+    e = service.create_task('e', 'shell', 'echo e', depends_on=[a.id, d.id])
+    return a, b, c, d, e
+
+def status_of(*tasks):
+    """读取任务的当前状态"""
+    return [Task.get_task_by_id(task.id).status for task in tasks]
+
+@pytest.mark.parametrize('policy, status', [('fail', 'failed'), ('cancel', 'canceled')])
+def test_failure_cascades_through_chain(db, monkeypatch, policy, status):
+    monkeypatch.setattr(Config, 'DEPENDENCY_FAILURE_POLICY', policy)
+    a, b, c, d, e = make_chain()
+    result = finish(db, a, 'failed')
+    assert sorted(result['propagated']) == sorted([b.id, c.id, e.id])
+    assert status_of(b, c, d, e) == [status, status, 'waiting', status]
+    assert Task.get_task_by_id(c.id).end_time is not None
+    assert len(get_ready_queue()) == 1
+
+def test_failure_without_policy_keeps_dependents_blocked(db, monkeypatch):
+    monkeypatch.setattr(Config, 'DEPENDENCY_FAILURE_POLICY', 'none')
+    a, b, c, d, e = make_chain()
+    result = finish(db, a, 'canceled')
+    assert result['propagated'] == []
+    assert status_of(b, c, e) == ['blocked', 'blocked', 'blocked']
+
+def test_cascade_skips_started_and_finished_tasks(db, monkeypatch):
+    monkeypatch.setattr(Config, 'DEPENDENCY_FAILURE_POLICY', 'fail')
+    a, b, c, d, e = make_chain()
+    db.execute("UPDATE tasks SET status = 'running' WHERE id = ?", (b.id,))
+    result = finish(db, a, 'failed')
+    # 已开始的任务不受影响，级联也不会越过它
+    assert sorted(result['propagated']) == [e.id]
+    assert status_of(b, c) == ['running', 'blocked']
+
+def test_completion_unblocks_only_when_all_upstreams_done(db):
+    a, b, c, d, e = make_chain()
+    result = finish(db, a, 'completed')
+    assert result['unblocked'] == [b.id]
+    assert status_of(b, c, e) == ['waiting', 'blocked', 'blocked']
+    assert finish(db, d, 'completed')['unblocked'] == [e.id]
+    assert status_of(e) == ['waiting']
+    assert len(get_ready_queue()) == 2
+
+def test_new_task_with_failed_upstream_cascades_immediately(db, monkeypatch):
+    monkeypatch.setattr(Config, 'DEPENDENCY_FAILURE_POLICY', 'cancel')
+    a = TaskService().create_task('a', 'shell', 'echo a')
+    finish(db, a, 'failed')
+    b = TaskService().create_task('b', 'shell', 'echo b', depends_on=[a.id])
+    assert b.status == 'canceled'
+
+def test_cancel_through_service_cascades(db, monkeypatch):
+    monkeypatch.setattr(Config, 'DEPENDENCY_FAILURE_POLICY', 'cancel')
+    a, b, c, d, e = make_chain()
+    assert TaskService().cancel_task(a.id)
+    assert status_of(a, b, c, d, e) == ['canceled', 'canceled', 'canceled', 'waiting', 'canceled']
+
+def test_reconcile_unblocks_stale_blocked_tasks(db):
+    a, b, c, d, e = make_chain()
+    db.execute("UPDATE tasks SET status = 'completed' WHERE id = ?", (a.id,))
+    assert DependencyService().reconcile() == 1
+    assert status_of(b, c) == ['waiting', 'blocked']
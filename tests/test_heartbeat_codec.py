@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+增量心跳编解码测试
+"""
+
+import pytest
+from backend.utils.heartbeat_codec import (
+    HeartbeatEncoder, HeartbeatDecoder, diff_resource_info, apply_resource_delta,
+    encode_body, decode_body
+)
+
+class MemoryKeyframeStore:
+    """保存在字典中的关键帧存储，模拟多个进程共用的数据库"""
+    
+    def __init__(self):
+        """初始化关键帧存储"""
+        self.keyframes = {}
+    
+    def load(self, agent_id):
+        """读取关键帧"""
+        return self.keyframes.get(agent_id)
+    
+    def save(self, agent_id, seq, resource_info):
+        """保存关键帧"""
+        self.keyframes[agent_id] = (seq, resource_info)
+    
+    def delete(self, agent_id):
+        """删除关键帧"""
+        self.keyframes.pop(agent_id, None)
+
+def resource_info(cpu_usage=1.0, gpu_usage=0.0):
+    """构造资源信息，包含静态字段"""
+    return {
+        'cpu_cores': 8,
+        'memory_total': 1 << 30,
+        'gpu_ids': ['0', '1'],
+        'cpu_usage': cpu_usage,
+        'memory_usage': 100,
+        'gpu_info': [
+            {'gpu_id': '0', 'usage': gpu_usage, 'memory_used': 0},
+            {'gpu_id': '1', 'usage': 0.0, 'memory_used': 0}
+        ]
+    }
+
+def send(encoder, decoder, info, agent_id='a'):
+    """编码并解码一次心跳，按服务器响应确认"""
+    data = encoder.encode(info)
+    merged, resync = decoder.decode(agent_id, data)
+    encoder.commit({'resync': True} if resync else {})
+    return data, merged, resync
+
+def test_diff_and_apply_round_trip():
+    previous = resource_info()
+    current = resource_info(cpu_usage=5.0, gpu_usage=0.5)
+    delta = diff_resource_info(previous, current)
+    assert delta == {'cpu_usage': 5.0, 'gpu_delta': {'0': {'usage': 0.5}}}
+    assert apply_resource_delta(previous, delta) == current
+
+def test_gpu_list_change_sends_full_gpu_info():
+    previous = resource_info()
+    current = resource_info()
+    current['gpu_info'] = current['gpu_info'][:1]
+    delta = diff_resource_info(previous, current)
+    assert delta == {'gpu_info': current['gpu_info']}
+
+def test_first_heartbeat_is_full_without_static_fields():
+    data = HeartbeatEncoder().encode(resource_info())
+    assert data['seq'] == 1 and data['full']
+    assert 'base' not in data
+    assert 'cpu_cores' not in data['resource_info']
+
+def test_delta_is_relative_to_confirmed_keyframe():
+    encoder, decoder = HeartbeatEncoder(), HeartbeatDecoder()
+    send(encoder, decoder, resource_info())
+    data, merged, resync = send(encoder, decoder, resource_info(cpu_usage=3.0, gpu_usage=0.2))
+    assert not data['full'] and data['base'] == 1
+    assert data['resource_info'] == {'cpu_usage': 3.0, 'gpu_delta': {'0': {'usage': 0.2}}}
+    assert not resync
+    assert merged['cpu_usage'] == 3.0 and merged['gpu_info'][0]['usage'] == 0.2
+
+def test_unconfirmed_keyframe_is_not_used_as_base():
+    encoder = HeartbeatEncoder()
+    encoder.encode(resource_info())  # 发送失败，没有commit
+    data = encoder.encode(resource_info())
+    assert data['full'] and data['seq'] == 1
+
+def test_keyframe_interval_forces_full_heartbeat():
+    encoder, decoder = HeartbeatEncoder(keyframe_interval=3), HeartbeatDecoder()
+    fulls = [send(encoder, decoder, resource_info(cpu_usage=i))[0]['full'] for i in range(7)]
+    assert fulls == [True, False, False, True, False, False, True]
+
+def test_seq_gap_does_not_require_resync():
+    encoder, decoder = HeartbeatEncoder(), HeartbeatDecoder()
+    send(encoder, decoder, resource_info())
+    # 第2次心跳丢失，服务器没有收到
+    encoder.encode(resource_info(cpu_usage=2.0))
+    encoder.commit({})
+    data, merged, resync = send(encoder, decoder, resource_info(cpu_usage=4.0))
+    assert data['seq'] == 3 and data['base'] == 1
+    assert not resync and merged['cpu_usage'] == 4.0
+
+def test_delta_decoded_by_another_process_through_keyframe_store():
+    store = MemoryKeyframeStore()
+    workers = [HeartbeatDecoder(store), HeartbeatDecoder(store)]
+    encoder = HeartbeatEncoder()
+    for i in range(10):
+        data = encoder.encode(resource_info(cpu_usage=float(i)))
+        merged, resync = workers[i % 2].decode('a', data)
+        encoder.commit({})
+        assert not resync
+        assert merged['cpu_usage'] == float(i)
+
+def test_missing_keyframe_requests_resync():
+    encoder, decoder = HeartbeatEncoder(), HeartbeatDecoder()
+    send(encoder, decoder, resource_info())
+    decoder.forget('a')
+    data, merged, resync = send(encoder, decoder, resource_info(cpu_usage=2.0))
+    assert not data['full'] and resync and merged is None
+    # 重新同步后发送全量
+    data, merged, resync = send(encoder, decoder, resource_info(cpu_usage=3.0))
+    assert data['full'] and not resync and merged['cpu_usage'] == 3.0
+
+def test_stale_keyframe_in_store_requests_resync():
+    store = MemoryKeyframeStore()
+    store.save('a', 7, {'cpu_usage': 1.0})
+    merged, resync = HeartbeatDecoder(store).decode('a', {'seq': 9, 'full': False, 'base': 8, 'resource_info': {}})
+    assert resync and merged is None
+
+def test_forget_deletes_keyframe_from_store():
+    store = MemoryKeyframeStore()
+    decoder = HeartbeatDecoder(store)
+    decoder.decode('a', {'seq': 1, 'full': True, 'resource_info': {'cpu_usage': 1.0}})
+    assert store.load('a') == (1, {'cpu_usage': 1.0})
+    decoder.forget('a')
+    assert store.load('a') is None and decoder.state('a') is None
+
+def test_legacy_chained_delta_requires_consecutive_seq():
+    decoder = HeartbeatDecoder()
+    decoder.decode('a', {'seq': 1, 'full': True, 'resource_info': {'cpu_usage': 1.0}})
+    merged, resync = decoder.decode('a', {'seq': 2, 'full': False, 'resource_info': {'cpu_usage': 2.0}})
+    assert merged == {'cpu_usage': 2.0} and not resync
+    merged, resync = decoder.decode('a', {'seq': 4, 'full': False, 'resource_info': {'cpu_usage': 3.0}})
+    assert resync and merged is None
+
+def test_heartbeat_without_seq_is_full():
+    merged, resync = HeartbeatDecoder().decode('a', {'resource_info': {'cpu_usage': 1.0}})
+    assert merged == {'cpu_usage': 1.0} and not resync
+
+def test_body_compressed_above_min_size():
+    data = {'task_info': {'status': 'running', 'note': 'x' * 2000}}
+    body, headers = encode_body(data, min_size=1024)
+    assert headers['Content-Encoding'] == 'deflate'
+    assert decode_body(body, headers['Content-Encoding']) == data
+    body, headers = encode_body({'seq': 1}, min_size=1024)
+    assert 'Content-Encoding' not in headers and decode_body(body) == {'seq': 1}
+
+def test_removed_key_is_sent_as_tombstone():
+    previous = resource_info()
+    current = resource_info()
+    del current['memory_usage']
+    delta = diff_resource_info(previous, current)
+    assert delta == {'removed_keys': ['memory_usage']}
+    assert apply_resource_delta(previous, delta) == current
+
+def test_removed_gpu_field_sends_full_gpu_info():
+    previous = resource_info()
+    current = resource_info()
+    del current['gpu_info'][1]['memory_used']
+    delta = diff_resource_info(previous, current)
+    assert delta == {'gpu_info': current['gpu_info']}
+    assert apply_resource_delta(previous, delta) == current
+
+def test_removed_key_leaves_decoder_state():
+    encoder, decoder = HeartbeatEncoder(), HeartbeatDecoder()
+    send(encoder, decoder, resource_info())
+    info = resource_info(cpu_usage=2.0)
+    del info['memory_usage']
+    data, merged, resync = send(encoder, decoder, info)
+    assert not data['full'] and not resync
+    assert 'memory_usage' not in merged and 'memory_usage' not in decoder.state('a')
+
+def test_decode_body_rejects_decompression_bomb():
+    body, headers = encode_body({'note': 'x' * (1 << 20)}, min_size=1024)
+    assert len(body) < 4096
+    with pytest.raises(ValueError):
+        decode_body(body, headers['Content-Encoding'], max_size=64 * 1024)
+    assert decode_body(body, headers['Content-Encoding'], max_size=2 << 20)['note'] == 'x' * (1 << 20)
+
+def test_decode_body_rejects_oversized_and_truncated_body():
+    body, _ = encode_body({'note': 'x' * 4096}, min_size=None)
+    with pytest.raises(ValueError):
+        decode_body(body, max_size=1024)
+    body, headers = encode_body({'note': 'x' * 4096}, min_size=1024)
+    with pytest.raises(ValueError):
+        decode_body(body[:-4], headers['Content-Encoding'])
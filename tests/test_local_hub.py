@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+子Agent心跳汇聚的日志转发测试
+"""
+
+import base64
+import pytest
+from agent import local_hub
+from agent.local_hub import SubAgentHub, HubClient, hub_supported
+from backend.utils.heartbeat_codec import decode_body
+
+class FakeServer:
+    """记录转发的日志，按偏移拼接后返回确认偏移，模拟TaskService.append_task_log"""
+    
+    def __init__(self):
+        """初始化"""
+        self.logs = {}  # 任务ID -> bytearray
+        self.available = True
+    
+    def post(self, url, data=None, headers=None, timeout=None):
+        """处理批量心跳请求"""
+        if not self.available:
+            raise ConnectionError('server unavailable')
+        payload = decode_body(data, (headers or {}).get('Content-Encoding'))
+        acked = []
+        for log in payload['logs']:
+            stream = self.logs.setdefault(log['task_id'], bytearray())
+            chunk = base64.b64decode(log['data'])
+            if log['offset'] <= len(stream):
+                stream += chunk[len(stream) - log['offset']:]
+            acked.append(len(stream))
+        result = {'heartbeats': [{'action': 'continue'} for _ in payload['heartbeats']], 'logs': acked}
+        return FakeResponse({'success': True, 'data': result})
+
+class FakeResponse:
+    """HTTP响应"""
+    
+    status_code = 200
+    
+    def __init__(self, body):
+        """初始化"""
+        self.body = body
+    
+    def json(self):
+        """响应内容"""
+        return self.body
+
+@pytest.fixture
+def server(monkeypatch):
+    """替换主Agent转发使用的requests.post"""
+    fake = FakeServer()
+    monkeypatch.setattr(local_hub.requests, 'post', fake.post)
+    return fake
+
+def submit(hub, offset, data, agent_id='sub-1', task_id=1):
+    """提交一个日志块，返回主Agent回复的偏移"""
+    log = {'task_id': task_id, 'offset': offset, 'data': base64.b64encode(data).decode('ascii')}
+    return hub.submit_log(agent_id, log)
+
+def test_duplicate_and_gapped_chunks(server):
+    hub = SubAgentHub('http://server', '/unused.sock')
+    assert submit(hub, 0, b'abcd') == 4
+    # 重复和重叠的日志块只保存超出部分
+    assert submit(hub, 0, b'abcd') == 4
+    assert submit(hub, 2, b'cdef') == 6
+    # 不连续的日志块被拒绝，子Agent从回复的偏移重新发送
+    assert submit(hub, 10, b'xyz') == 6
+    assert hub.flush()
+    assert bytes(server.logs[1]) == b'abcdef'
+    assert hub._logs == {}
+
+def test_pending_log_is_capped(server):
+    hub = SubAgentHub('http://server', '/unused.sock', max_log_pending=4)
+    assert submit(hub, 0, b'abcdef') == 4
+    assert submit(hub, 4, b'ef') == 4
+    assert hub.flush()
+    # 已转发的部分确认后腾出空间
+    assert submit(hub, 4, b'ef') == 6
+    assert hub.flush()
+    assert bytes(server.logs[1]) == b'abcdef'
+
+def test_failed_flush_keeps_log_for_retry(server):
+    hub = SubAgentHub('http://server', '/unused.sock')
+    submit(hub, 0, b'abc')
+    server.available = False
+    assert not hub.flush()
+    server.available = True
+    assert hub.flush()
+    assert bytes(server.logs[1]) == b'abc'
+
+def test_server_gap_resets_pending_log(server):
+    hub = SubAgentHub('http://server', '/unused.sock')
+    # 主Agent重启后收到的日志块不是从0开始，服务器还没有之前的部分
+    assert submit(hub, 5, b'fgh') == 8
+    assert hub.flush()
+    assert not server.logs.get(1)
+    # 主Agent要求子Agent从服务器的确认偏移重新发送
+    assert submit(hub, 5, b'fgh') == 0
+    assert submit(hub, 0, b'abcdefgh') == 8
+    assert hub.flush()
+    assert bytes(server.logs[1]) == b'abcdefgh'
+
+@pytest.mark.skipif(not hub_supported(), reason='需要Unix域套接字')
+def test_client_sends_log_through_socket(server, tmp_path):
+    hub = SubAgentHub('http://server', str(tmp_path / 'hub.sock'), flush_interval=3600)
+    hub.start()
+    client = HubClient(hub.socket_path)
+    try:
+        assert client.send_log('sub-1', 1, 0, b'hello ') == 6
+        assert client.send_log('sub-1', 1, 0, b'hello world') == 11
+        assert client.send_log('sub-1', 1, 20, b'!') == 11
+    finally:
+        client.close()
+        hub.close()
+    assert bytes(server.logs[1]) == b'hello world'
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务日志行索引测试
+"""
+
+import os
+from backend.utils.log_index import LineIndex, INDEX_SUFFIX
+
+def make_lines(start, count):
+    """生成第start行开始的count行日志"""
+    return b''.join(f'line {i}\n'.encode() for i in range(start, start + count))
+
+def write(path, data, mode='wb'):
+    """写入日志文件"""
+    with open(path, mode) as f:
+        f.write(data)
+
+def test_build_records_every_stride_lines(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    data = make_lines(0, 10)
+    write(log_path, data)
+    index = LineIndex(log_path, stride=4)
+    assert index.update() == (10, len(data))
+    assert list(index.offsets) == [0, data.index(b'line 4'), data.index(b'line 8')]
+    assert os.path.exists(log_path + INDEX_SUFFIX)
+
+def test_read_lines_range(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 10))
+    index = LineIndex(log_path, stride=4)
+    assert index.read_lines(5, 3) == (make_lines(5, 3), 5, 8, 10)
+    assert index.read_lines(8) == (make_lines(8, 2), 8, 10, 10)
+
+def test_read_lines_negative_start(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 10))
+    index = LineIndex(log_path, stride=4)
+    assert index.read_lines(-3) == (make_lines(7, 3), 7, 10, 10)
+    assert index.read_lines(-3, 2) == (make_lines(7, 2), 7, 9, 10)
+    # 超过总行数时从第一行开始
+    assert index.read_lines(-100, 2) == (make_lines(0, 2), 0, 2, 10)
+
+def test_read_lines_start_past_end_returns_last_line(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 10))
+    assert LineIndex(log_path, stride=4).read_lines(50, 5) == (make_lines(9, 1), 9, 10, 10)
+
+def test_last_line_without_newline_counts(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 3) + b'partial')
+    index = LineIndex(log_path, stride=2)
+    assert index.read_lines(-1) == (b'partial', 3, 4, 4)
+    # 补齐最后一行后继续追加
+    write(log_path, b' done\n' + make_lines(4, 2), mode='ab')
+    assert index.read_lines(3) == (b'partial done\n' + make_lines(4, 2), 3, 6, 6)
+
+def test_extend_scans_only_appended_data(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 6))
+    index = LineIndex(log_path, stride=4)
+    index.update()
+    write(log_path, make_lines(6, 7), mode='ab')
+    total, size = index.update()
+    assert (total, size) == (13, os.path.getsize(log_path))
+    assert len(index.offsets) == 4
+    assert index.read_lines(11) == (make_lines(11, 2), 11, 13, 13)
+
+def test_index_file_is_reused_by_new_instance(tmp_path, monkeypatch):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 9))
+    LineIndex(log_path, stride=4).update()
+    indexed_size = os.path.getsize(log_path)
+    write(log_path, make_lines(9, 3), mode='ab')
+    
+    scanned = []
+    original_scan = LineIndex._scan
+    def scan(self, block, base):
+        scanned.append(base)
+        return original_scan(self, block, base)
+    monkeypatch.setattr(LineIndex, '_scan', scan)
+    
+    index = LineIndex(log_path, stride=4)
+    assert index.read_lines(-4) == (make_lines(8, 4), 8, 12, 12)
+    # 只扫描上次索引之后追加的部分
+    assert scanned == [indexed_size]
+    assert len(index.offsets) == 4
+
+def test_index_file_with_other_stride_is_rebuilt(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 9))
+    LineIndex(log_path, stride=4).update()
+    index = LineIndex(log_path, stride=2)
+    assert index.read_lines(3, 2) == (make_lines(3, 2), 3, 5, 9)
+    assert len(index.offsets) == 5
+
+def test_corrupt_index_file_is_rebuilt(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 9))
+    write(log_path + INDEX_SUFFIX, b'garbage')
+    assert LineIndex(log_path, stride=4).read_lines(-2) == (make_lines(7, 2), 7, 9, 9)
+
+def test_rotation_rebuilds_index(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 10))
+    index = LineIndex(log_path, stride=4)
+    index.update()
+    # 轮转：新文件替换旧文件（inode变化），内容比旧文件还长
+    rotated = str(tmp_path / 'task.log.new')
+    write(rotated, make_lines(100, 12))
+    os.replace(rotated, log_path)
+    assert index.read_lines(0, 2) == (make_lines(100, 2), 0, 2, 12)
+
+def test_truncation_rebuilds_index(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 10))
+    index = LineIndex(log_path, stride=4)
+    index.update()
+    write(log_path, make_lines(50, 2), mode='r+b')
+    os.truncate(log_path, len(make_lines(50, 2)))
+    assert index.read_lines(0) == (make_lines(50, 2), 0, 2, 2)
+
+def test_rewrite_in_place_is_detected(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    write(log_path, make_lines(0, 4))
+    index = LineIndex(log_path, stride=2)
+    index.update()
+    # 同一个inode上重写为更长的内容，最后一个已索引的换行符不在原位置
+    with open(log_path, 'r+b') as f:
+        f.write(b'x' * (os.path.getsize(log_path) + 5) + b'\n')
+    assert index.update()[0] == 1
+
+def test_missing_log_file(tmp_path):
+    index = LineIndex(str(tmp_path / 'missing.log'), stride=4)
+    assert index.update() == (0, 0)
+    assert index.read_lines(-10) == (b'', 0, 0, 0)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+大日志文件读取测试
+"""
+
+from backend.utils.log_reader import tail, search, read_range, MAX_MATCH_LINE_BYTES
+
+def write_log(tmp_path, data):
+    """写入日志文件并返回路径"""
+    path = tmp_path / 'task.log'
+    path.write_bytes(data)
+    return str(path)
+
+def search_all(path, pattern, backward, page_size):
+    """按next_offset逐页查找，返回所有匹配和页数"""
+    matches = []
+    pages = 0
+    offset = None
+    while True:
+        result = search(path, pattern, backward=backward, offset=offset, max_matches=page_size)
+        matches.extend(result['matches'])
+        pages += 1
+        if result['next_offset'] is None:
+            return matches, pages
+        offset = result['next_offset']
+
+def test_tail_without_trailing_newline(tmp_path):
+    path = write_log(tmp_path, b'a\nb\nc')
+    result = tail(path, 2, 1024)
+    assert result['content'] == b'b\nc'
+    assert result['lines'] == 2 and not result['truncated']
+    assert (result['start_offset'], result['end_offset']) == (2, 5)
+
+def test_tail_with_trailing_newline(tmp_path):
+    path = write_log(tmp_path, b'a\nb\nc\n')
+    result = tail(path, 2, 1024)
+    assert result['content'] == b'b\nc\n' and result['lines'] == 2
+
+def test_tail_fewer_lines_than_requested(tmp_path):
+    path = write_log(tmp_path, b'a\nb\n')
+    result = tail(path, 10, 1024)
+    assert result['content'] == b'a\nb\n'
+    assert result['lines'] == 2 and result['start_offset'] == 0 and not result['truncated']
+
+def test_tail_truncates_at_utf8_boundary(tmp_path):
+    data = 'x' + '中' * 100 + '\n'
+    path = write_log(tmp_path, data.encode('utf-8'))
+    for max_bytes in (10, 11, 12, 13):
+        result = tail(path, 1, max_bytes)
+        assert result['truncated'] and result['lines'] == 1
+        assert len(result['content']) <= max_bytes
+        # 截断后的内容从完整的字符开始
+        text = result['content'].decode('utf-8')
+        assert data.endswith(text)
+
+def test_tail_respects_size(tmp_path):
+    path = write_log(tmp_path, b'a\nb\nc\nd')
+    result = tail(path, 1, 1024, size=4)
+    assert result['content'] == b'b\n' and result['end_offset'] == 4
+
+def test_tail_empty_and_missing_file(tmp_path):
+    empty = write_log(tmp_path, b'')
+    assert tail(empty, 5, 1024)['content'] == b''
+    missing = tail(str(tmp_path / 'missing.log'), 5, 1024)
+    assert missing['content'] == b'' and missing['lines'] == 0
+    assert tail(write_log(tmp_path, b'a\n'), 0, 1024)['lines'] == 0
+
+def test_search_backward_paging(tmp_path):
+    data = b''.join(f'{"ERROR" if i % 3 == 0 else "INFO"} {i}\n'.encode() for i in range(30))
+    path = write_log(tmp_path, data)
+    matches, pages = search_all(path, b'ERROR', backward=True, page_size=3)
+    assert [match['line'] for match in matches] == [f'ERROR {i}\n'.encode() for i in range(27, -1, -3)]
+    assert pages == 4
+    for match in matches:
+        assert data[match['match_offset']:match['match_offset'] + 5] == b'ERROR'
+        assert data[match['offset']:].startswith(match['line'])
+
+def test_search_forward_paging(tmp_path):
+    data = b''.join(f'{"ERROR" if i % 3 == 0 else "INFO"} {i}\n'.encode() for i in range(30))
+    path = write_log(tmp_path, data)
+    matches, pages = search_all(path, b'ERROR', backward=False, page_size=4)
+    assert [match['line'] for match in matches] == [f'ERROR {i}\n'.encode() for i in range(0, 30, 3)]
+    assert pages == 3
+
+def test_search_returns_each_line_once(tmp_path):
+    path = write_log(tmp_path, b'x ERROR ERROR ERROR\ny\nERROR z')
+    for backward in (True, False):
+        matches, _ = search_all(path, b'ERROR', backward=backward, page_size=1)
+        assert sorted(match['line'] for match in matches) == [b'ERROR z', b'x ERROR ERROR ERROR\n']
+
+def test_search_match_in_last_line_without_newline(tmp_path):
+    path = write_log(tmp_path, b'a\nb ERROR')
+    result = search(path, b'ERROR')
+    assert result['matches'] == [{'offset': 2, 'match_offset': 4, 'line': b'b ERROR'}]
+    assert result['next_offset'] is None
+
+def test_search_long_line_returns_window_around_match(tmp_path):
+    data = ('中' * 5000 + 'ERROR' + '中' * 5000 + '\n').encode('utf-8')
+    path = write_log(tmp_path, data)
+    match = search(path, b'ERROR')['matches'][0]
+    assert len(match['line']) <= MAX_MATCH_LINE_BYTES
+    assert match['offset'] <= match['match_offset'] < match['offset'] + len(match['line'])
+    # 窗口从字符边界开始，前半部分可以完整解码
+    head = match['line'][:match['match_offset'] - match['offset']]
+    assert set(head.decode('utf-8')) == {'中'}
+
+def test_search_max_bytes_limits_page(tmp_path):
+    data = b''.join(f'ERROR {i:03d}\n'.encode() for i in range(100))
+    path = write_log(tmp_path, data)
+    result = search(path, b'ERROR', backward=False, max_bytes=30)
+    assert len(result['matches']) == 3
+    assert result['next_offset'] == 30
+
+def test_search_missing_file_and_empty_pattern(tmp_path):
+    assert search(str(tmp_path / 'missing.log'), b'x') == {'matches': [], 'next_offset': None}
+    assert search(write_log(tmp_path, b'abc\n'), b'') == {'matches': [], 'next_offset': None}
+
+def test_read_range_clamps_to_file(tmp_path):
+    path = write_log(tmp_path, b'0123456789')
+    assert read_range(path, 8, 10) == {'content': b'89', 'start_offset': 8, 'end_offset': 10, 'size': 10}
+    assert read_range(path, -5, 3)['content'] == b'012'
+    assert read_range(path, 20, 3)['content'] == b''
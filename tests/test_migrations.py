@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+数据库迁移测试
+"""
+
+import pytest
+from backend.utils.database import Database
+from backend.utils import migrations
+from backend.utils.migrations import MIGRATIONS, run_migrations, get_schema_version
+
+@pytest.fixture
+def database(tmp_path):
+    """执行过全部迁移的独立数据库"""
+    database = Database(str(tmp_path / 'test.db'))
+    database.init_tables()
+    yield database
+    database.close()
+
+def applied_versions(database):
+    """已记录的迁移版本"""
+    return [row['version'] for row in database.fetch_all("SELECT version FROM schema_version ORDER BY version")]
+
+def test_versions_are_unique_and_contiguous():
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+
+def test_all_migrations_recorded(database):
+    assert applied_versions(database) == [version for version, _, _ in MIGRATIONS]
+    assert get_schema_version(database) == MIGRATIONS[-1][0]
+    indexes = {row['name'] for row in database.fetch_all("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'idx_tasks_status_priority_created', 'idx_tasks_created_id', 'idx_task_dependencies_task_id'} <= indexes
+
+def test_rerun_is_a_no_op(database):
+    assert run_migrations(database) == 0
+    database.init_tables()
+    assert applied_versions(database) == [version for version, _, _ in MIGRATIONS]
+
+def test_migrations_are_idempotent_when_versions_are_lost(database):
+    database.execute("INSERT INTO tasks (name, template_type, script_content) VALUES ('a', 'shell', 'echo')")
+    database.execute("DELETE FROM schema_version")
+    assert run_migrations(database) == len(MIGRATIONS)
+    assert database.fetch_one("SELECT COUNT(*) AS count FROM tasks")['count'] == 1
+
+def test_skipped_migration_is_retried(database, monkeypatch):
+    results = [False, None]
+    calls = []
+    
+    def flaky(db):
+        """第一次因条件不满足跳过，第二次执行"""
+        calls.append(1)
+        return results[len(calls) - 1]
+    
+    version = MIGRATIONS[-1][0] + 1
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS + [(version, "测试迁移", flaky)])
+    assert run_migrations(database) == 0
+    assert version not in applied_versions(database)
+    assert run_migrations(database) == 1
+    assert applied_versions(database)[-1] == version
+    assert run_migrations(database) == 0 and len(calls) == 2
+
+def test_failed_migration_is_rolled_back(database, monkeypatch):
+    def broken(db):
+        """建表后失败"""
+        db.execute("CREATE TABLE half_done (id INTEGER)")
+        raise RuntimeError("migration failed")
+    
+    version = MIGRATIONS[-1][0] + 1
+    monkeypatch.setattr(migrations, 'MIGRATIONS', MIGRATIONS + [(version, "测试迁移", broken)])
+    with pytest.raises(RuntimeError):
+        run_migrations(database)
+    assert version not in applied_versions(database)
+    assert database.fetch_one("SELECT name FROM sqlite_master WHERE name = 'half_done'") is None
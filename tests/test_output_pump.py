@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务输出读取与日志上报测试
+"""
+
+import os
+import sys
+import time
+import threading
+import subprocess
+from agent.output_pump import OutputQueue, OutputPump
+from agent.log_shipper import LogShipper
+
+class RecordingShipper(LogShipper):
+    """把日志块记录在内存中的日志上报，模拟服务器按偏移确认"""
+    
+    def __init__(self, log_path, queue, chunk_size=8):
+        """初始化日志上报"""
+        super().__init__('http://localhost', 1, 'sub', log_path, queue, chunk_size=chunk_size)
+        self.received = b''
+    
+    def _send(self, offset, chunk):
+        """按偏移追加日志块，返回确认偏移"""
+        self.received = self.received[:offset] + chunk
+        return len(self.received)
+
+def test_queue_reads_contiguous_chunks_and_drops_acked():
+    queue = OutputQueue(max_size=100)
+    queue.put(0, b'abc')
+    queue.put(3, b'defg')
+    assert queue.read(0, 5) == b'abcde'
+    assert queue.read(5, 100) == b'fg'
+    assert len(queue) == 4  # 确认偏移5之前的第一块已删除
+    assert queue.read(7, 100) == b''
+    assert len(queue) == 0
+
+def test_queue_full_drops_chunk_and_read_reports_gap():
+    queue = OutputQueue(max_size=4)
+    assert queue.put(0, b'abc')
+    assert not queue.put(3, b'de')
+    assert queue.dropped == 2
+    assert queue.read(0, 100) == b'abc'
+    # offset 3处的输出没有加入队列，需要从本地日志文件读取
+    assert queue.read(3, 100) is None
+    assert queue.put(5, b'fg')
+    assert queue.read(5, 100) == b'fg'
+
+def test_queue_backlog_waits_for_ack():
+    queue = OutputQueue(max_size=100, max_backlog=4)
+    queue.put(0, b'abcdef')
+    assert not queue.wait_for_backlog(timeout=0.01)
+    waiter = threading.Thread(target=queue.wait_for_backlog)
+    waiter.start()
+    queue.read(3, 100)
+    waiter.join(1)
+    assert not waiter.is_alive()
+    queue.close()
+    queue.put(6, b'x' * 10)
+    assert queue.wait_for_backlog(timeout=0)
+
+def test_shipper_reads_dropped_chunks_from_file(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    queue = OutputQueue(max_size=6)
+    data = b''
+    with open(log_path, 'ab') as f:
+        for part in (b'hello ', b'world ', b'again\n'):
+            queue.put(len(data), part)
+            f.write(part)
+            data += part
+    assert queue.dropped == 12
+    shipper = RecordingShipper(log_path, queue)
+    assert shipper.flush()
+    assert shipper.received == data and shipper.acked_offset == len(data)
+
+def test_pump_tees_pipe_to_file_and_queue(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    queue = OutputQueue(max_size=1 << 20)
+    script = "import sys\nfor i in range(1000): sys.stdout.write('line %d\\n' % i)\n"
+    process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE)
+    with open(log_path, 'ab') as log_file:
+        OutputPump(process.stdout, log_file, queue).run(process)
+    process.stdout.close()
+    process.wait()
+    
+    expected = ''.join(f'line {i}\n' for i in range(1000)).encode()
+    with open(log_path, 'rb') as f:
+        assert f.read() == expected
+    assert queue.read(0, len(expected) + 1) == expected
+
+def test_pump_pauses_when_backlog_exceeds_limit(tmp_path):
+    log_path = str(tmp_path / 'task.log')
+    queue = OutputQueue(max_size=1 << 20, max_backlog=64 * 1024)
+    script = "import sys\nsys.stdout.write('x' * (4 << 20))\n"
+    process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE)
+    with open(log_path, 'ab') as log_file:
+        pump = threading.Thread(target=OutputPump(process.stdout, log_file, queue).run, args=(process,))
+        pump.start()
+        time.sleep(0.5)
+        # 没有上报时读取暂停，任务进程阻塞在管道上
+        assert pump.is_alive() and process.poll() is None
+        assert os.path.getsize(log_path) < 256 * 1024
+        # 上报停止后不再限制积压
+        queue.close()
+        pump.join(10)
+    process.stdout.close()
+    process.wait()
+    assert not pump.is_alive()
+    assert os.path.getsize(log_path) == 4 << 20
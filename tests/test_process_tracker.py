@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+进程树资源统计测试，使用临时目录模拟/proc
+"""
+
+import os
+import pytest
+from agent import process_tracker
+from agent.process_tracker import ProcessTreeTracker, CLOCK_TICKS, PAGE_SIZE
+
+class FakeProc:
+    """临时目录中的/proc，children文件按各进程的父进程ID生成"""
+    
+    def __init__(self, root, children_file=True):
+        """初始化"""
+        self.root = root
+        self.children_file = children_file
+        self.uptime = 1000.0
+        self.processes = {}  # 进程ID -> 字段字典
+        self.write()
+    
+    def add(self, pid, ppid, cpu=0, start=0, rss_pages=1, threads=1, pss_kb=None):
+        """添加或替换一个进程，start为开机后的时钟周期"""
+        self.processes[pid] = {'ppid': ppid, 'cpu': cpu, 'start': start, 'rss_pages': rss_pages,
+                               'threads': threads, 'pss_kb': pss_kb}
+        self.write()
+    
+    def update(self, pid, **fields):
+        """修改进程的字段"""
+        self.processes[pid].update(fields)
+        self.write()
+    
+    def kill(self, pid):
+        """进程退出"""
+        del self.processes[pid]
+        self.write()
+    
+    def tick(self, seconds):
+        """时间前进"""
+        self.uptime += seconds
+        self.write()
+    
+    def now(self):
+        """当前开机时间（时钟周期）"""
+        return int(self.uptime * CLOCK_TICKS)
+    
+    def write(self):
+        """按当前状态重写整个目录"""
+        for name in os.listdir(self.root):
+            if name.isdigit():
+                self._remove(os.path.join(self.root, name))
+        with open(os.path.join(self.root, 'uptime'), 'w') as f:
+            f.write(f'{self.uptime:.2f} 0.00\n')
+        for pid, info in self.processes.items():
+            task_dir = os.path.join(self.root, str(pid), 'task', str(pid))
+            os.makedirs(task_dir)
+            # ')'之后的字段：状态、父进程ID，utime为第12个，线程数为第18个，启动时间为第20个，RSS为第22个
+            fields = ['S', info['ppid']] + [0] * 20
+            fields[11] = info['cpu']
+            fields[17] = info['threads']
+            fields[19] = info['start']
+            fields[21] = info['rss_pages']
+            with open(os.path.join(self.root, str(pid), 'stat'), 'w') as f:
+                f.write(f"{pid} (task (x)) " + ' '.join(str(field) for field in fields) + '\n')
+            if info['pss_kb'] is not None:
+                with open(os.path.join(self.root, str(pid), 'smaps_rollup'), 'w') as f:
+                    f.write(f"Rss: 0 kB\nPss: {info['pss_kb']} kB\n")
+            if self.children_file:
+                children = [child for child, other in self.processes.items() if other['ppid'] == pid]
+                with open(os.path.join(task_dir, 'children'), 'w') as f:
+                    f.write(''.join(f'{child} ' for child in children))
+    
+    def _remove(self, path):
+        """删除目录"""
+        for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+            for name in filenames:
+                os.remove(os.path.join(dirpath, name))
+            for name in dirnames:
+                os.rmdir(os.path.join(dirpath, name))
+        os.rmdir(path)
+
+@pytest.fixture
+def proc(tmp_path, monkeypatch):
+    """带有根进程100的模拟/proc"""
+    monkeypatch.setattr(process_tracker, 'PROC_DIR', str(tmp_path))
+    fake = FakeProc(str(tmp_path))
+    fake.add(100, 1, rss_pages=10)
+    return fake
+
+def test_discovers_tree_through_children_files(proc):
+    proc.add(101, 100, rss_pages=20)
+    proc.add(102, 101, rss_pages=30)
+    proc.add(200, 1, rss_pages=1000)
+    stats = ProcessTreeTracker(100).sample()
+    assert stats['process_count'] == 3
+    assert stats['memory_usage'] == 60 * PAGE_SIZE
+
+def test_discovers_tree_by_scanning_without_children_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_tracker, 'PROC_DIR', str(tmp_path))
+    proc = FakeProc(str(tmp_path), children_file=False)
+    proc.add(100, 1)
+    proc.add(101, 100)
+    proc.add(102, 101)
+    proc.add(200, 1)
+    tracker = ProcessTreeTracker(100)
+    assert not tracker._use_children_file
+    assert tracker.sample()['process_count'] == 3
+
+def test_exclude_root(proc):
+    proc.add(101, 100, rss_pages=20)
+    stats = ProcessTreeTracker(100, include_root=False).sample()
+    assert stats['process_count'] == 1 and stats['memory_usage'] == 20 * PAGE_SIZE
+
+def test_cpu_usage_between_samples(proc):
+    proc.add(101, 100, cpu=500)
+    tracker = ProcessTreeTracker(100)
+    assert tracker.sample()['cpu_usage'] == 0.0
+    proc.tick(2)
+    proc.update(100, cpu=CLOCK_TICKS)
+    proc.update(101, cpu=500 + CLOCK_TICKS * 2)
+    # 2秒内共使用3秒CPU时间
+    assert tracker.sample()['cpu_usage'] == pytest.approx(150.0, rel=0.01)
+
+def test_new_child_cpu_counted_from_start(proc):
+    tracker = ProcessTreeTracker(100, rescan_interval=0)
+    tracker.sample()
+    proc.tick(1)
+    # 两次采样之间启动并已使用0.5秒CPU时间的子进程
+    proc.add(101, 100, cpu=CLOCK_TICKS // 2, start=proc.now() - 10)
+    assert tracker.sample()['cpu_usage'] == pytest.approx(50.0, rel=0.05)
+
+def test_exited_child_is_not_counted(proc):
+    proc.add(101, 100, cpu=100)
+    tracker = ProcessTreeTracker(100, rescan_interval=0)
+    tracker.sample()
+    proc.tick(1)
+    proc.kill(101)
+    stats = tracker.sample()
+    assert stats['process_count'] == 1 and stats['cpu_usage'] == 0.0
+
+def test_cached_child_pid_reused_by_other_process_is_skipped(proc):
+    proc.add(101, 100, rss_pages=20)
+    tracker = ProcessTreeTracker(100, rescan_interval=3600)
+    assert tracker.sample()['process_count'] == 2
+    # 子进程退出后进程ID被不相关的进程复用，缓存的进程树中仍有101
+    proc.tick(1)
+    proc.kill(101)
+    proc.add(101, 1, cpu=10 ** 6, start=proc.now(), rss_pages=1000)
+    stats = tracker.sample()
+    assert stats['process_count'] == 1 and stats['memory_usage'] == 10 * PAGE_SIZE
+    assert stats['cpu_usage'] == 0.0
+
+def test_reused_pid_in_tree_does_not_use_old_cpu_baseline(proc):
+    proc.add(101, 100, cpu=1000, start=10)
+    tracker = ProcessTreeTracker(100, rescan_interval=0)
+    tracker.sample()
+    proc.tick(1)
+    # 同一父进程下的新进程复用了进程ID，CPU时间小于旧进程，不能与旧进程的CPU时间相减
+    proc.add(101, 100, cpu=CLOCK_TICKS // 4, start=proc.now() - 5)
+    assert tracker.sample()['cpu_usage'] == pytest.approx(25.0, rel=0.05)
+
+def test_cached_tree_refreshes_children_when_thread_count_changes(proc):
+    tracker = ProcessTreeTracker(100, rescan_interval=3600)
+    assert tracker.sample()['process_count'] == 1
+    proc.add(101, 100)
+    # 线程数和启动时间都未变化，沿用缓存的子进程列表
+    assert tracker.sample()['process_count'] == 1
+    proc.update(100, threads=2)
+    assert tracker.sample()['process_count'] == 2
+
+def test_pss_is_read_every_interval(proc):
+    proc.update(100, pss_kb=100)
+    proc.add(101, 100, pss_kb=50)
+    tracker = ProcessTreeTracker(100, pss_interval=10)
+    assert tracker.sample()['memory_pss'] == 150 * 1024
+    proc.update(101, pss_kb=500)
+    proc.tick(1)
+    assert tracker.sample()['memory_pss'] == 150 * 1024
+    proc.tick(10)
+    assert tracker.sample()['memory_pss'] == 600 * 1024
+    assert ProcessTreeTracker(100, pss_interval=0).sample()['memory_pss'] is None
+
+def test_root_exit_raises(proc):
+    tracker = ProcessTreeTracker(100)
+    tracker.sample()
+    proc.kill(100)
+    with pytest.raises(ProcessLookupError):
+        tracker.sample()
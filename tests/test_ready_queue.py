@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+就绪队列测试
+"""
+
+import pytest
+from backend.models.task import Task
+from backend.services.ready_queue import ReadyQueue
+
+def make_task(name, priority=3, cpu_cores=1):
+    """创建一个waiting状态的任务"""
+    return Task.create_task(name, 'shell', f'echo {name}', priority=priority, cpu_cores=cpu_cores)
+
+def fits_all(shape):
+    """任意资源规格都可执行"""
+    return True
+
+def drain(queue):
+    """按优先级依次取出队列中的全部任务ID"""
+    ids = []
+    while True:
+        task_id = queue.find(fits_all)
+        if task_id is None:
+            return ids
+        ids.append(task_id)
+        queue.remove(task_id)
+
+def race_rebuild(db, monkeypatch, queue, during_read):
+    """重建读取数据库后、替换队列前执行during_read，模拟并发的push/remove"""
+    fetch_all = db.fetch_all
+    
+    def racing_fetch_all(query, params=None):
+        rows = fetch_all(query, params)
+        monkeypatch.setattr(db, 'fetch_all', fetch_all)
+        during_read()
+        return rows
+    
+    monkeypatch.setattr(db, 'fetch_all', racing_fetch_all)
+    return queue.rebuild()
+
+def test_rebuild_orders_by_priority_and_created_time(db):
+    low = make_task('low', priority=5)
+    first = make_task('first', priority=1)
+    second = make_task('second', priority=1)
+    queue = ReadyQueue(refresh_interval=0)
+    assert queue.rebuild() == 3
+    assert drain(queue) == [first.id, second.id, low.id]
+
+def test_push_during_rebuild_is_kept(db, monkeypatch):
+    old = make_task('old')
+    queue = ReadyQueue(refresh_interval=0)
+    created = []
+    
+    def create_and_push():
+        task = make_task('new', priority=1)
+        created.append(task)
+        queue.push(task)
+    
+    # 新任务在读取之后创建，不在读取结果中，重建后仍应在队列中
+    assert race_rebuild(db, monkeypatch, queue, create_and_push) == 2
+    assert drain(queue) == [created[0].id, old.id]
+
+def test_remove_during_rebuild_is_kept(db, monkeypatch):
+    claimed = make_task('claimed', priority=1)
+    other = make_task('other')
+    queue = ReadyQueue(refresh_interval=0)
+    queue.rebuild()
+    
+    def claim_and_remove():
+        db.execute("UPDATE tasks SET status = 'running' WHERE id = ?", (claimed.id,))
+        queue.remove(claimed.id)
+    
+    # 读取结果中仍是waiting的任务已被领取，重建后不应再回到队列中
+    assert race_rebuild(db, monkeypatch, queue, claim_and_remove) == 1
+    assert drain(queue) == [other.id]
+
+def test_failed_rebuild_keeps_queue(db, monkeypatch):
+    task = make_task('task')
+    queue = ReadyQueue(refresh_interval=0)
+    queue.rebuild()
+    
+    def broken_fetch_all(query, params=None):
+        raise RuntimeError('database unavailable')
+    
+    monkeypatch.setattr(db, 'fetch_all', broken_fetch_all)
+    with pytest.raises(RuntimeError):
+        queue.rebuild()
+    monkeypatch.undo()
+    
+    # 失败的重建不留下操作记录，也不影响原队列
+    assert queue._journals == []
+    assert drain(queue) == [task.id]
+
+def test_find_skips_shapes_that_do_not_fit(db):
+    big = make_task('big', priority=1, cpu_cores=8)
+    small = make_task('small', priority=5, cpu_cores=1)
+    queue = ReadyQueue(refresh_interval=0)
+    queue.rebuild()
+    assert queue.find(lambda shape: shape[0] <= 4) == small.id
+    assert queue.find(fits_all) == big.id
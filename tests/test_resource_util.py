@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+GPU信息查询测试
+"""
+
+from types import SimpleNamespace
+from agent.resource_util import ResourceUtil
+
+class FakeNVMLError(Exception):
+    """带错误码的NVML异常"""
+    
+    def __init__(self, value):
+        """初始化"""
+        super().__init__(value)
+        self.value = value
+
+class FakeNVML:
+    """记录调用次数的NVML，utilization_error不为None时查询使用率抛出该错误码"""
+    
+    NVML_ERROR_NOT_SUPPORTED = 3
+    
+    def __init__(self, utilization_error=None):
+        """初始化"""
+        self.utilization_error = utilization_error
+        self.calls = []
+    
+    def nvmlDeviceGetUtilizationRates(self, handle):
+        """查询使用率"""
+        self.calls.append(('utilization', handle))
+        if self.utilization_error is not None:
+            raise FakeNVMLError(self.utilization_error)
+        return SimpleNamespace(gpu=50, memory=10)
+    
+    def nvmlDeviceGetMemoryInfo(self, handle):
+        """查询显存"""
+        self.calls.append(('memory', handle))
+        return SimpleNamespace(total=1000, used=250, free=750)
+
+def make_util(monkeypatch, nvml):
+    """使用FakeNVML和两个GPU句柄的ResourceUtil"""
+    monkeypatch.delenv('CUDA_VISIBLE_DEVICES', raising=False)
+    util = ResourceUtil()
+    util.pynvml = nvml
+    util.has_gpu = True
+    util._gpu_handles = [('0', 'h0'), ('1', 'h1')]
+    return util
+
+def test_each_gpu_is_queried_once_per_sample(monkeypatch):
+    nvml = FakeNVML()
+    util = make_util(monkeypatch, nvml)
+    gpus = util.get_gpu_info()
+    assert [gpu['gpu_id'] for gpu in gpus] == ['0', '1']
+    assert gpus[0]['usage'] == 0.5 and gpus[0]['memory_used'] == 250 and gpus[0]['memory_usage'] == 0.25
+    assert sorted(nvml.calls) == [('memory', 'h0'), ('memory', 'h1'), ('utilization', 'h0'), ('utilization', 'h1')]
+
+def test_unsupported_query_is_not_repeated(monkeypatch):
+    nvml = FakeNVML(utilization_error=FakeNVML.NVML_ERROR_NOT_SUPPORTED)
+    util = make_util(monkeypatch, nvml)
+    util.get_gpu_info()
+    nvml.calls.clear()
+    gpus = util.get_gpu_info()
+    assert nvml.calls == [('memory', 'h0'), ('memory', 'h1')]
+    assert gpus[0]['usage'] == 0.0 and gpus[0]['memory_used'] == 250
+
+def test_other_errors_are_retried(monkeypatch):
+    nvml = FakeNVML(utilization_error=999)
+    util = make_util(monkeypatch, nvml)
+    util.get_gpu_info()
+    nvml.calls.clear()
+    util.get_gpu_info()
+    assert ('utilization', 'h0') in nvml.calls
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务领取与取消的并发测试
+"""
+
+import threading
+from backend.models.task import Task
+from backend.models.agent import Agent
+from backend.models.agent_action import AgentAction
+from backend.services.task_service import TaskService
+
+def make_task(name='task'):
+    """创建一个waiting状态的任务"""
+    return Task.create_task(name, 'shell', 'echo hello', cpu_cores=1)
+
+def test_cancel_keeps_claim_made_after_read(db):
+    task = make_task()
+    stale = Task.get_task_by_id(task.id)
+    assert Task.get_task_by_id(task.id).claim_task('main-1')
+    
+    # 取消只修改状态，不用读取时的旧值覆盖领取写入的字段
+    assert stale.cancel_task()
+    latest = Task.get_task_by_id(task.id)
+    assert latest.status == 'canceled'
+    assert latest.agent_id == 'main-1' and latest.start_time is not None
+    assert latest.end_time is not None
+
+def test_cancel_finished_task_fails(db):
+    task = make_task()
+    stale = Task.get_task_by_id(task.id)
+    db.execute("UPDATE tasks SET status = 'completed' WHERE id = ?", (task.id,))
+    assert not stale.cancel_task()
+    assert Task.get_task_by_id(task.id).status == 'completed'
+
+def test_claim_between_read_and_cancel_loses(db, monkeypatch):
+    task = make_task()
+    get_task_by_id = Task.get_task_by_id
+    results = []
+    
+    def claim():
+        results.append(get_task_by_id(task.id).claim_task('main-1'))
+    
+    claimer = threading.Thread(target=claim)
+    
+    def read_then_claim(task_id):
+        """读取任务后由另一个线程领取同一任务"""
+        result = get_task_by_id(task_id)
+        if not claimer.is_alive() and not results:
+            claimer.start()
+            # 取消持有写事务，领取要等到取消提交后才能执行
+            claimer.join(0.2)
+        return result
+    
+    monkeypatch.setattr(Task, 'get_task_by_id', read_then_claim)
+    assert TaskService().cancel_task(task.id)
+    claimer.join()
+    
+    assert results == [False]
+    latest = get_task_by_id(task.id)
+    assert latest.status == 'canceled' and latest.agent_id is None
+
+def test_cancel_running_task_queues_quit_for_sub_agent(db):
+    task = make_task()
+    assert Task.get_task_by_id(task.id).claim_task('main-1')
+    sub_agent = Agent.create_agent('sub', 'sub', cpu_cores=1, task_id=task.id, main_agent_id='main-1')
+    
+    assert TaskService().cancel_task(task.id)
+    assert AgentAction.pop(sub_agent.id) == 'quit'
+    assert AgentAction.pop(sub_agent.id) is None
+    latest = Task.get_task_by_id(task.id)
+    assert latest.status == 'canceled' and latest.agent_id == 'main-1'
+
+def test_concurrent_claims_only_one_wins(db):
+    task = make_task()
+    service = TaskService()
+    agents = [f'main-{i}' for i in range(8)]
+    # 每个线程都持有领取前读取的任务实例，同时发起领取
+    copies = [Task.get_task_by_id(task.id) for _ in agents]
+    barrier = threading.Barrier(len(agents))
+    results = {}
+    
+    def claim(copy, agent_id):
+        barrier.wait()
+        results[agent_id] = service.claim_task(copy, agent_id)
+    
+    threads = [threading.Thread(target=claim, args=args) for args in zip(copies, agents)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    winners = [agent_id for agent_id, claimed in results.items() if claimed]
+    assert len(results) == len(agents) and len(winners) == 1
+    latest = Task.get_task_by_id(task.id)
+    assert latest.status == 'running' and latest.agent_id == winners[0]
+    assert latest.version == task.version + 1
+    # 失败的领取不会把已被领取的任务放回就绪队列
+    assert service.ready_queue.find(lambda shape: True) is None
+
+def test_claim_with_stale_version_fails(db):
+    task = make_task()
+    stale = Task.get_task_by_id(task.id)
+    db.execute("UPDATE tasks SET priority = 1, version = version + 1 WHERE id = ?", (task.id,))
+    service = TaskService()
+    assert not service.claim_task(stale, 'main-1')
+    assert Task.get_task_by_id(task.id).status == 'waiting'
+    # 任务仍在等待，按最新状态放回就绪队列，下次可以领取
+    assert service.ready_queue.find(lambda shape: True) == task.id
+    assert service.claim_task(Task.get_task_by_id(task.id), 'main-1')
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务分配（按Agent剩余资源装箱）测试
+"""
+
+from types import SimpleNamespace
+from backend.models.task import Task
+from backend.services.task_service import TaskService
+
+GB = 1024 * 1024 * 1024
+
+def make_agent(cpu_cores, gpus=()):
+    """构造主Agent，gpus为各GPU的显存（GB）"""
+    gpu_info = [{'gpu_id': str(i), 'memory_total': memory * GB, 'is_available': True}
+                for i, memory in enumerate(gpus)]
+    return SimpleNamespace(id='main-1', available_cpu_cores=cpu_cores, gpu_info=gpu_info)
+
+def make_task(service, name, priority=3, cpu_cores=1, gpu_count=None, gpu_memory=None):
+    """创建一个waiting状态的任务"""
+    return service.create_task(name, 'shell', f'echo {name}', priority=priority, cpu_cores=cpu_cores,
+                               gpu_count=gpu_count, gpu_memory=gpu_memory)
+
+def dispatched_ids(dispatched):
+    """已领取的任务ID列表"""
+    return [task.id for task, _ in dispatched]
+
+def test_dispatch_packs_tasks_until_cpu_is_used_up(db):
+    service = TaskService()
+    tasks = [make_task(service, f'task-{i}', cpu_cores=2) for i in range(3)]
+    dispatched = service.dispatch_tasks(make_agent(4), max_tasks=5)
+    assert dispatched_ids(dispatched) == [tasks[0].id, tasks[1].id]
+    assert Task.get_task_by_id(tasks[2].id).status == 'waiting'
+    assert all(Task.get_task_by_id(task.id).agent_id == 'main-1' for task, _ in dispatched)
+
+def test_dispatch_skips_tasks_that_do_not_fit(db):
+    service = TaskService()
+    big = make_task(service, 'big', priority=1, cpu_cores=8)
+    small = make_task(service, 'small', priority=5, cpu_cores=2)
+    assert dispatched_ids(service.dispatch_tasks(make_agent(4), max_tasks=5)) == [small.id]
+    assert Task.get_task_by_id(big.id).status == 'waiting'
+
+def test_dispatch_respects_max_tasks(db):
+    service = TaskService()
+    tasks = [make_task(service, f'task-{i}') for i in range(3)]
+    assert dispatched_ids(service.dispatch_tasks(make_agent(8))) == [tasks[0].id]
+    assert dispatched_ids(service.dispatch_tasks(make_agent(8), max_tasks=2)) == [tasks[1].id, tasks[2].id]
+    assert service.dispatch_tasks(make_agent(8), max_tasks=2) == []
+
+def test_dispatch_assigns_smallest_fitting_gpus_once(db):
+    service = TaskService()
+    small = make_task(service, 'small', priority=1, gpu_count=1, gpu_memory=4000)
+    large = make_task(service, 'large', priority=2, gpu_count=1, gpu_memory=16000)
+    extra = make_task(service, 'extra', priority=3, gpu_count=1, gpu_memory=1000)
+    dispatched = service.dispatch_tasks(make_agent(8, gpus=(24, 8)), max_tasks=5)
+    # 小显存任务使用8GB的GPU，把24GB的GPU留给大显存任务，GPU不会被重复分配
+    assert [(task.id, gpu_ids) for task, gpu_ids in dispatched] == [(small.id, ['1']), (large.id, ['0'])]
+    assert Task.get_task_by_id(extra.id).status == 'waiting'
+
+def test_dispatch_drops_stale_queue_entries(db):
+    service = TaskService()
+    taken = make_task(service, 'taken', priority=1)
+    other = make_task(service, 'other')
+    # 另一个进程已领取该任务，本进程的就绪队列还没有更新
+    db.execute("UPDATE tasks SET status = 'running', agent_id = 'main-2' WHERE id = ?", (taken.id,))
+    assert dispatched_ids(service.dispatch_tasks(make_agent(4), max_tasks=5)) == [other.id]
+    assert Task.get_task_by_id(taken.id).agent_id == 'main-2'
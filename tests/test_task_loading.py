@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务批量加载测试
+"""
+
+from backend.models import task as task_module
+from backend.models.task import Task
+from backend.services.task_service import TaskService
+
+def count_queries(db, monkeypatch):
+    """统计fetch_all的调用次数"""
+    calls = []
+    fetch_all = db.fetch_all
+    
+    def counting_fetch_all(query, params=None):
+        calls.append(query)
+        return fetch_all(query, params)
+    
+    monkeypatch.setattr(db, 'fetch_all', counting_fetch_all)
+    return calls
+
+def make_chain(count):
+    """创建count个任务，每个任务依赖前一个任务"""
+    tasks = [Task.create_task('task-0', 'shell', 'echo 0')]
+    for i in range(1, count):
+        tasks.append(Task.create_task(f'task-{i}', 'shell', f'echo {i}', depends_on=[tasks[-1].id]))
+    return tasks
+
+def test_from_rows_loads_dependencies_in_one_query(db, monkeypatch):
+    tasks = make_chain(5)
+    rows = db.fetch_all("SELECT * FROM tasks ORDER BY id")
+    calls = count_queries(db, monkeypatch)
+    loaded = Task.from_rows(rows)
+    assert len(calls) == 1
+    assert [task.id for task in loaded] == [task.id for task in tasks]
+    assert loaded[0].depends_on == []
+    assert [task.depends_on for task in loaded[1:]] == [[task.id] for task in tasks[:-1]]
+
+def test_get_tasks_by_ids_keeps_order_and_skips_missing(db):
+    tasks = make_chain(3)
+    ids = [tasks[2].id, 999999, tasks[0].id]
+    loaded = Task.get_tasks_by_ids(ids)
+    assert [task.id for task in loaded] == [tasks[2].id, tasks[0].id]
+    assert loaded[0].depends_on == [tasks[1].id]
+
+def test_dependencies_map_without_in_clause(db, monkeypatch):
+    tasks = make_chain(4)
+    ids = [task.id for task in tasks]
+    expected = Task.get_dependencies_map(ids)
+    # 任务数超过参数上限时改为扫描整个依赖表，结果相同
+    monkeypatch.setattr(task_module, 'MAX_SQL_PARAMS', 2)
+    assert Task.get_dependencies_map(ids[1:3]) == {ids[1]: [ids[0]], ids[2]: [ids[1]]}
+    assert Task.get_dependencies_map(ids) == expected
+    assert [task.id for task in Task.get_tasks_by_ids(ids)] == ids
+
+def test_task_list_query_count_is_constant(db, monkeypatch):
+    make_chain(12)
+    service = TaskService()
+    calls = count_queries(db, monkeypatch)
+    page = service.get_task_in_page(page=1, per_page=10)
+    assert len(page['tasks']) == 10
+    assert len(calls) == 2
+    calls.clear()
+    assert len(service.get_all_tasks()) == 12
+    assert len(calls) == 2
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按偏移追加任务日志测试
+"""
+
+import threading
+import pytest
+from backend.models.task import Task
+from backend.services.task_service import TaskService
+
+def make_task():
+    """创建一个任务，返回(服务, 任务)"""
+    return TaskService(), Task.create_task('task', 'shell', 'echo hello')
+
+def read_log(task):
+    """读取任务日志文件"""
+    with open(task.log_file, 'rb') as f:
+        return f.read()
+
+def test_sequential_chunks_are_appended(db):
+    service, task = make_task()
+    assert service.append_task_log(task.id, b'hello ', offset=0, agent_id='sub-1')
+    assert service.append_task_log(task.id, 'world', offset=6, agent_id='sub-1')
+    assert read_log(task) == b'hello world'
+    assert service.get_task_log_offset(task.id, 'sub-1') == 11
+
+def test_duplicate_and_overlapping_chunks_are_written_once(db):
+    service, task = make_task()
+    assert service.append_task_log(task.id, b'abcdef', offset=0, agent_id='sub-1')
+    # 确认丢失后重发的日志块
+    assert service.append_task_log(task.id, b'abcdef', offset=0, agent_id='sub-1')
+    assert service.append_task_log(task.id, b'cd', offset=2, agent_id='sub-1')
+    # 与已写入部分重叠的日志块只写入超出部分
+    assert service.append_task_log(task.id, b'efgh', offset=4, agent_id='sub-1')
+    assert read_log(task) == b'abcdefgh'
+    assert service.get_task_log_offset(task.id, 'sub-1') == 8
+
+def test_gap_raises_and_writes_nothing(db):
+    service, task = make_task()
+    assert service.append_task_log(task.id, b'abc', offset=0, agent_id='sub-1')
+    with pytest.raises(ValueError):
+        service.append_task_log(task.id, b'xyz', offset=5, agent_id='sub-1')
+    assert read_log(task) == b'abc'
+    assert service.get_task_log_offset(task.id, 'sub-1') == 3
+
+def test_new_agent_restarts_stream_at_zero(db):
+    service, task = make_task()
+    assert service.append_task_log(task.id, b'first\n', offset=0, agent_id='sub-1')
+    # 任务被重新分配给另一个子Agent，输出流从0重新开始，日志追加在原日志之后
+    assert service.get_task_log_offset(task.id, 'sub-2') == 0
+    with pytest.raises(ValueError):
+        service.append_task_log(task.id, b'second\n', offset=6, agent_id='sub-2')
+    assert service.append_task_log(task.id, b'second\n', offset=0, agent_id='sub-2')
+    assert read_log(task) == b'first\nsecond\n'
+    assert service.get_task_log_offset(task.id, 'sub-2') == 7
+    assert service.get_task_log_offset(task.id, 'sub-1') == 0
+
+def test_append_without_offset(db):
+    service, task = make_task()
+    assert service.append_task_log(task.id, 'line\n')
+    assert service.append_task_log(task.id, 'line\n')
+    assert read_log(task) == b'line\nline\n'
+    assert service.get_task_log_offset(task.id) == 0
+
+def test_missing_task_returns_false(db):
+    assert not TaskService().append_task_log(999999, b'abc', offset=0, agent_id='sub-1')
+
+def test_concurrent_duplicate_chunks_are_written_once(db):
+    service, task = make_task()
+    chunk = b'x' * 4096
+    barrier = threading.Barrier(4)
+    results = []
+    
+    def append():
+        barrier.wait()
+        results.append(service.append_task_log(task.id, chunk, offset=0, agent_id='sub-1'))
+    
+    threads = [threading.Thread(target=append) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert results == [True] * 4
+    assert read_log(task) == chunk
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务列表游标分页测试
+"""
+
+import pytest
+from backend.models.task import Task
+from backend.services.task_service import TaskService
+
+def make_tasks(db, count, created_time='2024-01-01 00:00:00'):
+    """创建count个任务，created_time全部相同"""
+    ids = [Task.create_task(f'task-{i}', 'shell', f'echo {i}').id for i in range(count)]
+    db.execute("UPDATE tasks SET created_time = ?", (created_time,))
+    return ids
+
+def collect_pages(service, per_page, filters=None):
+    """从第一页翻到最后一页，返回每页的任务ID列表"""
+    pages = []
+    cursor = None
+    while True:
+        result = service.get_task_in_cursor(cursor=cursor, per_page=per_page, filters=filters)
+        pages.append([task.id for task in result['tasks']])
+        assert result['has_more'] == (result['next_cursor'] is not None)
+        if not result['has_more']:
+            return pages
+        cursor = result['next_cursor']
+
+def test_page_boundary_with_equal_created_time(db):
+    ids = make_tasks(db, 7)
+    pages = collect_pages(TaskService(), per_page=2)
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    # created_time相同时按id倒序，翻页没有重复也没有遗漏
+    assert [task_id for page in pages for task_id in page] == sorted(ids, reverse=True)
+
+def test_last_page_exactly_full_has_no_more(db):
+    make_tasks(db, 4)
+    pages = collect_pages(TaskService(), per_page=2)
+    assert [len(page) for page in pages] == [2, 2]
+
+def test_cursor_orders_by_created_time_then_id(db):
+    ids = make_tasks(db, 4)
+    db.execute("UPDATE tasks SET created_time = ? WHERE id = ?", ('2024-01-02 00:00:00', ids[0]))
+    pages = collect_pages(TaskService(), per_page=3)
+    assert pages == [[ids[0], ids[3], ids[2]], [ids[1]]]
+
+def test_cursor_with_filters_and_exact_total(db):
+    ids = make_tasks(db, 6)
+    for task_id in ids[::2]:
+        db.execute("UPDATE tasks SET status = 'completed' WHERE id = ?", (task_id,))
+    service = TaskService()
+    pages = collect_pages(service, per_page=2, filters={'status': ['completed']})
+    assert [task_id for page in pages for task_id in page] == sorted(ids[::2], reverse=True)
+    result = service.get_task_in_cursor(per_page=2, filters={'status': ['completed']}, exact_total=True)
+    assert result['total'] == 3 and not result['total_is_estimate']
+
+def test_invalid_cursor_raises(db):
+    with pytest.raises(ValueError):
+        TaskService().get_task_in_cursor(cursor='not-a-cursor')
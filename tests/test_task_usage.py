@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+任务资源使用汇总测试
+"""
+
+import os
+import sys
+import subprocess
+import pytest
+from agent.task_usage import TaskUsageCollector
+from agent.process_tracker import ProcessTreeTracker, proc_supported
+
+def test_summary_reports_tree_peak_and_rusage_peak_separately():
+    collector = TaskUsageCollector()
+    collector.start()
+    for memory_usage in (100, 300, 200):
+        collector.add_sample({'cpu_usage': 50.0, 'memory_usage': memory_usage})
+    collector.finish()
+    summary = collector.summary()
+    assert summary['peak_rss'] == 300 and summary['samples'] == 3
+    if sys.platform.startswith('win'):
+        assert summary['rusage_max_rss'] is None
+    else:
+        assert summary['rusage_max_rss'] > 0
+
+def test_summary_without_samples_has_no_tree_peak():
+    collector = TaskUsageCollector()
+    collector.start()
+    collector.finish()
+    assert collector.summary()['peak_rss'] is None
+
+@pytest.mark.skipif(not proc_supported(), reason="需要/proc")
+def test_tracker_can_exclude_root_process():
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(5)'])
+    try:
+        with_root = ProcessTreeTracker(os.getpid()).sample()
+        without_root = ProcessTreeTracker(os.getpid(), include_root=False).sample()
+    finally:
+        child.kill()
+        child.wait()
+    assert without_root['process_count'] == with_root['process_count'] - 1
+    assert 0 < without_root['memory_usage'] < with_root['memory_usage']